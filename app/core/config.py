@@ -15,9 +15,40 @@ class Settings(BaseSettings):
     DB_NAME: str
     DB_USER: str
     DB_PASSWORD: str
+    DB_REPLICA_URLS: List[str] = [] # DSN реплик только для чтения, JSON-список
+    DB_POOL_MIN_SIZE: int = 1
+    DB_POOL_MAX_SIZE: int = 5
+    DB_CONNECT_TIMEOUT: float = 10 # Таймаут установки соединения, сек
+    DB_COMMAND_TIMEOUT: float = 30 # Таймаут выполнения запроса, сек
+    DB_POOL_ACQUIRE_TIMEOUT: float = 10 # Ожидание свободного соединения в пуле, сек
+    DB_REPLICA_HEALTHCHECK_INTERVAL: float = 10 # Период проверки реплик, сек
+    DB_MAX_RESULT_ROWS: int = 100 # Сколько строк читать курсором для неагрегатных запросов
+    DB_PREPARED_CACHE_SIZE: int = 256 # Подготовленных выражений на одно соединение
+    DB_WARMUP_STATEMENTS: int = 20 # Сколько горячих шаблонов готовить на новом соединении
+    INDEX_ADVISOR_TOP_QUERIES: int = 5 # Сколько самых медленных запросов разбирать через EXPLAIN ANALYZE
+    INDEX_ADVISOR_RUNS: int = 5 # Повторов запроса для замера задержки до и после создания индекса
+    DB_COMBINE_WINDOW_MS: int = 5 # Окно сбора одновременных агрегатов по одной таблице в один запрос
+    DB_COMBINE_MAX_SIZE: int = 16 # Максимум агрегатов в одном запросе (1 - без объединения)
+    APPROXIMATE_COST_THRESHOLD: float = 100000.0 # Стоимость плана (EXPLAIN), с которой сначала отправляется оценка по выборке; 0 - отключить
+    APPROXIMATE_SAMPLE_PERCENT: float = 1.0 # Процент страниц video_snapshots в выборке TABLESAMPLE SYSTEM
+    ENTITY_INDEX_ERROR_RATE: float = 0.001 # Доля ложных «есть» в индексе известных id (фильтр Блума)
+    SNAPSHOT_RETENTION_DAYS: int = 30 # Снимки старше сворачиваются до одного на видео в день (scripts/compact_snapshots.py)
 
     YANDEX_API_KEY: str
     YANDEX_FOLDER_ID: str
+    YANDEX_GPT_STREAM: bool = True # Потоковый режим с обрезкой после первого SQL-запроса
+    YANDEX_GPT_TIMEOUT: float = 15 # Таймаут одной попытки, сек
+    GPT_MAX_RETRIES: int = 2 # Повторы при временных ошибках (таймаут, 429, 5xx)
+    GPT_HEDGE_DELAY: float = 3 # Задержка дублирующего запроса, пока нет статистики p95
+    GPT_BREAKER_FAILURES: int = 5 # Ошибок подряд до открытия выключателя
+    GPT_BREAKER_RESET_TIMEOUT: float = 30 # Через сколько секунд пробовать снова
+    GPT_BATCH_WINDOW_MS: int = 30 # Окно сбора вопросов в один запрос к YandexGPT
+    GPT_BATCH_MAX_SIZE: int = 8 # Максимум вопросов в пакете (1 - без пакетирования)
+    REQUEST_DEADLINE: float = 25 # Сколько секунд отводится на ответ на одно сообщение (все этапы вместе)
+    MULTI_QUESTION_MAX: int = 5 # Сколько вопросов из одного сообщения обрабатывать одновременно
+    CLASSIFIER_MODEL_PATH: str = "data/question_classifier.npz" # Модель классификатора вопросов (scripts/train_question_classifier.py); нет файла - фильтр по словам
+    CLASSIFIER_REJECT_THRESHOLD: float = 0.2 # Вопрос отклоняется без YandexGPT, если вероятность ответа числом ниже
+    CLASSIFIER_ROUTE_THRESHOLD: float = 0.8 # Уверенность, с которой таблица и агрегат передаются YandexGPT подсказкой
 
     REDIS_HOST: str 
     REDIS_PORT: int
@@ -28,6 +59,30 @@ class Settings(BaseSettings):
     # Настройки кеширования
     ENABLE_CACHE: bool
     MIN_CACHE_LENGTH: int # Минимальное кол-во запросов для кеширования
+    CACHE_READ_TIMEOUT: float = 1.0 # Ожидание чтения из Redis при ответе, сек; дольше - считаем промахом
+    CACHE_HISTORICAL_TTL: int = 30 * 24 * 3600 # Ответы за закрытый период: до новой загрузки данных, но не дольше
+    CACHE_SLIDING_TTL: int = 60 # Ответы относительно now() (скользящее окно), сек
+    CACHE_SOFT_TTL_RATIO: float = 0.8 # Доля TTL, после которой ответ отдается и обновляется в фоне
+    CACHE_XFETCH_BETA: float = 1.0 # Насколько рано (вероятностно) начинать фоновое обновление
+    CACHE_REFRESH_LOCK_TTL: int = 30 # Блокировка фонового обновления одного ключа, сек
+    CACHE_WARMUP_TOP_N: int = 50 # Сколько популярных вопросов прогревать при старте и после загрузки
+    CACHE_WARMUP_CONCURRENCY: int = 4 # Одновременных вопросов при прогреве (и запросов к YandexGPT)
+    NEGATIVE_CACHE_TTL: int = 300 # Сколько помнить вопросы без ответа (ошибка генерации, пустой результат), сек
+    NEGATIVE_CACHE_ERROR_TTL: int = 30 # Сколько помнить ошибки выполнения SQL, сек
+    POPULARITY_SKETCH_WIDTH: int = 2048 # Счетчиков в строке Count-Min sketch популярности вопросов
+    POPULARITY_SKETCH_DEPTH: int = 4 # Строк (хеш-функций) в sketch
+    POPULARITY_TOP_K: int = 200 # Сколько самых частых вопросов хранить с текстом и SQL
+    POPULARITY_DECAY_INTERVAL: int = 24 * 3600 # Раз в сколько секунд счетчики популярности делятся пополам
+    QUESTION_LOG_SIZE: int = 20000 # Сколько последних вопросов с исходом хранить для обучения классификатора
+    SEMANTIC_CACHE_SIZE: int = 5000 # Сколько вопросов с SQL держать для поиска похожих (вытесняются давно не использованные)
+    SEMANTIC_CACHE_DIM: int = 1024 # Размер вектора хешированных n-грамм вопроса
+    SEMANTIC_CACHE_THRESHOLD: float = 0.9 # Косинусное сходство, с которого SQL похожего вопроса используется без YandexGPT; > 1 - отключить
+    INGEST_STREAM: str = "ingest:videos" # Поток Redis, из которого scripts/ingest.py загружает видео и снимки
+    INGEST_DEAD_LETTER_STREAM: str = "ingest:videos:dead" # Куда откладываются сообщения, которые нельзя загрузить
+    INGEST_BATCH_SIZE: int = 1000 # Сообщений в одной пачке COPY
+    INGEST_BATCH_INTERVAL_MS: int = 500 # Сколько ждать добора неполной пачки
+    INGEST_GENERATION_INTERVAL: float = 30 # Не чаще раза в столько секунд менять поколение данных (сброс кеша ответов)
+    INGEST_REPORT_INTERVAL: float = 60 # Период отчета о пропускной способности и задержке, сек
 
     @property
     def database_url(self):
@@ -0,0 +1,98 @@
+import time
+import asyncio
+from contextlib import contextmanager
+from contextvars import Context, ContextVar
+from dataclasses import dataclass
+from typing import Coroutine, Iterable, Iterator, Optional, Sequence
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Время, отведенное на ответ, истекло"""
+
+
+@dataclass(slots=True)
+class Deadline:
+    """Момент (по time.monotonic), к которому ответ должен быть готов"""
+    expires_at: float
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(time.monotonic() + seconds)
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+
+# Срок текущего сообщения; копируется в задачи asyncio вместе с контекстом
+_current: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(seconds: float) -> Iterator[Deadline]:
+    """Задать срок для всего, что выполняется внутри блока (в том числе в порожденных задачах)"""
+    deadline = Deadline.after(seconds)
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def time_left(limit: Optional[float] = None) -> Optional[float]:
+    """Сколько времени может занять очередной этап.
+
+    limit - собственный таймаут этапа: результат не больше него и не больше
+    остатка срока. Без срока возвращается limit (None - без ограничения).
+    Если срок уже истек, выбрасывает DeadlineExceeded.
+    """
+    deadline = _current.get()
+    if deadline is None:
+        return limit
+    left = deadline.remaining()
+    if left <= 0:
+        raise DeadlineExceeded("Срок ответа истек")
+    return left if limit is None else min(limit, left)
+
+
+def deadline_expired() -> bool:
+    deadline = _current.get()
+    return deadline is not None and deadline.expired
+
+
+def latest_deadline(deadlines: Iterable[Optional[Deadline]]) -> Optional[Deadline]:
+    """Самый поздний из сроков; None, если хотя бы один из них не задан"""
+    latest = None
+    for deadline in deadlines:
+        if deadline is None:
+            return None
+        if latest is None or deadline.expires_at > latest.expires_at:
+            latest = deadline
+    return latest
+
+
+def create_shared_task(coro: Coroutine, futures: Sequence[asyncio.Future],
+                       deadlines: Iterable[Optional[Deadline]]) -> asyncio.Task:
+    """Задача, результат которой ждут несколько вызывающих (futures).
+
+    Выполняется в собственном контексте с самым поздним из их сроков, а не
+    в контексте того, кто ее запустил, и отменяется, когда отменены все ожидающие.
+    """
+    context = Context()
+    context.run(_current.set, latest_deadline(deadlines))
+    task = asyncio.create_task(coro, context=context)
+
+    def abandon(_):
+        if all(future.cancelled() for future in futures):
+            task.cancel()
+
+    for future in futures:
+        future.add_done_callback(abandon)
+    return task
@@ -4,6 +4,8 @@ from aiogram import Router, types
 from aiogram.filters import Command
 from aiogram.types import Message
 
+from app.services.db_service import QueryResult
+
 logger = logging.getLogger(__name__)
 router = Router()
 
@@ -31,8 +33,37 @@ def contains_non_numeric_keywords(query: str) -> bool:
     
     return False
 
-def format_numeric_result(results: list) -> str:
-    """Форматирует результаты запроса в простое текстовое представление чисел"""
+# Граница вопросов: после "?" или перед пунктом списка на новой строке ("1) ...", "2. ...", "- ...")
+_QUESTION_BOUNDARY = re.compile(r'(?<=\?)\s+|\n+(?=\s*(?:\d+[\).]|[-•*])\s)')
+_LIST_MARKER = re.compile(r'^\s*(?:\d+[\).]|[-•*])\s+')
+
+def split_questions(text: str) -> list:
+    """Разделить сообщение на отдельные вопросы.
+
+    Вопросы разделяются знаком "?" или оформлены списком по строкам;
+    перенос строки без этих признаков вопрос не разделяет.
+    """
+    parts = [_LIST_MARKER.sub('', part).strip() for part in _QUESTION_BOUNDARY.split(text)]
+    return [part for part in parts if part]
+
+def _format_value(value) -> str:
+    """Преобразует значение в строку, убирая дробные нули"""
+    if value is None:
+        return "Нет данных"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def format_numeric_result(results) -> str:
+    """Форматирует результаты запроса в простое текстовое представление чисел.
+
+    Принимает QueryResult, записи asyncpg или список словарей.
+    """
+    if isinstance(results, QueryResult):
+        if results.scalar:
+            return _format_value(results.value)
+        results = results.rows
+
     if not results:
         return "Нет данных"
     
@@ -41,21 +72,12 @@ def format_numeric_result(results: list) -> str:
         row = results[0]
         if len(row) == 1:
             # Извлекаем первое (и единственное) значение
-            value = list(row.values())[0]
-            if value is None:
-                return "Нет данных"
-            
-            # Преобразуем в строку, убирая дробные нули
-            if isinstance(value, (int, float)):
-                if isinstance(value, float) and value.is_integer():
-                    return str(int(value))
-                return str(value)
-            return str(value)
+            return _format_value(next(iter(row.values())))
     
     # Пытаемся извлечь числовые значения из результатов
     numeric_values = []
     for row in results:
-        for key, value in row.items():
+        for value in row.values():
             if isinstance(value, (int, float)):
                 if isinstance(value, float) and value.is_integer():
                     numeric_values.append(int(value))
@@ -69,4 +91,4 @@ def format_numeric_result(results: list) -> str:
             # Возвращаем все числовые значения через запятую
             return ", ".join(str(v) for v in numeric_values)
     
-    return "Нет числовых данных для ответа"
\ No newline at end of file
+    return "Нет числовых данных для ответа"
@@ -1,17 +1,185 @@
+import json
+import time
+import asyncio
 import logging
-from aiogram import Router, Bot
+from typing import Awaitable, Callable, Optional
+from aiogram import Router, Bot, F
 from aiogram.filters import Command
 from aiogram.types import Message
 
 from app.core.config import settings
+from app.core.deadline import current_deadline, deadline_expired, deadline_scope
 from app.services.gpt_service import gpt_service
+from app.services.gpt_batcher import gpt_batcher
 from app.services import db_service
-from app.services.cache_service import cache_service
-from .base import contains_non_numeric_keywords, format_numeric_result
+from app.services.cache_service import cache_service, FailureKind
+from app.services.sql_rewriter import rewrite_sargable
+from app.services.sql_guard import analyze_sql, UnsafeSQLError
+from app.services.index_advisor import index_advisor
+from app.services.approximate import approximator
+from app.services.entity_index import entity_index
+from app.services.semantic_cache import semantic_cache
+from app.services.question_classifier import question_classifier
+from .base import contains_non_numeric_keywords, format_numeric_result, split_questions
 
 logger = logging.getLogger(__name__)
 router = Router()
 
+# Ответы на неудачи; повтор того же вопроса получает их из негативного кеша
+FAILURE_MESSAGES = {
+    FailureKind.GENERATION_FAILED: "Не удалось сгенерировать запрос. Попробуйте сформулировать иначе.",
+    FailureKind.INVALID_SQL: "Сгенерирован некорректный запрос.",
+    FailureKind.EMPTY_RESULT: "По вашему запросу данных не найдено.",
+    FailureKind.DB_ERROR: "Произошла ошибка при обработке запроса",
+}
+
+
+GPT_UNAVAILABLE_MESSAGE = "Сервис генерации запросов временно недоступен. Попробуйте позже."
+ERROR_MESSAGE = "Произошла ошибка при обработке запроса"
+TIMEOUT_MESSAGE = "Не удалось ответить вовремя. Попробуйте еще раз позже."
+
+
+async def remember_failure(user_query: str, kind: FailureKind, generation: Optional[int] = None) -> str:
+    """Запомнить неудачу в негативном кеше (для поколения данных generation) и вернуть ответ на нее"""
+    await cache_service.save_negative_result(user_query, kind, generation)
+    await cache_service.log_question(user_query, kind.value)
+    return FAILURE_MESSAGES[kind]
+
+def route_question(user_query: str) -> Optional[str]:
+    """Текст вопроса для YandexGPT или None, если числом на него не ответить.
+
+    С обученной моделью (question_classifier) вопрос отклоняется при низкой
+    вероятности ответа числом, а уверенно предсказанные таблица и агрегат
+    добавляются к вопросу подсказкой. Без модели - фильтр по словам.
+    """
+    if question_classifier is None:
+        return None if contains_non_numeric_keywords(user_query) else user_query
+
+    prediction = question_classifier.predict(user_query)
+    if prediction.answerable < settings.CLASSIFIER_REJECT_THRESHOLD:
+        logger.info(f"Вопрос отклонен классификатором (p={prediction.answerable:.2f}): {user_query}")
+        return None
+    hint = prediction.hint(settings.CLASSIFIER_ROUTE_THRESHOLD)
+    return f"{user_query} {hint}" if hint else user_query
+
+async def within_deadline(answer: Awaitable[str]) -> str:
+    """Дождаться ответа не дольше остатка срока; по истечении все этапы отменяются"""
+    deadline = current_deadline()
+    try:
+        async with asyncio.timeout(deadline.remaining() if deadline else None):
+            return await answer
+    except TimeoutError:
+        logger.warning("⏱ Срок ответа истек, обработка вопроса отменена")
+        return TIMEOUT_MESSAGE
+
+async def answer_question(user_query: str, typing: Callable[[], Awaitable],
+                          on_estimate: Optional[Callable[[str], Awaitable]] = None,
+                          routed_query: Optional[str] = None) -> str:
+    """Ответить на один вопрос: кеш, генерация SQL, проверка и выполнение.
+
+    Возвращает текст ответа или сообщение о неудаче. typing вызывается перед
+    обращением к YandexGPT; on_estimate получает приблизительную оценку дорогого
+    агрегата, пока выполняется точный запрос (без него оценка не считается).
+    routed_query - вопрос с подсказкой классификатора для YandexGPT (route_question).
+    """
+    # Проверяем кеш
+    cached_result = await cache_service.get_cached_result(user_query)
+    if cached_result:
+        return cached_result
+    # Поколение данных до выполнения запроса: ответ по данным, которые успеют
+    # перезагрузить, сохранится уже устаревшим
+    generation = cache_service.generation
+    started = time.monotonic()
+
+    # Недавно уже не смогли ответить на этот вопрос - отвечаем сразу
+    failure = await cache_service.get_negative_result(user_query, generation)
+    if failure:
+        return FAILURE_MESSAGES[failure]
+
+    # Вопрос о креаторе или видео, которых нет в данных, - отвечаем сразу, без генерации и запроса
+    index_generation = cache_service.generation if cache_service.redis_client else None
+    unknown = entity_index.find_unknown(user_query, index_generation)
+    if unknown:
+        return unknown.message()
+
+    # Похожий вопрос уже задавали - берем его SQL с новыми значениями, без YandexGPT
+    similar = semantic_cache.lookup(user_query)
+    if similar is not None:
+        await semantic_cache.touch(cache_service.redis_client, similar)
+
+    # YandexGPT недоступен - отвечаем сразу, не дожидаясь таймаута
+    if similar is None and not gpt_service.is_available():
+        return GPT_UNAVAILABLE_MESSAGE
+
+    try:
+        if similar is not None:
+            sql = similar.sql
+        else:
+            await typing()
+            db_schema = await db_service.get_schema()
+
+            sql = await gpt_batcher.ask_gpt(routed_query or user_query, db_schema)
+
+            if not sql:
+                return await remember_failure(user_query, FailureKind.GENERATION_FAILED, generation)
+        
+        # Условия по датам - в диапазоны, чтобы работали индексы по created_at
+        sql = rewrite_sargable(sql)
+
+        # Разбираем запрос: только один SELECT по известным таблицам (безопасность)
+        try:
+            guarded = analyze_sql(sql, settings.DB_MAX_RESULT_ROWS)
+        except UnsafeSQLError as e:
+            logger.warning(f"Сгенерированный запрос отклонен: {e}, SQL: {sql}")
+            return await remember_failure(user_query, FailureKind.INVALID_SQL, generation)
+        logger.info(f"SQL запрос [{guarded.fingerprint}]: {guarded.sql}")
+        
+        # Дорогой агрегат по снимкам: пока считается точный ответ, отправляем оценку по выборке
+        exact = asyncio.create_task(db_service.fetch_result(guarded))
+        try:
+            if on_estimate is not None:
+                estimate = await approximator.estimate(guarded)
+                if estimate is not None and not exact.done():
+                    await on_estimate(estimate.format())
+            results = await exact
+        finally:
+            # При истечении срока точный запрос отменяется и освобождает соединение
+            if not exact.done():
+                exact.cancel()
+        
+        if results is None:
+            if deadline_expired():
+                # Не ошибка запроса: в следующий раз на него может хватить времени
+                return TIMEOUT_MESSAGE
+            return await remember_failure(user_query, FailureKind.DB_ERROR, generation)
+        if not results:
+            return await remember_failure(user_query, FailureKind.EMPTY_RESULT, generation)
+
+        await cache_service.record_sql_template(results.template)
+        
+        # Форматируем результат как простое число/числа
+        formatted_result = format_numeric_result(results)
+        
+        await cache_service.save_to_cache(
+            user_query, formatted_result, sql=guarded.sql,
+            generation=generation, compute_time=time.monotonic() - started
+        )
+        await cache_service.log_question(user_query, "answered", guarded.sql)
+        if similar is None:
+            await semantic_cache.add(cache_service.redis_client, user_query, guarded.sql)
+        return formatted_result
+
+    except Exception as e:
+        logger.error(f"Ошибка: {e}", exc_info=True)
+        return ERROR_MESSAGE
+
+async def refresh_answer(sql: str) -> Optional[str]:
+    """Пересчитать ответ по сохраненному SQL (фоновое обновление и прогрев кеша)"""
+    results = await db_service.fetch_result(sql)
+    if not results:
+        return None
+    return format_numeric_result(results)
+
 @router.message(Command("start"))
 async def cmd_start(message: Message):
     """Приветственное сообщение"""
@@ -40,6 +208,45 @@ async def cmd_start(message: Message):
 """
     await message.answer(welcome_text)
 
+@router.message(Command("stats"), F.from_user.id.in_(settings.ADMIN_ID))
+async def cmd_stats(message: Message):
+    """Метрики сервисов (только для администраторов)"""
+    metrics = {
+        "db_pools": db_service.pool_metrics(),
+        "prepared_statements": db_service.planning_report(),
+        "top_queries": db_service.query_report(),
+        "combiner": db_service.combiner.metrics,
+        "gpt": {"available": gpt_service.is_available(), **gpt_service.usage},
+        "cache": cache_service.get_metrics(),
+        "approximate": approximator.metrics,
+        "entity_index": entity_index.metrics,
+        "semantic_cache": {**semantic_cache.metrics, "size": semantic_cache.size},
+    }
+    await message.answer(json.dumps(metrics, ensure_ascii=False, indent=2))
+
+@router.message(Command("indexes"), F.from_user.id.in_(settings.ADMIN_ID))
+async def cmd_indexes(message: Message):
+    """Рекомендации индексов по самым медленным запросам (только для администраторов)"""
+    recommendations = await index_advisor.recommend()
+    if not recommendations:
+        await message.answer("Новых индексов не требуется.")
+        return
+
+    lines = [f"{rec.ddl()};\n— {rec.reason} (запросов: {len(rec.fingerprints)})" for rec in recommendations]
+    lines.append("\nСоздать: /create_indexes")
+    await message.answer("\n\n".join(lines))
+
+@router.message(Command("create_indexes"), F.from_user.id.in_(settings.ADMIN_ID))
+async def cmd_create_indexes(message: Message):
+    """Создать рекомендованные индексы и показать задержку до и после (только для администраторов)"""
+    if not index_advisor.last_recommendations:
+        await message.answer("Нет рекомендаций. Сначала выполните /indexes")
+        return
+
+    await message.answer(f"Создаю индексы: {len(index_advisor.last_recommendations)}...")
+    report = await index_advisor.apply()
+    await message.answer(json.dumps(report, ensure_ascii=False, indent=2))
+
 @router.message()
 async def handle_text(message: Message, bot: Bot):
     """Обработка текстовых запросов пользователя"""
@@ -47,6 +254,12 @@ async def handle_text(message: Message, bot: Bot):
     
     if not user_query:
         return
+
+    # Несколько вопросов в одном сообщении - отвечаем на все сразу
+    questions = split_questions(user_query)
+    if len(questions) > 1:
+        await answer_questions(message, bot, questions)
+        return
     
     if len(user_query) < 10:
         await message.answer(
@@ -59,8 +272,10 @@ async def handle_text(message: Message, bot: Bot):
         )
         return
 
-    # Проверяем, содержит ли запрос ключевые слова для нечисловых ответов
-    if contains_non_numeric_keywords(user_query):
+    # Вопросы, на которые не ответить числом, не отправляем в YandexGPT
+    routed_query = route_question(user_query)
+    if routed_query is None:
+        await cache_service.log_question(user_query, "rejected")
         await message.answer(
             "Я отвечаю только на количественные вопросы, которые можно ответить числом.\n\n"
             "Не могу ответить на вопросы со словами: 'какой', 'какие', 'кто', 'что', 'покажи', 'топ', 'список' и т.д.\n\n"
@@ -71,46 +286,62 @@ async def handle_text(message: Message, bot: Bot):
             "• Максимальное количество комментариев"
         )
         return
-    
-    # Проверяем кеш
-    cached_result = await cache_service.get_cached_result(user_query)
-    if cached_result:
-        await message.answer(cached_result)
-        return
-    
 
-    await bot.send_chat_action(message.chat.id, "typing")
-        
-    try:
-        db_schema = await db_service.get_schema()
-        
-        sql = await gpt_service.ask_gpt(user_query, db_schema)
-        
-        if not sql:
-            await message.answer("Не удалось сгенерировать запрос. Попробуйте сформулировать иначе.")
-            return
-        
-        # Проверяем, что запрос начинается с SELECT (безопасность)
-        if not sql.strip().upper().startswith('SELECT'):
-            await message.answer("Сгенерирован некорректный запрос.")
-            return
-        
-        logger.info(f"SQL запрос: {sql}")
-        
-        results = await db_service.execute_query(sql)
-        
-        if not results:
-            await message.answer("По вашему запросу данных не найдено.")
-            return
-        
-        # Форматируем результат как простое число/числа
-        formatted_result = format_numeric_result(results)
-        
-        await cache_service.save_to_cache(user_query, formatted_result)
+    approximate_message = None
 
-        # Отправляем только числовой ответ
-        await message.answer(f"{formatted_result}")     
+    async def typing():
+        await bot.send_chat_action(message.chat.id, "typing")
 
-    except Exception as e:
-        logger.error(f"Ошибка: {e}", exc_info=True)
-        await message.answer(f"Произошла ошибка при обработке запроса")
\ No newline at end of file
+    async def send_estimate(text: str):
+        nonlocal approximate_message
+        approximate_message = await message.answer(text)
+
+    with deadline_scope(settings.REQUEST_DEADLINE):
+        answer = await within_deadline(
+            answer_question(user_query, typing, on_estimate=send_estimate, routed_query=routed_query)
+        )
+
+    # Отправляем только числовой ответ (точным значением заменяем оценку)
+    if approximate_message is not None:
+        await approximate_message.edit_text(f"{answer}")
+    else:
+        await message.answer(f"{answer}")
+
+
+async def answer_questions(message: Message, bot: Bot, questions: list) -> None:
+    """Ответить на несколько вопросов одним сообщением.
+
+    Вопросы обрабатываются одновременно: генерация SQL попадает в один пакет
+    YandexGPT (gpt_batcher), запросы делят пул БД и объединяются в общий
+    проход по таблице, поэтому ответ приходит примерно за время самого
+    медленного вопроса.
+    """
+    skipped = len(questions) - settings.MULTI_QUESTION_MAX
+    questions = questions[:settings.MULTI_QUESTION_MAX]
+    typing_sent = False
+
+    async def typing():
+        nonlocal typing_sent
+        if not typing_sent:
+            typing_sent = True
+            await bot.send_chat_action(message.chat.id, "typing")
+
+    async def answer(question: str) -> str:
+        if len(question) < 10:
+            return "Вопрос слишком короткий."
+        routed_query = route_question(question)
+        if routed_query is None:
+            await cache_service.log_question(question, "rejected")
+            return "Отвечаю только на количественные вопросы."
+        return await within_deadline(answer_question(question, typing, routed_query=routed_query))
+
+    started = time.monotonic()
+    # Общий срок на все вопросы: не успевший вопрос получает сообщение о таймауте
+    with deadline_scope(settings.REQUEST_DEADLINE):
+        answers = await asyncio.gather(*(answer(question) for question in questions))
+    logger.info(f"Ответ на {len(questions)} вопросов за {time.monotonic() - started:.2f} с")
+
+    lines = [f"{i}. {question}\n{text}" for i, (question, text) in enumerate(zip(questions, answers), 1)]
+    if skipped > 0:
+        lines.append(f"Отвечаю не более чем на {settings.MULTI_QUESTION_MAX} вопросов за раз, пропущено: {skipped}.")
+    await message.answer("\n\n".join(lines))
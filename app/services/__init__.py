@@ -1,4 +1,5 @@
 from .gpt_service import gpt_service
+from .gpt_batcher import gpt_batcher
 from .db_service import db_service
 from .cache_service import cache_service
-__all__ = ['gpt_service', 'db_service', 'cache_service']
\ No newline at end of file
+__all__ = ['gpt_service', 'gpt_batcher', 'db_service', 'cache_service']
\ No newline at end of file
@@ -0,0 +1,191 @@
+import math
+import logging
+from dataclasses import dataclass
+from typing import Mapping, Optional
+
+import sqlglot
+from sqlglot import exp
+
+from app.core.config import settings
+from app.services.db_service import db_service
+from app.services.sql_guard import GuardedSQL, analyze_sql
+
+logger = logging.getLogger(__name__)
+
+# Таблица, полное чтение которой делает агрегаты медленными
+SAMPLED_TABLE = "video_snapshots"
+
+# Квантиль нормального распределения для 95% интервала
+_Z95 = 1.96
+
+
+@dataclass(slots=True)
+class Approximation:
+    """Запрос по выборке и способ пересчитать его результат в оценку.
+
+    kind: count - COUNT(*) / COUNT(col), sum - SUM(expr),
+    distinct - COUNT(DISTINCT col). fraction - доля таблицы в выборке.
+    """
+    guarded: GuardedSQL
+    kind: str
+    fraction: float
+
+
+@dataclass(slots=True)
+class Estimate:
+    """Оценка значения и границы 95% интервала"""
+    value: float
+    low: float
+    high: float
+    percent: float
+
+    def format(self) -> str:
+        return (f"≈ {_round(self.value)} (приблизительно, по {self.percent:g}% данных; "
+                f"95%: {_round(self.low)}–{_round(self.high)}). Уточняю...")
+
+
+def _round(value: float) -> str:
+    return str(int(round(value)))
+
+
+def _sampled(table: exp.Table, percent: float) -> exp.Table:
+    table = table.copy()
+    table.set("sample", exp.TableSample(method=exp.var("SYSTEM"), percent=exp.Literal.number(percent)))
+    return table
+
+
+def build_approximation(guarded: GuardedSQL, percent: float) -> Optional[Approximation]:
+    """Запрос по выборке TABLESAMPLE SYSTEM для одного агрегата по снимкам.
+
+    Поддерживается SELECT из одной таблицы video_snapshots без группировки,
+    подзапросов и соединений с единственной проекцией COUNT(*), COUNT(col),
+    SUM(expr) или COUNT(DISTINCT col). Для остальных запросов - None.
+    """
+    if not guarded.scalar or guarded.tables != {SAMPLED_TABLE}:
+        return None
+    tree = sqlglot.parse_one(guarded.sql, read="postgres")
+    if not isinstance(tree, exp.Select) or any(tree.args.get(arg) for arg in ("joins", "with", "distinct", "having")):
+        return None
+    tables = list(tree.find_all(exp.Table))
+    if len(tables) != 1 or tables[0].args.get("sample") or len(list(tree.find_all(exp.Select))) != 1:
+        return None
+
+    projection = tree.expressions[0].unalias()
+    fraction = percent / 100
+    where = tree.args.get("where")
+
+    if isinstance(projection, exp.Count) and isinstance(projection.this, exp.Distinct):
+        columns = projection.this.expressions
+        if len(columns) != 1 or not isinstance(columns[0], exp.Column):
+            return None
+        column = columns[0]
+        # Частоты значений в выборке: сколько всего различных и сколько встретились один раз
+        inner = exp.select(column.copy(), exp.alias_(exp.Count(this=exp.Star()), "c")) \
+            .from_(_sampled(tables[0], percent)) \
+            .where(exp.Not(this=exp.Is(this=column.copy(), expression=exp.Null()))) \
+            .group_by(column.copy())
+        if where is not None:
+            inner = inner.where(where.this.copy())
+        singletons = exp.Sum(this=exp.Case(
+            ifs=[exp.If(this=exp.EQ(this=exp.column("c"), expression=exp.Literal.number(1)),
+                        true=exp.Literal.number(1))],
+            default=exp.Literal.number(0),
+        ))
+        sample = exp.select(exp.alias_(exp.Count(this=exp.Star()), "d"), exp.alias_(singletons, "f1")) \
+            .from_(inner.subquery("sample"))
+        kind = "distinct"
+    elif isinstance(projection, exp.Count):
+        sample = tree.copy()
+        sample.set("expressions", [exp.alias_(projection.copy(), "n")])
+        kind = "count"
+    elif isinstance(projection, exp.Sum):
+        # Квадраты в numeric: произведение integer переполняется
+        value = exp.Cast(this=exp.Paren(this=projection.this.copy()), to=exp.DataType.build("numeric"))
+        sample = tree.copy()
+        sample.set("expressions", [
+            exp.alias_(projection.copy(), "s"),
+            exp.alias_(exp.Sum(this=exp.Mul(this=value.copy(), expression=value.copy())), "s2"),
+        ])
+        kind = "sum"
+    else:
+        return None
+
+    if kind != "distinct":
+        sample.find(exp.Table).replace(_sampled(tables[0], percent))
+    return Approximation(analyze_sql(sample.sql(dialect="postgres")), kind, fraction)
+
+
+def estimate_from_row(approximation: Approximation, row: Mapping) -> Optional[Estimate]:
+    """Пересчитать результат выборки в оценку по всей таблице.
+
+    COUNT и SUM - оценка Хорвица-Томпсона (сумма по выборке / доля выборки)
+    с дисперсией sum(x^2) * (1 - q) / q^2. COUNT(DISTINCT) - оценка GEE:
+    значения, встреченные в выборке один раз, умножаются на sqrt(1/q);
+    границы - от числа различных в выборке до случая, когда все такие
+    значения действительно редкие. SYSTEM выбирает страницы целиком, поэтому
+    при сильной корреляции значений со страницами интервал занижен.
+    Пустая выборка оценки не дает (None).
+    """
+    q = approximation.fraction
+    percent = q * 100
+
+    if approximation.kind == "distinct":
+        d, f1 = int(row["d"] or 0), int(row["f1"] or 0)
+        if not d:
+            return None
+        return Estimate(d - f1 + f1 / math.sqrt(q), d, d - f1 + f1 / q, percent)
+
+    if approximation.kind == "count":
+        n = int(row["n"] or 0)
+        if not n:
+            return None
+        value, spread = n / q, _Z95 * math.sqrt((1 - q) * n) / q
+        return Estimate(value, max(value - spread, n), value + spread, percent)
+
+    if row["s"] is None:
+        return None
+    value = float(row["s"]) / q
+    spread = _Z95 * math.sqrt((1 - q) * float(row["s2"] or 0)) / q
+    return Estimate(value, value - spread, value + spread, percent)
+
+
+class Approximator:
+    """Быстрая оценка дорогих агрегатов по снимкам.
+
+    Если планировщик оценивает запрос дороже APPROXIMATE_COST_THRESHOLD,
+    тот же агрегат считается по выборке APPROXIMATE_SAMPLE_PERCENT% страниц
+    таблицы. Оценка отправляется пользователю, пока выполняется точный запрос.
+    """
+
+    def __init__(self, db=db_service):
+        self.db = db
+        self.metrics = {"estimates": 0, "skipped_cheap": 0}
+
+    async def estimate(self, guarded: GuardedSQL) -> Optional[Estimate]:
+        threshold = settings.APPROXIMATE_COST_THRESHOLD
+        if not threshold:
+            return None
+        try:
+            approximation = build_approximation(guarded, settings.APPROXIMATE_SAMPLE_PERCENT)
+            if approximation is None:
+                return None
+            cost = await self.db.plan_cost(guarded.sql)
+            if cost is None or cost < threshold:
+                self.metrics["skipped_cheap"] += 1
+                return None
+            result = await self.db.fetch_result(approximation.guarded)
+        except Exception as e:
+            logger.warning(f"Не удалось получить оценку по выборке: {e}")
+            return None
+        if not result:
+            return None
+
+        row = {"n": result.value} if result.scalar else result.rows[0]
+        estimate = estimate_from_row(approximation, row)
+        if estimate is not None:
+            self.metrics["estimates"] += 1
+            logger.info(f"📐 Оценка по выборке [{guarded.fingerprint}] (стоимость плана {cost:.0f}): {estimate}")
+        return estimate
+
+
+approximator = Approximator()
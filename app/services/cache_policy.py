@@ -0,0 +1,121 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+from typing import List, Optional, Tuple
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ParseError
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Колонки времени, по которым ответ привязан к периоду
+TIME_COLUMNS = {"created_at", "video_created_at", "updated_at"}
+
+
+@dataclass(slots=True)
+class CachePolicy:
+    """Сколько хранить ответ и почему.
+
+    window: closed - период целиком в прошлом (ответ меняется только с новой
+    загрузкой данных), day - относительно CURRENT_DATE (до конца суток),
+    sliding - относительно now() (скользящее окно), open - без ограничения сверху.
+    """
+    ttl: int
+    window: str
+
+
+def _column(node: exp.Expression) -> Optional[exp.Column]:
+    """Колонка времени, в том числе внутри DATE(...) и ::date"""
+    while isinstance(node, (exp.Cast, exp.Date)):
+        node = node.this
+    if isinstance(node, exp.Column) and node.name in TIME_COLUMNS:
+        return node
+    return None
+
+
+def _moment(node: exp.Expression) -> Optional[datetime]:
+    """Значение литерала даты/времени в локальном времени без часового пояса"""
+    while isinstance(node, exp.Cast):
+        node = node.this
+    if not isinstance(node, exp.Literal) or not node.is_string:
+        return None
+    try:
+        moment = datetime.fromisoformat(node.this.strip())
+    except ValueError:
+        return None
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
+
+
+def _upper_bounds(tree: exp.Expression) -> Tuple[bool, List[Tuple[datetime, bool]]]:
+    """Есть ли условия по времени и их верхние границы (момент, граница исключена)"""
+    has_time_predicate = False
+    bounds = []
+
+    for predicate in tree.find_all(exp.Between):
+        if _column(predicate.this):
+            has_time_predicate = True
+            moment = _moment(predicate.args.get("high"))
+            if moment:
+                bounds.append((moment, False))
+
+    for predicate in tree.find_all(exp.EQ, exp.LT, exp.LTE, exp.GT, exp.GTE):
+        left, right = predicate.this, predicate.expression
+        if _column(left):
+            value, op = right, type(predicate)
+        elif _column(right):
+            # '2025-01-01' > created_at то же, что created_at < '2025-01-01'
+            value = left
+            op = {exp.LT: exp.GT, exp.LTE: exp.GTE, exp.GT: exp.LT, exp.GTE: exp.LTE}.get(type(predicate), exp.EQ)
+        else:
+            continue
+        has_time_predicate = True
+        moment = _moment(value)
+        if moment and op in (exp.LT, exp.LTE, exp.EQ):
+            bounds.append((moment, op is exp.LT))
+
+    return has_time_predicate, bounds
+
+
+def _seconds_until_next_day(now: datetime) -> int:
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), time())
+    return max(int((tomorrow - now).total_seconds()), 1)
+
+
+def cache_policy_for_sql(sql: str, now: Optional[datetime] = None,
+                         default_ttl: Optional[int] = None) -> CachePolicy:
+    """Выбрать TTL ответа по условиям на время в SQL.
+
+    Запросы от now()/CURRENT_TIMESTAMP живут CACHE_SLIDING_TTL, от CURRENT_DATE -
+    до начала следующих суток. Если верхняя граница периода целиком в прошлом,
+    ответ хранится CACHE_HISTORICAL_TTL: устаревает он только при новой загрузке
+    данных, что отслеживается поколением кеша. Остальное - default_ttl.
+    """
+    now = now or datetime.now()
+    default_ttl = default_ttl or settings.REDIS_CACHE_TTL
+    try:
+        tree = sqlglot.parse_one(sql, read="postgres")
+    except ParseError as e:
+        logger.debug(f"Не удалось разобрать SQL для выбора TTL: {e}")
+        return CachePolicy(default_ttl, "open")
+
+    if tree.find(exp.CurrentTimestamp):
+        return CachePolicy(settings.CACHE_SLIDING_TTL, "sliding")
+    if tree.find(exp.CurrentDate):
+        return CachePolicy(_seconds_until_next_day(now), "day")
+
+    has_time_predicate, bounds = _upper_bounds(tree)
+    if has_time_predicate and tree.find(exp.Or):
+        # Через OR период может остаться открытым - не рискуем
+        return CachePolicy(default_ttl, "open")
+    today = datetime.combine(now.date(), time())
+    if has_time_predicate and bounds and all(
+        moment <= today if exclusive else moment < today for moment, exclusive in bounds
+    ):
+        return CachePolicy(settings.CACHE_HISTORICAL_TTL, "closed")
+    return CachePolicy(default_ttl, "open")
+
@@ -1,19 +1,54 @@
 import json
+import math
+import time
+import random
+import asyncio
 import hashlib
 import logging
-from typing import Optional
+from enum import Enum
+from typing import Awaitable, Callable, Optional
 import redis.asyncio as redis
-from datetime import datetime
 
 from app.core.config import settings
+from app.core.deadline import time_left
+from app.services.cache_policy import CachePolicy, cache_policy_for_sql
+from app.services.popularity import PopularityTracker
 
 logger = logging.getLogger(__name__)
 
+# Счетчики выполнений шаблонов SQL (sorted set: шаблон -> число выполнений)
+SQL_TEMPLATES_KEY = "stats:sql_templates"
+# Поколение данных: увеличивается при каждой загрузке, ответы прошлых поколений устарели
+GENERATION_KEY = "cache:generation"
+# Последние вопросы с исходом обработки (список JSON) - разметка для классификатора вопросов
+QUESTION_LOG_KEY = "stats:questions:log"
+
+
+class FailureKind(str, Enum):
+    """Почему на вопрос не удалось ответить (значение в негативном кеше)"""
+    GENERATION_FAILED = "generation_failed"
+    INVALID_SQL = "invalid_sql"
+    EMPTY_RESULT = "empty_result"
+    DB_ERROR = "db_error"
+
+
 class CacheService:
     def __init__(self):
         self.redis_client: Optional[redis.Redis] = None
         self.ttl = settings.REDIS_CACHE_TTL
+        self.negative_ttl = settings.NEGATIVE_CACHE_TTL
+        self.negative_error_ttl = settings.NEGATIVE_CACHE_ERROR_TTL
         self.enabled = settings.ENABLE_CACHE
+        self.metrics = {"hits": 0, "negative_hits": 0, "misses": 0, "stale": 0, "refreshes": 0}
+        # Последнее прочитанное поколение данных
+        self.generation = 0
+        # Пересчет ответа по сохраненному SQL для фонового обновления
+        self.refresher: Optional[Callable[[str], Awaitable[Optional[str]]]] = None
+        self._refreshing = set()
+        self._tasks = set()
+        self.negative_hits_by_kind = {kind.value: 0 for kind in FailureKind}
+        # Частота вопросов: Count-Min sketch и top-K вместо хеша на каждый вопрос
+        self.popularity = PopularityTracker()
         
     async def connect(self):
         """Подключиться к Redis"""
@@ -61,73 +96,318 @@ class CacheService:
         """Генерация ключа для кеша на основе запроса"""
         query_hash = hashlib.md5(query.strip().lower().encode()).hexdigest()
         return f"cache:query:{query_hash}"
+
+    def _get_query_hash(self, query: str) -> str:
+        """Хеш вопроса в статистике популярности"""
+        return hashlib.md5(query.strip().lower().encode()).hexdigest()
+
+    def _get_negative_key(self, query: str, generation: Optional[int] = None) -> str:
+        """Ключ негативного кеша - поколение данных и тот же хеш запроса, что и у обычного.
+
+        После загрузки данных прежние неудачи («нет данных») не находятся.
+        """
+        query_hash = hashlib.md5(query.strip().lower().encode()).hexdigest()
+        return f"cache:neg:{self.generation if generation is None else generation}:{query_hash}"
     
     async def get_cached_result(self, query: str) -> Optional[str]:
-        """Получить закешированный результат"""
+        """Получить закешированный результат.
+
+        Ответ, сохраненный в прошлом поколении данных, считается устаревшим
+        и удаляется. Поколение читается тем же запросом к Redis (MGET).
+        Чтение дольше CACHE_READ_TIMEOUT (или остатка срока ответа) - промах.
+        """
         if not self.enabled or not self.redis_client:
             logger.debug("Кеширование отключено или Redis не подключен")
             return None
             
         try:
             cache_key = self._get_cache_key(query)
-            cached = await self.redis_client.get(cache_key)
+            generation, cached = await asyncio.wait_for(
+                self.redis_client.mget(GENERATION_KEY, cache_key), time_left(settings.CACHE_READ_TIMEOUT)
+            )
+            self.generation = int(generation or 0)
             
             if cached:
-                logger.info(f"✅ Найден кеш для запроса: '{query[:30]}...'")
-                return cached
+                entry = self._decode(cached)
+                if entry.get("generation", self.generation) == self.generation:
+                    self.metrics["hits"] += 1
+                    logger.info(f"✅ Найден кеш для запроса: '{query[:30]}...'")
+                    if self._should_refresh(entry):
+                        self._schedule_refresh(query, cache_key, entry)
+                    return entry["result"]
+                self.metrics["stale"] += 1
+                await self.redis_client.delete(cache_key)
+                logger.info(f"♻️ Кеш устарел после новой загрузки данных: '{query[:30]}...'")
             else:
+                self.metrics["misses"] += 1
                 logger.debug(f"❌ Кеш не найден для запроса: '{query[:30]}...'")
         except Exception as e:
             logger.error(f"Ошибка получения из кеша: {e}", exc_info=True)
             
         return None
+
+    @staticmethod
+    def _decode(cached: str) -> dict:
+        """Запись кеша: ответ, поколение, SQL и мягкий срок годности"""
+        try:
+            entry = json.loads(cached)
+        except ValueError:
+            entry = None
+        if not isinstance(entry, dict):
+            # Запись старого формата - просто текст ответа
+            return {"result": cached}
+        return entry
+
+    def _should_refresh(self, entry: dict, now: Optional[float] = None) -> bool:
+        """Пора ли обновить ответ в фоне.
+
+        Вероятностное раннее обновление (XFetch): чем ближе мягкий срок и чем
+        дольше считался ответ (delta), тем вероятнее обновление - обновления
+        популярных ключей размазываются во времени, а не совпадают.
+        """
+        soft_expiry = entry.get("soft_expiry")
+        if soft_expiry is None or not entry.get("sql") or self.refresher is None:
+            return False
+        now = time.time() if now is None else now
+        delta = entry.get("delta", 1.0)
+        return now - delta * settings.CACHE_XFETCH_BETA * math.log(1.0 - random.random()) >= soft_expiry
+
+    def _schedule_refresh(self, query: str, cache_key: str, entry: dict) -> None:
+        if cache_key in self._refreshing:
+            return
+        self._refreshing.add(cache_key)
+        task = asyncio.create_task(self._refresh(query, cache_key, entry))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(self, query: str, cache_key: str, entry: dict) -> None:
+        """Пересчитать ответ по сохраненному SQL; одновременно - только один процесс"""
+        lock_key = f"lock:refresh:{cache_key}"
+        locked = False
+        try:
+            locked = await self.redis_client.set(lock_key, "1", nx=True, ex=settings.CACHE_REFRESH_LOCK_TTL)
+            if not locked:
+                return
+            generation = self.generation
+            started = time.monotonic()
+            result = await self.refresher(entry["sql"])
+            if result is None:
+                return
+            await self._store(cache_key, result, entry["sql"], generation, time.monotonic() - started)
+            self.metrics["refreshes"] += 1
+            logger.info(f"🔁 Кеш обновлен в фоне: '{query[:30]}...' -> {result}")
+        except Exception as e:
+            logger.error(f"Ошибка фонового обновления кеша: {e}", exc_info=True)
+        finally:
+            self._refreshing.discard(cache_key)
+            if locked:
+                await self.redis_client.delete(lock_key)
+
+    def set_refresher(self, refresher: Callable[[str], Awaitable[Optional[str]]]) -> None:
+        """Задать функцию пересчета ответа по SQL (без нее записи не обновляются в фоне)"""
+        self.refresher = refresher
+
+    async def _store(self, cache_key: str, result: str, sql: Optional[str], generation: int,
+                     compute_time: Optional[float] = None) -> CachePolicy:
+        """Записать ответ: жесткий срок - TTL политики, мягкий - его доля CACHE_SOFT_TTL_RATIO"""
+        policy = cache_policy_for_sql(sql, default_ttl=self.ttl) if sql else CachePolicy(self.ttl, "open")
+        entry = {"result": result, "generation": generation}
+        if sql:
+            entry.update({
+                "sql": sql,
+                "soft_expiry": time.time() + policy.ttl * settings.CACHE_SOFT_TTL_RATIO,
+                "delta": round(compute_time or 1.0, 3),
+            })
+        await self.redis_client.setex(cache_key, policy.ttl, json.dumps(entry, ensure_ascii=False))
+        return policy
         
-    async def save_to_cache(self, query: str, result: str) -> None:
-        """Сохранить результат в кеш"""
+    async def save_to_cache(self, query: str, result: str, sql: Optional[str] = None,
+                            generation: Optional[int] = None, compute_time: Optional[float] = None) -> None:
+        """Сохранить результат в кеш.
+
+        TTL выбирается по условиям на время в sql (см. cache_policy_for_sql).
+        generation - поколение данных, прочитанное до выполнения запроса:
+        если данные успели перезагрузить, ответ сразу окажется устаревшим.
+        compute_time - сколько секунд считался ответ (для раннего обновления).
+        """
         if not self.enabled or not self.redis_client:
             logger.debug("Кеширование отключено или Redis не подключен")
             return
             
         try:
             # Проверяем, нужно ли кешировать (с учетом MIN_CACHE_LENGTH)
-            should_cache = await self._should_cache_query(query)
+            should_cache = await self._should_cache_query(query, sql)
             
             if should_cache:
                 cache_key = self._get_cache_key(query)
-                await self.redis_client.setex(cache_key, self.ttl, result)
-                logger.info(f"💾 Результат сохранен в кеш: '{query[:30]}...' -> {result}")
+                if generation is None:
+                    generation = int(await self.redis_client.get(GENERATION_KEY) or 0)
+                policy = await self._store(cache_key, result, sql, generation, compute_time)
+                logger.info(f"💾 Результат сохранен в кеш на {policy.ttl} с ({policy.window}): '{query[:30]}...' -> {result}")
             else:
                 logger.debug(f"⚠️ Запрос не достиг лимита для кеширования: '{query[:30]}...'")
                 
         except Exception as e:
             logger.error(f"Ошибка сохранения в кеш: {e}", exc_info=True)
+
+    async def store_answer(self, query: str, result: str, sql: Optional[str] = None,
+                           generation: Optional[int] = None, compute_time: Optional[float] = None) -> None:
+        """Сохранить ответ без проверки порога использования (прогрев кеша)"""
+        if not self.enabled or not self.redis_client:
+            return
+        if generation is None:
+            generation = int(await self.redis_client.get(GENERATION_KEY) or 0)
+        await self._store(self._get_cache_key(query), result, sql, generation, compute_time)
+
+    async def remember_sql(self, query: str, sql: str) -> None:
+        """Сохранить SQL вопроса, если он среди самых популярных"""
+        if not self.enabled or not self.redis_client:
+            return
+        await self.popularity.remember_sql(self.redis_client, self._get_query_hash(query), sql)
+
+    async def has_fresh_answer(self, query: str) -> bool:
+        """Есть ли в кеше ответ текущего поколения (без учета в метриках)"""
+        if not self.enabled or not self.redis_client:
+            return False
+        generation, cached = await self.redis_client.mget(GENERATION_KEY, self._get_cache_key(query))
+        self.generation = int(generation or 0)
+        return bool(cached) and self._decode(cached).get("generation", self.generation) == self.generation
+
+    async def get_popular_queries(self, limit: int) -> list:
+        """Самые частые вопросы из top-K: вопрос, оценка числа использований и SQL"""
+        if not self.enabled or not self.redis_client:
+            return []
+        try:
+            return await self.popularity.top(self.redis_client, limit)
+        except Exception as e:
+            logger.error(f"Ошибка чтения статистики вопросов: {e}", exc_info=True)
+            return []
+
+    async def get_generation(self) -> int:
+        """Прочитать текущее поколение данных"""
+        if self.enabled and self.redis_client:
+            try:
+                self.generation = int(await self.redis_client.get(GENERATION_KEY) or 0)
+            except Exception as e:
+                logger.error(f"Ошибка чтения поколения данных: {e}", exc_info=True)
+        return self.generation
+
+    async def bump_generation(self) -> Optional[int]:
+        """Начать новое поколение данных: все сохраненные ответы становятся устаревшими"""
+        if not self.enabled or not self.redis_client:
+            return None
+        try:
+            self.generation = await self.redis_client.incr(GENERATION_KEY)
+            logger.info(f"🔄 Новое поколение данных: {self.generation}")
+            return self.generation
+        except Exception as e:
+            logger.error(f"Ошибка смены поколения кеша: {e}", exc_info=True)
+            return None
             
-    async def _should_cache_query(self, query: str) -> bool:
-        """Определить, нужно ли кешировать запрос"""
+    async def get_negative_result(self, query: str, generation: Optional[int] = None) -> Optional[FailureKind]:
+        """Причина, по которой на этот вопрос недавно не удалось ответить.
+
+        generation - текущее поколение данных (None - прочитать из Redis):
+        неудачи прошлых поколений не учитываются.
+        """
+        if not self.enabled or not self.redis_client:
+            return None
         try:
-            # Сначала проверяем, есть ли уже кеш
-            cache_key = self._get_cache_key(query)
-            existing = await self.redis_client.get(cache_key)
-            if existing:
+            if generation is None:
+                generation = await self.get_generation()
+            cached = await asyncio.wait_for(
+                self.redis_client.get(self._get_negative_key(query, generation)),
+                time_left(settings.CACHE_READ_TIMEOUT)
+            )
+            if cached:
+                kind = FailureKind(cached)
+                self.metrics["negative_hits"] += 1
+                self.negative_hits_by_kind[kind.value] += 1
+                logger.info(f"🚫 Найден негативный кеш ({kind.value}) для запроса: '{query[:30]}...'")
+                return kind
+        except Exception as e:
+            logger.error(f"Ошибка получения из негативного кеша: {e}", exc_info=True)
+        return None
+
+    async def save_negative_result(self, query: str, kind: FailureKind, generation: Optional[int] = None) -> None:
+        """Запомнить неудачу, чтобы повтор того же вопроса не шел в YandexGPT и БД.
+
+        Ошибки выполнения SQL чаще временные, поэтому хранятся меньше.
+        generation - поколение данных, прочитанное до выполнения запроса
+        (None - текущее из Redis), как у save_to_cache.
+        """
+        if not self.enabled or not self.redis_client:
+            return
+        ttl = self.negative_error_ttl if kind is FailureKind.DB_ERROR else self.negative_ttl
+        try:
+            if generation is None:
+                generation = await self.get_generation()
+            await self.redis_client.setex(self._get_negative_key(query, generation), ttl, kind.value)
+            logger.info(f"💾 Неудача ({kind.value}) сохранена в негативный кеш на {ttl} с: '{query[:30]}...'")
+        except Exception as e:
+            logger.error(f"Ошибка сохранения в негативный кеш: {e}", exc_info=True)
+
+    async def log_question(self, query: str, outcome: str, sql: Optional[str] = None) -> None:
+        """Записать вопрос и исход его обработки в журнал (хранятся QUESTION_LOG_SIZE последних)"""
+        if not self.enabled or not self.redis_client:
+            return
+        entry = json.dumps({"q": query, "outcome": outcome, "sql": sql}, ensure_ascii=False)
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.lpush(QUESTION_LOG_KEY, entry)
+            pipe.ltrim(QUESTION_LOG_KEY, 0, settings.QUESTION_LOG_SIZE - 1)
+            await pipe.execute()
+        except Exception as e:
+            logger.error(f"Ошибка записи в журнал вопросов: {e}", exc_info=True)
+
+    async def get_question_log(self) -> list:
+        """Журнал вопросов: словари {"q", "outcome", "sql"}, новые первыми"""
+        if not self.enabled or not self.redis_client:
+            return []
+        try:
+            return [json.loads(entry) for entry in await self.redis_client.lrange(QUESTION_LOG_KEY, 0, -1)]
+        except Exception as e:
+            logger.error(f"Ошибка чтения журнала вопросов: {e}", exc_info=True)
+            return []
+
+    def get_metrics(self) -> dict:
+        """Попадания в обычный и негативный кеш"""
+        return {**self.metrics, "negative_hits_by_kind": dict(self.negative_hits_by_kind)}
+
+    async def record_sql_template(self, template: str) -> None:
+        """Учесть выполнение шаблона SQL (для прогрева подготовленных выражений)"""
+        if not self.enabled or not self.redis_client or not template:
+            return
+        try:
+            await self.redis_client.zincrby(SQL_TEMPLATES_KEY, 1, template)
+        except Exception as e:
+            logger.error(f"Ошибка учета шаблона SQL: {e}", exc_info=True)
+
+    async def get_hot_sql_templates(self, limit: int) -> list:
+        """Самые частые шаблоны SQL"""
+        if not self.enabled or not self.redis_client:
+            return []
+        try:
+            return await self.redis_client.zrevrange(SQL_TEMPLATES_KEY, 0, limit - 1)
+        except Exception as e:
+            logger.error(f"Ошибка получения популярных шаблонов SQL: {e}", exc_info=True)
+            return []
+
+    async def _should_cache_query(self, query: str, sql: Optional[str] = None) -> bool:
+        """Определить, нужно ли кешировать запрос.
+
+        Проверка наличия ответа и учет вопроса в sketch популярности - один
+        вызов Lua-скрипта. SQL сохраняется для вопросов из top-K - по нему
+        прогрев заполняет кеш без обращения к YandexGPT.
+        """
+        try:
+            exists, usage_count = await self.popularity.record(
+                self.redis_client, self._get_query_hash(query), query, self._get_cache_key(query)
+            )
+            if exists:
                 return False  # Уже есть в кеше, не нужно повторно сохранять
-            
-            # Проверяем статистику использования
-            stats_key = f"stats:query:{hashlib.md5(query.strip().lower().encode()).hexdigest()}"
-            
-            # Увеличиваем счетчик использования
-            usage_count = await self.redis_client.hincrby(stats_key, "usage_count", 1)
-            
-            if usage_count == 1:
-                # Первое использование
-                await self.redis_client.hset(stats_key, mapping={
-                    "first_used": datetime.now().isoformat(),
-                    "last_used": datetime.now().isoformat(),
-                    "query": query[:500]
-                })
-                await self.redis_client.expire(stats_key, 7 * 24 * 3600)
-            else:
-                # Обновляем время последнего использования
-                await self.redis_client.hset(stats_key, "last_used", datetime.now().isoformat())
+            if sql:
+                await self.popularity.remember_sql(self.redis_client, self._get_query_hash(query), sql)
             
             # Кешируем, если достигли порога
             if usage_count >= settings.MIN_CACHE_LENGTH:
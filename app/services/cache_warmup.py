@@ -0,0 +1,99 @@
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+from app.core.config import settings
+from app.services.cache_service import cache_service
+from app.services.db_service import db_service
+from app.services.gpt_batcher import gpt_batcher
+from app.services.sql_guard import analyze_sql
+from app.services.sql_rewriter import rewrite_sargable
+
+logger = logging.getLogger(__name__)
+
+
+async def generate_sql(user_query: str) -> Optional[str]:
+    """SQL для вопроса, которого нет в статистике: YandexGPT, переписывание дат и проверка"""
+    db_schema = await db_service.get_schema()
+    sql = await gpt_batcher.ask_gpt(user_query, db_schema)
+    if not sql:
+        return None
+    return analyze_sql(rewrite_sargable(sql), settings.DB_MAX_RESULT_ROWS).sql
+
+
+async def warm_up_cache(compute: Optional[Callable[[str], Awaitable[Optional[str]]]] = None,
+                        generate: Optional[Callable[[str], Awaitable[Optional[str]]]] = generate_sql,
+                        limit: Optional[int] = None, concurrency: Optional[int] = None) -> dict:
+    """Заполнить кеш ответами на самые популярные вопросы.
+
+    Вопросы берутся из top-K популярности (см. PopularityTracker). Для первых
+    limit вопросов без свежего ответа выполняется сохраненный SQL, а если его
+    нет - SQL генерируется (generate=None отключает генерацию). Одновременно
+    обрабатывается не больше concurrency вопросов - это же бюджет запросов
+    к YandexGPT. Возвращает отчет с числом прогретых вопросов и длительностью.
+    """
+    compute = compute or cache_service.refresher
+    limit = limit or settings.CACHE_WARMUP_TOP_N
+    report = {"total": 0, "warmed": 0, "generated": 0, "fresh": 0, "failed": 0, "duration_s": 0.0}
+    if compute is None or not cache_service.redis_client:
+        logger.info("Прогрев кеша пропущен: кеш не подключен")
+        return report
+
+    started = time.monotonic()
+    popular = await cache_service.get_popular_queries(limit)
+    report["total"] = len(popular)
+    semaphore = asyncio.Semaphore(concurrency or settings.CACHE_WARMUP_CONCURRENCY)
+    done = 0
+
+    async def warm(item: dict) -> None:
+        nonlocal done
+        query = item["query"]
+        async with semaphore:
+            try:
+                if await cache_service.has_fresh_answer(query):
+                    report["fresh"] += 1
+                    return
+
+                generation = cache_service.generation
+                item_started = time.monotonic()
+                sql = item["sql"]
+                if not sql and generate is not None:
+                    sql = await generate(query)
+                    if sql:
+                        report["generated"] += 1
+                        await cache_service.remember_sql(query, sql)
+                result = await compute(sql) if sql else None
+                if result is None:
+                    report["failed"] += 1
+                    return
+
+                await cache_service.store_answer(query, result, sql, generation, time.monotonic() - item_started)
+                report["warmed"] += 1
+            except Exception as e:
+                report["failed"] += 1
+                logger.warning(f"Не удалось прогреть вопрос '{query[:30]}...': {e}")
+            finally:
+                done += 1
+                if done % 10 == 0 or done == report["total"]:
+                    logger.info(f"🔥 Прогрев кеша: {done}/{report['total']}")
+
+    await asyncio.gather(*(warm(item) for item in popular))
+    report["duration_s"] = round(time.monotonic() - started, 2)
+    logger.info(f"✅ Прогрев кеша завершен: {report}")
+    return report
+
+
+async def run_standalone_warmup() -> dict:
+    """Прогрев вне бота (например, после загрузки данных): подключиться, прогреть, отключиться"""
+    # Импорт здесь: обработчики сами зависят от сервисов
+    from app.handlers.user_handlers import refresh_answer
+
+    await cache_service.connect()
+    cache_service.set_refresher(refresh_answer)
+    try:
+        await db_service.connect()
+        return await warm_up_cache()
+    finally:
+        await db_service.disconnect()
+        await cache_service.disconnect()
@@ -0,0 +1,78 @@
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых узел считается недоступным (в отличие от ошибок SQL)
+CONNECTION_ERRORS = (
+    OSError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    asyncpg.CannotConnectNowError,
+)
+
+
+class PoolHandle:
+    """Пул соединений к одному узлу PostgreSQL и его состояние для балансировки"""
+
+    def __init__(self, name: str, dsn: Optional[str], pool: Optional[asyncpg.Pool] = None):
+        self.name = name
+        self.dsn = dsn
+        self.pool = pool
+        self.healthy = pool is not None
+        self.outstanding = 0
+        self.queries = 0
+        self.failures = 0
+
+    @asynccontextmanager
+    async def acquire(self, timeout: Optional[float] = None):
+        """Взять соединение, учитывая число выполняющихся запросов"""
+        self.outstanding += 1
+        self.queries += 1
+        try:
+            async with self.pool.acquire(timeout=timeout) as conn:
+                yield conn
+        finally:
+            self.outstanding -= 1
+
+    def mark_failed(self, error: Exception) -> None:
+        """Исключить узел из балансировки до успешной проверки здоровья"""
+        self.failures += 1
+        if self.healthy:
+            logger.warning(f"Узел {self.name} исключен из балансировки: {error}")
+        self.healthy = False
+
+    def mark_healthy(self) -> None:
+        if not self.healthy:
+            logger.info(f"Узел {self.name} снова доступен")
+        self.healthy = True
+
+    def metrics(self) -> dict:
+        """Загрузка пула: размер, свободные соединения, доля занятых от максимума"""
+        if self.pool is None:
+            return {"healthy": False, "outstanding": self.outstanding,
+                    "queries": self.queries, "failures": self.failures}
+        size = self.pool.get_size()
+        idle = self.pool.get_idle_size()
+        max_size = self.pool.get_max_size()
+        return {
+            "healthy": self.healthy,
+            "size": size,
+            "idle": idle,
+            "max_size": max_size,
+            "utilization": round((size - idle) / max_size, 2) if max_size else 0.0,
+            "outstanding": self.outstanding,
+            "queries": self.queries,
+            "failures": self.failures,
+        }
+
+
+def pick_least_outstanding(handles: list) -> Optional[PoolHandle]:
+    """Здоровый узел с наименьшим числом выполняющихся запросов"""
+    healthy = [handle for handle in handles if handle.healthy and handle.pool is not None]
+    if not healthy:
+        return None
+    return min(healthy, key=lambda handle: handle.outstanding)
@@ -1,21 +1,226 @@
+import json
+import time
+import asyncio
 import asyncpg
 import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, Sequence, Union
 from app.core.config import settings
+from app.core.deadline import current_deadline, time_left
+from app.services.sql_params import parameterize_sql, coerce_params, UnsupportedParamType
+from app.services.sql_guard import GuardedSQL, UnsafeSQLError, analyze_sql
+from app.services.query_combiner import QueryCombiner
+from app.services.db_pools import PoolHandle, CONNECTION_ERRORS, pick_least_outstanding
 
 logger = logging.getLogger(__name__)
 
+# Сколько разных запросов (по отпечатку) хранить в статистике
+_MAX_TRACKED_QUERIES = 1000
+
+
+def _deadline_timeout() -> dict:
+    """Таймаут запроса по остатку срока ответа (без срока действует command_timeout пула).
+
+    По таймауту asyncpg отменяет запрос на сервере и возвращает соединение в пул.
+    """
+    deadline = current_deadline()
+    if deadline is None:
+        return {}
+    return {"timeout": time_left(settings.DB_COMMAND_TIMEOUT)}
+
+
+@dataclass(slots=True)
+class QueryResult:
+    """Результат запроса без промежуточных словарей.
+
+    Для запроса с одним агрегатом хранится только значение (scalar=True),
+    для остальных - записи asyncpg как есть, не более max_rows штук.
+    """
+    value: Any = None
+    rows: Sequence[asyncpg.Record] = ()
+    scalar: bool = False
+    truncated: bool = False
+    template: Optional[str] = None
+    fingerprint: Optional[str] = None
+
+    def __bool__(self) -> bool:
+        return self.scalar or bool(self.rows)
+
+
+class PreparedConnection(asyncpg.Connection):
+    """Соединение с собственным LRU подготовленных выражений.
+
+    В отличие от conn.prepare(), повторная подготовка того же шаблона на этом
+    соединении не обращается к серверу.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._prepared = OrderedDict()
+
+    async def prepare_cached(self, template: str):
+        """Вернуть подготовленное выражение и признак того, что его пришлось готовить"""
+        stmt = self._prepared.get(template)
+        if stmt is not None:
+            self._prepared.move_to_end(template)
+            return stmt, False
+
+        stmt = await self.prepare(template)
+        self._prepared[template] = stmt
+        if len(self._prepared) > settings.DB_PREPARED_CACHE_SIZE:
+            self._prepared.popitem(last=False)
+        return stmt, True
+
+
 class SimpleDatabase:
     def __init__(self):
         self.pool = None
+        self.primary = PoolHandle("primary", None)
+        self.replicas = []
+        self._health_task = None
+        self.hot_statements = ()
+        # Шаблоны, которые не удалось выполнить с параметрами
+        self._raw_only = set()
+        self.prepared_stats = {"prepares": 0, "reuses": 0, "prepare_ms": 0.0}
+        # Статистика по отпечаткам запросов: число выполнений и время
+        self.query_stats = {}
+        self.combiner = QueryCombiner(self._execute)
     
-    async def connect(self):
-        """Подключиться к базе данных"""
+    async def connect(self, hot_statements: Sequence[str] = ()):
+        """Подключиться к базе данных.
+
+        hot_statements - популярные шаблоны SQL, которые заранее готовятся
+        на каждом новом соединении пула.
+        """
         if not self.pool:
-            self.pool = await asyncpg.create_pool(
-                dsn=settings.database_url,
-                min_size=1,
-                max_size=5
-            )
+            self.hot_statements = tuple(hot_statements)
+            self.pool = await self._create_pool(settings.database_url)
+
+            # Реплики только для чтения; недоступная при старте реплика
+            # подключится при следующей проверке здоровья
+            for i, dsn in enumerate(settings.DB_REPLICA_URLS, 1):
+                replica = PoolHandle(f"replica-{i}", dsn)
+                try:
+                    replica.pool = await self._create_pool(dsn)
+                    replica.healthy = True
+                except Exception as e:
+                    replica.mark_failed(e)
+                self.replicas.append(replica)
+            if self.replicas:
+                self._health_task = asyncio.create_task(self._health_check_loop())
+
+    async def _create_pool(self, dsn: str) -> asyncpg.Pool:
+        return await asyncpg.create_pool(
+            dsn=dsn,
+            min_size=settings.DB_POOL_MIN_SIZE,
+            max_size=settings.DB_POOL_MAX_SIZE,
+            timeout=settings.DB_CONNECT_TIMEOUT,
+            command_timeout=settings.DB_COMMAND_TIMEOUT,
+            connection_class=PreparedConnection,
+            init=self._init_connection
+        )
+
+    async def disconnect(self):
+        """Закрыть все пулы"""
+        if self._health_task:
+            self._health_task.cancel()
+        for replica in self.replicas:
+            if replica.pool:
+                await replica.pool.close()
+        if self.pool:
+            await self.pool.close()
+
+    async def _health_check_loop(self) -> None:
+        """Периодически проверять реплики и возвращать восстановившиеся в балансировку"""
+        while True:
+            await asyncio.sleep(settings.DB_REPLICA_HEALTHCHECK_INTERVAL)
+            await asyncio.gather(*(self._check_replica(replica) for replica in self.replicas))
+
+    async def _check_replica(self, replica: PoolHandle) -> None:
+        try:
+            if replica.pool is None:
+                replica.pool = await self._create_pool(replica.dsn)
+            await replica.pool.fetchval("SELECT 1", timeout=settings.DB_CONNECT_TIMEOUT)
+            replica.mark_healthy()
+        except Exception as e:
+            replica.mark_failed(e)
+
+    async def _run_read(self, work, primary: bool = False):
+        """Выполнить читающую операцию work(conn) на наименее загруженной реплике.
+
+        Если реплик нет или реплика отказала по соединению, она исключается
+        из балансировки, а операция повторяется на основном узле. primary -
+        читать только с основного узла (отставание реплики недопустимо).
+        """
+        self.primary.pool = self.pool
+        replica = None if primary else pick_least_outstanding(self.replicas)
+        if replica is not None:
+            try:
+                async with replica.acquire(timeout=time_left(settings.DB_POOL_ACQUIRE_TIMEOUT)) as conn:
+                    return await work(conn)
+            except CONNECTION_ERRORS as e:
+                replica.mark_failed(e)
+
+        async with self.primary.acquire(timeout=time_left(settings.DB_POOL_ACQUIRE_TIMEOUT)) as conn:
+            return await work(conn)
+
+    def pool_metrics(self) -> dict:
+        """Загрузка всех пулов"""
+        self.primary.pool = self.pool
+        return {handle.name: handle.metrics() for handle in [self.primary, *self.replicas]}
+
+    async def _init_connection(self, conn: PreparedConnection) -> None:
+        """Прогрев нового соединения: подготовка горячих шаблонов"""
+        if not self.hot_statements:
+            return
+        started = time.perf_counter()
+        prepared = 0
+        for template in self.hot_statements:
+            try:
+                await conn.prepare_cached(template)
+                prepared += 1
+            except Exception as e:
+                logger.debug(f"Не удалось подготовить шаблон {template}: {e}")
+        logger.info(f"Соединение прогрето: {prepared} шаблонов за {(time.perf_counter() - started) * 1000:.1f} мс")
+
+    def planning_report(self) -> dict:
+        """Сколько времени на разбор и планирование сэкономило повторное использование выражений"""
+        prepares = self.prepared_stats["prepares"]
+        avg_prepare_ms = self.prepared_stats["prepare_ms"] / prepares if prepares else 0.0
+        return {
+            "prepares": prepares,
+            "reuses": self.prepared_stats["reuses"],
+            "avg_prepare_ms": round(avg_prepare_ms, 3),
+            "saved_ms": round(avg_prepare_ms * self.prepared_stats["reuses"], 1),
+        }
+    
+    def _record_query(self, guarded: GuardedSQL, elapsed_ms: float) -> None:
+        stats = self.query_stats.get(guarded.fingerprint)
+        if stats is None:
+            if len(self.query_stats) >= _MAX_TRACKED_QUERIES:
+                return
+            stats = self.query_stats[guarded.fingerprint] = {
+                "sql": guarded.normalized, "sample": guarded.sql,
+                "calls": 0, "total_ms": 0.0, "max_ms": 0.0
+            }
+        stats["calls"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+    def query_report(self, limit: int = 10) -> list:
+        """Самые затратные запросы по суммарному времени выполнения"""
+        top = sorted(self.query_stats.items(), key=lambda item: item[1]["total_ms"], reverse=True)[:limit]
+        return [
+            {
+                "fingerprint": fingerprint,
+                "sql": stats["sql"],
+                "calls": stats["calls"],
+                "avg_ms": round(stats["total_ms"] / stats["calls"], 2),
+                "max_ms": round(stats["max_ms"], 2),
+            }
+            for fingerprint, stats in top
+        ]
     
     async def get_schema(self) -> str:
         """Получить простую схему базы данных"""
@@ -36,6 +241,7 @@ class SimpleDatabase:
 2. ТАБЛИЦА "video_snapshots" (исторические снапшоты статистики):
    - id: UUID (первичный ключ)
    - video_id: UUID (ссылка на видео из таблицы videos, ВНЕШНИЙ КЛЮЧ)
+   - creator_id: UUID (креатор видео, то же значение, что videos.creator_id)
    - views_count: INTEGER (количество просмотров на момент снапшота)
    - likes_count: INTEGER (количество лайков на момент снапшота)
    - comments_count: INTEGER (количество комментариев на момент снапшота)
@@ -61,7 +267,8 @@ class SimpleDatabase:
    
 3. Если запрос содержит слова "итоговая статистика", "итоговый", "по итогам", "общее" - используй таблицу "videos"
 
-4. Для фильтрации по креатору используй поле videos.creator_id
+4. Для фильтрации по креатору используй поле creator_id той таблицы, из которой считаешь:
+   videos.creator_id для итоговой статистики, video_snapshots.creator_id для истории (без JOIN с videos)
 
 ПРИМЕРЫ ПРАВИЛЬНЫХ SQL-ЗАПРОСОВ:
 
@@ -83,45 +290,180 @@ class SimpleDatabase:
 6. Запрос: "Изменение просмотров за последний день (для снапшотов)"
    SQL: SELECT SUM(delta_views_count) FROM video_snapshots WHERE created_at >= CURRENT_DATE - INTERVAL '1 day'
 
+7. Запрос: "На сколько выросли просмотры видео креатора X 27 ноября 2025?"
+   SQL: SELECT SUM(delta_views_count) FROM video_snapshots WHERE creator_id = 'X' AND created_at >= '2025-11-27' AND created_at < '2025-11-28'
+
 ВАЖНО: Для запросов об итоговой статистике видео НЕ используй таблицу video_snapshots!
 """
     
     async def execute_query(self, sql: str) -> list:
-        """Выполнить SQL-запрос и вернуть результаты"""
-        if not sql.strip().upper().startswith('SELECT'):
-            logger.warning(f"Попытка выполнить не SELECT запрос: {sql}")
+        """Выполнить SQL-запрос и вернуть записи asyncpg (без копирования в словари)"""
+        try:
+            guarded = analyze_sql(sql, settings.DB_MAX_RESULT_ROWS)
+        except UnsafeSQLError as e:
+            logger.warning(f"Запрос отклонен: {e}, SQL: {sql}")
             return []
         
         await self.connect()
         
         try:
-            async with self.pool.acquire() as conn:
-                rows = await conn.fetch(sql)
-                result = []
-                for row in rows:
-                    # Преобразуем каждую строку в словарь
-                    row_dict = {}
-                    for key in row.keys():
-                        row_dict[key] = row[key]
-                    result.append(row_dict)
-                return result
+            return await self._run_read(lambda conn: conn.fetch(guarded.sql))
         except Exception as e:
             logger.error(f"Ошибка выполнения SQL запроса: {e}, SQL: {sql}")
             return []
-    
+
+    async def fetch_result(self, sql: Union[str, GuardedSQL],
+                           max_rows: Optional[int] = None) -> Optional[QueryResult]:
+        """Выполнить SELECT и вернуть компактный результат.
+
+        sql - текст или уже проверенный analyze_sql запрос; непрошедший
+        проверку запрос в пул не попадает. Литералы выносятся в параметры,
+        чтобы запросы с разными значениями переиспользовали одно подготовленное
+        выражение. Запрос с одним агрегатом выполняется через fetchval,
+        остальные ограничены LIMIT и читаются курсором не больше чем на
+        max_rows строк. Одновременные агрегаты по одной таблице объединяются
+        в один проход (QueryCombiner). При ошибке возвращает None.
+        """
+        max_rows = max_rows or settings.DB_MAX_RESULT_ROWS
+        if isinstance(sql, GuardedSQL):
+            guarded = sql
+        else:
+            try:
+                guarded = analyze_sql(sql, max_rows)
+            except UnsafeSQLError as e:
+                logger.warning(f"Запрос отклонен: {e}, SQL: {sql}")
+                return None
+
+        if guarded.scalar:
+            return await self.combiner.fetch_result(guarded)
+        return await self._execute(guarded, max_rows)
+
+    async def _execute(self, guarded: GuardedSQL, max_rows: Optional[int] = None) -> Optional[QueryResult]:
+        """Выполнить проверенный запрос (подготовленное выражение или курсор)"""
+        max_rows = max_rows or settings.DB_MAX_RESULT_ROWS
+        sql = guarded.sql
+        scalar = guarded.scalar
+        template, params = parameterize_sql(sql)
+        await self.connect()
+
+        async def work(conn):
+            if params and template not in self._raw_only:
+                result = await self._fetch_prepared(conn, template, params, scalar, max_rows)
+                if result is not None:
+                    return result
+
+            if scalar:
+                return QueryResult(value=await conn.fetchval(sql, **_deadline_timeout()), scalar=True, template=template)
+
+            # Курсор работает только внутри транзакции
+            async with conn.transaction(readonly=True):
+                cursor = await conn.cursor(sql)
+                rows = await cursor.fetch(max_rows + 1, **_deadline_timeout())
+            return QueryResult(rows=rows[:max_rows], truncated=len(rows) > max_rows, template=template)
+
+        try:
+            started = time.perf_counter()
+            result = await self._run_read(work)
+        except Exception as e:
+            logger.error(f"Ошибка выполнения SQL запроса: {e}, SQL: {sql}")
+            return None
+        self._record_query(guarded, (time.perf_counter() - started) * 1000)
+        result.fingerprint = guarded.fingerprint
+        return result
+
+    async def plan_cost(self, sql: str) -> Optional[float]:
+        """Стоимость запроса по оценке планировщика (EXPLAIN без выполнения)"""
+        await self.connect()
+        try:
+            plan = await self._run_read(lambda conn: conn.fetchval(f"EXPLAIN (FORMAT JSON) {sql}"))
+        except Exception as e:
+            logger.warning(f"Не удалось получить план запроса: {e}, SQL: {sql}")
+            return None
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]["Plan"]["Total Cost"]
+
+    async def scan_column(self, sql: str, consume: Callable[[list], None], chunk_size: int = 50000,
+                          primary: bool = False) -> int:
+        """Прочитать первую колонку запроса частями по chunk_size значений.
+
+        Для служебных полных проходов (индекс известных id): значения не
+        копятся в памяти, а передаются consume по мере чтения курсором.
+        primary - читать с основного узла, а не с реплики.
+        Возвращает число прочитанных строк.
+        """
+        await self.connect()
+
+        async def work(conn):
+            total = 0
+            async with conn.transaction(readonly=True):
+                cursor = await conn.cursor(sql)
+                while rows := await cursor.fetch(chunk_size):
+                    consume([row[0] for row in rows])
+                    total += len(rows)
+            return total
+
+        return await self._run_read(work, primary=primary)
+
+    async def _fetch_prepared(self, conn, template: str, params: list, scalar: bool,
+                              max_rows: int) -> Optional[QueryResult]:
+        """Выполнить шаблон через подготовленное выражение соединения.
+
+        Если шаблон не готовится или тип его параметра не поддерживается, он
+        запоминается и дальше выполняется исходным текстом (None). Если к типу
+        не приводится только значение (views_count > 1.5 для целого), исходным
+        текстом выполняется лишь этот запрос.
+        """
+        try:
+            started = time.perf_counter()
+            stmt, fresh = await conn.prepare_cached(template)
+            if fresh:
+                self.prepared_stats["prepares"] += 1
+                self.prepared_stats["prepare_ms"] += (time.perf_counter() - started) * 1000
+            else:
+                self.prepared_stats["reuses"] += 1
+            args = coerce_params(params, stmt.get_parameters(), conn.get_settings().TimeZone)
+        except CONNECTION_ERRORS:
+            raise
+        except UnsupportedParamType as e:
+            self._remember_raw_only(template, e)
+            return None
+        except (ValueError, ArithmeticError) as e:
+            # Не подходит только это значение - для других значений шаблон по-прежнему готовится
+            logger.debug(f"Значение не приводится к типу параметра ({e}), запрос выполняется без параметров")
+            return None
+        except Exception as e:
+            self._remember_raw_only(template, e)
+            return None
+
+        if scalar:
+            return QueryResult(value=await stmt.fetchval(*args, **_deadline_timeout()), scalar=True, template=template)
+
+        async with conn.transaction(readonly=True):
+            cursor = await stmt.cursor(*args)
+            rows = await cursor.fetch(max_rows + 1, **_deadline_timeout())
+        return QueryResult(rows=rows[:max_rows], truncated=len(rows) > max_rows, template=template)
+
+    def _remember_raw_only(self, template: str, error: Exception) -> None:
+        logger.debug(f"Шаблон выполняется без параметров ({error}): {template}")
+        if len(self._raw_only) < settings.DB_PREPARED_CACHE_SIZE:
+            self._raw_only.add(template)
+
     async def get_stats(self) -> dict:
         """Получить базовую статистику (оставлено для обратной совместимости, если нужно)"""
         await self.connect()
         
+        async def work(conn):
+            videos_count = await conn.fetchval("SELECT COUNT(*) FROM videos")
+            snapshots_count = await conn.fetchval("SELECT COUNT(*) FROM video_snapshots")
+            
+            return {
+                "videos": videos_count,
+                "snapshots": snapshots_count
+            }
+
         try:
-            async with self.pool.acquire() as conn:
-                videos_count = await conn.fetchval("SELECT COUNT(*) FROM videos")
-                snapshots_count = await conn.fetchval("SELECT COUNT(*) FROM video_snapshots")
-                
-                return {
-                    "videos": videos_count,
-                    "snapshots": snapshots_count
-                }
+            return await self._run_read(work)
         except Exception as e:
             logger.error(f"Ошибка получения статистики: {e}")
             return {"videos": 0, "snapshots": 0}
@@ -0,0 +1,190 @@
+import re
+import math
+import time
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.db_service import db_service
+
+logger = logging.getLogger(__name__)
+
+_MASK64 = (1 << 64) - 1
+
+# Идентификаторы в тексте вопроса: UUID с дефисами или 32 шестнадцатеричных символа
+_ENTITY_ID = re.compile(
+    r'(?<![0-9a-f])(?:[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{32})(?![0-9a-f])'
+)
+_CREATOR_WORDS = re.compile(r'креатор|автор|блогер')
+_VIDEO_WORDS = re.compile(r'видео|ролик')
+
+
+def normalize_id(value) -> str:
+    """Единый вид id для индекса и вопроса: нижний регистр без дефисов"""
+    return str(value).replace('-', '').lower()
+
+
+def _digests(keys: Iterable[str]) -> np.ndarray:
+    """Два 64-битных хеша каждого ключа (blake2b), массив n x 2"""
+    data = b"".join(hashlib.blake2b(key.encode(), digest_size=16).digest() for key in keys)
+    return np.frombuffer(data, dtype="<u8").reshape(-1, 2)
+
+
+class BloomFilter:
+    """Фильтр Блума: «нет» - точно нет, «есть» - с вероятностью ошибки error_rate.
+
+    Биты хранятся в массиве uint8 (m = -n ln p / ln^2 2 бит), позиции -
+    двойное хеширование h1 + i * h2 по модулю m для i < k. Пакетное
+    добавление векторизовано, проверка одного ключа - k обращений к байтам.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(capacity, 1)
+        self.size = max(int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        self._view = memoryview(self.bits)
+        self.count = 0
+
+    def add_many(self, keys: List[str]) -> None:
+        if not keys:
+            return
+        digests = _digests(keys)
+        steps = np.arange(self.hashes, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            positions = (digests[:, :1] + steps * digests[:, 1:]) % np.uint64(self.size)
+        positions = positions.ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3),
+                         np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+        self.count += len(keys)
+
+    def __contains__(self, key: str) -> bool:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+        view = self._view
+        for i in range(self.hashes):
+            position = ((h1 + i * h2) & _MASK64) % self.size
+            if not view[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @property
+    def nbytes(self) -> int:
+        return self.bits.nbytes
+
+
+@dataclass(slots=True)
+class UnknownEntity:
+    """Id из вопроса, которого нет в данных"""
+    kind: str  # creator или video
+    entity_id: str
+
+    def message(self) -> str:
+        if self.kind == "creator":
+            return f"Нет такого креатора: {self.entity_id}. Проверьте идентификатор."
+        return f"Нет такого видео: {self.entity_id}. Проверьте идентификатор."
+
+
+class EntityIndex:
+    """Индекс известных id креаторов и видео для мгновенного ответа на вопросы о несуществующих.
+
+    Два фильтра Блума строятся полным проходом по videos при старте и после
+    каждой загрузки данных (смена поколения cache:generation). Пока индекс
+    не соответствует текущему поколению, вопросы не отсекаются: новые id
+    могли еще не попасть в него.
+    """
+
+    def __init__(self, db=db_service, error_rate: float = None):
+        self.db = db
+        self.error_rate = settings.ENTITY_INDEX_ERROR_RATE if error_rate is None else error_rate
+        self.creators: Optional[BloomFilter] = None
+        self.videos: Optional[BloomFilter] = None
+        self.generation: Optional[int] = None
+        self.metrics = {"rebuilds": 0, "rebuild_s": 0.0, "creators": 0, "videos": 0, "memory_bytes": 0,
+                        "unknown_answers": 0}
+        self._rebuild_task: Optional[asyncio.Task] = None
+
+    async def rebuild(self, generation: int) -> None:
+        """Построить фильтры заново для данных поколения generation"""
+        started = time.monotonic()
+        capacity = await self.db.fetch_result("SELECT COUNT(*) FROM videos")
+        capacity = (capacity.value if capacity else 0) or 0
+        creators = BloomFilter(capacity, self.error_rate)
+        videos = BloomFilter(capacity, self.error_rate)
+
+        # Только с основного узла: на отстающей реплике нет новых id, а их отсутствие
+        # в фильтре find_unknown считает окончательным ответом
+        await self.db.scan_column(
+            "SELECT DISTINCT creator_id FROM videos WHERE creator_id IS NOT NULL",
+            lambda values: creators.add_many([normalize_id(value) for value in values]),
+            primary=True,
+        )
+        await self.db.scan_column(
+            "SELECT id FROM videos",
+            lambda values: videos.add_many([normalize_id(value) for value in values]),
+            primary=True,
+        )
+
+        self.creators, self.videos, self.generation = creators, videos, generation
+        self.metrics.update(
+            rebuilds=self.metrics["rebuilds"] + 1, rebuild_s=round(time.monotonic() - started, 2),
+            creators=creators.count, videos=videos.count, memory_bytes=creators.nbytes + videos.nbytes,
+        )
+        logger.info(f"🗂 Индекс id построен (поколение {generation}): креаторов {creators.count}, "
+                    f"видео {videos.count}, {self.metrics['memory_bytes'] / 1024:.0f} КБ "
+                    f"за {self.metrics['rebuild_s']} с")
+
+    def schedule_rebuild(self, generation: int) -> None:
+        """Пересчитать индекс в фоне (один пересчет за раз).
+
+        Смену поколения во время пересчета заметит следующий вопрос с id.
+        """
+        if self._rebuild_task is not None and not self._rebuild_task.done():
+            return
+
+        async def run():
+            try:
+                await self.rebuild(generation)
+            except Exception as e:
+                logger.error(f"Не удалось построить индекс id: {e}", exc_info=True)
+
+        self._rebuild_task = asyncio.create_task(run())
+
+    def find_unknown(self, question: str, generation: Optional[int]) -> Optional[UnknownEntity]:
+        """Первый id из вопроса, которого точно нет среди креаторов и видео.
+
+        generation - текущее поколение данных (None - неизвестно, без Redis).
+        Если индекс построен для другого поколения, запускается его пересчет
+        в фоне, а вопрос не отсекается (None).
+        """
+        text = question.lower()
+        matches = list(_ENTITY_ID.finditer(text))
+        if not matches or generation is None:
+            return None
+        if self.generation != generation:
+            self.schedule_rebuild(generation)
+            return None
+
+        for match in matches:
+            entity_id = normalize_id(match.group())
+            if entity_id in self.creators or entity_id in self.videos:
+                continue
+            # Чей id - по ближайшему слову перед ним («видео креатора <id>» - креатор),
+            # без подсказок - по виду: UUID с дефисами у видео, 32 символа у креаторов
+            before = text[:match.start()]
+            creator = max((m.end() for m in _CREATOR_WORDS.finditer(before)), default=-1)
+            video = max((m.end() for m in _VIDEO_WORDS.finditer(before)), default=-1)
+            if creator == video:
+                kind = "video" if "-" in match.group() else "creator"
+            else:
+                kind = "creator" if creator > video else "video"
+            self.metrics["unknown_answers"] += 1
+            return UnknownEntity(kind, match.group())
+        return None
+
+entity_index = EntityIndex()
@@ -0,0 +1,121 @@
+import re
+import asyncio
+import logging
+from typing import Optional
+
+from app.core.config import settings
+from app.core.deadline import create_shared_task, current_deadline
+from app.services.gpt_service import gpt_service, extract_first_statement
+
+logger = logging.getLogger(__name__)
+
+# Начало ответа на N-й вопрос: "1) SELECT ...", "2. SELECT ..."
+_NUMBERED_LINE = re.compile(r'^\s*(\d+)\s*[\).:]\s*', re.MULTILINE)
+
+
+def parse_numbered_sql(text: str, count: int) -> dict:
+    """Разобрать пакетный ответ модели в словарь {номер вопроса: SQL}.
+
+    Номера вне диапазона 1..count и ответы без SELECT пропускаются.
+    """
+    text = text.replace('```sql', '').replace('```', '')
+    matches = list(_NUMBERED_LINE.finditer(text))
+    result = {}
+    for i, match in enumerate(matches):
+        number = int(match.group(1))
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        sql = extract_first_statement(text[match.end():end], final=True)
+        if 1 <= number <= count and sql and number not in result:
+            result[number] = sql
+    return result
+
+
+class GPTBatcher:
+    """Микробатчинг вопросов перед YandexGPT.
+
+    Вопросы, пришедшие в течение короткого окна, отправляются одним запросом:
+    схема БД передается один раз, а модель отвечает нумерованным списком SQL.
+    Вопросы, для которых пакетный ответ не разобрался, уходят отдельными запросами.
+    """
+
+    def __init__(self, gpt=gpt_service, window_ms: int = None, max_size: int = None):
+        self.gpt = gpt
+        self.window = (settings.GPT_BATCH_WINDOW_MS if window_ms is None else window_ms) / 1000
+        self.max_size = settings.GPT_BATCH_MAX_SIZE if max_size is None else max_size
+        self._pending = {}
+        self._timers = {}
+        self._tasks = set()
+
+    async def ask_gpt(self, user_query: str, db_schema: str) -> Optional[str]:
+        """Поставить вопрос в очередь и дождаться SQL для него"""
+        if self.max_size <= 1:
+            return await self.gpt.ask_gpt(user_query, db_schema)
+
+        future = asyncio.get_running_loop().create_future()
+        batch = self._pending.setdefault(db_schema, [])
+        batch.append((user_query, future, current_deadline()))
+
+        if len(batch) >= self.max_size:
+            self._flush(db_schema)
+        elif db_schema not in self._timers:
+            self._timers[db_schema] = asyncio.get_running_loop().call_later(
+                self.window, self._flush, db_schema
+            )
+        return await future
+
+    def _flush(self, db_schema: str) -> None:
+        """Забрать накопленные вопросы и запустить их обработку в фоне.
+
+        Генерация идет до самого позднего срока ожидающих и отменяется,
+        если все они отменили свои вопросы.
+        """
+        timer = self._timers.pop(db_schema, None)
+        if timer:
+            timer.cancel()
+        batch = [entry for entry in self._pending.pop(db_schema, []) if not entry[1].done()]
+        if batch:
+            task = create_shared_task(self._run_batch([entry[:2] for entry in batch], db_schema),
+                                      [entry[1] for entry in batch], [entry[2] for entry in batch])
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: list, db_schema: str) -> None:
+        try:
+            if len(batch) == 1:
+                query, future = batch[0]
+                self._resolve(future, await self.gpt.ask_gpt(query, db_schema))
+                return
+
+            questions = [query for query, _ in batch]
+            text = await self.gpt.ask_gpt_batch(questions, db_schema)
+            answers = parse_numbered_sql(text, len(batch)) if text else {}
+            if len(answers) < len(batch):
+                logger.warning(f"Пакетный ответ разобран частично ({len(answers)} из {len(batch)}), "
+                               f"остальные вопросы отправляются по одному")
+
+            fallback = []
+            for number, (query, future) in enumerate(batch, 1):
+                if number in answers:
+                    self._resolve(future, answers[number])
+                else:
+                    fallback.append((query, future))
+
+            results = await asyncio.gather(
+                *(self.gpt.ask_gpt(query, db_schema) for query, _ in fallback),
+                return_exceptions=True
+            )
+            for (_, future), sql in zip(fallback, results):
+                self._resolve(future, None if isinstance(sql, BaseException) else sql)
+        except Exception as e:
+            logger.error(f"Ошибка пакетной генерации SQL: {e}", exc_info=True)
+            for _, future in batch:
+                self._resolve(future, None)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, sql: Optional[str]) -> None:
+        # Ожидающий мог уже отменить запрос
+        if not future.done():
+            future.set_result(sql)
+
+
+gpt_batcher = GPTBatcher()
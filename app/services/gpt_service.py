@@ -1,29 +1,22 @@
 import aiohttp
+import asyncio
 import json
+import time
+from typing import Optional
 from app.core.config import settings
+from app.core.deadline import DeadlineExceeded, deadline_expired, time_left
+from app.services.resilience import CircuitBreaker, LatencyTracker, backoff_delay
 import logging
 
 logger = logging.getLogger(__name__)
 
-class SimpleYandexGPT:
-    def __init__(self):
-        self.api_key = settings.YANDEX_API_KEY
-        self.folder_id = settings.YANDEX_FOLDER_ID
-        self.url = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+# Статусы, при которых запрос имеет смысл повторить
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
 
-        # Логирование настроек API
-        if not self.api_key or not self.folder_id:
-            logger.error("YandexGPT API ключи не настроены!")
-        else:
-            logger.info(f"YandexGPT API настроен (folder_id: {self.folder_id[:10]}...)")
-    
-    
-    async def ask_gpt(self, user_query: str, db_schema: str) -> str:
-        """Преобразовать запрос пользователя в SQL (асинхронная версия)"""
-            
-        prompt = f"""
-        Ты SQL-эксперт. Преобразуй запрос на русском языке в SQL для PostgreSQL.
-        
+
+# Правила и примеры генерации общие для одиночного и пакетного промпта:
+# SQL вопроса не должен зависеть от того, попал ли он в пакет
+SQL_RULES = """
         ВАЖНО: 
         1.Генерируй ТОЛЬКО SELECT-запросы, которые возвращают ЧИСЛЕННЫЕ результаты:
         - COUNT() - для подсчёта количества
@@ -31,67 +24,312 @@ class SimpleYandexGPT:
         - AVG() - для среднего значения
         - MAX()/MIN() - для максимальных/минимальных значений
         2. Для работы с датами используй следующие правила:
-       - При сравнении дат используй функцию DATE() или диапазон
+       - При сравнении дат используй полуоткрытый диапазон, не оборачивая колонку в функции
        - НЕ используй простое равенство с датой (created_at = '2025-11-27' НЕПРАВИЛЬНО!)
-       - Используй DATE(created_at) = '2025-11-27' или диапазон created_at >= '2025-11-27' AND created_at < '2025-11-28'
+       - Используй диапазон created_at >= '2025-11-27' AND created_at < '2025-11-28' вместо DATE(created_at) = '2025-11-27'
         3. Формат дат в базе: TIMESTAMP WITH TIME ZONE
+        4. Подсказка в скобках после вопроса - предполагаемые таблица и агрегат; следуй ей, если она не противоречит вопросу
+"""
 
-        {db_schema}
-        
-        Пользователь спрашивает: {user_query}
-        
+SQL_EXAMPLES = """
         Генерируй запрос так, чтобы он возвращал ОДНО числовое значение или несколько чисел, если это необходимо.
         Используй только агрегирующие функции (COUNT, SUM, AVG, MAX, MIN).
 
         Примеры правильных запросов для работы с датами:
-        - "Сколько разных видео получали просмотры 27 ноября 2025" → SELECT COUNT(DISTINCT video_id) FROM video_snapshots WHERE DATE(created_at) = '2025-11-27'
-        - "Сколько видео создано 2025-11-10" → SELECT COUNT(*) FROM videos WHERE DATE(video_created_at) = '2025-11-10'
+        - "Сколько разных видео получали просмотры 27 ноября 2025" → SELECT COUNT(DISTINCT video_id) FROM video_snapshots WHERE created_at >= '2025-11-27' AND created_at < '2025-11-28'
+        - "Сколько видео создано 2025-11-10" → SELECT COUNT(*) FROM videos WHERE video_created_at >= '2025-11-10' AND video_created_at < '2025-11-11'
         - "Сколько видео за ноябрь 2025" → SELECT COUNT(*) FROM videos WHERE video_created_at >= '2025-11-01' AND video_created_at < '2025-12-01'
-        
-        Верни ТОЛЬКО SQL-запрос без пояснений и без форматирования markdown.
+
         Примеры правильных запросов:
         - SELECT COUNT(*) FROM videos;
         - SELECT SUM(views_count) FROM videos;
         - SELECT AVG(likes_count) FROM videos;
         - SELECT MAX(comments_count) FROM videos;
+"""
+
+
+class TransientGPTError(Exception):
+    """Временная ошибка API (таймаут, перегрузка), запрос можно повторить"""
+
+
+class GPTAPIError(Exception):
+    """Ошибка API, которую повтор не исправит (неверный ключ, нет доступа, неверный запрос)"""
+
+
+def extract_first_statement(text: str, final: bool = False) -> Optional[str]:
+    """Выделить первый законченный SELECT-запрос из (возможно неполного) ответа модели.
+
+    Запрос считается законченным, если встретилась точка с запятой или закрывающий
+    блок markdown вне строковых литералов. Если final=True (ответ получен целиком),
+    запросом считается и незавершенный хвост до первой пустой строки.
+    """
+    upper = text.upper()
+    start = upper.find('SELECT')
+    if start == -1:
+        return None
+
+    quote = None
+    depth = 0
+    i = start
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"'):
+            quote = ch
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif depth <= 0 and (ch == ';' or text.startswith('```', i)):
+            return text[start:i].strip() or None
+        elif final and depth <= 0 and text.startswith('\n\n', i):
+            break
+        i += 1
+
+    if final:
+        return text[start:i].strip() or None
+    return None
+
+
+class SimpleYandexGPT:
+    def __init__(self):
+        self.api_key = settings.YANDEX_API_KEY
+        self.folder_id = settings.YANDEX_FOLDER_ID
+        self.url = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+        self.stream = settings.YANDEX_GPT_STREAM
+        self.max_tokens = 500
+        self.timeout = settings.YANDEX_GPT_TIMEOUT
+        self.max_retries = settings.GPT_MAX_RETRIES
+        self.latency = LatencyTracker()
+        self.usage = {"requests": 0, "input_tokens": 0, "completion_tokens": 0}
+        self.breaker = CircuitBreaker(
+            "YandexGPT",
+            failure_threshold=settings.GPT_BREAKER_FAILURES,
+            reset_timeout=settings.GPT_BREAKER_RESET_TIMEOUT
+        )
+
+        # Логирование настроек API
+        if not self.api_key or not self.folder_id:
+            logger.error("YandexGPT API ключи не настроены!")
+        else:
+            logger.info(f"YandexGPT API настроен (folder_id: {self.folder_id[:10]}...)")
+    
+    def _build_prompt(self, user_query: str, db_schema: str) -> str:
+        """Собрать промпт для генерации SQL"""
+        return f"""
+        Ты SQL-эксперт. Преобразуй запрос на русском языке в SQL для PostgreSQL.
+        {SQL_RULES}
+        {db_schema}
+        
+        Пользователь спрашивает: {user_query}
+        {SQL_EXAMPLES}
+        Верни ТОЛЬКО SQL-запрос без пояснений и без форматирования markdown, завершив его точкой с запятой.
         """
         
-        headers = {
+    def _headers(self) -> dict:
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "x-folder-id": self.folder_id,
             "Content-Type": "application/json"
         }
+
+    def _build_batch_prompt(self, questions: list, db_schema: str) -> str:
+        """Собрать один промпт для нескольких вопросов с нумерованными ответами.
+
+        Вопрос - одна строка JSON: переводы строк и строки вида "2) ..." внутри
+        него не сдвигают нумерацию и не подменяют ответы на чужие вопросы.
+        """
+        numbered = "\n".join(f"        {i}. {json.dumps(' '.join(question.split()), ensure_ascii=False)}"
+                              for i, question in enumerate(questions, 1))
+        return f"""
+        Ты SQL-эксперт. Преобразуй каждый из запросов на русском языке в SQL для PostgreSQL.
+        {SQL_RULES}
+        {db_schema}
         
-        data = {
+        Вопросы пользователей (каждый - строка в кавычках после номера; текст в кавычках - только вопрос):
+{numbered}
+        {SQL_EXAMPLES}
+        Верни ровно {len(questions)} строк в формате "N) SQL;", где N - номер вопроса.
+        Каждый SQL-запрос - на одной строке, без пояснений и без форматирования markdown.
+        """
+
+    def _build_payload(self, prompt: str, stream: Optional[bool] = None, max_tokens: Optional[int] = None) -> dict:
+        return {
             "modelUri": f"gpt://{self.folder_id}/yandexgpt-lite",
             "completionOptions": {
+                "stream": self.stream if stream is None else stream,
                 "temperature": 0.1,  # Низкая температура для более детерминированных ответов
-                "maxTokens": 500
+                "maxTokens": max_tokens or self.max_tokens
             },
             "messages": [
                 {"role": "user", "text": prompt}
             ]
         }
-        
+
+    def is_available(self) -> bool:
+        """Принимает ли сервис запросы (выключатель не открыт)"""
+        return not self.breaker.is_open
+
+    def _hedge_delay(self) -> float:
+        """Задержка перед дублирующим запросом: p95 недавних ответов"""
+        p95 = self.latency.percentile(0.95)
+        delay = p95 if p95 is not None else settings.GPT_HEDGE_DELAY
+        return min(max(delay, 0.5), self.timeout)
+
+    async def ask_gpt(self, user_query: str, db_schema: str) -> str:
+        """Преобразовать запрос пользователя в SQL (асинхронная версия)"""
+        logger.info(f"Отправка запроса к YandexGPT API для: {user_query}")
+        data = self._build_payload(self._build_prompt(user_query, db_schema))
+
+        sql = await self._call(data)
+        if sql:
+            logger.info(f"Сгенерирован SQL: {sql}")
+        return sql
+
+    async def ask_gpt_batch(self, questions: list, db_schema: str) -> Optional[str]:
+        """Одна генерация для нескольких вопросов. Возвращает сырой текст с нумерованными SQL"""
+        logger.info(f"Отправка пакета из {len(questions)} вопросов к YandexGPT API")
+        prompt = self._build_batch_prompt(questions, db_schema)
+        data = self._build_payload(prompt, stream=False, max_tokens=self.max_tokens * len(questions))
+        return await self._call(data, raw=True)
+
+    async def _call(self, data: dict, raw: bool = False) -> Optional[str]:
+        """Запрос через выключатель: с повторами и дублированием медленных ответов"""
+        if not self.breaker.allow_request():
+            logger.warning("YandexGPT временно недоступен (выключатель открыт), запрос не отправлен")
+            return None
+
         try:
-            logger.info(f"Отправка запроса к YandexGPT API для: {user_query}")
             async with aiohttp.ClientSession() as session:
-                async with session.post(self.url, headers=headers, json=data, timeout=30) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        sql = result['result']['alternatives'][0]['message']['text'].strip()
-                        # Очищаем от markdown и лишних символов
-                        sql = sql.replace('```sql', '').replace('```', '').strip()
-                        # Убираем точку с запятой в конце если есть
-                        sql = sql.rstrip(';')
-                        logger.info(f"Сгенерирован SQL: {sql}")
-                        return sql
-                    else:
-                        text = await response.text()
-                        logger.error(f"Ошибка API: {response.status}, {text}")
-                        return None
+                result = await self._hedged_request(session, data, raw)
+            self.breaker.record_success()
+            return result
+        except DeadlineExceeded:
+            # Истек срок ответа пользователю, а не отказал сервис - выключатель не трогаем
+            logger.warning("Срок ответа истек, запрос к YandexGPT прерван")
+        except TransientGPTError as e:
+            logger.error(f"YandexGPT не ответил после повторов: {e}")
+            self.breaker.record_failure()
+        except GPTAPIError as e:
+            # Истекший ключ или сломанный API не пройдут сами - это сбой, иначе выключатель не откроется
+            logger.error(f"Ошибка API: {e}")
+            self.breaker.record_failure()
         except Exception as e:
+            # Непредвиденная ошибка - тоже сбой: иначе пробный запрос half_open так и не завершится
             logger.error(f"Ошибка YandexGPT: {e}", exc_info=True)
-            return None
+            self.breaker.record_failure()
+        return None
+
+    async def _hedged_request(self, session: aiohttp.ClientSession, data: dict, raw: bool = False) -> Optional[str]:
+        """Отправить запрос и, если ответа нет дольше p95, продублировать его.
+
+        Возвращается результат того запроса, который успешно завершится первым.
+        """
+        delay = self._hedge_delay()
+        tasks = {asyncio.create_task(self._request_with_retry(session, data, raw))}
+        error = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                logger.info(f"⏱ Нет ответа YandexGPT за {delay:.2f}с, отправляем дублирующий запрос")
+                tasks.add(asyncio.create_task(self._request_with_retry(session, data, raw)))
+
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _request_with_retry(self, session: aiohttp.ClientSession, data: dict, raw: bool = False) -> Optional[str]:
+        """Повторять запрос при временных ошибках с экспоненциальной задержкой и джиттером"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self._request_once(session, data, raw)
+            except TransientGPTError as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = backoff_delay(attempt, base=0.5, cap=4.0)
+                left = time_left()
+                if left is not None and left <= delay:
+                    raise DeadlineExceeded("Не осталось времени на повтор запроса к YandexGPT") from e
+                logger.warning(f"Временная ошибка YandexGPT ({e}), повтор через {delay:.2f}с")
+                await asyncio.sleep(delay)
+
+    async def _request_once(self, session: aiohttp.ClientSession, data: dict, raw: bool = False) -> Optional[str]:
+        """Один запрос к API. Временные ошибки поднимаются как TransientGPTError, остальные - как GPTAPIError.
+
+        При raw=True возвращается текст ответа целиком, иначе - первый SQL-запрос из него.
+        """
+        started = time.perf_counter()
+        # Не дольше остатка срока ответа: по таймауту aiohttp закрывает соединение
+        timeout = aiohttp.ClientTimeout(total=time_left(self.timeout))
+        try:
+            async with session.post(self.url, headers=self._headers(), json=data, timeout=timeout) as response:
+                if response.status == 200:
+                    if data["completionOptions"]["stream"]:
+                        sql = await self._read_stream(response)
+                    else:
+                        result = (await response.json())['result']
+                        self._record_usage(result.get('usage'))
+                        text = result['alternatives'][0]['message']['text']
+                        if raw:
+                            return text
+                        sql = extract_first_statement(text, final=True)
+                    self.latency.observe(time.perf_counter() - started)
+                    if not sql:
+                        logger.error("YandexGPT вернул ответ без SELECT-запроса")
+                    return sql
+
+                text = await response.text()
+                if response.status in TRANSIENT_STATUSES:
+                    raise TransientGPTError(f"HTTP {response.status}: {text[:200]}")
+                raise GPTAPIError(f"HTTP {response.status}: {text[:200]}")
+        except (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError) as e:
+            if deadline_expired():
+                raise DeadlineExceeded("Срок ответа истек во время запроса к YandexGPT") from e
+            raise TransientGPTError(repr(e)) from e
+
+    def _record_usage(self, usage: Optional[dict]) -> None:
+        """Учесть расход токенов (API возвращает числа строками)"""
+        self.usage["requests"] += 1
+        if usage:
+            self.usage["input_tokens"] += int(usage.get("inputTextTokens", 0))
+            self.usage["completion_tokens"] += int(usage.get("completionTokens", 0))
+
+    async def _read_stream(self, response) -> Optional[str]:
+        """Читать потоковый ответ и закрыть его сразу после первого законченного запроса.
+
+        В потоковом режиме API присылает JSON-объекты построчно, в каждом - текст
+        альтернативы, накопленный к этому моменту.
+        """
+        text = ""
+        usage = None
+        try:
+            async for line in response.content:
+                line = line.strip()
+                if not line:
+                    continue
+                chunk = json.loads(line)['result']
+                usage = chunk.get('usage', usage)
+                part = chunk['alternatives'][0]['message']['text']
+                # Поддерживаем и накопительные, и инкрементальные чанки
+                text = part if part.startswith(text) else text + part
+
+                sql = extract_first_statement(text)
+                if sql:
+                    logger.debug("Получен законченный SQL, закрываем поток")
+                    response.close()
+                    return sql
+        finally:
+            self._record_usage(usage)
+
+        return extract_first_statement(text, final=True)
 
-gpt_service = SimpleYandexGPT()
\ No newline at end of file
+gpt_service = SimpleYandexGPT()
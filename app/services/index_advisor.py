@@ -0,0 +1,311 @@
+import json
+import time
+import logging
+import statistics
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import sqlglot
+from sqlglot import exp
+
+from app.core.config import settings
+from app.services.db_service import db_service
+
+logger = logging.getLogger(__name__)
+
+# Колонки времени в таблицах, куда строки только дописываются: физический
+# порядок совпадает с порядком значений, и BRIN-индекс в сотни раз меньше B-tree
+BRIN_CANDIDATES = {("video_snapshots", "created_at")}
+
+# Сколько колонок выборки добавлять в INCLUDE покрывающего индекса
+_MAX_INCLUDE_COLUMNS = 3
+
+_EQUALITY = (exp.EQ, exp.In)
+_RANGE = (exp.GT, exp.GTE, exp.LT, exp.LTE, exp.Between)
+
+_EXISTING_INDEXES_SQL = """
+SELECT t.relname AS table_name, i.relname AS index_name, am.amname AS method, x.indnkeyatts AS key_count,
+       ARRAY(SELECT pg_get_indexdef(x.indexrelid, k, true) FROM generate_series(1, x.indnatts) AS k) AS columns
+FROM pg_index x
+JOIN pg_class i ON i.oid = x.indexrelid
+JOIN pg_class t ON t.oid = x.indrelid
+JOIN pg_am am ON am.oid = i.relam
+WHERE t.relname = ANY($1::text[]) AND x.indisvalid
+"""
+
+# Прерванный CREATE INDEX CONCURRENTLY оставляет индекс INVALID: он не используется
+# планировщиком, но из-за него IF NOT EXISTS пропускает повторное создание
+_INVALID_INDEX_SQL = """
+SELECT EXISTS (
+    SELECT 1 FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+    WHERE i.relname = $1 AND NOT x.indisvalid AND pg_table_is_visible(x.indrelid)
+)
+"""
+
+
+@dataclass
+class TablePredicates:
+    """Как запрос обращается к одной таблице"""
+    table: str
+    equality: List[str] = field(default_factory=list)
+    range: List[str] = field(default_factory=list)
+    selected: List[str] = field(default_factory=list)
+
+
+@dataclass
+class IndexRecommendation:
+    """Рекомендуемый индекс и запросы (отпечатки), которым он поможет"""
+    table: str
+    columns: List[str]
+    method: str = "btree"
+    include: List[str] = field(default_factory=list)
+    fingerprints: List[str] = field(default_factory=list)
+    reason: str = ""
+
+    @property
+    def name(self) -> str:
+        suffix = "brin" if self.method == "brin" else ("cov" if self.include else "")
+        parts = ["idx", self.table, *self.columns] + ([suffix] if suffix else [])
+        return "_".join(parts)[:63]
+
+    def ddl(self) -> str:
+        sql = (f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {self.name} "
+               f"ON {self.table} USING {self.method} ({', '.join(self.columns)})")
+        if self.include:
+            sql += f" INCLUDE ({', '.join(self.include)})"
+        return sql
+
+
+def _add(items: List[str], column: str) -> None:
+    if column not in items:
+        items.append(column)
+
+
+def extract_predicates(sql: str) -> Dict[str, TablePredicates]:
+    """Колонки условий равенства, диапазонов и выборки по каждой таблице запроса.
+
+    Колонка без указания таблицы относится к единственной таблице запроса;
+    в запросах с несколькими таблицами такие колонки пропускаются.
+    """
+    tree = sqlglot.parse_one(sql, read="postgres")
+    aliases = {table.alias_or_name: table.name for table in tree.find_all(exp.Table)}
+    tables = set(aliases.values())
+    result = {table: TablePredicates(table) for table in tables}
+
+    def table_of(column: exp.Column) -> Optional[str]:
+        if column.table:
+            return aliases.get(column.table)
+        return next(iter(tables)) if len(tables) == 1 else None
+
+    for condition in (*tree.find_all(exp.Where), *tree.find_all(exp.Join)):
+        for predicate in condition.find_all(*_EQUALITY, *_RANGE):
+            sides = [predicate.this] if isinstance(predicate, (exp.In, exp.Between)) \
+                else [predicate.this, predicate.expression]
+            for side in sides:
+                table = table_of(side) if isinstance(side, exp.Column) else None
+                if table is None:
+                    continue
+                if isinstance(predicate, _EQUALITY):
+                    _add(result[table].equality, side.name)
+                else:
+                    _add(result[table].range, side.name)
+
+    for select in tree.find_all(exp.Select):
+        for projection in select.expressions:
+            for column in projection.find_all(exp.Column):
+                table = table_of(column)
+                if table is not None:
+                    _add(result[table].selected, column.name)
+
+    return result
+
+
+def _plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def needs_index(plan: dict, table: str) -> bool:
+    """Читает ли план таблицу целиком или отбрасывает фильтром больше, чем возвращает"""
+    for node in _plan_nodes(plan):
+        if node.get("Relation Name") != table:
+            continue
+        if node.get("Node Type") == "Seq Scan":
+            return True
+        if node.get("Rows Removed by Filter", 0) > node.get("Actual Rows", 0):
+            return True
+    return False
+
+
+def recommend_for(predicates: TablePredicates) -> Optional[IndexRecommendation]:
+    """Индекс для одной таблицы запроса: составной, покрывающий или BRIN"""
+    table = predicates.table
+    range_column = next((column for column in predicates.range if column not in predicates.equality), None)
+
+    if not predicates.equality and range_column and (table, range_column) in BRIN_CANDIDATES:
+        return IndexRecommendation(
+            table, [range_column], method="brin",
+            reason=f"диапазон по {range_column} в таблице, куда строки только дописываются"
+        )
+
+    columns = list(predicates.equality) + ([range_column] if range_column else [])
+    if not columns:
+        return None
+    include = [column for column in predicates.selected if column not in columns][:_MAX_INCLUDE_COLUMNS]
+    if len(columns) > 1:
+        reason = "равенство по " + ", ".join(predicates.equality) + (f" и диапазон по {range_column}" if range_column else "")
+    else:
+        reason = f"условие по {columns[0]}"
+    if include:
+        reason += f"; INCLUDE ({', '.join(include)}) для чтения только из индекса"
+    return IndexRecommendation(table, columns, include=include, reason=reason)
+
+
+def is_covered(recommendation: IndexRecommendation, existing: List[dict]) -> bool:
+    """Есть ли уже индекс, начинающийся с тех же колонок и содержащий нужные INCLUDE"""
+    for index in existing:
+        if index["table_name"] != recommendation.table or index["method"] != recommendation.method:
+            continue
+        columns = list(index["columns"])
+        key = columns[:index["key_count"]]
+        if key[:len(recommendation.columns)] == recommendation.columns \
+                and set(recommendation.include) <= set(columns):
+            return True
+    return False
+
+
+class IndexAdvisor:
+    """Рекомендации индексов по фактически выполненным запросам.
+
+    Источник нагрузки - статистика db_service по отпечаткам запросов.
+    Самые затратные по суммарному времени запросы разбираются через
+    EXPLAIN ANALYZE; для таблиц, которые читаются целиком, предлагается индекс.
+    """
+
+    def __init__(self, db=db_service):
+        self.db = db
+        self.last_recommendations: List[IndexRecommendation] = []
+
+    async def explain(self, sql: str) -> dict:
+        """План с фактическим выполнением (в транзакции только на чтение)"""
+        await self.db.connect()
+        async with self.db.pool.acquire() as conn:
+            async with conn.transaction(readonly=True):
+                plan = await conn.fetchval(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}")
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]
+
+    async def existing_indexes(self, tables: List[str]) -> List[dict]:
+        await self.db.connect()
+        async with self.db.pool.acquire() as conn:
+            rows = await conn.fetch(_EXISTING_INDEXES_SQL, tables)
+        return [dict(row) for row in rows]
+
+    async def recommend(self, limit: Optional[int] = None) -> List[IndexRecommendation]:
+        """Проанализировать самые медленные запросы и предложить индексы"""
+        limit = limit or settings.INDEX_ADVISOR_TOP_QUERIES
+        top = self.db.query_report(limit)
+        merged: Dict[tuple, IndexRecommendation] = {}
+
+        for entry in top:
+            sample = self.db.query_stats[entry["fingerprint"]]["sample"]
+            try:
+                predicates = extract_predicates(sample)
+                plan = (await self.explain(sample))["Plan"]
+            except Exception as e:
+                logger.warning(f"Не удалось разобрать запрос {entry['fingerprint']}: {e}")
+                continue
+
+            for table_predicates in predicates.values():
+                if not needs_index(plan, table_predicates.table):
+                    continue
+                recommendation = recommend_for(table_predicates)
+                if recommendation is None:
+                    continue
+                key = (recommendation.table, tuple(recommendation.columns), recommendation.method)
+                if key in merged:
+                    known = merged[key]
+                    for column in recommendation.include:
+                        if len(known.include) < _MAX_INCLUDE_COLUMNS:
+                            _add(known.include, column)
+                    _add(known.fingerprints, entry["fingerprint"])
+                else:
+                    recommendation.fingerprints.append(entry["fingerprint"])
+                    merged[key] = recommendation
+
+        if merged:
+            existing = await self.existing_indexes(sorted({rec.table for rec in merged.values()}))
+            self.last_recommendations = [rec for rec in merged.values() if not is_covered(rec, existing)]
+        else:
+            self.last_recommendations = []
+        return self.last_recommendations
+
+    async def _measure(self, conn, sql: str, runs: int) -> float:
+        """Медианная задержка запроса, мс"""
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            await conn.fetch(sql)
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    async def _drop_invalid(self, conn, name: str) -> None:
+        """Удалить оставшийся от неудачного создания индекс INVALID с этим именем"""
+        if await conn.fetchval(_INVALID_INDEX_SQL, name):
+            logger.warning(f"Удаляем недостроенный индекс {name}")
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+    async def apply(self, recommendations: Optional[List[IndexRecommendation]] = None,
+                    runs: Optional[int] = None) -> List[dict]:
+        """Создать индексы (CONCURRENTLY, на основном узле) и замерить задержку до и после.
+
+        Для каждого индекса возвращается задержка затронутых им отпечатков
+        запросов до создания индекса и после ANALYZE таблицы.
+        """
+        recommendations = self.last_recommendations if recommendations is None else recommendations
+        runs = runs or settings.INDEX_ADVISOR_RUNS
+        report = []
+        await self.db.connect()
+
+        async with self.db.pool.acquire() as conn:
+            for recommendation in recommendations:
+                samples = {fingerprint: self.db.query_stats[fingerprint]["sample"]
+                           for fingerprint in recommendation.fingerprints if fingerprint in self.db.query_stats}
+                before = {fingerprint: await self._measure(conn, sql, runs) for fingerprint, sql in samples.items()}
+
+                started = time.perf_counter()
+                try:
+                    await self._drop_invalid(conn, recommendation.name)
+                    await conn.execute(recommendation.ddl())
+                    await conn.execute(f"ANALYZE {recommendation.table}")
+                except Exception as e:
+                    logger.error(f"Не удалось создать индекс {recommendation.name}: {e}")
+                    report.append({"index": recommendation.name, "error": str(e)})
+                    try:
+                        await self._drop_invalid(conn, recommendation.name)
+                    except Exception as drop_error:
+                        logger.error(f"Не удалось удалить недостроенный индекс {recommendation.name}: {drop_error}")
+                    continue
+                build_ms = (time.perf_counter() - started) * 1000
+                logger.info(f"✅ Создан индекс {recommendation.name} за {build_ms:.0f} мс")
+
+                after = {fingerprint: await self._measure(conn, sql, runs) for fingerprint, sql in samples.items()}
+                report.append({
+                    "index": recommendation.name,
+                    "ddl": recommendation.ddl(),
+                    "build_ms": round(build_ms, 1),
+                    "queries": [
+                        {"fingerprint": fingerprint,
+                         "before_ms": round(before[fingerprint], 2),
+                         "after_ms": round(after[fingerprint], 2)}
+                        for fingerprint in samples
+                    ],
+                })
+
+        self.last_recommendations = [rec for rec in self.last_recommendations if rec not in recommendations]
+        return report
+
+
+index_advisor = IndexAdvisor()
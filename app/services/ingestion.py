@@ -0,0 +1,377 @@
+import json
+import time
+import uuid
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Tuple
+
+import asyncpg
+
+from app.core.config import settings
+from app.services.cache_service import GENERATION_KEY
+
+logger = logging.getLogger(__name__)
+
+INGEST_GROUP = "ingesters"
+
+VIDEO_COLUMNS = ("id", "creator_id", "video_created_at", "views_count", "likes_count", "comments_count",
+                 "reports_count", "created_at", "updated_at")
+SNAPSHOT_COLUMNS = ("id", "video_id", "views_count", "likes_count", "comments_count", "reports_count",
+                    "delta_views_count", "delta_likes_count", "delta_comments_count", "delta_reports_count",
+                    "created_at", "updated_at")
+_TIMESTAMPS = {"video_created_at", "created_at", "updated_at"}
+_UUIDS = {"id", "video_id", "creator_id"}
+
+# Промежуточные таблицы для COPY: очищаются при каждом коммите
+CREATE_STAGING = """
+CREATE TEMP TABLE IF NOT EXISTS ingest_videos (LIKE videos INCLUDING DEFAULTS) ON COMMIT DELETE ROWS;
+CREATE TEMP TABLE IF NOT EXISTS ingest_snapshots (LIKE video_snapshots INCLUDING DEFAULTS) ON COMMIT DELETE ROWS;
+"""
+
+
+def _updates(columns: Tuple[str, ...]) -> str:
+    return ", ".join(f"{column} = EXCLUDED.{column}" for column in columns if column not in ("id", "created_at"))
+
+
+UPSERT_VIDEOS = (
+    f"INSERT INTO videos ({', '.join(VIDEO_COLUMNS)}) SELECT {', '.join(VIDEO_COLUMNS)} FROM ingest_videos "
+    f"ON CONFLICT (id) DO UPDATE SET {_updates(VIDEO_COLUMNS)}"
+)
+
+# Креатор видео сменился - его копия в снимках тоже (до upsert видео, пока видна старая)
+SYNC_SNAPSHOT_CREATORS = """
+UPDATE video_snapshots s SET creator_id = i.creator_id
+FROM ingest_videos i JOIN videos v ON v.id = i.id
+WHERE s.video_id = i.id AND v.creator_id IS DISTINCT FROM i.creator_id
+"""
+
+# Снимок без видео нарушил бы внешний ключ, а снимок за свернутый день
+# (scripts/compact_snapshots.py) посчитал бы приращения второй раз.
+# creator_id снимка - копия креатора видео
+UPSERT_SNAPSHOTS = (
+    f"INSERT INTO video_snapshots ({', '.join(SNAPSHOT_COLUMNS)}, creator_id) "
+    f"SELECT {', '.join(f's.{column}' for column in SNAPSHOT_COLUMNS)}, v.creator_id "
+    "FROM ingest_snapshots s JOIN videos v ON v.id = s.video_id "
+    "WHERE $1::timestamptz IS NULL OR s.created_at >= $1 "
+    f"ON CONFLICT (id) DO UPDATE SET {_updates(SNAPSHOT_COLUMNS + ('creator_id',))}"
+)
+
+# Итоговые счетчики видео - по самому свежему снимку, если он новее строки видео
+UPDATE_VIDEO_TOTALS = """
+UPDATE videos v SET
+    views_count = s.views_count,
+    likes_count = s.likes_count,
+    comments_count = s.comments_count,
+    reports_count = s.reports_count,
+    updated_at = s.created_at
+FROM (
+    SELECT DISTINCT ON (video_id) * FROM ingest_snapshots ORDER BY video_id, created_at DESC
+) s
+WHERE v.id = s.video_id AND (v.updated_at IS NULL OR v.updated_at < s.created_at)
+"""
+
+
+def _value(column: str, value):
+    if value is None:
+        return None
+    if column in _UUIDS:
+        return uuid.UUID(str(value))
+    if column in _TIMESTAMPS:
+        moment = value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+        # Время без пояса считаем UTC - так его кодирует asyncpg для timestamptz
+        return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+    return int(value)
+
+
+def _row(item: dict, columns: Tuple[str, ...]) -> tuple:
+    return tuple(_value(column, item.get(column)) for column in columns)
+
+
+def _snapshot_row(item: dict) -> tuple:
+    row = _row(item, SNAPSHOT_COLUMNS)
+    if row[SNAPSHOT_COLUMNS.index("created_at")] is None:
+        # Снимок без времени не сравнить с границей свертки: UPSERT_SNAPSHOTS молча отбросил бы его
+        raise ValueError(f"снимок {item.get('id')} без created_at")
+    return row
+
+
+# Сообщение, которое не разбирается (не JSON, нет полей, неверный UUID, число или дата)
+MALFORMED = (ValueError, TypeError, KeyError, AttributeError)
+# Значение, которое отвергла PostgreSQL (число вне INTEGER, нарушение ограничения)
+REJECTED_BY_DB = (asyncpg.DataError, asyncpg.IntegrityConstraintViolationError)
+
+
+def parse_message(payload: str) -> Tuple[List[tuple], List[tuple]]:
+    """Строки видео и снимков для COPY из одного сообщения очереди.
+
+    Сообщение - JSON видео в формате scripts/load_json.py (со списком
+    snapshots или без) или отдельного снимка (с полем video_id).
+    Неразборчивое сообщение (в том числе со снимком без created_at) -
+    исключение из MALFORMED.
+    """
+    item = json.loads(payload)
+    if not isinstance(item, dict):
+        raise ValueError("сообщение не JSON-объект")
+    if "video_id" in item:
+        return [], [_snapshot_row(item)]
+    snapshots = [_snapshot_row({"video_id": item["id"], **snapshot}) for snapshot in item.get("snapshots") or ()]
+    return [_row(item, VIDEO_COLUMNS)], snapshots
+
+
+def _merge(parsed: Iterable[Tuple[List[tuple], List[tuple]]]) -> Tuple[List[tuple], List[tuple]]:
+    # Повторы одного id в пачке схлопываются, остается последний (иначе upsert упадет)
+    videos, snapshots = {}, {}
+    for video_rows, snapshot_rows in parsed:
+        videos.update((row[0], row) for row in video_rows)
+        snapshots.update((row[0], row) for row in snapshot_rows)
+    return list(videos.values()), list(snapshots.values())
+
+
+def parse_messages(payloads: Iterable[str]) -> Tuple[List[tuple], List[tuple]]:
+    """Строки для COPY из сообщений очереди (parse_message), повторы id схлопываются"""
+    return _merge(parse_message(payload) for payload in payloads)
+
+
+def _affected(status: str) -> int:
+    # Статус команды PostgreSQL: "INSERT 0 15", "UPDATE 3"
+    try:
+        return int(status.split()[-1])
+    except (AttributeError, ValueError, IndexError):
+        return 0
+
+
+def _entry_ms(entry_id: str) -> int:
+    # Id записи потока Redis: "<мс добавления>-<номер>"
+    return int(entry_id.split("-", 1)[0])
+
+
+@dataclass(slots=True)
+class IngestBatch:
+    """Итог записи одной пачки"""
+    messages: int
+    videos: int
+    snapshots: int
+    skipped_snapshots: int
+    lag_ms: float  # от добавления самого старого сообщения до коммита
+    dead_lettered: int = 0  # отложено в INGEST_DEAD_LETTER_STREAM
+
+
+class Ingestor:
+    """Непрерывная загрузка видео и снимков из потока Redis.
+
+    Сообщения читаются группой потребителей (XREADGROUP) и копятся в пачку,
+    пока в ней не наберется batch_size сообщений или не пройдет
+    batch_interval_ms с первого. Пачка загружается через COPY во временные
+    таблицы и переносится в videos и video_snapshots upsert'ами в одной
+    транзакции; после коммита сообщения подтверждаются и удаляются из потока.
+    Неподтвержденные (пачка не записалась или процесс упал) читаются заново
+    при следующем запуске. Сообщение, которое не разбирается или которое
+    отвергла PostgreSQL, откладывается в dead_letter_stream с текстом ошибки и
+    подтверждается, чтобы не останавливать поток. Поколение данных увеличивается не чаще раза
+    в generation_interval секунд, чтобы кеш ответов не сбрасывался на каждой пачке.
+    """
+
+    def __init__(self, redis_client, conn, consumer: str = "ingester", stream: str = None,
+                 batch_size: int = None, batch_interval_ms: int = None, generation_interval: float = None,
+                 dead_letter_stream: str = None):
+        self.redis = redis_client
+        self.conn = conn
+        self.consumer = consumer
+        self.stream = stream or settings.INGEST_STREAM
+        self.dead_letter_stream = dead_letter_stream or settings.INGEST_DEAD_LETTER_STREAM
+        self.batch_size = batch_size or settings.INGEST_BATCH_SIZE
+        self.batch_interval = (batch_interval_ms or settings.INGEST_BATCH_INTERVAL_MS) / 1000
+        self.generation_interval = settings.INGEST_GENERATION_INTERVAL \
+            if generation_interval is None else generation_interval
+        self.metrics = {"messages": 0, "batches": 0, "videos": 0, "snapshots": 0, "skipped_snapshots": 0,
+                        "dead_lettered": 0, "generations": 0}
+        # Задержка от добавления сообщения до коммита и до смены поколения (когда данные видит бот)
+        self.commit_lags = deque(maxlen=1000)
+        self.visible_lags = deque(maxlen=1000)
+        self._oldest_unpublished: Optional[int] = None
+        self._last_bump: Optional[float] = None
+        self._started = time.monotonic()
+        self._pending_recovered = False
+
+    async def setup(self) -> None:
+        """Группа потребителей (с созданием потока) и временные таблицы соединения"""
+        try:
+            await self.redis.xgroup_create(self.stream, INGEST_GROUP, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        await self.conn.execute(CREATE_STAGING)
+
+    async def read(self, count: int, block_ms: int) -> List[Tuple[str, dict]]:
+        """Очередные сообщения; сначала - полученные раньше, но не подтвержденные"""
+        start = ">" if self._pending_recovered else "0"
+        response = await self.redis.xreadgroup(INGEST_GROUP, self.consumer, {self.stream: start},
+                                               count=count, block=None if start == "0" else block_ms)
+        messages = response[0][1] if response else []
+        if start == "0" and len(messages) < count:
+            self._pending_recovered = True
+        return messages
+
+    async def _store(self, parsed: List[Tuple[List[tuple], List[tuple]]]) -> Tuple[int, int, int]:
+        """Записать строки сообщений в одной транзакции: видео, снимков всего и записанных"""
+        videos, snapshots = _merge(parsed)
+        async with self.conn.transaction():
+            boundary = None
+            if await self.conn.fetchval("SELECT to_regclass('snapshot_compaction') IS NOT NULL"):
+                boundary = await self.conn.fetchval("SELECT compacted_before FROM snapshot_compaction")
+            if videos:
+                await self.conn.copy_records_to_table("ingest_videos", records=videos, columns=VIDEO_COLUMNS)
+                await self.conn.execute(SYNC_SNAPSHOT_CREATORS)
+                await self.conn.execute(UPSERT_VIDEOS)
+            written = 0
+            if snapshots:
+                await self.conn.copy_records_to_table("ingest_snapshots", records=snapshots,
+                                                      columns=SNAPSHOT_COLUMNS)
+                written = _affected(await self.conn.execute(UPSERT_SNAPSHOTS, boundary))
+                await self.conn.execute(UPDATE_VIDEO_TOTALS)
+        return len(videos), len(snapshots), written
+
+    async def write(self, messages: List[Tuple[str, dict]]) -> IngestBatch:
+        """Записать пачку в одной транзакции и подтвердить сообщения.
+
+        Неразборчивые сообщения и сообщения, которые отвергла PostgreSQL,
+        откладываются в dead_letter_stream и тоже подтверждаются.
+        """
+        parsed, dead = [], []
+        for entry_id, fields in messages:
+            try:
+                parsed.append((entry_id, fields, parse_message(fields["data"])))
+            except MALFORMED as e:
+                dead.append((entry_id, fields, e))
+
+        videos = snapshots = written = 0
+        if parsed:
+            try:
+                videos, snapshots, written = await self._store([rows for _, _, rows in parsed])
+            except REJECTED_BY_DB as e:
+                # Одно недопустимое значение отменило всю пачку - пишем ее по сообщению
+                logger.warning(f"Пачка отвергнута ({e}), запись по одному сообщению")
+                for entry_id, fields, rows in parsed:
+                    try:
+                        stored_videos, stored_snapshots, stored = await self._store([rows])
+                    except REJECTED_BY_DB as error:
+                        dead.append((entry_id, fields, error))
+                        continue
+                    videos += stored_videos
+                    snapshots += stored_snapshots
+                    written += stored
+
+        ids = [entry_id for entry_id, _ in messages]
+        pipe = self.redis.pipeline(transaction=False)
+        for entry_id, fields, error in dead:
+            pipe.xadd(self.dead_letter_stream, {"data": fields.get("data", ""), "entry_id": entry_id,
+                                                "error": f"{type(error).__name__}: {error}"[:500]})
+        pipe.xack(self.stream, INGEST_GROUP, *ids)
+        pipe.xdel(self.stream, *ids)
+        await pipe.execute()
+        for entry_id, _, error in dead:
+            logger.error(f"Сообщение {entry_id} отложено в {self.dead_letter_stream}: {error}")
+
+        oldest = min(_entry_ms(entry_id) for entry_id in ids)
+        if written or videos:
+            if self._oldest_unpublished is None or oldest < self._oldest_unpublished:
+                self._oldest_unpublished = oldest
+        batch = IngestBatch(len(messages), videos, written, snapshots - written,
+                            time.time() * 1000 - oldest, len(dead))
+        self.commit_lags.append(batch.lag_ms)
+        self.metrics["messages"] += batch.messages
+        self.metrics["batches"] += 1
+        self.metrics["videos"] += batch.videos
+        self.metrics["snapshots"] += batch.snapshots
+        self.metrics["skipped_snapshots"] += batch.skipped_snapshots
+        self.metrics["dead_lettered"] += batch.dead_lettered
+        if batch.skipped_snapshots:
+            logger.warning(f"Пропущено снимков без видео или за свернутый период: {batch.skipped_snapshots}")
+        return batch
+
+    async def publish_generation(self, force: bool = False) -> bool:
+        """Увеличить поколение данных, если есть новые записи и прошло generation_interval"""
+        if self._oldest_unpublished is None:
+            return False
+        if not force and self._last_bump is not None \
+                and time.monotonic() - self._last_bump < self.generation_interval:
+            return False
+        generation = await self.redis.incr(GENERATION_KEY)
+        self.visible_lags.append(time.time() * 1000 - self._oldest_unpublished)
+        self._oldest_unpublished = None
+        self._last_bump = time.monotonic()
+        self.metrics["generations"] += 1
+        logger.info(f"📥 Новые данные видны боту: поколение {generation}")
+        return True
+
+    async def run_once(self) -> Optional[IngestBatch]:
+        """Собрать и записать одну пачку (None - сообщений не было)"""
+        # Неподтвержденные сообщения перечитываются отдельными пачками, без добора новых
+        recovering = not self._pending_recovered
+        messages = await self.read(self.batch_size, int(self.batch_interval * 1000))
+        if not messages:
+            await self.publish_generation()
+            return None
+        deadline = time.monotonic() + self.batch_interval
+        while not recovering and len(messages) < self.batch_size:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            more = await self.read(self.batch_size - len(messages), max(int(left * 1000), 1))
+            if not more:
+                break
+            messages.extend(more)
+        batch = await self.write(messages)
+        await self.publish_generation()
+        return batch
+
+    async def run(self, stop: asyncio.Event, report_interval: float = None) -> None:
+        """Загружать пачки до установки stop, периодически печатая отчет"""
+        report_interval = report_interval or settings.INGEST_REPORT_INTERVAL
+        await self.setup()
+        next_report = time.monotonic() + report_interval
+        while not stop.is_set():
+            try:
+                await self.run_once()
+            except Exception as e:
+                # Сообщения пачки не подтверждены и будут прочитаны снова
+                logger.error(f"Ошибка загрузки пачки: {e}", exc_info=True)
+                self._pending_recovered = False
+                await asyncio.sleep(1)
+            if time.monotonic() >= next_report:
+                logger.info(f"📥 Загрузка: {self.report()}")
+                next_report = time.monotonic() + report_interval
+        await self.publish_generation(force=True)
+
+    def report(self) -> dict:
+        """Пропускная способность и задержка свежести (p50/p95, мс)"""
+        def percentiles(values) -> dict:
+            ordered = sorted(values)
+            if not ordered:
+                return {}
+            return {"p50": round(ordered[len(ordered) // 2]), "p95": round(ordered[int(len(ordered) * 0.95)])}
+
+        elapsed = time.monotonic() - self._started
+        return {
+            **self.metrics,
+            "messages_per_s": round(self.metrics["messages"] / elapsed, 1) if elapsed else 0.0,
+            "commit_lag_ms": percentiles(self.commit_lags),
+            "visible_lag_ms": percentiles(self.visible_lags),
+        }
+
+
+async def publish(redis_client, items: Iterable[dict], stream: str = None, chunk: int = 1000) -> int:
+    """Добавить видео или снимки в поток загрузки; возвращает число сообщений"""
+    stream = stream or settings.INGEST_STREAM
+    sent = 0
+    pipe = redis_client.pipeline(transaction=False)
+    for item in items:
+        pipe.xadd(stream, {"data": json.dumps(item, ensure_ascii=False, default=str)})
+        sent += 1
+        if sent % chunk == 0:
+            await pipe.execute()
+    await pipe.execute()
+    return sent
@@ -0,0 +1,146 @@
+import time
+import hashlib
+import logging
+from typing import List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Count-Min sketch: depth строк по width счетчиков u32 в одной строке Redis (BITFIELD)
+SKETCH_KEY = "stats:popularity:cms"
+# Самые частые вопросы: sorted set md5 -> оценка частоты и тексты/SQL только для них
+TOP_KEY = "stats:popularity:top"
+TOP_QUERIES_KEY = "stats:popularity:queries"
+TOP_SQL_KEY = "stats:popularity:sql"
+DECAY_AT_KEY = "stats:popularity:decay_at"
+
+# KEYS: sketch, top, queries, sql, decay_at, ключ ответа в кеше
+# ARGV: md5 вопроса, текст вопроса, K, now, интервал затухания, номера счетчиков...
+_RECORD_SCRIPT = """
+local exists = redis.call('EXISTS', KEYS[6])
+local now = tonumber(ARGV[4])
+local decay_at = tonumber(redis.call('GET', KEYS[5]) or '0')
+if decay_at == 0 then
+    redis.call('SET', KEYS[5], now + tonumber(ARGV[5]))
+elseif now >= decay_at then
+    -- Затухание: все счетчики и оценки top-K делятся пополам
+    local data = redis.call('GET', KEYS[1])
+    if data then
+        local parts = {}
+        for i = 1, #data - 3, 4 do
+            parts[#parts + 1] = struct.pack('>I4', math.floor(struct.unpack('>I4', data, i) / 2))
+        end
+        redis.call('SET', KEYS[1], table.concat(parts))
+    end
+    local top = redis.call('ZRANGE', KEYS[2], 0, -1, 'WITHSCORES')
+    for i = 1, #top, 2 do
+        redis.call('ZADD', KEYS[2], math.floor(tonumber(top[i + 1]) / 2), top[i])
+    end
+    redis.call('SET', KEYS[5], now + tonumber(ARGV[5]))
+end
+
+local ops = {'OVERFLOW', 'SAT'}
+for i = 6, #ARGV do
+    ops[#ops + 1] = 'INCRBY'
+    ops[#ops + 1] = 'u32'
+    ops[#ops + 1] = '#' .. ARGV[i]
+    ops[#ops + 1] = 1
+end
+local counters = redis.call('BITFIELD', KEYS[1], unpack(ops))
+local estimate = counters[1]
+for i = 2, #counters do
+    if counters[i] < estimate then estimate = counters[i] end
+end
+
+local member = ARGV[1]
+local k = tonumber(ARGV[3])
+if redis.call('ZSCORE', KEYS[2], member) or redis.call('ZCARD', KEYS[2]) < k then
+    if redis.call('ZADD', KEYS[2], estimate, member) == 1 then
+        redis.call('HSET', KEYS[3], member, ARGV[2])
+    end
+else
+    local lowest = redis.call('ZRANGE', KEYS[2], 0, 0, 'WITHSCORES')
+    if estimate > tonumber(lowest[2]) then
+        redis.call('ZREM', KEYS[2], lowest[1])
+        redis.call('HDEL', KEYS[3], lowest[1])
+        redis.call('HDEL', KEYS[4], lowest[1])
+        redis.call('ZADD', KEYS[2], estimate, member)
+        redis.call('HSET', KEYS[3], member, ARGV[2])
+    end
+end
+return {exists, estimate}
+"""
+
+# SQL храним только для вопросов из top-K
+_REMEMBER_SQL_SCRIPT = """
+if redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+class PopularityTracker:
+    """Частота вопросов в памяти фиксированного размера.
+
+    Вместо хеша stats:query:<md5> на каждый вопрос - Count-Min sketch
+    (оценка частоты сверху, width x depth счетчиков) и top-K самых частых
+    вопросов с текстом и SQL. Раз в decay_interval все счетчики делятся
+    пополам, чтобы старые всплески не держали вопрос в топе вечно.
+    """
+
+    def __init__(self, width: Optional[int] = None, depth: Optional[int] = None,
+                 top_k: Optional[int] = None, decay_interval: Optional[int] = None):
+        self.width = width or settings.POPULARITY_SKETCH_WIDTH
+        self.depth = depth or settings.POPULARITY_SKETCH_DEPTH
+        self.top_k = top_k or settings.POPULARITY_TOP_K
+        self.decay_interval = decay_interval or settings.POPULARITY_DECAY_INTERVAL
+        self._client = None
+        self._scripts = {}
+
+    def offsets(self, member: str) -> List[int]:
+        """Номера счетчиков вопроса (двойное хеширование по md5), по одному в каждой строке"""
+        digest = hashlib.md5(member.encode()).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def _script(self, client, name: str, source: str):
+        if client is not self._client:
+            self._client = client
+            self._scripts = {}
+        if name not in self._scripts:
+            self._scripts[name] = client.register_script(source)
+        return self._scripts[name]
+
+    async def record(self, client, member: str, query: str, answer_key: str) -> Tuple[bool, int]:
+        """Учесть вопрос одним запросом к Redis: есть ли уже ответ в кеше и оценка частоты"""
+        script = self._script(client, "record", _RECORD_SCRIPT)
+        exists, estimate = await script(
+            keys=[SKETCH_KEY, TOP_KEY, TOP_QUERIES_KEY, TOP_SQL_KEY, DECAY_AT_KEY, answer_key],
+            args=[member, query[:500], self.top_k, int(time.time()), self.decay_interval,
+                  *self.offsets(member)],
+        )
+        return bool(exists), int(estimate)
+
+    async def remember_sql(self, client, member: str, sql: str) -> bool:
+        """Сохранить SQL вопроса, если он в top-K"""
+        script = self._script(client, "remember_sql", _REMEMBER_SQL_SCRIPT)
+        return bool(await script(keys=[TOP_KEY, TOP_SQL_KEY], args=[member, sql]))
+
+    async def top(self, client, limit: int) -> List[dict]:
+        """Самые частые вопросы: текст, оценка числа использований и SQL"""
+        ranked = await client.zrevrange(TOP_KEY, 0, limit - 1, withscores=True)
+        if not ranked:
+            return []
+        members = [member for member, _ in ranked]
+        pipe = client.pipeline(transaction=False)
+        pipe.hmget(TOP_QUERIES_KEY, members)
+        pipe.hmget(TOP_SQL_KEY, members)
+        queries, sqls = await pipe.execute()
+        return [
+            {"query": query, "usage_count": int(score), "sql": sql}
+            for (_, score), query, sql in zip(ranked, queries, sqls) if query
+        ]
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+from dataclasses import replace
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import sqlglot
+from sqlglot import exp
+
+from app.core.config import settings
+from app.core.deadline import create_shared_task, current_deadline
+from app.services.sql_guard import GuardedSQL, analyze_sql
+from app.services.sql_params import parameterize_sql
+
+logger = logging.getLogger(__name__)
+
+# Части запроса, с которыми агрегат нельзя перенести в общий SELECT
+_BLOCKING_ARGS = ("joins", "with", "group", "having", "distinct", "order", "limit", "offset", "windows")
+
+
+def combine_key(guarded: GuardedSQL) -> Optional[Tuple[str, exp.Select]]:
+    """Таблица запроса (с псевдонимом) и дерево, если запрос можно объединить с другими.
+
+    Подходит SELECT с одним агрегатом (в том числе внутри ROUND, ::numeric)
+    из одной таблицы без соединений, группировки и подзапросов.
+    """
+    if not guarded.scalar or len(guarded.tables) != 1:
+        return None
+    tree = sqlglot.parse_one(guarded.sql, read="postgres")
+    if not isinstance(tree, exp.Select) or any(tree.args.get(arg) for arg in _BLOCKING_ARGS):
+        return None
+    source = tree.args.get("from_")
+    if source is None or not isinstance(source.this, exp.Table) or source.this.args.get("sample"):
+        return None
+    if len(list(tree.find_all(exp.Select))) != 1 or tree.find(exp.Filter, exp.Window):
+        return None
+    return source.this.sql(dialect="postgres"), tree
+
+
+def _with_filter(projection: exp.Expression, condition: exp.Expression) -> exp.Expression:
+    """Добавить FILTER (WHERE condition) к каждому агрегату проекции"""
+    if isinstance(projection, exp.AggFunc):
+        return exp.Filter(this=projection, expression=exp.Where(this=condition.copy()))
+    for agg in list(projection.find_all(exp.AggFunc)):
+        agg.replace(exp.Filter(this=agg.copy(), expression=exp.Where(this=condition.copy())))
+    return projection
+
+
+def combine_sql(trees: List[exp.Select]) -> str:
+    """Один SELECT с агрегатами всех запросов (колонки c0, c1, ... по порядку).
+
+    Одинаковое для всех условие остается в WHERE; разные условия переносятся
+    в FILTER (WHERE ...) своих агрегатов, а в WHERE остается их OR, чтобы
+    не читать строки, не нужные ни одному запросу.
+    """
+    conditions = [tree.args["where"].this if tree.args.get("where") else None for tree in trees]
+    shared = len({condition.sql() if condition is not None else "" for condition in conditions}) == 1
+
+    projections = []
+    for i, (tree, condition) in enumerate(zip(trees, conditions)):
+        projection = tree.expressions[0].unalias().copy()
+        if not shared and condition is not None:
+            projection = _with_filter(projection, condition)
+        projections.append(exp.alias_(projection, f"c{i}"))
+
+    combined = exp.select(*projections).from_(trees[0].args["from_"].this.copy())
+    if shared and conditions[0] is not None:
+        combined = combined.where(conditions[0].copy())
+    elif all(condition is not None for condition in conditions):
+        combined = combined.where(exp.or_(*(exp.Paren(this=condition.copy()) for condition in conditions)))
+    return combined.sql(dialect="postgres")
+
+
+class QueryCombiner:
+    """Объединение одновременных агрегатов по одной таблице в один проход.
+
+    Запросы с одним агрегатом, пришедшие в течение короткого окна, группируются
+    по таблице и выполняются одним SELECT с несколькими агрегатами; каждый
+    вызывающий получает свою колонку. Если общий запрос не выполнился, запросы
+    повторяются по одному.
+    """
+
+    def __init__(self, execute: Callable[[GuardedSQL], Awaitable], window_ms: int = None, max_size: int = None):
+        self.execute = execute
+        self.window = (settings.DB_COMBINE_WINDOW_MS if window_ms is None else window_ms) / 1000
+        self.max_size = settings.DB_COMBINE_MAX_SIZE if max_size is None else max_size
+        self.metrics = {"batches": 0, "combined_queries": 0, "scans_saved": 0, "fallbacks": 0}
+        self._pending = {}
+        self._timers = {}
+        self._tasks = set()
+
+    async def fetch_result(self, guarded: GuardedSQL):
+        """Выполнить запрос, по возможности вместе с другими агрегатами по той же таблице"""
+        key = combine_key(guarded) if self.max_size > 1 else None
+        if key is None:
+            return await self.execute(guarded)
+
+        table, tree = key
+        future = asyncio.get_running_loop().create_future()
+        batch = self._pending.setdefault(table, [])
+        batch.append((guarded, tree, future, current_deadline()))
+
+        if len(batch) >= self.max_size:
+            self._flush(table)
+        elif table not in self._timers:
+            self._timers[table] = asyncio.get_running_loop().call_later(self.window, self._flush, table)
+        return await future
+
+    def _flush(self, table: str) -> None:
+        """Забрать накопленные запросы и запустить их выполнение в фоне.
+
+        Общий запрос выполняется до самого позднего срока ожидающих и
+        отменяется, если все они отменили свои запросы.
+        """
+        timer = self._timers.pop(table, None)
+        if timer:
+            timer.cancel()
+        batch = [entry for entry in self._pending.pop(table, []) if not entry[2].done()]
+        if batch:
+            task = create_shared_task(self._run_batch([entry[:3] for entry in batch]),
+                                      [entry[2] for entry in batch], [entry[3] for entry in batch])
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: list) -> None:
+        # Одинаковые запросы выполняются один раз
+        unique = {}
+        for guarded, tree, future in batch:
+            unique.setdefault(guarded.sql, (guarded, tree, []))[2].append(future)
+        groups = list(unique.values())
+
+        try:
+            if len(groups) == 1:
+                guarded, _, futures = groups[0]
+                result = await self.execute(guarded)
+                for future in futures:
+                    self._resolve(future, result)
+                return
+
+            combined = analyze_sql(combine_sql([tree for _, tree, _ in groups]))
+            result = await self.execute(combined)
+            if result:
+                row = result.rows[0]
+                self.metrics["batches"] += 1
+                self.metrics["combined_queries"] += len(batch)
+                self.metrics["scans_saved"] += len(batch) - 1
+                logger.info(f"🔗 Объединено запросов в один проход: {len(batch)} ({len(groups)} различных)")
+                for i, (guarded, _, futures) in enumerate(groups):
+                    for future in futures:
+                        self._resolve(future, self._column_result(result, row[i], guarded))
+                return
+        except Exception as e:
+            logger.warning(f"Не удалось объединить запросы: {e}")
+
+        self.metrics["fallbacks"] += 1
+        results = await asyncio.gather(*(self.execute(guarded) for guarded, _, _ in groups), return_exceptions=True)
+        for (_, _, futures), result in zip(groups, results):
+            for future in futures:
+                self._resolve(future, None if isinstance(result, BaseException) else result)
+
+    @staticmethod
+    def _column_result(combined, value, guarded: GuardedSQL):
+        """Результат одного запроса из колонки общего"""
+        return replace(combined, value=value, rows=(), scalar=True, truncated=False,
+                       template=parameterize_sql(guarded.sql)[0], fingerprint=guarded.fingerprint)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result) -> None:
+        # Ожидающий мог уже отменить запрос
+        if not future.done():
+            future.set_result(result)
@@ -0,0 +1,260 @@
+import re
+import json
+import zlib
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+import sqlglot
+from sqlglot import exp
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+TABLES = ("videos", "video_snapshots")
+AGGREGATES = ("count", "count_distinct", "sum", "avg", "max", "min")
+
+# Колонки весов: вероятность ответа числом, затем таблица и агрегат
+_ANSWERABLE = 0
+_TABLE = slice(1, 1 + len(TABLES))
+_AGGREGATE = slice(1 + len(TABLES), 1 + len(TABLES) + len(AGGREGATES))
+_OUTPUTS = 1 + len(TABLES) + len(AGGREGATES)
+
+_WORD = re.compile(r'\w+')
+_DIGITS = re.compile(r'\d')
+
+_AGGREGATE_TYPES = ((exp.Sum, "sum"), (exp.Avg, "avg"), (exp.Max, "max"), (exp.Min, "min"))
+
+
+def _normalize(text: str) -> str:
+    # Регистр, "ё" и конкретные цифры не различаются: "27 ноября" и "15 ноября" -
+    # один и тот же вопрос для классификатора
+    return _DIGITS.sub('0', text.lower().replace('ё', 'е'))
+
+
+def _word_features(word: str) -> List[str]:
+    padded = f" {word} "
+    features = [f"w:{word}"]
+    for n in (3, 4, 5):
+        features.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return features
+
+
+def question_features(text: str) -> List[str]:
+    """Признаки вопроса: слова целиком и символьные 3-5-граммы слов"""
+    return [feature for word in _WORD.findall(_normalize(text)) for feature in _word_features(word)]
+
+
+@lru_cache(maxsize=65536)
+def _word_indices(word: str, dim: int) -> np.ndarray:
+    # Слова повторяются из вопроса в вопрос: хешируем n-граммы слова один раз
+    return np.array([zlib.crc32(feature.encode()) % dim for feature in _word_features(word)], dtype=np.int64)
+
+
+def feature_indices(text: str, dim: int) -> np.ndarray:
+    """Номера признаков в векторе размера dim (хеширование, устойчивое между запусками)"""
+    words = _WORD.findall(_normalize(text))
+    if not words:
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate([_word_indices(word, dim) for word in words])
+
+
+def labels_from_sql(sql: str) -> Tuple[Optional[str], Optional[str]]:
+    """Таблица и агрегат запроса, на который был получен ответ (разметка для обучения)"""
+    try:
+        tree = sqlglot.parse_one(sql, read="postgres")
+    except sqlglot.errors.ParseError:
+        return None, None
+    tables = {table.name for table in tree.find_all(exp.Table)}
+    table = "video_snapshots" if "video_snapshots" in tables else "videos" if "videos" in tables else None
+
+    aggregate = None
+    for agg in tree.find_all(exp.AggFunc):
+        if isinstance(agg, exp.Count):
+            aggregate = "count_distinct" if isinstance(agg.this, exp.Distinct) else "count"
+        else:
+            aggregate = next((name for kind, name in _AGGREGATE_TYPES if isinstance(agg, kind)), None)
+        if aggregate:
+            break
+    return table, aggregate
+
+
+@dataclass(slots=True)
+class LabeledQuestion:
+    """Вопрос с разметкой. Для вопросов без ответа table и aggregate - None"""
+    text: str
+    answerable: bool
+    table: Optional[str] = None
+    aggregate: Optional[str] = None
+
+
+@dataclass(slots=True)
+class Prediction:
+    """Вероятность ответа числом и наиболее вероятные таблица и агрегат"""
+    answerable: float
+    table: str
+    table_confidence: float
+    aggregate: str
+    aggregate_confidence: float
+
+    def hint(self, threshold: float) -> str:
+        """Подсказка для YandexGPT из уверенных предсказаний (пустая, если уверенных нет)"""
+        parts = []
+        if self.table_confidence >= threshold:
+            parts.append(f"таблица {self.table}")
+        if self.aggregate_confidence >= threshold:
+            parts.append(f"агрегат {self.aggregate.replace('_', ' ').upper()}")
+        return f"(подсказка: {', '.join(parts)})" if parts else ""
+
+
+def read_labeled(path: str) -> List[LabeledQuestion]:
+    """Размеченные вопросы из JSONL: {"q", "answerable", "table", "aggregate"}"""
+    with open(path, encoding="utf-8") as f:
+        return [
+            LabeledQuestion(item["q"], bool(item["answerable"]), item.get("table"), item.get("aggregate"))
+            for item in map(json.loads, filter(str.strip, f))
+        ]
+
+
+def examples_from_log(entries: Iterable[dict]) -> List[LabeledQuestion]:
+    """Разметка из журнала вопросов (cache_service.get_question_log).
+
+    Ответ получен - вопрос числовой, таблица и агрегат берутся из SQL;
+    YandexGPT не сгенерировал запрос или запрос отклонен - числом не ответить.
+    Пустой результат и ошибки БД ничего не говорят о вопросе, а отклоненные
+    классификатором вопросы - его собственные предсказания; они пропускаются.
+    Повторы вопроса учитываются один раз (по последнему исходу).
+    """
+    examples = {}
+    for entry in entries:
+        query, outcome = entry.get("q"), entry.get("outcome")
+        if not query or query in examples:
+            continue
+        if outcome == "answered" and entry.get("sql"):
+            examples[query] = LabeledQuestion(query, True, *labels_from_sql(entry["sql"]))
+        elif outcome in ("generation_failed", "invalid_sql"):
+            examples[query] = LabeledQuestion(query, False)
+    return list(examples.values())
+
+
+def _softmax(z: np.ndarray) -> np.ndarray:
+    z = z - z.max(axis=-1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+def _sigmoid(z: np.ndarray) -> np.ndarray:
+    return 1 / (1 + np.exp(-z))
+
+
+class QuestionClassifier:
+    """Линейный классификатор вопросов по символьным n-граммам.
+
+    Одна матрица весов dim x (1 + таблицы + агрегаты): вектор вопроса -
+    хешированные n-граммы, нормированные на sqrt(числа признаков), поэтому
+    предсказание - сумма нескольких десятков строк матрицы и три функции
+    активации над ее срезами.
+    """
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray):
+        self.weights = weights
+        self.bias = bias
+        self.dim = weights.shape[0]
+
+    def _scores(self, text: str) -> np.ndarray:
+        indices = feature_indices(text, self.dim)
+        if not len(indices):
+            return self.bias
+        return self.weights[indices].sum(axis=0) / np.sqrt(len(indices)) + self.bias
+
+    def predict(self, text: str) -> Prediction:
+        scores = self._scores(text)
+        tables = _softmax(scores[_TABLE])
+        aggregates = _softmax(scores[_AGGREGATE])
+        table, aggregate = int(tables.argmax()), int(aggregates.argmax())
+        return Prediction(
+            answerable=float(_sigmoid(scores[_ANSWERABLE])),
+            table=TABLES[table], table_confidence=float(tables[table]),
+            aggregate=AGGREGATES[aggregate], aggregate_confidence=float(aggregates[aggregate]),
+        )
+
+    @staticmethod
+    def _matrix(rows: List[np.ndarray], dim: int) -> np.ndarray:
+        """Плотная матрица признаков для пачки вопросов"""
+        matrix = np.zeros((len(rows), dim), dtype=np.float32)
+        for i, indices in enumerate(rows):
+            if len(indices):
+                np.add.at(matrix[i], indices, 1 / np.sqrt(len(indices)))
+        return matrix
+
+    @classmethod
+    def train(cls, examples: Iterable[LabeledQuestion], dim: int = 1 << 14, epochs: int = 200,
+              learning_rate: float = 5.0, l2: float = 1e-5, batch_size: int = 256,
+              seed: int = 0) -> "QuestionClassifier":
+        """Обучить логистическую регрессию (ответ числом) и две softmax-регрессии.
+
+        Таблица и агрегат учатся только на вопросах с ответом, для которых
+        они известны. Мини-батчевый градиентный спуск с L2-регуляризацией.
+        """
+        examples = list(examples)
+        rows = [feature_indices(example.text, dim) for example in examples]
+        answerable = np.array([example.answerable for example in examples], dtype=np.float32)
+        tables = np.zeros((len(examples), len(TABLES)), dtype=np.float32)
+        aggregates = np.zeros((len(examples), len(AGGREGATES)), dtype=np.float32)
+        for i, example in enumerate(examples):
+            if example.answerable and example.table in TABLES:
+                tables[i, TABLES.index(example.table)] = 1
+            if example.answerable and example.aggregate in AGGREGATES:
+                aggregates[i, AGGREGATES.index(example.aggregate)] = 1
+        has_table, has_aggregate = tables.any(axis=1), aggregates.any(axis=1)
+
+        rng = np.random.default_rng(seed)
+        weights = np.zeros((dim, _OUTPUTS), dtype=np.float32)
+        bias = np.zeros(_OUTPUTS, dtype=np.float32)
+        for _ in range(epochs):
+            order = rng.permutation(len(examples))
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                x = cls._matrix([rows[i] for i in batch], dim)
+                scores = x @ weights + bias
+
+                gradient = np.zeros_like(scores)
+                gradient[:, _ANSWERABLE] = _sigmoid(scores[:, _ANSWERABLE]) - answerable[batch]
+                gradient[:, _TABLE] = (_softmax(scores[:, _TABLE]) - tables[batch]) * has_table[batch, None]
+                gradient[:, _AGGREGATE] = \
+                    (_softmax(scores[:, _AGGREGATE]) - aggregates[batch]) * has_aggregate[batch, None]
+                gradient /= len(batch)
+
+                weights -= learning_rate * (x.T @ gradient + l2 * weights)
+                bias -= learning_rate * gradient.sum(axis=0)
+        return cls(weights, bias)
+
+    def save(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(path, weights=self.weights, bias=self.bias,
+                            tables=np.array(TABLES), aggregates=np.array(AGGREGATES))
+
+    @classmethod
+    def load(cls, path: str) -> Optional["QuestionClassifier"]:
+        """Загрузить модель; без файла или для другого набора классов - None"""
+        if not path or not Path(path).exists():
+            logger.info(f"Модель классификатора вопросов не найдена ({path}), используется фильтр по словам")
+            return None
+        try:
+            with np.load(path) as data:
+                if tuple(data["tables"]) != TABLES or tuple(data["aggregates"]) != AGGREGATES:
+                    logger.warning("Модель классификатора обучена для других классов, используется фильтр по словам")
+                    return None
+                model = cls(data["weights"], data["bias"])
+        except Exception as e:
+            logger.error(f"Не удалось загрузить модель классификатора вопросов: {e}")
+            return None
+        logger.info(f"Загружена модель классификатора вопросов ({path}, признаков: {model.dim})")
+        return model
+
+
+question_classifier = QuestionClassifier.load(settings.CLASSIFIER_MODEL_PATH)
@@ -0,0 +1,87 @@
+import random
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Автоматический выключатель для внешнего сервиса.
+
+    После failure_threshold ошибок подряд переходит в состояние "open" и сразу
+    отклоняет запросы. Через reset_timeout секунд пропускает один пробный запрос
+    ("half_open"): успех закрывает выключатель, ошибка снова открывает его.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self._state = self.CLOSED
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+        return self._state
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == self.OPEN
+
+    def allow_request(self) -> bool:
+        """Можно ли отправить запрос. В half_open пропускается только один пробный запрос"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN:
+            # Пока пробный запрос не завершился, остальные отклоняем
+            self._state = self.OPEN
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self._state != self.CLOSED:
+            logger.info(f"🟢 Выключатель {self.name} закрыт")
+        self.failures = 0
+        self._state = self.CLOSED
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._state != self.CLOSED or self.failures >= self.failure_threshold:
+            if self._state == self.CLOSED:
+                logger.warning(f"🔴 Выключатель {self.name} открыт после {self.failures} ошибок подряд")
+            self._state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Скользящее окно задержек для расчета перцентилей"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, q: float):
+        """Вернуть q-й перцентиль (0..1) или None, если данных пока мало"""
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Экспоненциальная задержка с полным джиттером для попытки attempt (с 0)"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
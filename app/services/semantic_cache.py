@@ -0,0 +1,412 @@
+import re
+import json
+import time
+import hashlib
+import uuid
+import logging
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.question_classifier import feature_indices
+from app.services.sql_params import parameterize_sql, render_template
+
+logger = logging.getLogger(__name__)
+
+# Вопросы с SQL (hash: md5 вопроса -> JSON {"q", "sql", "t"}) - восстанавливаются при старте
+SEMANTIC_KEY = "cache:semantic"
+
+_MONTH_STEMS = ("январ", "феврал", "март", "апрел", "ма", "июн", "июл", "август", "сентябр", "октябр", "ноябр",
+                "декабр")
+_MONTH = r"(?P<{name}>январ\w*|феврал\w*|март\w*|апрел\w*|ма[йяе]|июн\w*|июл\w*|август\w*|сентябр\w*|октябр\w*" \
+         r"|ноябр\w*|декабр\w*)"
+_YEAR = r"(?:\s+(?P<{name}>\d{{4}})(?:\s*(?:года|год|г\.?))?)?"
+
+# Множители чисел: "10 тыс", "2,5 млн", "10k"
+_SCALES = (("тыс", 10 ** 3), ("млн", 10 ** 6), ("миллион", 10 ** 6), ("млрд", 10 ** 9), ("миллиард", 10 ** 9))
+
+# Значения в вопросе, которые подставляются в SQL: id, даты, месяцы, числа (с множителем)
+_PARAM_RE = re.compile(
+    r"(?P<id>(?<![0-9a-f])(?:[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{32})(?![0-9a-f]))"
+    r"|(?P<iso>\b\d{4}-\d{2}-\d{2}\b)"
+    r"|(?P<dotted>\b\d{1,2}\.\d{1,2}\.\d{4}\b)"
+    rf"|(?P<day>\b\d{{1,2}})\s+{_MONTH.format(name='day_month')}\b{_YEAR.format(name='day_year')}"
+    rf"|\b{_MONTH.format(name='month')}\b{_YEAR.format(name='month_year')}"
+    r"|(?P<number>\b\d+(?:[.,]\d+)?)(?:\s*(?P<scale>(?:тыс|млн|миллион|млрд|миллиард)\w*)|(?P<short>[кk]))?\b"
+)
+
+# Синонимы предметной области и слова, не меняющие смысла вопроса
+_SYNONYMS = (
+    (re.compile(r"\b(?:ролик|клип|видос)\w*"), "видео"),
+    (re.compile(r"\b(?:автор|блогер|креатор)\w*"), "креатор"),
+    (re.compile(r"\b(?:количеств|числ)\w*"), "сколько"),
+)
+# Слова сравнения и направления: меняют смысл при том же наборе значений ("больше" и "меньше",
+# "до" и "после" ноября), поэтому у похожих вопросов они должны совпадать в точности
+_QUALIFIERS = {
+    "больше": "больше", "более": "больше", "выше": "больше", "свыше": "больше", "превышает": "больше",
+    "меньше": "меньше", "менее": "меньше", "ниже": "меньше",
+    "до": "до", "раньше": "до", "ранее": "до", "после": "после", "позже": "после", "позднее": "после",
+    "с": "с", "со": "с", "начиная": "с", "от": "от", "по": "по", "между": "между", "ровно": "ровно",
+    "минимум": "не меньше", "максимум": "не больше", "не": "не",
+}
+# Относительное время: "вчера" и "сегодня", "за неделю" и "за месяц" - разные условия по датам,
+# которых нет среди значений вопроса, поэтому у похожих вопросов они тоже должны совпадать
+_TIME_WORDS = (
+    (re.compile(r"позавчера"), "позавчера"), (re.compile(r"вчера\w*"), "вчера"),
+    (re.compile(r"сегодня\w*"), "сегодня"), (re.compile(r"завтра\w*"), "завтра"),
+    (re.compile(r"(?:дн[еияю]\w*|день|сут(?:ки|ок|кам?и?))"), "день"), (re.compile(r"час(?:а|ов|ам?и?|ы)?"), "час"),
+    (re.compile(r"недел\w*"), "неделя"), (re.compile(r"месяц\w*|месячн\w*"), "месяц"),
+    (re.compile(r"квартал\w*"), "квартал"), (re.compile(r"год\w*|лет"), "год"),
+    (re.compile(r"прошл\w*|прошедш\w*|предыдущ\w*"), "прошлый"), (re.compile(r"последн\w*"), "последний"),
+    (re.compile(r"текущ\w*|нынешн\w*"), "текущий"),
+)
+_STOP_WORDS = {"в", "во", "на", "у", "и", "а", "ли", "же", "всего", "какое", "каково", "какая", "каков", "есть",
+               "хранится", "хранятся", "имеется", "имеются", "базе", "базы", "системе", "данных", "нас", "сейчас"}
+
+
+@dataclass(slots=True)
+class QuestionParam:
+    """Значение из вопроса. day: (год или None, месяц, день), month: (год или None, месяц).
+
+    ops - слова сравнения и направления перед значением ("больше", "до", "не меньше").
+    """
+    kind: str
+    value: object
+    ops: Tuple[str, ...] = ()
+
+
+def _month(word: str) -> int:
+    return next(i for i, stem in enumerate(_MONTH_STEMS, 1) if word.startswith(stem))
+
+
+def qualifiers(words: List[str]) -> List[Optional[str]]:
+    """Слово сравнения или направления для каждого слова (None - обычное слово).
+
+    Синонимы приводятся к одному виду, "не" объединяется со следующим
+    словом сравнения: "не менее" и "минимум" - одно и то же "не меньше".
+    """
+    result = [_QUALIFIERS.get(word, "больше" if word.startswith("превыш") else None) for word in words]
+    for i in range(len(result) - 1):
+        if result[i] == "не" and result[i + 1] and result[i + 1] != "не":
+            result[i], result[i + 1] = None, "не " + result[i + 1]
+    return result
+
+
+def time_word(word: str) -> Optional[str]:
+    """Слово относительного времени в одном виде ("вчерашних" - "вчера") или None"""
+    return next((name for pattern, name in _TIME_WORDS if pattern.fullmatch(word)), None)
+
+
+def exact_words(skeleton: str) -> Tuple[str, ...]:
+    """Слова сравнения, направления и относительного времени вопроса по порядку.
+
+    Они меняют смысл, не меняя значений, поэтому у похожих вопросов
+    должны совпадать в точности.
+    """
+    words = skeleton.split()
+    return tuple(op or time_word(word) for word, op in zip(words, qualifiers(words)) if op or time_word(word))
+
+
+def extract_params(question: str) -> Tuple[str, List[QuestionParam]]:
+    """Вопрос без конкретных значений (skeleton) и сами значения по порядку.
+
+    "Сколько видео у креатора <id> 27 ноября 2025" и то же для другого
+    креатора и дня дают одинаковый skeleton и разные параметры. Множитель
+    входит в число: "10 млн" - значение 10000000.
+    """
+    text = question.lower().replace("ё", "е")
+    params = []
+
+    def replace(match: re.Match) -> str:
+        if match.group("id"):
+            params.append(QuestionParam("id", match.group("id")))
+            return " _id_ "
+        if match.group("month"):
+            year = match.group("month_year")
+            params.append(QuestionParam("month", (int(year) if year else None, _month(match.group("month")))))
+            return " _month_ "
+        if match.group("number"):
+            number = Decimal(match.group("number").replace(",", "."))
+            if match.group("short"):
+                number *= 1000
+            elif match.group("scale"):
+                number *= next(factor for stem, factor in _SCALES if match.group("scale").startswith(stem))
+            params.append(QuestionParam("number", number))
+            return " _num_ "
+
+        if match.group("iso"):
+            year, month, day = map(int, match.group("iso").split("-"))
+        elif match.group("dotted"):
+            day, month, year = map(int, match.group("dotted").split("."))
+        else:
+            year = match.group("day_year")
+            year, month, day = int(year) if year else None, _month(match.group("day_month")), int(match.group("day"))
+        params.append(QuestionParam("day", (year, month, day)))
+        return " _day_ "
+
+    skeleton = _PARAM_RE.sub(replace, text)
+    for pattern, word in _SYNONYMS:
+        skeleton = pattern.sub(word, skeleton)
+    words = [word for word in re.findall(r"\w+", skeleton) if word not in _STOP_WORDS]
+
+    # Значению достаются слова сравнения после предыдущего значения: "больше _num_", "с _day_ по _day_"
+    ops, placeholders = [], iter(params)
+    for word, op in zip(words, qualifiers(words)):
+        if op:
+            ops.append(op)
+        elif word in ("_id_", "_day_", "_month_", "_num_"):
+            next(placeholders).ops = tuple(ops)
+            ops = []
+    return " ".join(words), params
+
+
+def _plain_id(value: str) -> str:
+    return value.replace("-", "").lower()
+
+
+def _next_month(day: date) -> date:
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def _bindings(sql_params: list, params: List[QuestionParam]) -> List[List[Tuple[int, str]]]:
+    """Для каждого литерала SQL - какие значения вопроса он может означать и как из них получен.
+
+    Дата дня - сам день (day) или следующий день (day+1, конец диапазона);
+    первое число месяца - начало месяца (month) или конец предыдущего (month+1).
+    """
+    result = []
+    for value in sql_params:
+        candidates = []
+        literal_day = None
+        if isinstance(value, str) and re.fullmatch(r"\d{4}-\d{2}-\d{2}(?:[ T][\d:.+]*)?", value):
+            try:
+                literal_day = date.fromisoformat(value[:10])
+            except ValueError:
+                pass
+
+        for i, param in enumerate(params):
+            if param.kind == "id" and isinstance(value, str) and _plain_id(value) == _plain_id(param.value):
+                candidates.append((i, "id"))
+            elif param.kind == "number" and isinstance(value, (int, Decimal)) and Decimal(value) == param.value:
+                candidates.append((i, "number"))
+            elif literal_day and param.kind == "day":
+                year, month, day = param.value
+                for offset, derived in ((0, "day"), (1, "day+1")):
+                    base = literal_day - timedelta(days=offset)
+                    if (base.month, base.day) == (month, day) and year in (None, base.year):
+                        candidates.append((i, derived))
+            elif literal_day and param.kind == "month" and literal_day.day == 1:
+                year, month = param.value
+                previous = literal_day - timedelta(days=1)
+                if literal_day.month == month and year in (None, literal_day.year):
+                    candidates.append((i, "month"))
+                elif previous.month == month and year in (None, previous.year):
+                    candidates.append((i, "month+1"))
+        result.append(candidates)
+    return result
+
+
+def _rebind_value(old_value, derived: str, old: QuestionParam, new: QuestionParam):
+    """Значение литерала для нового параметра (год без явного указания берется из старого литерала)"""
+    if derived == "id":
+        # Запись id как в исходном SQL: с дефисами или без
+        if "-" in old_value and "-" not in new.value:
+            return str(uuid.UUID(new.value))
+        return new.value if "-" in old_value else _plain_id(new.value)
+    if derived == "number":
+        if isinstance(old_value, int) and new.value == new.value.to_integral_value():
+            return int(new.value)
+        return new.value
+    literal_day = date.fromisoformat(old_value[:10])
+    suffix = old_value[10:]
+    if derived in ("day", "day+1"):
+        offset = 1 if derived == "day+1" else 0
+        base = literal_day - timedelta(days=offset)
+        year, month, day = new.value
+        try:
+            result = date(year or base.year, month, day) + timedelta(days=offset)
+        except ValueError:
+            return None
+    else:
+        base = literal_day if derived == "month" else literal_day - timedelta(days=1)
+        year, month = new.value
+        result = date(year or base.year, month, 1)
+        if derived == "month+1":
+            result = _next_month(result)
+    return result.isoformat() + suffix
+
+
+def rebind_sql(sql: str, old_params: List[QuestionParam], new_params: List[QuestionParam]) -> Optional[str]:
+    """SQL для вопроса с новыми значениями или None, если подставить их надежно нельзя.
+
+    Значения должны совпадать по видам, порядку и словам сравнения перед
+    ними ("больше 100" не подставляется в SQL для "меньше 100"); каждое
+    изменившееся значение должно однозначно найтись среди литералов SQL.
+    """
+    if [(param.kind, param.ops) for param in old_params] != [(param.kind, param.ops) for param in new_params]:
+        return None
+    if all(old.value == new.value for old, new in zip(old_params, new_params)):
+        return sql
+
+    template, values = parameterize_sql(sql, typed_literals=True)
+    covered = set()
+    for j, candidates in enumerate(_bindings(values, old_params)):
+        if not candidates:
+            continue
+        rebound = {_rebind_value(values[j], derived, old_params[i], new_params[i]) for i, derived in candidates}
+        if len(rebound) != 1 or None in rebound:
+            return None
+        values[j] = rebound.pop()
+        covered.update(i for i, _ in candidates)
+
+    if any(old.value != new.value and i not in covered
+           for i, (old, new) in enumerate(zip(old_params, new_params))):
+        return None
+    return render_template(template, values)
+
+
+@dataclass(slots=True)
+class SemanticHit:
+    """SQL похожего вопроса с подставленными значениями"""
+    sql: str
+    similarity: float
+    source: str
+    key: str
+
+
+class SemanticCache:
+    """Кеш SQL по смыслу вопроса.
+
+    Вопрос без конкретных значений (extract_params) с заменой синонимов
+    превращается в вектор хешированных n-грамм единичной длины; векторы
+    хранятся строками матрицы, и ближайший по косинусу вопрос находится
+    одним умножением матрицы на вектор. Если сходство не ниже порога, а
+    слова сравнения, направления и относительного времени совпадают
+    в точности, его SQL с подставленными значениями нового вопроса
+    используется вместо генерации. При переполнении вытесняется давно не
+    использованный вопрос; время использования сохраняется и в Redis.
+    """
+
+    def __init__(self, capacity: int = None, dim: int = None, threshold: float = None):
+        self.capacity = capacity or settings.SEMANTIC_CACHE_SIZE
+        self.dim = dim or settings.SEMANTIC_CACHE_DIM
+        self.threshold = settings.SEMANTIC_CACHE_THRESHOLD if threshold is None else threshold
+        self.matrix = np.zeros((self.capacity, self.dim), dtype=np.float32)
+        self.last_used = np.zeros(self.capacity)
+        self.entries: List[Optional[dict]] = [None] * self.capacity
+        self.rows = {}
+        self.size = 0
+        self.metrics = {"hits": 0, "misses": 0, "rebind_failed": 0, "evicted": 0}
+
+    def embed(self, skeleton: str) -> np.ndarray:
+        vector = np.bincount(feature_indices(skeleton, self.dim), minlength=self.dim).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def _key(question: str) -> str:
+        return hashlib.md5(question.strip().lower().encode()).hexdigest()
+
+    def search(self, question: str) -> Optional[Tuple[float, dict, str, List[QuestionParam]]]:
+        """Ближайший сохраненный вопрос: сходство, запись, skeleton и значения нового вопроса"""
+        if not self.size:
+            return None
+        skeleton, params = extract_params(question)
+        scores = self.matrix[:self.size] @ self.embed(skeleton)
+        row = int(scores.argmax())
+        return float(scores[row]), self.entries[row], skeleton, params
+
+    def lookup(self, question: str) -> Optional[SemanticHit]:
+        """SQL похожего вопроса или None"""
+        found = self.search(question)
+        if found is None or found[0] < self.threshold:
+            self.metrics["misses"] += 1
+            return None
+        similarity, entry, skeleton, params = found
+        # Высокое сходство при другом сравнении ("меньше" вместо "больше") или времени ("вчера") - другой вопрос
+        if exact_words(skeleton) != entry["exact"]:
+            self.metrics["misses"] += 1
+            return None
+        sql = rebind_sql(entry["sql"], entry["params"], params)
+        if sql is None:
+            self.metrics["rebind_failed"] += 1
+            return None
+        self.last_used[self.rows[entry["key"]]] = time.time()
+        self.metrics["hits"] += 1
+        logger.info(f"🧭 Похожий вопрос ({similarity:.2f}): '{entry['q'][:40]}' -> '{question[:40]}'")
+        return SemanticHit(sql, similarity, entry["q"], entry["key"])
+
+    def _insert(self, question: str, sql: str, used_at: float) -> Tuple[str, Optional[str]]:
+        """Добавить вопрос в матрицу; возвращает его ключ и ключ вытесненного"""
+        key = self._key(question)
+        evicted = None
+        row = self.rows.get(key)
+        if row is None:
+            if self.size < self.capacity:
+                row = self.size
+                self.size += 1
+            else:
+                row = int(self.last_used.argmin())
+                evicted = self.entries[row]["key"]
+                del self.rows[evicted]
+                self.metrics["evicted"] += 1
+            self.rows[key] = row
+
+        skeleton, params = extract_params(question)
+        self.matrix[row] = self.embed(skeleton)
+        self.last_used[row] = used_at
+        self.entries[row] = {"key": key, "q": question, "sql": sql, "params": params,
+                             "exact": exact_words(skeleton)}
+        return key, evicted
+
+    @staticmethod
+    def _stored(entry: dict, used_at: float) -> str:
+        return json.dumps({"q": entry["q"], "sql": entry["sql"], "t": used_at}, ensure_ascii=False)
+
+    async def add(self, client, question: str, sql: str) -> None:
+        """Запомнить SQL вопроса (и сохранить в Redis, если он подключен)"""
+        now = time.time()
+        key, evicted = self._insert(question, sql, now)
+        if client is None:
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.hset(SEMANTIC_KEY, key, self._stored(self.entries[self.rows[key]], now))
+            if evicted:
+                pipe.hdel(SEMANTIC_KEY, evicted)
+            await pipe.execute()
+        except Exception as e:
+            logger.error(f"Ошибка сохранения вопроса в семантический кеш: {e}", exc_info=True)
+
+    async def touch(self, client, hit: SemanticHit) -> None:
+        """Сохранить в Redis время использования вопроса, чтобы после перезапуска вытеснялись давно не нужные"""
+        row = self.rows.get(hit.key)
+        if client is None or row is None:
+            return
+        try:
+            await client.hset(SEMANTIC_KEY, hit.key, self._stored(self.entries[row], float(self.last_used[row])))
+        except Exception as e:
+            logger.error(f"Ошибка сохранения использования семантического кеша: {e}", exc_info=True)
+
+    async def load(self, client) -> int:
+        """Восстановить матрицу из Redis: последние использованные вопросы в пределах capacity"""
+        if client is None:
+            return 0
+        try:
+            stored = await client.hgetall(SEMANTIC_KEY)
+        except Exception as e:
+            logger.error(f"Ошибка загрузки семантического кеша: {e}", exc_info=True)
+            return 0
+        entries = sorted((json.loads(value) for value in stored.values()), key=lambda entry: entry["t"])
+        for entry in entries[-self.capacity:]:
+            self._insert(entry["q"], entry["sql"], entry["t"])
+        logger.info(f"🧭 Семантический кеш загружен: {self.size} вопросов")
+        return self.size
+
+
+semantic_cache = SemanticCache()
@@ -0,0 +1,154 @@
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from typing import FrozenSet, Optional
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ParseError
+
+logger = logging.getLogger(__name__)
+
+# Таблицы, к которым разрешено обращаться сгенерированному SQL
+ALLOWED_TABLES = frozenset({"videos", "video_snapshots"})
+
+# Разрешенные функции (классы выражений sqlglot): агрегаты, даты, арифметика
+ALLOWED_FUNCTIONS = (
+    exp.Count, exp.Sum, exp.Avg, exp.Min, exp.Max, exp.Stddev, exp.Variance,
+    exp.PercentileCont, exp.PercentileDisc,
+    exp.Round, exp.Abs, exp.Ceil, exp.Floor, exp.Greatest, exp.Least,
+    exp.Coalesce, exp.Nullif, exp.Case, exp.If, exp.Cast, exp.TryCast,
+    exp.Extract, exp.Date, exp.DateTrunc, exp.TimestampTrunc, exp.TimeToStr,
+    exp.CurrentDate, exp.CurrentTimestamp,
+    exp.Lower, exp.Upper, exp.Length,
+)
+
+# Операторы (AND, +, NOT, IN, EXISTS ...) в sqlglot тоже функции - их не ограничиваем
+_OPERATORS = (exp.Binary, exp.Unary, exp.Predicate, exp.Connector)
+
+# Узлы, которых не должно быть в запросе только на чтение
+_FORBIDDEN_NODES = (
+    exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Create, exp.Drop,
+    exp.Alter, exp.Command, exp.Into, exp.Lock, exp.Set, exp.Transaction,
+)
+
+
+class UnsafeSQLError(ValueError):
+    """Сгенерированный SQL не прошел проверку"""
+
+
+@dataclass(slots=True)
+class GuardedSQL:
+    """Проверенный запрос.
+
+    sql - текст для выполнения (при необходимости с добавленным LIMIT),
+    fingerprint - хеш нормализованного запроса без литералов: одинаков
+    для запросов, отличающихся только значениями.
+    """
+    sql: str
+    fingerprint: str
+    normalized: str
+    tables: FrozenSet[str] = field(default_factory=frozenset)
+    scalar: bool = False
+    limited: bool = False
+
+
+def _parse(sql: str) -> exp.Expression:
+    try:
+        statements = [statement for statement in sqlglot.parse(sql, read="postgres") if statement is not None]
+    except ParseError as e:
+        raise UnsafeSQLError(f"Не удалось разобрать SQL: {e}") from e
+    if len(statements) != 1:
+        raise UnsafeSQLError(f"Ожидался один запрос, получено: {len(statements)}")
+
+    tree = statements[0]
+    if not isinstance(tree, (exp.Select, exp.Union, exp.Intersect, exp.Except)):
+        raise UnsafeSQLError(f"Разрешен только SELECT, получено: {tree.key.upper()}")
+    return tree
+
+
+def _check_tree(tree: exp.Expression) -> FrozenSet[str]:
+    """Проверить узлы, таблицы и функции; вернуть имена использованных таблиц"""
+    cte_names = {cte.alias_or_name for cte in tree.find_all(exp.CTE)}
+    tables = set()
+
+    for node in tree.walk():
+        if isinstance(node, _FORBIDDEN_NODES):
+            raise UnsafeSQLError(f"Запрещенная конструкция: {node.key.upper()}")
+
+        if isinstance(node, exp.Table):
+            if node.name in cte_names and not node.db:
+                continue
+            if node.db or node.catalog or node.name not in ALLOWED_TABLES:
+                raise UnsafeSQLError(f"Таблица не разрешена: {node.sql(dialect='postgres')}")
+            tables.add(node.name)
+
+        elif isinstance(node, exp.Func) and not isinstance(node, _OPERATORS):
+            if not isinstance(node, ALLOWED_FUNCTIONS):
+                name = node.name if isinstance(node, exp.Anonymous) else node.sql_name()
+                raise UnsafeSQLError(f"Функция не разрешена: {name}")
+
+    if not tables:
+        raise UnsafeSQLError("Запрос не обращается ни к одной таблице")
+    return frozenset(tables)
+
+
+def _is_aggregate(projection: exp.Expression) -> bool:
+    """Проекция вычисляется агрегатом (в том числе внутри ROUND(...), ::numeric)"""
+    return any(not agg.find_ancestor(exp.Window) for agg in projection.find_all(exp.AggFunc)) \
+        and not projection.find(exp.Window)
+
+
+def _is_single_row(tree: exp.Expression) -> bool:
+    """Агрегаты без группировки возвращают ровно одну строку"""
+    return isinstance(tree, exp.Select) and not tree.args.get("group") \
+        and all(_is_aggregate(projection) for projection in tree.expressions)
+
+
+def fingerprint_sql(tree: exp.Expression) -> str:
+    """Нормализованный текст запроса: литералы заменены на ?, регистр приведен"""
+    def strip_literal(node):
+        if isinstance(node, exp.Literal):
+            return exp.Var(this="?")
+        return node
+
+    return tree.transform(strip_literal).sql(dialect="postgres", normalize=True)
+
+
+def _limit_value(tree: exp.Expression) -> Optional[int]:
+    limit = tree.args.get("limit")
+    if limit is None:
+        return None
+    value = limit.expression
+    if isinstance(value, exp.Literal) and value.is_int:
+        return int(value.this)
+    # LIMIT ALL, LIMIT $1 и т.п. считаем отсутствием ограничения
+    return None
+
+
+def analyze_sql(sql: str, max_rows: Optional[int] = None) -> GuardedSQL:
+    """Разобрать SQL и проверить, что это один SELECT только на чтение.
+
+    Разрешены только таблицы ALLOWED_TABLES и функции ALLOWED_FUNCTIONS.
+    Если задан max_rows и запрос не сводится к одной строке агрегатов, в него
+    добавляется LIMIT max_rows + 1 (лишняя строка - признак обрезки).
+    При нарушении выбрасывает UnsafeSQLError.
+    """
+    tree = _parse(sql)
+    tables = _check_tree(tree)
+    single_row = _is_single_row(tree)
+    scalar = single_row and len(tree.expressions) == 1
+    normalized = fingerprint_sql(tree)
+    fingerprint = hashlib.md5(normalized.encode()).hexdigest()
+
+    text = sql.strip().rstrip(";").strip()
+    limited = False
+    if max_rows and not single_row:
+        limit = _limit_value(tree)
+        if limit is None or limit > max_rows + 1:
+            text = tree.limit(max_rows + 1).sql(dialect="postgres")
+            limited = True
+            logger.info(f"В запрос добавлен LIMIT {max_rows + 1}: {fingerprint}")
+
+    return GuardedSQL(sql=text, fingerprint=fingerprint, normalized=normalized,
+                      tables=tables, scalar=scalar, limited=limited)
@@ -0,0 +1,146 @@
+import re
+import uuid
+from decimal import Decimal
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+from typing import Sequence, Tuple
+
+# Токены SQL, которые важны для выделения литералов
+_TOKEN_RE = re.compile(r"""
+    (?P<string>'(?:[^']|'')*')
+  | (?P<ident>"(?:[^"]|"")*")
+  | (?P<number>(?<![\w.$])\d+(?:\.\d+)?(?![\w.]))
+  | (?P<word>[A-Za-z_][A-Za-z_0-9]*)
+  | (?P<cast>::)
+  | (?P<paren>[()])
+""", re.VERBOSE)
+
+# После этих слов литерал задает тип и не может быть параметром
+_TYPED_LITERAL_PREFIXES = {'INTERVAL', 'DATE', 'TIMESTAMP', 'TIMESTAMPTZ', 'TIME'}
+
+# Слова, которыми заканчивается список ORDER BY / GROUP BY
+_BY_LIST_END = {'LIMIT', 'OFFSET', 'HAVING', 'WINDOW', 'UNION', 'INTERSECT', 'EXCEPT', 'FETCH', 'FOR', 'ORDER'}
+
+
+def parameterize_sql(sql: str, typed_literals: bool = False) -> Tuple[str, list]:
+    """Вынести литералы запроса в параметры $1, $2, ...
+
+    Запросы, отличающиеся только значениями (id креатора, даты, пороги),
+    превращаются в один шаблон, и кеш подготовленных выражений начинает
+    попадать. Литералы до первого FROM (список выборки), типизированные
+    литералы (INTERVAL '1 day'), литералы с явным приведением (::) и целые
+    в списках ORDER BY / GROUP BY (номер колонки: ORDER BY 1 DESC; параметр
+    на его месте - сортировка по константе) не трогаются. typed_literals=True
+    выносит и их - для подстановки других значений в текст запроса, а не для
+    подготовленных выражений.
+    """
+    parts = []
+    params = []
+    position = 0
+    seen_from = False
+    previous_word = None
+    previous_end = 0
+    depth = 0
+    by_depth = None  # глубина скобок, на которой идет список ORDER BY / GROUP BY
+
+    for match in _TOKEN_RE.finditer(sql):
+        kind = match.lastgroup
+        if kind == 'word':
+            word = match.group().upper()
+            if word == 'BY' and previous_word in ('ORDER', 'GROUP'):
+                by_depth = depth
+            elif word in _BY_LIST_END and by_depth == depth:
+                by_depth = None
+            previous_word = word
+            previous_end = match.end()
+            if word == 'FROM':
+                seen_from = True
+            continue
+        if kind == 'paren':
+            depth += 1 if match.group() == '(' else -1
+            if by_depth is not None and depth < by_depth:
+                by_depth = None
+            previous_word = None
+            continue
+        if kind not in ('string', 'number'):
+            previous_word = None
+            continue
+
+        literal = match.group()
+        typed = previous_word in _TYPED_LITERAL_PREFIXES and not sql[previous_end:match.start()].strip()
+        previous_word = None
+        if not seen_from or (not typed_literals and (typed or sql.startswith('::', match.end()))):
+            continue
+        if by_depth == depth and kind == 'number' and '.' not in literal:
+            continue
+
+        if kind == 'string':
+            value = literal[1:-1].replace("''", "'")
+        elif '.' in literal:
+            value = Decimal(literal)
+        else:
+            value = int(literal)
+
+        params.append(value)
+        parts.append(sql[position:match.start()])
+        parts.append(f"${len(params)}")
+        position = match.end()
+
+    parts.append(sql[position:])
+    return "".join(parts), params
+
+
+_PLACEHOLDER_RE = re.compile(r"\$(\d+)")
+
+
+def render_template(template: str, params: Sequence) -> str:
+    """Подставить значения в шаблон parameterize_sql обратно литералами"""
+    def literal(match: re.Match) -> str:
+        value = params[int(match.group(1)) - 1]
+        if isinstance(value, str):
+            return "'" + value.replace("'", "''") + "'"
+        return str(value)
+
+    return _PLACEHOLDER_RE.sub(literal, template)
+
+
+class UnsupportedParamType(ValueError):
+    """Тип параметра шаблона не поддерживается - не зависит от значения"""
+
+
+def coerce_params(params: Sequence, types: Sequence, timezone: str = "UTC") -> list:
+    """Привести значения литералов к типам параметров, выведенным PostgreSQL.
+
+    asyncpg кодирует параметры в бинарном формате и не принимает, например,
+    строку для timestamptz. Строковые даты без часового пояса интерпретируются
+    в часовом поясе сессии - так же, как их понял бы сам сервер.
+    Значение, которое не приводится к типу, приводит к ValueError,
+    неподдерживаемый тип - к UnsupportedParamType.
+    """
+    result = []
+    for value, pg_type in zip(params, types):
+        name = pg_type.name
+        if name in ('text', 'varchar', 'bpchar', 'name'):
+            result.append(str(value))
+        elif name in ('int2', 'int4', 'int8'):
+            number = Decimal(str(value))
+            if number != number.to_integral_value():
+                # views_count > 1.5 нельзя сузить до целого без изменения смысла
+                raise ValueError(f"Дробный литерал {value} для целочисленного параметра")
+            result.append(int(number))
+        elif name == 'numeric':
+            result.append(Decimal(str(value)))
+        elif name in ('float4', 'float8'):
+            result.append(float(value))
+        elif name == 'uuid':
+            result.append(uuid.UUID(str(value)))
+        elif name == 'date':
+            result.append(date.fromisoformat(str(value)[:10]))
+        elif name in ('timestamp', 'timestamptz'):
+            moment = datetime.fromisoformat(str(value))
+            if name == 'timestamptz' and moment.tzinfo is None:
+                moment = moment.replace(tzinfo=ZoneInfo(timezone))
+            result.append(moment)
+        else:
+            raise UnsupportedParamType(f"Неподдерживаемый тип параметра: {name}")
+    return result
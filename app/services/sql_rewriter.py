@@ -0,0 +1,147 @@
+import re
+import logging
+from datetime import date, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Условие целиком, а не часть выражения: перед ним нет слова и арифметики (TO_DATE(...), 1 + DATE(...)),
+# после - продолжения литерала и арифметики (= 20251, = 2025 - 1, = '2025-11-27' + 1, ::timestamp)
+_LEAD = r'(?<![\w.])(?<![-+*/%^|])(?<![-+*/%^|]\s)'
+_TRAIL = r'(?![\w.])(?!\s*(?:[-+*/%^|\[]|::))'
+# Колонка, возможно с именем таблицы: created_at, v.video_created_at
+_COL = r'(?P<col>(?:\w+\.)?\w+)'
+# Дата-литерал: '2025-11-27', DATE '2025-11-27', '2025-11-27'::date
+_DATE = r"(?:DATE\s+)?'(?P<{name}>\d{{4}}-\d{{2}}-\d{{2}})'(?:\s*::\s*date)?"
+# Выражение от текущей даты: CURRENT_DATE, CURRENT_DATE - INTERVAL '1 day', CURRENT_DATE - 7
+_CURRENT = r"(?P<current>CURRENT_DATE(?:\s*[-+]\s*(?:INTERVAL\s*'[^']*'|\d+))?)"
+# Колонка, приведенная к дате: DATE(col), col::date, CAST(col AS DATE)
+_AS_DATE = rf'(?:DATE\s*\(\s*{_COL}\s*\)|{_COL.replace("col", "col2")}\s*::\s*date|CAST\s*\(\s*{_COL.replace("col", "col3")}\s+AS\s+DATE\s*\))'
+
+_DATE_CMP_RE = re.compile(
+    rf"{_LEAD}{_AS_DATE}\s*(?P<op>>=|<=|=|>|<)\s*(?:{_DATE.format(name='day')}|{_CURRENT}){_TRAIL}",
+    re.IGNORECASE
+)
+_DATE_BETWEEN_RE = re.compile(
+    rf"{_LEAD}{_AS_DATE}\s+BETWEEN\s+{_DATE.format(name='start')}\s+AND\s+{_DATE.format(name='end')}{_TRAIL}",
+    re.IGNORECASE
+)
+_YEAR_MONTH_RE = re.compile(
+    rf"{_LEAD}EXTRACT\s*\(\s*(?P<first>YEAR|MONTH)\s+FROM\s+{_COL}\s*\)\s*=\s*(?P<first_value>\d+)"
+    rf"\s+AND\s+EXTRACT\s*\(\s*(?P<second>YEAR|MONTH)\s+FROM\s+(?P=col)\s*\)\s*=\s*(?P<second_value>\d+){_TRAIL}",
+    re.IGNORECASE
+)
+_YEAR_RE = re.compile(rf"{_LEAD}EXTRACT\s*\(\s*YEAR\s+FROM\s+{_COL}\s*\)\s*=\s*(?P<year>\d{{4}}){_TRAIL}",
+                      re.IGNORECASE)
+_TRUNC_RE = re.compile(
+    rf"{_LEAD}DATE_TRUNC\s*\(\s*'(?P<unit>day|week|month|year)'\s*,\s*{_COL}\s*\)\s*=\s*"
+    rf"(?:(?:DATE\s+|TIMESTAMP\s+)?'(?P<day>\d{{4}}-\d{{2}}-\d{{2}})(?:\s+00:00(?::00)?)?'(?:\s*::\s*\w+)?"
+    rf"|(?P<trunc_current>DATE_TRUNC\s*\(\s*'(?P=unit)'\s*,\s*(?:CURRENT_DATE|NOW\s*\(\s*\)|CURRENT_TIMESTAMP)\s*\))){_TRAIL}",
+    re.IGNORECASE
+)
+
+
+def _range(col: str, start: str, end: str) -> str:
+    return f"({col} >= {start} AND {col} < {end})"
+
+
+def _literal(day: date) -> str:
+    return f"'{day.isoformat()}'"
+
+
+def _add_unit(day: date, unit: str) -> date:
+    """Начало следующего периода (day уже выровнен по unit)"""
+    if unit == 'day':
+        return day + timedelta(days=1)
+    if unit == 'week':
+        return day + timedelta(days=7)
+    if unit == 'month':
+        return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    return date(day.year + 1, 1, 1)
+
+
+def _is_aligned(day: date, unit: str) -> bool:
+    if unit == 'week':
+        return day.weekday() == 0
+    if unit == 'month':
+        return day.day == 1
+    if unit == 'year':
+        return day.month == 1 and day.day == 1
+    return True
+
+
+def _column(match: re.Match) -> str:
+    groups = match.groupdict()
+    return groups.get('col') or groups.get('col2') or groups.get('col3')
+
+
+def _rewrite_date_cmp(match: re.Match) -> str:
+    col = _column(match)
+    op = match.group('op')
+    if match.group('day'):
+        start = date.fromisoformat(match.group('day'))
+        start_sql, next_sql = _literal(start), _literal(start + timedelta(days=1))
+    else:
+        start_sql = match.group('current')
+        next_sql = f"({start_sql}) + INTERVAL '1 day'"
+
+    if op == '=':
+        return _range(col, start_sql, next_sql)
+    if op == '>=':
+        return f"{col} >= {start_sql}"
+    if op == '>':
+        return f"{col} >= {next_sql}"
+    if op == '<':
+        return f"{col} < {start_sql}"
+    return f"{col} < {next_sql}"
+
+
+def _rewrite_between(match: re.Match) -> str:
+    end = date.fromisoformat(match.group('end')) + timedelta(days=1)
+    return _range(_column(match), f"'{match.group('start')}'", _literal(end))
+
+
+def _rewrite_year_month(match: re.Match) -> str:
+    parts = {match.group('first').upper(): int(match.group('first_value')),
+             match.group('second').upper(): int(match.group('second_value'))}
+    if set(parts) != {'YEAR', 'MONTH'} or not 1 <= parts['MONTH'] <= 12:
+        return match.group(0)
+    start = date(parts['YEAR'], parts['MONTH'], 1)
+    return _range(match.group('col'), _literal(start), _literal(_add_unit(start, 'month')))
+
+
+def _rewrite_year(match: re.Match) -> str:
+    year = int(match.group('year'))
+    return _range(match.group('col'), _literal(date(year, 1, 1)), _literal(date(year + 1, 1, 1)))
+
+
+def _rewrite_trunc(match: re.Match) -> str:
+    unit = match.group('unit').lower()
+    col = match.group('col')
+    if match.group('trunc_current'):
+        start_sql = match.group('trunc_current')
+        return _range(col, start_sql, f"{start_sql} + INTERVAL '1 {unit}'")
+
+    start = date.fromisoformat(match.group('day'))
+    if not _is_aligned(start, unit):
+        # Невыровненная дата никогда не равна date_trunc(...) - оставляем как есть
+        return match.group(0)
+    return _range(col, _literal(start), _literal(_add_unit(start, unit)))
+
+
+def rewrite_sargable(sql: str) -> str:
+    """Переписать предикаты вида DATE(col) = d в полуоткрытые диапазоны по col.
+
+    Функция над колонкой не дает PostgreSQL использовать индексы по created_at /
+    video_created_at. Диапазон [d, d + 1 день) эквивалентен исходному условию:
+    и DATE(timestamptz), и литерал в диапазоне интерпретируются в часовом поясе
+    сессии. Поддерживаются DATE(col), col::date, CAST(col AS DATE) со сравнениями
+    и BETWEEN, EXTRACT(YEAR/MONTH ...) и date_trunc(...) с равенством.
+    """
+    rewritten = _YEAR_MONTH_RE.sub(_rewrite_year_month, sql)
+    rewritten = _YEAR_RE.sub(_rewrite_year, rewritten)
+    rewritten = _TRUNC_RE.sub(_rewrite_trunc, rewritten)
+    rewritten = _DATE_BETWEEN_RE.sub(_rewrite_between, rewritten)
+    rewritten = _DATE_CMP_RE.sub(_rewrite_date_cmp, rewritten)
+    if rewritten != sql:
+        logger.info(f"Предикаты по датам переписаны для использования индексов: {rewritten}")
+    return rewritten
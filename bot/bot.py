@@ -7,7 +7,11 @@ from aiogram.client.default import DefaultBotProperties
 from app.core.config import settings
 from app.services import db_service
 from app.services.cache_service import cache_service
+from app.services.cache_warmup import warm_up_cache
+from app.services.entity_index import entity_index
+from app.services.semantic_cache import semantic_cache
 from app.handlers import base_router, user_router
+from app.handlers.user_handlers import refresh_answer
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -28,19 +32,35 @@ async def main():
     dp.include_router(user_router)
     dp.include_router(base_router)
     
-    # Подключаемся к базе данных
-    await db_service.connect()
-    
     await cache_service.connect()
+    # Популярные ответы обновляются в фоне до истечения срока
+    cache_service.set_refresher(refresh_answer)
 
     if cache_service.redis_client:
         logger.info("✅ Redis подключен, кеширование активно")
     else:
         logger.warning("⚠️ Redis не подключен, кеширование не работает")
 
+    # Подключаемся к базе данных, заранее готовя самые частые шаблоны SQL
+    hot_statements = await cache_service.get_hot_sql_templates(settings.DB_WARMUP_STATEMENTS)
+    await db_service.connect(hot_statements=hot_statements)
+
+    # SQL ранее заданных вопросов - для ответов на похожие без YandexGPT
+    await semantic_cache.load(cache_service.redis_client)
+
+    # Заполняем кеш ответами на популярные вопросы до приема сообщений
+    await warm_up_cache()
+
+    # Индекс известных id креаторов и видео строится в фоне; пока его нет, вопросы с id идут обычным путем
+    entity_index.schedule_rebuild(await cache_service.get_generation())
+
     # Запуск бота
     logger.info("Бот запущен и готов к работе!")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        logger.info(f"Повторное использование подготовленных выражений: {db_service.planning_report()}")
+        await db_service.disconnect()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,94 @@
+"""Индекс известных id: память и стоимость проверки для большого числа id.
+
+Строит фильтр Блума (app/services/entity_index.py) для --ids случайных id
+вида creator_id (32 шестнадцатеричных символа) и сравнивает его с
+отсортированным массивом 64-битных хешей (np.searchsorted) и, при --with-set,
+с обычным set строк. Для каждого варианта печатает память, время построения,
+задержку проверки известного и неизвестного id (мкс) и долю ложных «есть»
+на --probes неизвестных id. БД и Redis не нужны:
+
+    python scripts/bench_entity_index.py --ids 10000000 --error-rate 0.001
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.entity_index import BloomFilter
+
+
+def random_ids(count: int) -> list:
+    data = os.urandom(16 * count).hex()
+    return [data[i:i + 32] for i in range(0, len(data), 32)]
+
+
+def lookup_us(contains, keys: list) -> float:
+    started = time.perf_counter()
+    for key in keys:
+        contains(key)
+    return (time.perf_counter() - started) / len(keys) * 1e6
+
+
+def hash64(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+
+
+def report(name: str, nbytes: int, build_s: float, contains, known: list, unknown: list) -> None:
+    false_positives = sum(1 for key in unknown if contains(key))
+    print(f"{name:<22}{nbytes / 2 ** 20:>10.1f}{build_s:>10.1f}"
+          f"{lookup_us(contains, known[:len(unknown)]):>12.2f}{lookup_us(contains, unknown):>12.2f}"
+          f"{false_positives / len(unknown):>12.4%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ids", type=int, default=10_000_000)
+    parser.add_argument("--error-rate", type=float, default=0.001)
+    parser.add_argument("--probes", type=int, default=100_000)
+    parser.add_argument("--chunk", type=int, default=50_000, help="Размер пачки при построении (как чтение курсором)")
+    parser.add_argument("--with-set", action="store_true", help="Сравнить с set строк (много памяти)")
+    args = parser.parse_args()
+
+    print(f"Генерация {args.ids} id...")
+    known = random_ids(args.ids)
+    unknown = random_ids(args.probes)
+    print(f"\n{'вариант':<22}{'память, МБ':>10}{'сборка, с':>10}{'есть, мкс':>12}{'нет, мкс':>12}{'ложные есть':>12}")
+
+    started = time.perf_counter()
+    bloom = BloomFilter(args.ids, args.error_rate)
+    for start in range(0, len(known), args.chunk):
+        bloom.add_many(known[start:start + args.chunk])
+    report(f"Блум (k={bloom.hashes})", bloom.nbytes, time.perf_counter() - started,
+           bloom.__contains__, known, unknown)
+
+    started = time.perf_counter()
+    hashes = np.fromiter((hash64(key) for key in known), dtype=np.uint64, count=len(known))
+    hashes.sort()
+
+    def in_sorted(key: str) -> bool:
+        value = np.uint64(hash64(key))
+        position = np.searchsorted(hashes, value)
+        return position < len(hashes) and hashes[position] == value
+
+    report("сорт. массив хешей", hashes.nbytes, time.perf_counter() - started, in_sorted, known, unknown)
+
+    if args.with_set:
+        tracemalloc.start()
+        started = time.perf_counter()
+        ids = set(known)
+        build_s = time.perf_counter() - started
+        # Строки уже в памяти; set добавляет таблицу, а сами строки на id - еще столько же
+        nbytes = tracemalloc.get_traced_memory()[0] + sum(sys.getsizeof(key) for key in known[:1000]) * len(known) // 1000
+        tracemalloc.stop()
+        report("set строк", nbytes, build_s, ids.__contains__, known, unknown)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Бенчмарк пакетной генерации SQL против запросов по одному.
+
+Поднимает локальную заглушку YandexGPT, которая считает токены промпта,
+отвечает с задержкой, зависящей от длины ответа, и ограничивает число
+одновременных запросов (как квота облака). Запуск:
+
+    python scripts/bench_gpt_batching.py --questions 64 --max-size 8
+"""
+import sys
+import time
+import asyncio
+import argparse
+import re
+from pathlib import Path
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.gpt_service import SimpleYandexGPT
+from app.services.gpt_batcher import GPTBatcher
+from app.services.db_service import db_service
+
+QUESTION_LINE = re.compile(r'^\s+(\d+)\. ', re.MULTILINE)
+
+
+def count_tokens(text: str) -> int:
+    # Грубая оценка токенизатора: ~4 символа на токен
+    return max(1, len(text) // 4)
+
+
+def make_stub(upstream_concurrency: int, base_latency: float, token_latency: float):
+    semaphore = asyncio.Semaphore(upstream_concurrency)
+
+    async def handler(request):
+        payload = await request.json()
+        prompt = payload["messages"][0]["text"]
+        numbers = QUESTION_LINE.findall(prompt.split("Вопросы пользователей:")[-1]) \
+            if "Вопросы пользователей:" in prompt else []
+        if numbers:
+            text = "\n".join(f"{n}) SELECT COUNT(*) FROM videos;" for n in numbers)
+        else:
+            text = "SELECT COUNT(*) FROM videos;"
+
+        completion_tokens = count_tokens(text)
+        async with semaphore:
+            await asyncio.sleep(base_latency + token_latency * completion_tokens)
+        return web.json_response({"result": {
+            "alternatives": [{"message": {"role": "assistant", "text": text}}],
+            "usage": {
+                "inputTextTokens": str(count_tokens(prompt)),
+                "completionTokens": str(completion_tokens),
+            },
+        }})
+
+    return handler
+
+
+async def run(mode: str, url: str, questions: list, schema: str, args) -> dict:
+    gpt = SimpleYandexGPT()
+    gpt.url = url
+    gpt.stream = False
+    batcher = GPTBatcher(gpt, window_ms=args.window_ms, max_size=1 if mode == "single" else args.max_size)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(batcher.ask_gpt(q, schema) for q in questions))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "mode": mode,
+        "answered": sum(1 for r in results if r),
+        "seconds": elapsed,
+        "qps": len(questions) / elapsed,
+        **gpt.usage,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=64)
+    parser.add_argument("--window-ms", type=int, default=30)
+    parser.add_argument("--max-size", type=int, default=8)
+    parser.add_argument("--upstream-concurrency", type=int, default=4)
+    parser.add_argument("--base-latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.005)
+    args = parser.parse_args()
+
+    app = web.Application()
+    app.router.add_post("/completion", make_stub(args.upstream_concurrency, args.base_latency, args.token_latency))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/completion"
+
+    schema = await db_service.get_schema()
+    questions = [f"Сколько видео набрали больше {i * 1000} просмотров?" for i in range(args.questions)]
+
+    try:
+        rows = [await run(mode, url, questions, schema, args) for mode in ("single", "batch")]
+    finally:
+        await runner.cleanup()
+
+    print(f"{'режим':<8}{'ответов':>9}{'сек':>9}{'вопр/с':>9}{'запросов':>10}{'вход. токены':>14}{'выход. токены':>15}")
+    for row in rows:
+        print(f"{row['mode']:<8}{row['answered']:>9}{row['seconds']:>9.2f}{row['qps']:>9.1f}"
+              f"{row['requests']:>10}{row['input_tokens']:>14}{row['completion_tokens']:>15}")
+    single, batch = rows
+    print(f"\nПропускная способность: x{batch['qps'] / single['qps']:.1f}, "
+          f"входных токенов: {batch['input_tokens'] / single['input_tokens']:.0%} от запросов по одному")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,173 @@
+"""Загрузка синтетического набора и типичные агрегатные запросы на локальном PostgreSQL.
+
+Генерирует набор (scripts/generate_dataset.py) или берет готовый --data,
+загружает его VideoDatabase из scripts/load_json.py в отдельную схему
+(создание таблиц, загрузка, ANALYZE - время каждого этапа и строк в секунду),
+затем выполняет фиксированный набор запросов, похожих на те, что генерирует
+YandexGPT, и печатает медиану и максимум времени каждого. Нужен PostgreSQL
+(настройки DB_* из .env); схема удаляется в конце, если не указан --keep:
+
+    python scripts/bench_loader.py --videos 100000 --snapshots 48 --runs 5
+    python scripts/bench_loader.py --data data/videos.json --skip-load --keep
+"""
+import io
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import asyncpg
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from app.core.config import settings
+from generate_dataset import generate
+from load_json import VideoDatabase
+
+SCHEMA = "bench_loader"
+
+# {creator} - креатор с наибольшим числом видео, {day} и {month} - середина периода
+QUERIES = {
+    "всего видео": "SELECT COUNT(*) FROM videos",
+    "видео креатора за период": (
+        "SELECT COUNT(*) FROM videos WHERE creator_id = '{creator}' "
+        "AND video_created_at >= '{month}' AND video_created_at < '{next_month}'"
+    ),
+    "видео больше N просмотров": "SELECT COUNT(*) FROM videos WHERE views_count > 100000",
+    "прирост просмотров за день": (
+        "SELECT SUM(delta_views_count) FROM video_snapshots "
+        "WHERE created_at >= '{day}' AND created_at < '{next_day}'"
+    ),
+    "видео с приростом за день": (
+        "SELECT COUNT(DISTINCT video_id) FROM video_snapshots "
+        "WHERE delta_views_count > 0 AND created_at >= '{day}' AND created_at < '{next_day}'"
+    ),
+    "прирост у креатора за месяц": (
+        "SELECT SUM(s.delta_views_count) FROM video_snapshots s JOIN videos v ON v.id = s.video_id "
+        "WHERE v.creator_id = '{creator}' AND s.created_at >= '{month}' AND s.created_at < '{next_month}'"
+    ),
+    "прирост у креатора без JOIN": (
+        "SELECT SUM(delta_views_count) FROM video_snapshots "
+        "WHERE creator_id = '{creator}' AND created_at >= '{month}' AND created_at < '{next_month}'"
+    ),
+    "средние лайки": "SELECT ROUND(AVG(likes_count), 2) FROM videos",
+    "креаторов с видео": "SELECT COUNT(DISTINCT creator_id) FROM videos",
+}
+
+
+def load(path: str) -> tuple:
+    """Загрузить набор в схему SCHEMA; время этапов (сек) и число загруженных строк"""
+    db = VideoDatabase()
+    db.connect()
+    timings = {}
+    try:
+        db.cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        db.cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+        db.cursor.execute(f"SET search_path TO {SCHEMA}")
+        db.connection.commit()
+
+        started = time.monotonic()
+        db.create_tables()
+        timings["create_tables"] = time.monotonic() - started
+
+        # Построчный вывод загрузчика (по строке на видео) не печатаем, кроме ошибок
+        output = io.StringIO()
+        started = time.monotonic()
+        with redirect_stdout(output):
+            db.load_videos_data(path)
+        timings["load"] = time.monotonic() - started
+        errors = [line for line in output.getvalue().splitlines() if "✗" in line or "Ошибка" in line]
+        for line in errors[:5]:
+            print(line)
+        if len(errors) > 5:
+            print(f"  ... и еще ошибок: {len(errors) - 5}")
+
+        started = time.monotonic()
+        db.cursor.execute("ANALYZE videos; ANALYZE video_snapshots")
+        db.connection.commit()
+        timings["analyze"] = time.monotonic() - started
+        db.cursor.execute("SELECT (SELECT COUNT(*) FROM videos) + (SELECT COUNT(*) FROM video_snapshots)")
+        rows = db.cursor.fetchone()[0]
+    finally:
+        db.close()
+    return timings, rows
+
+
+async def run_queries(runs: int, keep: bool) -> None:
+    conn = await asyncpg.connect(settings.database_url, server_settings={"search_path": SCHEMA})
+    try:
+        videos = await conn.fetchval("SELECT COUNT(*) FROM videos")
+        snapshots = await conn.fetchval("SELECT COUNT(*) FROM video_snapshots")
+        print(f"\nВ схеме {SCHEMA}: видео {videos}, снимков {snapshots}")
+        creator = await conn.fetchval(
+            "SELECT creator_id FROM videos GROUP BY creator_id ORDER BY COUNT(*) DESC LIMIT 1"
+        )
+        middle = await conn.fetchval(
+            "SELECT to_timestamp((extract(epoch FROM MIN(video_created_at)) "
+            "+ extract(epoch FROM MAX(video_created_at))) / 2) FROM videos"
+        )
+        middle = (middle or datetime.now(timezone.utc)).date()
+        month = middle.replace(day=1)
+        values = {
+            "creator": creator,
+            "day": middle.isoformat(),
+            "next_day": (middle + timedelta(days=1)).isoformat(),
+            "month": month.isoformat(),
+            "next_month": month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1).isoformat(),
+        }
+
+        print(f"\n{'запрос':<30}{'p50, мс':>10}{'max, мс':>10}  результат")
+        for name, template in QUERIES.items():
+            sql = template.format(**values)
+            samples = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                result = await conn.fetchval(sql)
+                samples.append((time.perf_counter() - started) * 1000)
+            print(f"{name:<30}{statistics.median(samples):>10.1f}{max(samples):>10.1f}  {result}")
+    finally:
+        if not keep:
+            await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", help="Готовый videos.json (без него набор генерируется)")
+    parser.add_argument("--output", default="data/bench_videos.json", help="Куда писать сгенерированный набор")
+    parser.add_argument("--creators", type=int, default=1000)
+    parser.add_argument("--videos", type=int, default=10000)
+    parser.add_argument("--snapshots", type=float, default=24, help="Среднее число снимков на видео")
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=5, help="Повторов каждого запроса")
+    parser.add_argument("--skip-load", action="store_true", help="Только запросы к уже загруженной схеме")
+    parser.add_argument("--keep", action="store_true", help="Не удалять схему после замеров")
+    args = parser.parse_args()
+
+    path = args.data
+    if not path and not args.skip_load:
+        started = time.monotonic()
+        stats = generate(args.output, args.creators, args.videos, args.snapshots,
+                         datetime(2025, 8, 1, tzinfo=timezone.utc), args.days, args.seed)
+        print(f"Сгенерировано за {time.monotonic() - started:.1f} с: {stats}")
+        path = args.output
+
+    if not args.skip_load:
+        size_mb = Path(path).stat().st_size / 1024 / 1024
+        timings, rows = load(path)
+        print(f"\nЗагрузка {path} ({size_mb:.1f} МБ):")
+        for stage, seconds in timings.items():
+            print(f"  {stage:<14}{seconds:>8.1f} с")
+        print(f"  {rows} строк, {rows / timings['load']:.0f} строк/с")
+
+    asyncio.run(run_queries(args.runs, args.keep))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Память Redis на статистику популярности вопросов: хеш на вопрос против sketch.
+
+Генерирует синтетическую нагрузку с длинным хвостом (распределение Ципфа:
+немного частых вопросов и много уникальных) и прогоняет ее дважды в пустой
+базе Redis: прежней схемой (хеш stats:query:<md5> с usage_count, временем и
+текстом на каждый вопрос) и PopularityTracker (Count-Min sketch + top-K).
+Печатает used_memory после каждого прогона и долю истинного top-N, найденную
+в top-K. Нужен Redis (настройки REDIS_* из .env); база --db очищается:
+
+    python scripts/bench_popularity_memory.py --events 100000 --distinct 50000 --db 15 --flush
+"""
+import sys
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+import redis.asyncio as redis
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.config import settings
+from app.services.popularity import PopularityTracker
+
+
+def workload(events: int, distinct: int, skew: float, seed: int) -> list:
+    """Вопросы с частотами по закону Ципфа"""
+    rng = random.Random(seed)
+    weights = [1 / rank ** skew for rank in range(1, distinct + 1)]
+    ranks = rng.choices(range(distinct), weights=weights, k=events)
+    return [f"Сколько просмотров набрали видео креатора номер {rank} за ноябрь 2025?" for rank in ranks]
+
+
+def query_hash(query: str) -> str:
+    return hashlib.md5(query.strip().lower().encode()).hexdigest()
+
+
+async def used_memory(client: redis.Redis) -> int:
+    return (await client.info("memory"))["used_memory"]
+
+
+async def run_legacy(client: redis.Redis, queries: list, batch: int = 1000) -> None:
+    """Прежняя схема: хеш статистики на каждый вопрос (как до PopularityTracker)"""
+    seen = set()
+    for start in range(0, len(queries), batch):
+        pipe = client.pipeline(transaction=False)
+        for query in queries[start:start + batch]:
+            key = f"stats:query:{query_hash(query)}"
+            now = datetime.now().isoformat()
+            pipe.hincrby(key, "usage_count", 1)
+            if key in seen:
+                pipe.hset(key, mapping={"last_used": now})
+            else:
+                seen.add(key)
+                pipe.hset(key, mapping={"first_used": now, "last_used": now, "query": query[:500]})
+                pipe.expire(key, 7 * 24 * 3600)
+        await pipe.execute()
+
+
+async def run_sketch(client: redis.Redis, tracker: PopularityTracker, queries: list, concurrency: int = 50) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def record(query: str) -> None:
+        async with semaphore:
+            member = query_hash(query)
+            await tracker.record(client, member, query, f"cache:query:{member}")
+
+    await asyncio.gather(*(record(query) for query in queries))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--distinct", type=int, default=50_000)
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--top", type=int, default=50, help="сколько самых частых вопросов сверять")
+    parser.add_argument("--db", type=int, default=15)
+    parser.add_argument("--flush", action="store_true", help="разрешить очистку базы --db")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    client = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=args.db,
+                         password=settings.REDIS_PASSWORD or None, decode_responses=True)
+    if await client.dbsize() and not args.flush:
+        await client.close()
+        sys.exit(f"База Redis {args.db} не пуста; запустите с --flush, чтобы очистить ее")
+
+    try:
+        queries = workload(args.events, args.distinct, args.skew, args.seed)
+        truth = Counter(query_hash(query) for query in queries)
+        print(f"Событий: {len(queries)}, уникальных вопросов: {len(truth)}")
+
+        await client.flushdb()
+        baseline = await used_memory(client)
+        started = time.perf_counter()
+        await run_legacy(client, queries)
+        legacy_bytes = await used_memory(client) - baseline
+        legacy_s = time.perf_counter() - started
+        legacy_keys = await client.dbsize()
+
+        await client.flushdb()
+        baseline = await used_memory(client)
+        tracker = PopularityTracker()
+        started = time.perf_counter()
+        await run_sketch(client, tracker, queries)
+        sketch_bytes = await used_memory(client) - baseline
+        sketch_s = time.perf_counter() - started
+        sketch_keys = await client.dbsize()
+
+        top = await tracker.top(client, args.top)
+        expected = {member for member, _ in truth.most_common(args.top)}
+        found = {query_hash(item["query"]) for item in top}
+        overestimate = [item["usage_count"] - truth[query_hash(item["query"])] for item in top]
+
+        print(f"{'схема':<22}{'ключей':>10}{'память, КБ':>14}{'время, с':>10}")
+        print(f"{'хеш на вопрос':<22}{legacy_keys:>10}{legacy_bytes / 1024:>14.1f}{legacy_s:>10.2f}")
+        print(f"{'sketch + top-K':<22}{sketch_keys:>10}{sketch_bytes / 1024:>14.1f}{sketch_s:>10.2f}")
+        print(f"Экономия памяти: {legacy_bytes / max(sketch_bytes, 1):.1f}x")
+        print(f"Top-{args.top}: найдено {len(expected & found)} из {len(expected)}, "
+              f"завышение оценки в среднем {sum(overestimate) / max(len(overestimate), 1):.1f}")
+    finally:
+        await client.flushdb()
+        await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
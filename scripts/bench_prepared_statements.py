@@ -0,0 +1,74 @@
+"""Сколько времени разбора и планирования экономит переиспользование выражений.
+
+Для каждого типичного запроса выполняется серия с разными литералами:
+сначала исходным текстом (каждый текст уникален - кеш выражений asyncpg
+промахивается), затем через SimpleDatabase.fetch_result с параметрами.
+Дополнительно из EXPLAIN (ANALYZE) берется Planning Time исходного запроса.
+Нужна база с загруженными данными (настройки DB_* из .env):
+
+    python scripts/bench_prepared_statements.py --runs 200
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+import asyncpg
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.config import settings
+from app.services.db_service import db_service
+
+QUERIES = {
+    "видео с просмотрами > X": "SELECT COUNT(*) FROM videos WHERE views_count > {i}",
+    "сумма просмотров за день": (
+        "SELECT SUM(delta_views_count) FROM video_snapshots "
+        "WHERE created_at >= '2025-11-{day:02d}' AND created_at < '2025-11-{next_day:02d}'"
+    ),
+    "лайки креатора": "SELECT SUM(likes_count) FROM videos WHERE creator_id = '{creator}'",
+}
+
+
+def render(template: str, i: int, creator: str) -> str:
+    day = i % 27 + 1
+    return template.format(i=i * 10, day=day, next_day=day + 1, creator=creator)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(settings.database_url)
+    creator = await conn.fetchval("SELECT creator_id FROM videos LIMIT 1") or "0" * 32
+    await db_service.connect()
+
+    print(f"{'запрос':<28}{'planning, мс':>14}{'текстом, мс':>13}{'шаблоном, мс':>14}{'экономия, мс':>14}")
+    try:
+        for name, template in QUERIES.items():
+            plan = await conn.fetchval(f"EXPLAIN (ANALYZE, FORMAT JSON) {render(template, 1, creator)}")
+            planning_ms = json.loads(plan)[0]["Planning Time"]
+
+            started = time.perf_counter()
+            for i in range(args.runs):
+                await conn.fetchval(render(template, i, creator))
+            raw_ms = (time.perf_counter() - started) * 1000 / args.runs
+
+            started = time.perf_counter()
+            for i in range(args.runs):
+                await db_service.fetch_result(render(template, i, creator))
+            prepared_ms = (time.perf_counter() - started) * 1000 / args.runs
+
+            print(f"{name:<28}{planning_ms:>14.3f}{raw_ms:>13.3f}{prepared_ms:>14.3f}{raw_ms - prepared_ms:>14.3f}")
+    finally:
+        await conn.close()
+        await db_service.pool.close()
+
+    print(f"\nСтатистика подготовленных выражений: {db_service.planning_report()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+"""Объединение одновременных агрегатов по videos: проходы по таблице и занятость пула.
+
+Отправляет пачками одновременные вопросы-агрегаты («сумма просмотров»,
+«среднее число лайков», «максимум комментариев» ...) через fetch_result
+без объединения (DB_COMBINE_MAX_SIZE=1) и с QueryCombiner. Для каждого режима
+печатает число выполненных запросов, прирост seq_scan по videos из
+pg_stat_user_tables, среднее и пиковое число занятых соединений и задержку
+пачки. Нужен PostgreSQL с загруженными данными (настройки DB_* из .env):
+
+    python scripts/bench_query_combiner.py --bursts 50 --concurrency 12
+"""
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.db_service import SimpleDatabase
+from app.services.query_combiner import QueryCombiner
+
+QUERIES = [
+    "SELECT SUM(views_count) FROM videos",
+    "SELECT AVG(likes_count) FROM videos",
+    "SELECT MAX(comments_count) FROM videos",
+    "SELECT COUNT(*) FROM videos WHERE views_count > 100000",
+    "SELECT SUM(likes_count) FROM videos WHERE video_created_at >= '2025-11-01'",
+    "SELECT MIN(reports_count) FROM videos",
+]
+
+_SCANS_SQL = "SELECT seq_scan + COALESCE(idx_scan, 0) FROM pg_stat_user_tables WHERE relname = 'videos'"
+
+
+async def table_scans(db: SimpleDatabase) -> int:
+    # Счетчики попадают в статистику с задержкой: ждем их отправки и сбрасываем снимок сеанса
+    async with db.pool.acquire() as conn:
+        await conn.execute("SELECT pg_stat_clear_snapshot()")
+        await asyncio.sleep(1.1)
+        return await conn.fetchval(_SCANS_SQL)
+
+
+async def run(db: SimpleDatabase, bursts: int, concurrency: int) -> dict:
+    executed = 0
+    execute = db._execute
+
+    async def counted(guarded, max_rows=None):
+        nonlocal executed
+        executed += 1
+        return await execute(guarded, max_rows)
+
+    db.combiner.execute = counted
+    busy = []
+    stop = asyncio.Event()
+
+    async def sample():
+        while not stop.is_set():
+            busy.append(db.primary.outstanding + sum(replica.outstanding for replica in db.replicas))
+            await asyncio.sleep(0.001)
+
+    scans_before = await table_scans(db)
+    sampler = asyncio.create_task(sample())
+    latencies = []
+    for _ in range(bursts):
+        started = time.perf_counter()
+        await asyncio.gather(*(db.fetch_result(QUERIES[i % len(QUERIES)]) for i in range(concurrency)))
+        latencies.append((time.perf_counter() - started) * 1000)
+    stop.set()
+    await sampler
+    scans = await table_scans(db) - scans_before
+
+    return {
+        "executed": executed,
+        "scans": scans,
+        "busy_avg": statistics.mean(busy) if busy else 0.0,
+        "busy_max": max(busy, default=0),
+        "latency_ms": statistics.median(latencies),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bursts", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=12)
+    parser.add_argument("--window-ms", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'режим':<16}{'запросов':>10}{'проходов':>10}{'занято ср.':>12}{'занято макс':>13}{'пачка, мс':>11}")
+    for name, max_size in (("по одному", 1), ("объединение", args.concurrency)):
+        db = SimpleDatabase()
+        db.combiner = QueryCombiner(db._execute, window_ms=args.window_ms, max_size=max_size)
+        await db.connect()
+        try:
+            # Прогрев: подготовленные выражения и кеш страниц
+            await asyncio.gather(*(db.fetch_result(sql) for sql in QUERIES))
+            stats = await run(db, args.bursts, args.concurrency)
+        finally:
+            await db.disconnect()
+        print(f"{name:<16}{stats['executed']:>10}{stats['scans']:>10}{stats['busy_avg']:>12.2f}"
+              f"{stats['busy_max']:>13}{stats['latency_ms']:>11.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""Микробенчмарк обработки результата запроса на стороне Python.
+
+Сравнивает прежний путь (копирование каждой записи asyncpg в словарь и
+list(row.values()) в format_numeric_result) с новым: значение из fetchval
+для одного агрегата и записи asyncpg без копирования для нескольких строк.
+Используются настоящие asyncpg.Record, база данных не нужна:
+
+    python scripts/bench_query_result.py
+"""
+import sys
+import timeit
+from pathlib import Path
+
+from asyncpg.protocol.protocol import _create_record
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.handlers.base import format_numeric_result
+from app.services.db_service import QueryResult
+
+
+def legacy_execute(rows: list) -> list:
+    """Копирование записей, как в прежнем execute_query"""
+    result = []
+    for row in rows:
+        row_dict = {}
+        for key in row.keys():
+            row_dict[key] = row[key]
+        result.append(row_dict)
+    return result
+
+
+def legacy_format(results: list) -> str:
+    """Прежний format_numeric_result"""
+    if not results:
+        return "Нет данных"
+    if len(results) == 1:
+        row = results[0]
+        if len(row) == 1:
+            value = list(row.values())[0]
+            if value is None:
+                return "Нет данных"
+            if isinstance(value, (int, float)):
+                if isinstance(value, float) and value.is_integer():
+                    return str(int(value))
+                return str(value)
+            return str(value)
+    numeric_values = []
+    for row in results:
+        for key, value in row.items():
+            if isinstance(value, (int, float)):
+                if isinstance(value, float) and value.is_integer():
+                    numeric_values.append(int(value))
+                else:
+                    numeric_values.append(value)
+    return ", ".join(str(v) for v in numeric_values)
+
+
+def bench(name: str, legacy, current, number: int) -> None:
+    old = min(timeit.repeat(legacy, number=number, repeat=5)) / number * 1e6
+    new = min(timeit.repeat(current, number=number, repeat=5)) / number * 1e6
+    print(f"{name:<28}{old:>12.2f}{new:>12.2f}{old / new:>10.1f}x")
+
+
+def main():
+    scalar_rows = [_create_record({"count": 0}, (123456,))]
+    scalar_value = scalar_rows[0][0]
+
+    mapping = {"views_count": 0, "likes_count": 1, "comments_count": 2}
+    many_rows = [_create_record(mapping, (i * 10, i * 2, i)) for i in range(100)]
+
+    print(f"{'сценарий':<28}{'было, мкс':>12}{'стало, мкс':>12}{'ускорение':>10}")
+    bench(
+        "один агрегат",
+        lambda: legacy_format(legacy_execute(scalar_rows)),
+        lambda: format_numeric_result(QueryResult(value=scalar_value, scalar=True)),
+        number=200_000,
+    )
+    bench(
+        "100 строк x 3 колонки",
+        lambda: legacy_format(legacy_execute(many_rows)),
+        lambda: format_numeric_result(QueryResult(rows=many_rows)),
+        number=5_000,
+    )
+
+
+if __name__ == "__main__":
+    main()
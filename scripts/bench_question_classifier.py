@@ -0,0 +1,91 @@
+"""Классификатор вопросов против фильтра по словам: точность и задержка.
+
+Точность считается кросс-валидацией (--folds частей) на размеченных вопросах
+(по умолчанию scripts/question_seed.jsonl; формат JSONL {"q", "answerable",
+"table", "aggregate"}, журнал из Redis выгружается scripts/train_question_classifier.py).
+Для решения «отвечать или нет» печатается доля верных ответов, сколько
+числовых вопросов отклонено зря и сколько вопросов без числового ответа
+дошло бы до YandexGPT; для модели - еще точность таблицы и агрегата.
+Задержка - время классификации одного вопроса (мкс) на всем наборе:
+
+    python scripts/bench_question_classifier.py --data labeled.jsonl --folds 5
+"""
+import sys
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.handlers.base import contains_non_numeric_keywords
+from app.services.question_classifier import QuestionClassifier, read_labeled
+
+SEED_PATH = Path(__file__).resolve().parent / "question_seed.jsonl"
+
+
+def report(name: str, examples: list, accepted: list) -> None:
+    answerable = [example.answerable for example in examples]
+    correct = sum(a == b for a, b in zip(accepted, answerable))
+    false_rejects = sum(a and not b for a, b in zip(answerable, accepted))
+    doomed = sum(b and not a for a, b in zip(answerable, accepted))
+    print(f"{name:<14}{correct / len(examples):>10.1%}{false_rejects:>16}/{sum(answerable):<5}"
+          f"{doomed:>14}/{len(examples) - sum(answerable)}")
+
+
+def latency_us(classify, texts: list, repeat: int) -> tuple:
+    samples = []
+    for _ in range(repeat):
+        for text in texts:
+            started = time.perf_counter()
+            classify(text)
+            samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=str(SEED_PATH))
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.2, help="Порог отклонения (CLASSIFIER_REJECT_THRESHOLD)")
+    parser.add_argument("--repeat", type=int, default=20, help="Повторов набора при замере задержки")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    examples = read_labeled(args.data)
+    order = np.random.default_rng(args.seed).permutation(len(examples))
+    folds = [set(order[i::args.folds].tolist()) for i in range(args.folds)]
+
+    tested, accepted, table_hits, aggregate_hits = [], [], [], []
+    for fold in folds:
+        model = QuestionClassifier.train(examples[i] for i in range(len(examples)) if i not in fold)
+        for i in sorted(fold):
+            example = examples[i]
+            prediction = model.predict(example.text)
+            tested.append(example)
+            accepted.append(prediction.answerable >= args.threshold)
+            if example.answerable and example.table:
+                table_hits.append(prediction.table == example.table)
+            if example.answerable and example.aggregate:
+                aggregate_hits.append(prediction.aggregate == example.aggregate)
+
+    print(f"Вопросов: {len(examples)}, кросс-валидация: {args.folds} частей, порог: {args.threshold}\n")
+    print(f"{'фильтр':<14}{'верно':>10}{'отклонено зря':>22}{'дошло до GPT':>20}")
+    report("по словам", tested, [not contains_non_numeric_keywords(example.text) for example in tested])
+    report("классификатор", tested, accepted)
+    if table_hits:
+        print(f"\nТаблица угадана: {statistics.mean(table_hits):.1%}, агрегат: {statistics.mean(aggregate_hits):.1%}")
+
+    model = QuestionClassifier.train(examples)
+    texts = [example.text for example in examples]
+    print(f"\n{'задержка, мкс':<16}{'p50':>8}{'p99':>8}")
+    for name, classify in (("по словам", contains_non_numeric_keywords), ("классификатор", model.predict)):
+        p50, p99 = latency_us(classify, texts, args.repeat)
+        print(f"{name:<16}{p50:>8.1f}{p99:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
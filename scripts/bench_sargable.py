@@ -0,0 +1,102 @@
+"""Эффект переписывания условий по датам в диапазоны на большой таблице снимков.
+
+Создает во временной схеме таблицу video_snapshots с индексом по created_at
+(как в VideoDatabase.create_tables), заполняет ее через generate_series и для
+типичных запросов сравнивает исходный SQL с результатом rewrite_sargable:
+результаты должны совпасть, а время - уменьшиться. Нужен PostgreSQL
+(настройки DB_* из .env):
+
+    python scripts/bench_sargable.py --rows 2000000 --runs 5
+"""
+import sys
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+import asyncpg
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.config import settings
+from app.services.sql_rewriter import rewrite_sargable
+
+SCHEMA = "bench_sargable"
+
+QUERIES = {
+    "DATE(col) = день": (
+        "SELECT SUM(delta_views_count) FROM video_snapshots WHERE DATE(created_at) = '2025-11-27'"
+    ),
+    "DATE(col) BETWEEN": (
+        "SELECT COUNT(DISTINCT video_id) FROM video_snapshots "
+        "WHERE DATE(created_at) BETWEEN '2025-11-20' AND '2025-11-22'"
+    ),
+    "col::date > день": (
+        "SELECT COUNT(*) FROM video_snapshots WHERE created_at::date > '2025-12-30'"
+    ),
+    "EXTRACT год и месяц": (
+        "SELECT SUM(delta_views_count) FROM video_snapshots "
+        "WHERE EXTRACT(YEAR FROM created_at) = 2025 AND EXTRACT(MONTH FROM created_at) = 12"
+    ),
+    "date_trunc('day') = день": (
+        "SELECT COUNT(*) FROM video_snapshots WHERE date_trunc('day', created_at) = '2025-11-27'"
+    ),
+}
+
+
+async def prepare_table(conn: asyncpg.Connection, rows: int) -> None:
+    await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    await conn.execute(f"CREATE SCHEMA {SCHEMA}")
+    await conn.execute(f"SET search_path TO {SCHEMA}")
+    await conn.execute("""
+        CREATE TABLE video_snapshots (
+            id BIGSERIAL PRIMARY KEY,
+            video_id INTEGER NOT NULL,
+            delta_views_count INTEGER NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL
+        )
+    """)
+    # Снимки раз в несколько секунд на протяжении года
+    await conn.execute(f"""
+        INSERT INTO video_snapshots (video_id, delta_views_count, created_at)
+        SELECT i % 5000, (i * 7919) % 100,
+               TIMESTAMPTZ '2025-03-01' + (i * INTERVAL '1 second') * (31536000.0 / {rows})
+        FROM generate_series(1, {rows}) AS i
+    """)
+    await conn.execute("CREATE INDEX idx_snapshots_created_at ON video_snapshots(created_at)")
+    await conn.execute("ANALYZE video_snapshots")
+
+
+async def timed(conn: asyncpg.Connection, sql: str, runs: int):
+    value = await conn.fetchval(sql)
+    started = time.perf_counter()
+    for _ in range(runs):
+        await conn.fetchval(sql)
+    return value, (time.perf_counter() - started) * 1000 / runs
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(settings.database_url)
+    try:
+        print(f"Заполнение {args.rows} снимков...")
+        await prepare_table(conn, args.rows)
+
+        print(f"{'запрос':<26}{'было, мс':>12}{'стало, мс':>12}{'ускорение':>11}  результат")
+        for name, sql in QUERIES.items():
+            rewritten = rewrite_sargable(sql)
+            old_value, old_ms = await timed(conn, sql, args.runs)
+            new_value, new_ms = await timed(conn, rewritten, args.runs)
+            status = "совпадает" if old_value == new_value else f"РАЗЛИЧАЕТСЯ: {old_value} != {new_value}"
+            print(f"{name:<26}{old_ms:>12.2f}{new_ms:>12.2f}{old_ms / new_ms:>10.1f}x  {status}")
+    finally:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
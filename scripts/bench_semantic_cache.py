@@ -0,0 +1,101 @@
+"""Семантический кеш на журнале вопросов: доля попаданий и ложные попадания по порогу.
+
+Вопросы с ответом из журнала в Redis (stats:questions:log) или из файла
+--data (JSONL {"q", "sql"}) проигрываются по порядку: каждый сначала ищется
+среди предыдущих, затем добавляется в кеш со своим SQL. Точные повторы
+пропускаются - на них отвечает обычный кеш ответов. Попадание ложное, если
+SQL похожего вопроса с подставленными значениями не совпадает с SQL,
+сгенерированным для этого вопроса (после нормализации sqlglot; оценка
+осторожная - равносильный запрос другой записи тоже считается ложным):
+
+    python scripts/bench_semantic_cache.py --data answered.jsonl --thresholds 0.8 0.85 0.9 0.95
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+
+import sqlglot
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.config import settings
+from app.services.cache_service import cache_service
+from app.services.semantic_cache import SemanticCache, exact_words, extract_params, rebind_sql
+
+
+def normalized(sql: str) -> str:
+    try:
+        return sqlglot.parse_one(sql, read="postgres").sql(dialect="postgres", normalize=True)
+    except sqlglot.errors.ParseError:
+        return sql
+
+
+async def logged_answers() -> list:
+    await cache_service.connect()
+    try:
+        entries = await cache_service.get_question_log()
+    finally:
+        await cache_service.disconnect()
+    # Журнал хранит новые вопросы первыми
+    return [entry for entry in reversed(entries) if entry.get("outcome") == "answered" and entry.get("sql")]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", help="Вопросы с SQL (JSONL {\"q\", \"sql\"}); без него - журнал из Redis")
+    parser.add_argument("--thresholds", type=float, nargs="*", default=[0.8, 0.85, 0.9, 0.95, 0.98])
+    parser.add_argument("--capacity", type=int, default=settings.SEMANTIC_CACHE_SIZE)
+    args = parser.parse_args()
+
+    if args.data:
+        with open(args.data, encoding="utf-8") as f:
+            answers = [json.loads(line) for line in f if line.strip()]
+    else:
+        answers = await logged_answers()
+    if not answers:
+        sys.exit("Нет вопросов с ответом")
+
+    cache = SemanticCache(capacity=args.capacity)
+    seen = set()
+    replayed = []  # (сходство, SQL из кеша или None, верный ли он)
+    latencies = []
+    for answer in answers:
+        question, sql = answer["q"], answer["sql"]
+        if question in seen:
+            continue
+        seen.add(question)
+
+        started = time.perf_counter()
+        found = cache.search(question)
+        if found is not None:
+            similarity, entry, skeleton, params = found
+            rebound = None
+            if exact_words(skeleton) == entry["exact"]:
+                rebound = rebind_sql(entry["sql"], entry["params"], params)
+            latencies.append((time.perf_counter() - started) * 1e6)
+            replayed.append((similarity, rebound, rebound is not None and normalized(rebound) == normalized(sql)))
+        await cache.add(None, question, sql)
+
+    print(f"Вопросов с ответом: {len(answers)}, без точных повторов: {len(seen)}, емкость: {args.capacity}\n")
+    print(f"{'порог':<8}{'попаданий':>12}{'доля':>8}{'ложных':>10}{'не подставилось':>18}")
+    for threshold in args.thresholds:
+        close = [item for item in replayed if item[0] >= threshold]
+        hits = [item for item in close if item[1] is not None]
+        false_hits = sum(not correct for _, _, correct in hits)
+        print(f"{threshold:<8}{len(hits):>12}{len(hits) / len(seen):>8.1%}{false_hits:>10}"
+              f"{len(close) - len(hits):>18}")
+
+    if latencies:
+        latencies.sort()
+        print(f"\nПоиск и подстановка: p50 {statistics.median(latencies):.0f} мкс, "
+              f"p99 {latencies[int(len(latencies) * 0.99)]:.0f} мкс")
+    skeletons = len({extract_params(question)[0] for question in seen})
+    print(f"Разных вопросов без учета значений: {skeletons}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
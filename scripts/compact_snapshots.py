@@ -0,0 +1,211 @@
+"""Свертка старых снимков video_snapshots до одного снимка на видео в день.
+
+Снимки старше --days дней (SNAPSHOT_RETENTION_DAYS, граница - начало суток
+в часовом поясе сессии PostgreSQL) сворачиваются: от каждого дня каждого
+видео остается последний снимок с абсолютными счетчиками на конец дня, его
+delta_*_count заменяются суммой приращений за день, остальные снимки дня
+удаляются. Ответы на вопросы с точностью до дня (сумма приращений за дни,
+счетчики на конец дня, число видео с приростом при неотрицательных
+приращениях) не меняются; пропадает только разбивка по часам внутри дня.
+
+Видео обрабатываются пачками по --batch, каждая пачка - отдельная короткая
+транзакция (обновление и удаление вместе), поэтому бот во время свертки видит
+либо исходные снимки дня, либо уже свернутые, и может работать как обычно.
+Повторный запуск не трогает уже свернутые дни. Граница свертки записывается
+в snapshot_compaction: scripts/load_json.py не загружает снимки старше нее
+повторно (иначе приращения посчитались бы дважды).
+
+    python scripts/compact_snapshots.py --days 30 --batch 500 --verify --vacuum
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import psycopg2
+import psycopg2.errors
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.config import settings
+
+LOCK_RETRIES = 3
+
+DELTAS = ("delta_views_count", "delta_likes_count", "delta_comments_count", "delta_reports_count")
+
+CREATE_STATE = """
+CREATE TABLE IF NOT EXISTS snapshot_compaction (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    compacted_before TIMESTAMP WITH TIME ZONE NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+)
+"""
+
+# Граница только растет: свернутые дни уже нельзя развернуть обратно
+SAVE_BOUNDARY = """
+INSERT INTO snapshot_compaction (compacted_before) VALUES (%s)
+ON CONFLICT (id) DO UPDATE SET
+    compacted_before = GREATEST(snapshot_compaction.compacted_before, EXCLUDED.compacted_before),
+    updated_at = now()
+"""
+
+# Последний снимок дня получает суммы приращений за день, остальные снимки дня удаляются
+COMPACT_BATCH = f"""
+WITH days AS (
+    SELECT
+        id,
+        row_number() OVER (per_day ORDER BY created_at DESC, id DESC) AS rank_in_day,
+        COUNT(*) OVER per_day AS snapshots,
+        {", ".join(f"SUM({column}) OVER per_day AS {column}" for column in DELTAS)}
+    FROM video_snapshots
+    WHERE video_id = ANY(%(videos)s::uuid[]) AND created_at < %(boundary)s
+    WINDOW per_day AS (PARTITION BY video_id, date_trunc('day', created_at))
+),
+kept AS (
+    UPDATE video_snapshots s SET
+        {", ".join(f"{column} = days.{column}" for column in DELTAS)},
+        updated_at = now()
+    FROM days
+    WHERE s.id = days.id AND days.rank_in_day = 1 AND days.snapshots > 1
+    RETURNING s.id
+)
+DELETE FROM video_snapshots s
+USING days
+WHERE s.id = days.id AND days.rank_in_day > 1
+"""
+
+# Ответы с точностью до дня: должны совпасть до и после свертки
+DAY_TOTALS = f"""
+SELECT
+    date_trunc('day', created_at) AS day,
+    {", ".join(f"SUM({column})" for column in DELTAS)},
+    COUNT(DISTINCT video_id) FILTER (WHERE delta_views_count > 0),
+    SUM(views_count) FILTER (WHERE last_of_day)
+FROM (
+    SELECT *, row_number() OVER (
+        PARTITION BY video_id, date_trunc('day', created_at) ORDER BY created_at DESC, id DESC
+    ) = 1 AS last_of_day
+    FROM video_snapshots
+    WHERE created_at < %s
+) snapshots
+GROUP BY 1
+ORDER BY 1
+"""
+
+
+def connect():
+    return psycopg2.connect(
+        host=settings.DB_HOST,
+        database=settings.DB_NAME,
+        user=settings.DB_USER,
+        password=settings.DB_PASSWORD,
+        port=settings.DB_PORT,
+    )
+
+
+def compaction_boundary(cursor, days: int):
+    cursor.execute("SELECT date_trunc('day', now() - make_interval(days => %s))", (days,))
+    return cursor.fetchone()[0]
+
+
+def day_totals(cursor, boundary) -> list:
+    cursor.execute(DAY_TOTALS, (boundary,))
+    return cursor.fetchall()
+
+
+def compact(connection, boundary, batch: int, pause: float) -> tuple:
+    """Свернуть снимки до boundary; возвращает (видео, удалено снимков)"""
+    videos = deleted = 0
+    last_id = None
+    with connection.cursor() as cursor:
+        while True:
+            # Пачка видео по возрастанию id (keyset), у которых есть снимки до границы
+            cursor.execute(
+                """
+                SELECT v.id::text FROM videos v
+                WHERE (%(last)s::uuid IS NULL OR v.id > %(last)s::uuid)
+                  AND EXISTS (SELECT 1 FROM video_snapshots s WHERE s.video_id = v.id AND s.created_at < %(boundary)s)
+                ORDER BY v.id
+                LIMIT %(batch)s
+                """,
+                {"last": last_id, "boundary": boundary, "batch": batch},
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            connection.commit()
+            if not ids:
+                break
+
+            for attempt in range(LOCK_RETRIES + 1):
+                try:
+                    cursor.execute(COMPACT_BATCH, {"videos": ids, "boundary": boundary})
+                    deleted += cursor.rowcount
+                    connection.commit()
+                    break
+                except psycopg2.errors.LockNotAvailable:
+                    # Снимки этих видео сейчас обновляет кто-то еще - повторим чуть позже
+                    connection.rollback()
+                    if attempt == LOCK_RETRIES:
+                        raise
+                    time.sleep(1 + attempt)
+                except Exception:
+                    connection.rollback()
+                    raise
+            videos += len(ids)
+            last_id = ids[-1]
+            print(f"  ✓ Видео: {videos}, удалено снимков: {deleted}")
+            if pause:
+                time.sleep(pause)
+    return videos, deleted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=settings.SNAPSHOT_RETENTION_DAYS,
+                        help="Сворачивать снимки старше стольких дней")
+    parser.add_argument("--batch", type=int, default=500, help="Видео в одной транзакции")
+    parser.add_argument("--pause", type=float, default=0.0, help="Пауза между пачками, сек")
+    parser.add_argument("--lock-timeout", type=int, default=2000,
+                        help="Ожидание блокировки строк, мс (занятую пачку лучше повторить, чем ждать)")
+    parser.add_argument("--verify", action="store_true", help="Сравнить итоги по дням до и после свертки")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM ANALYZE video_snapshots после свертки")
+    args = parser.parse_args()
+
+    connection = connect()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SET lock_timeout = %s", (args.lock_timeout,))
+            cursor.execute(CREATE_STATE)
+            boundary = compaction_boundary(cursor, args.days)
+            # Граница фиксируется до свертки: загрузка, запущенная параллельно, уже не добавит старые снимки
+            cursor.execute(SAVE_BOUNDARY, (boundary,))
+            cursor.execute("SELECT COUNT(*) FROM video_snapshots WHERE created_at < %s", (boundary,))
+            before = cursor.fetchone()[0]
+            totals = day_totals(cursor, boundary) if args.verify else None
+        connection.commit()
+        print(f"Свертка снимков до {boundary}: {before} снимков")
+
+        started = time.monotonic()
+        videos, deleted = compact(connection, boundary, args.batch, args.pause)
+        print(f"Свернуто за {time.monotonic() - started:.1f} с: видео {videos}, "
+              f"удалено снимков {deleted}, осталось {before - deleted}")
+
+        if totals is not None:
+            with connection.cursor() as cursor:
+                after = day_totals(cursor, boundary)
+            connection.commit()
+            if after != totals:
+                changed = [row[0] for row, other in zip(totals, after) if row != other]
+                sys.exit(f"✗ Итоги по дням изменились ({len(totals)} -> {len(after)} дней): {changed[:10]}")
+            print(f"✓ Итоги по {len(totals)} дням совпадают")
+
+        if args.vacuum:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute("VACUUM (ANALYZE) video_snapshots")
+            print("VACUUM ANALYZE video_snapshots выполнен")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Синтетический videos.json в формате VideoDatabase.load_videos_data (scripts/load_json.py).
+
+Распределения приближены к реальным: число видео у креаторов и итоговые
+просмотры видео - по Ципфу (немного креаторов и видео собирают большую
+часть; ранги креаторов - усеченный Ципф на 1..--creators), жалобы - редкие
+события. Снимки идут раз в час с публикации видео, их число - пуассоновское
+со средним --snapshots; просмотры распределяются по снимкам неравномерно
+(всплески: доли по Дирихле с малым параметром), лайки снимка - доля его
+прироста просмотров, комментарии - доля прироста лайков, так что лайков
+никогда не больше просмотров. Даты публикации равномерно
+распределены по --days дням начиная с --start. Файл пишется потоково,
+поэтому размер набора ограничен только диском:
+
+    python scripts/generate_dataset.py --creators 2000 --videos 100000 --snapshots 48 --output data/videos.json
+"""
+import sys
+import json
+import uuid
+import time
+import argparse
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+ZIPF_CREATORS = 1.3  # Параметр распределения видео по креаторам
+ZIPF_VIEWS = 1.7  # Параметр распределения итоговых просмотров
+BURSTINESS = 0.3  # Параметр Дирихле для долей просмотров по снимкам: меньше - резче всплески
+
+
+def _timestamp(moment: datetime) -> str:
+    return moment.isoformat(timespec="seconds")
+
+
+def _uuid(rng: np.random.Generator) -> str:
+    return str(uuid.UUID(bytes=rng.bytes(16), version=4))
+
+
+def _split(rng: np.random.Generator, total: int, weights: np.ndarray) -> np.ndarray:
+    """Разложить total на приращения по снимкам пропорционально weights"""
+    return rng.multinomial(total, weights) if total else np.zeros(len(weights), dtype=np.int64)
+
+
+def creator_ranks(rng: np.random.Generator, creators: int, videos: int) -> np.ndarray:
+    """Ранг креатора (с нуля) для каждого видео: Ципф, усеченный и нормированный на 1..creators.
+
+    Хвост распределения за пределами числа креаторов не достается последнему из них.
+    """
+    weights = np.arange(1, creators + 1, dtype=np.float64) ** -ZIPF_CREATORS
+    return rng.choice(creators, size=videos, p=weights / weights.sum())
+
+
+def generate_video(rng: np.random.Generator, creator_id: str, published: datetime, snapshots: int,
+                   until: datetime) -> dict:
+    """Видео со снимками: итоговые счетчики равны счетчикам последнего снимка"""
+    views = int(min(rng.zipf(ZIPF_VIEWS) * 50, 50_000_000))
+    reports = int(rng.poisson(views * 1e-5))
+
+    # Снимки раз в час, но не позже конца периода
+    hours = max(min(snapshots, int((until - published).total_seconds() // 3600)), 1)
+    weights = rng.dirichlet(np.full(hours, BURSTINESS))
+    view_deltas = _split(rng, views, weights)
+    # Лайки - часть новых просмотров снимка, комментарии - часть новых лайков
+    like_deltas = rng.binomial(view_deltas, rng.beta(2, 50))
+    comment_deltas = rng.binomial(like_deltas, rng.beta(2, 20))
+    deltas = [view_deltas, like_deltas, comment_deltas, _split(rng, reports, weights)]
+    totals = [np.cumsum(delta) for delta in deltas]
+
+    video_id = _uuid(rng)
+    items = []
+    for hour in range(hours):
+        moment = published + timedelta(hours=hour + 1)
+        items.append({
+            "id": _uuid(rng),
+            "video_id": video_id,
+            "views_count": int(totals[0][hour]),
+            "likes_count": int(totals[1][hour]),
+            "comments_count": int(totals[2][hour]),
+            "reports_count": int(totals[3][hour]),
+            "delta_views_count": int(deltas[0][hour]),
+            "delta_likes_count": int(deltas[1][hour]),
+            "delta_comments_count": int(deltas[2][hour]),
+            "delta_reports_count": int(deltas[3][hour]),
+            "created_at": _timestamp(moment),
+            "updated_at": _timestamp(moment),
+        })
+
+    return {
+        "id": video_id,
+        "creator_id": creator_id,
+        "video_created_at": _timestamp(published),
+        "views_count": views,
+        "likes_count": int(totals[1][-1]),
+        "comments_count": int(totals[2][-1]),
+        "reports_count": reports,
+        "created_at": _timestamp(published),
+        "updated_at": items[-1]["updated_at"],
+        "snapshots": items,
+    }
+
+
+def generate(path: str, creators: int, videos: int, snapshots: float, start: datetime, days: int,
+             seed: int = 0) -> dict:
+    """Записать набор в path; возвращает число креаторов, видео и снимков"""
+    rng = np.random.default_rng(seed)
+    creator_ids = [rng.bytes(16).hex() for _ in range(creators)]
+    # Первые креаторы получают большую часть видео
+    ranks = creator_ranks(rng, creators, videos)
+    order = rng.permutation(creators)
+    offsets = rng.uniform(0, days * 86400, videos)
+    counts = rng.poisson(snapshots, videos)
+    until = start + timedelta(days=days)
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    used = set()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"videos": [\n')
+        for i in range(videos):
+            creator_id = creator_ids[order[ranks[i]]]
+            used.add(creator_id)
+            video = generate_video(rng, creator_id, start + timedelta(seconds=float(offsets[i])),
+                                   int(counts[i]), until)
+            written += len(video["snapshots"])
+            f.write((",\n" if i else "") + json.dumps(video, ensure_ascii=False))
+        f.write("\n]}\n")
+    return {"creators": len(used), "videos": videos, "snapshots": written}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--creators", type=int, default=1000)
+    parser.add_argument("--videos", type=int, default=10000)
+    parser.add_argument("--snapshots", type=float, default=24, help="Среднее число снимков на видео")
+    parser.add_argument("--start", default="2025-08-01", help="Первый день публикаций (UTC)")
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="data/videos.json")
+    args = parser.parse_args()
+
+    start = datetime.fromisoformat(args.start).replace(tzinfo=timezone.utc)
+    started = time.monotonic()
+    stats = generate(args.output, args.creators, args.videos, args.snapshots, start, args.days, args.seed)
+    size_mb = Path(args.output).stat().st_size / 1024 / 1024
+    print(f"{args.output}: креаторов {stats['creators']}, видео {stats['videos']}, снимков {stats['snapshots']}, "
+          f"{size_mb:.1f} МБ за {time.monotonic() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Непрерывная загрузка данных из потока Redis (app/services/ingestion.py).
+
+run - читать поток INGEST_STREAM и загружать видео и снимки пачками
+(INGEST_BATCH_SIZE сообщений или INGEST_BATCH_INTERVAL_MS), раз в
+INGEST_REPORT_INTERVAL печатая пропускную способность и задержку свежести:
+от добавления сообщения до коммита и до смены поколения данных, после
+которой новые данные видит бот. Останавливается по Ctrl+C / SIGTERM,
+дописав начатую пачку. Таблицы должны быть созданы scripts/load_json.py.
+
+publish - отправить в поток видео из JSON в формате scripts/load_json.py
+({"videos": [...]}) или из JSONL (видео или снимок на строку); --rate
+ограничивает скорость (сообщений в секунду) для замера задержки под нагрузкой:
+
+    python scripts/ingest.py run --consumer ingester-1
+    python scripts/ingest.py publish data/new_videos.jsonl --rate 2000
+"""
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+from pathlib import Path
+
+import asyncpg
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.config import settings
+from app.services.cache_service import cache_service
+from app.services.ingestion import Ingestor, publish
+
+
+def read_items(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl") or path.endswith(".ndjson"):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f).get("videos", [])
+
+
+async def run(args) -> None:
+    await cache_service.connect()
+    if not cache_service.redis_client:
+        sys.exit("Redis недоступен")
+    conn = await asyncpg.connect(settings.database_url)
+    ingestor = Ingestor(cache_service.redis_client, conn, consumer=args.consumer)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await ingestor.run(stop)
+    finally:
+        print(f"Итог загрузки: {ingestor.report()}")
+        await conn.close()
+        await cache_service.disconnect()
+
+
+async def publish_file(args) -> None:
+    await cache_service.connect()
+    if not cache_service.redis_client:
+        sys.exit("Redis недоступен")
+    items = read_items(args.path)
+    started = time.monotonic()
+    sent = 0
+    try:
+        if not args.rate:
+            sent = await publish(cache_service.redis_client, items)
+        else:
+            # Порциями по 1/10 секунды, чтобы поток шел равномерно
+            chunk = max(args.rate // 10, 1)
+            for start in range(0, len(items), chunk):
+                sent += await publish(cache_service.redis_client, items[start:start + chunk])
+                await asyncio.sleep(max(started + sent / args.rate - time.monotonic(), 0))
+    finally:
+        await cache_service.disconnect()
+    elapsed = time.monotonic() - started
+    print(f"Отправлено {sent} сообщений за {elapsed:.1f} с ({sent / elapsed if elapsed else 0:.0f}/с)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Загружать данные из потока")
+    run_parser.add_argument("--consumer", default="ingester", help="Имя потребителя в группе")
+    publish_parser = commands.add_parser("publish", help="Отправить файл в поток")
+    publish_parser.add_argument("path")
+    publish_parser.add_argument("--rate", type=int, default=0, help="Сообщений в секунду (0 - без ограничения)")
+    args = parser.parse_args()
+
+    asyncio.run(run(args) if args.command == "run" else publish_file(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,21 @@
 from app.core.config import settings
+from app.services.cache_service import GENERATION_KEY
+from app.services.cache_warmup import run_standalone_warmup
 import json
+import asyncio
+import redis
 import psycopg2
 from datetime import datetime
 import os
+import sys
 
+# Индекс с этим именем, оставшийся INVALID после прерванного CREATE INDEX CONCURRENTLY
+INVALID_INDEX_SQL = """
+SELECT EXISTS (
+    SELECT 1 FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+    WHERE i.relname = %s AND NOT x.indisvalid AND pg_table_is_visible(x.indrelid)
+)
+"""
 
 class VideoDatabase:
     def __init__(self):
@@ -31,7 +43,7 @@ class VideoDatabase:
         create_videos_table = """
         CREATE TABLE IF NOT EXISTS videos (
             id UUID PRIMARY KEY,
-            creator_id VARCHAR(255),
+            creator_id UUID,
             video_created_at TIMESTAMP WITH TIME ZONE,
             views_count INTEGER,
             likes_count INTEGER,
@@ -46,6 +58,7 @@ class VideoDatabase:
         CREATE TABLE IF NOT EXISTS video_snapshots (
             id UUID PRIMARY KEY,
             video_id UUID REFERENCES videos(id) ON DELETE CASCADE,
+            creator_id UUID,
             views_count INTEGER,
             likes_count INTEGER,
             comments_count INTEGER,
@@ -58,6 +71,9 @@ class VideoDatabase:
             updated_at TIMESTAMP WITH TIME ZONE
         );
         
+        -- Таблица, созданная до появления креатора в снапшотах (заполняется scripts/migrate_creator_ids.py)
+        ALTER TABLE video_snapshots ADD COLUMN IF NOT EXISTS creator_id UUID;
+
         -- Индексы для ускорения запросов
         CREATE INDEX IF NOT EXISTS idx_snapshots_video_id ON video_snapshots(video_id);
         CREATE INDEX IF NOT EXISTS idx_snapshots_created_at ON video_snapshots(created_at);
@@ -69,15 +85,66 @@ class VideoDatabase:
             self.cursor.execute(create_videos_table)
             self.cursor.execute(create_snapshots_table)
             self.connection.commit()
+            # Таблица снапшотов может быть уже большой - индекс строится без блокировки записи
+            self.create_index_concurrently("idx_snapshots_creator_created", "video_snapshots(creator_id, created_at)")
             print("Таблицы созданы успешно")
         except Exception as e:
             print(f"Ошибка создания таблиц: {e}")
             self.connection.rollback()
             raise
 
+    def drop_invalid_index(self, name):
+        """Удалить индекс INVALID с этим именем (вызывается вне транзакции)"""
+        self.cursor.execute(INVALID_INDEX_SQL, (name,))
+        if self.cursor.fetchone()[0]:
+            print(f"Удаляем недостроенный индекс {name}")
+            self.cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+    def create_index_concurrently(self, name, target):
+        """CREATE INDEX CONCURRENTLY name ON target: запись в таблицу во время построения не блокируется.
+
+        IF NOT EXISTS считает существующим и индекс INVALID, оставшийся от
+        прерванного построения, поэтому такой индекс сначала удаляется;
+        после неудачного построения он тоже удаляется.
+        """
+        self.connection.commit()
+        self.connection.autocommit = True
+        try:
+            self.drop_invalid_index(name)
+            try:
+                self.cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {target}")
+            except psycopg2.Error:
+                self.drop_invalid_index(name)
+                raise
+        finally:
+            self.connection.autocommit = False
+
+    def get_compaction_boundary(self):
+        """Граница свертки снимков (scripts/compact_snapshots.py) или None, если свертки не было"""
+        self.cursor.execute("SELECT to_regclass('snapshot_compaction') IS NOT NULL")
+        if not self.cursor.fetchone()[0]:
+            return None
+        self.cursor.execute("SELECT compacted_before FROM snapshot_compaction")
+        row = self.cursor.fetchone()
+        return row[0] if row else None
+
+    def is_compacted(self, snapshot, boundary):
+        """Снимок за уже свернутый период: его приращения уже учтены в снимке за день"""
+        if boundary is None:
+            return False
+        created_at = datetime.fromisoformat(snapshot['created_at'])
+        if created_at.tzinfo is None:
+            # Как и PostgreSQL, время без пояса считаем временем в поясе сессии
+            created_at = created_at.replace(tzinfo=boundary.tzinfo)
+        return created_at < boundary
+
     def load_videos_data(self, json_file_path):
         """Загрузка данных из JSON файла"""
         try:
+            boundary = self.get_compaction_boundary()
+            skipped_snapshots = 0
+            untimed_snapshots = 0
+
             with open(json_file_path, 'r', encoding='utf-8') as file:
                 data = json.load(file)
                 videos = data.get('videos', [])
@@ -117,14 +184,23 @@ class VideoDatabase:
                         # Загрузка снапшотов
                         snapshots = video.get('snapshots', [])
                         for snapshot in snapshots:
+                            if not snapshot.get('created_at'):
+                                # Без времени снимок не сравнить с границей свертки и не отнести ко дню
+                                print(f"  ✗ Снапшот {snapshot.get('id', 'unknown')} без created_at пропущен")
+                                untimed_snapshots += 1
+                                continue
+                            if self.is_compacted(snapshot, boundary):
+                                skipped_snapshots += 1
+                                continue
                             self.cursor.execute("""
                                 INSERT INTO video_snapshots 
-                                (id, video_id, views_count, likes_count, comments_count, reports_count,
+                                (id, video_id, creator_id, views_count, likes_count, comments_count, reports_count,
                                  delta_views_count, delta_likes_count, delta_comments_count, delta_reports_count,
                                  created_at, updated_at)
-                                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                                 ON CONFLICT (id) DO UPDATE SET
                                     video_id = EXCLUDED.video_id,
+                                    creator_id = EXCLUDED.creator_id,
                                     views_count = EXCLUDED.views_count,
                                     likes_count = EXCLUDED.likes_count,
                                     comments_count = EXCLUDED.comments_count,
@@ -137,6 +213,8 @@ class VideoDatabase:
                             """, (
                                 snapshot['id'],
                                 snapshot['video_id'],
+                                # Копия креатора видео: история по креатору без JOIN с videos
+                                video['creator_id'],
                                 snapshot['views_count'],
                                 snapshot['likes_count'],
                                 snapshot['comments_count'],
@@ -157,6 +235,10 @@ class VideoDatabase:
                 
                 self.connection.commit()
                 print(f"Загрузка завершена. Загружено: {videos_inserted} видео")
+                if skipped_snapshots:
+                    print(f"Пропущено снапшотов за свернутый период (до {boundary}): {skipped_snapshots}")
+                if untimed_snapshots:
+                    print(f"Пропущено снапшотов без created_at: {untimed_snapshots}")
                 
         except FileNotFoundError:
             print(f"Файл {json_file_path} не найден")
@@ -205,6 +287,28 @@ class VideoDatabase:
             self.connection.close()
             print("Соединение с базой данных закрыто")
 
+def bump_cache_generation():
+    """Новое поколение данных: закешированные ботом ответы становятся устаревшими"""
+    try:
+        client = redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB,
+            password=settings.REDIS_PASSWORD or None,
+        )
+        generation = client.incr(GENERATION_KEY)
+        print(f"Поколение кеша: {generation}")
+    except Exception as e:
+        print(f"Не удалось обновить поколение кеша: {e}")
+
+def warm_up_cache():
+    """Прогреть кеш популярными вопросами по новым данным"""
+    try:
+        report = asyncio.run(run_standalone_warmup())
+        print(f"Прогрев кеша: {report['warmed']} из {report['total']} вопросов за {report['duration_s']} с")
+    except Exception as e:
+        print(f"Не удалось прогреть кеш: {e}")
+
 def main():
     """Основная функция"""
     db = VideoDatabase()
@@ -217,8 +321,11 @@ def main():
         db.create_tables()
         
         # 3. Загрузка данных из JSON
-        json_file = "/opt/data/videos.json"  # Укажите путь к вашему файлу
+        # Путь можно передать аргументом (например, набор из scripts/generate_dataset.py)
+        json_file = sys.argv[1] if len(sys.argv) > 1 else "/opt/data/videos.json"
         db.load_videos_data(json_file)
+        bump_cache_generation()
+        warm_up_cache()
         
         # 4. Показать статистику
         db.get_statistics()
@@ -0,0 +1,169 @@
+"""Перевод creator_id на UUID и копия креатора в video_snapshots - с замерами до и после.
+
+videos.creator_id из VARCHAR(255) (32 шестнадцатеричных символа) становится
+UUID (16 байт вместо 33), в video_snapshots появляется creator_id с индексом
+(creator_id, created_at): история по креатору считается без JOIN с videos.
+До и после миграции печатаются размеры таблиц и индексов и время запроса
+истории по креатору (медиана по --creators самым крупным креаторам):
+
+    python scripts/migrate_creator_ids.py --batch 1000 --creators 20 --runs 3
+
+Смена типа переписывает videos под эксклюзивной блокировкой (запросы бота
+к videos ждут ее окончания); заполнение снимков идет пачками видео в
+отдельных транзакциях, индекс строится CONCURRENTLY. Повторный запуск
+пропускает выполненные шаги, а индекс, оставшийся INVALID после прерванного
+построения, удаляет и строит заново. --measure-only - только замеры.
+"""
+import sys
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+import psycopg2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from load_json import VideoDatabase
+
+# История по креатору за месяц до последнего снимка: через JOIN и по копии в снимках
+JOIN_QUERY = """
+SELECT SUM(s.delta_views_count) FROM video_snapshots s JOIN videos v ON v.id = s.video_id
+WHERE v.creator_id = %(creator)s AND s.created_at >= %(since)s
+"""
+DIRECT_QUERY = """
+SELECT SUM(delta_views_count) FROM video_snapshots
+WHERE creator_id = %(creator)s AND created_at >= %(since)s
+"""
+
+SIZES = """
+SELECT c.relname, pg_relation_size(c.oid)
+FROM pg_class c
+WHERE c.relname IN ('videos', 'video_snapshots')
+   OR c.oid IN (SELECT indexrelid FROM pg_index WHERE indrelid IN ('videos'::regclass, 'video_snapshots'::regclass))
+ORDER BY c.relname
+"""
+
+BACKFILL_BATCH = """
+UPDATE video_snapshots s SET creator_id = v.creator_id
+FROM videos v
+WHERE s.video_id = v.id AND v.id = ANY(%s::uuid[]) AND s.creator_id IS DISTINCT FROM v.creator_id
+"""
+
+
+def column_type(cursor, table: str, column: str):
+    cursor.execute(
+        "SELECT data_type FROM information_schema.columns WHERE table_name = %s AND column_name = %s "
+        "AND table_schema = current_schema()",
+        (table, column),
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def measure(db: VideoDatabase, creators: int, runs: int) -> dict:
+    """Размеры отношений (байт) и время запросов истории по креатору (мс)"""
+    cursor = db.cursor
+    cursor.execute(SIZES)
+    sizes = dict(cursor.fetchall())
+    cursor.execute("SELECT MAX(created_at) - INTERVAL '30 days' FROM video_snapshots")
+    since = cursor.fetchone()[0]
+    cursor.execute("SELECT creator_id FROM videos GROUP BY creator_id ORDER BY COUNT(*) DESC LIMIT %s", (creators,))
+    top = [row[0] for row in cursor.fetchall()]
+
+    queries = {"JOIN videos": JOIN_QUERY}
+    if column_type(cursor, "video_snapshots", "creator_id"):
+        cursor.execute("SELECT COUNT(*) FROM video_snapshots WHERE creator_id IS NULL")
+        if not cursor.fetchone()[0]:
+            queries["video_snapshots.creator_id"] = DIRECT_QUERY
+
+    latencies = {}
+    for name, sql in queries.items():
+        samples = []
+        for creator in top:
+            for _ in range(runs):
+                started = time.perf_counter()
+                cursor.execute(sql, {"creator": creator, "since": since})
+                cursor.fetchone()
+                samples.append((time.perf_counter() - started) * 1000)
+        latencies[name] = statistics.median(samples) if samples else None
+    db.connection.commit()
+    return {"sizes": sizes, "latency_ms": latencies}
+
+
+def migrate(db: VideoDatabase, batch: int) -> None:
+    cursor = db.cursor
+    if column_type(cursor, "videos", "creator_id") != "uuid":
+        started = time.monotonic()
+        cursor.execute("ALTER TABLE videos ALTER COLUMN creator_id TYPE UUID USING creator_id::uuid")
+        db.connection.commit()
+        print(f"videos.creator_id -> UUID за {time.monotonic() - started:.1f} с")
+
+    cursor.execute("ALTER TABLE video_snapshots ADD COLUMN IF NOT EXISTS creator_id UUID")
+    db.connection.commit()
+
+    # Пачки видео по возрастанию id; снимки уже заполненных видео не трогаются
+    started = time.monotonic()
+    last_id, updated = None, 0
+    while True:
+        cursor.execute(
+            "SELECT id::text FROM videos WHERE (%(last)s::uuid IS NULL OR id > %(last)s::uuid) ORDER BY id LIMIT %(batch)s",
+            {"last": last_id, "batch": batch},
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            break
+        cursor.execute(BACKFILL_BATCH, (ids,))
+        updated += cursor.rowcount
+        db.connection.commit()
+        last_id = ids[-1]
+    print(f"video_snapshots.creator_id заполнен: {updated} снимков за {time.monotonic() - started:.1f} с")
+
+    started = time.monotonic()
+    # Недостроенный индекс прерванного запуска удаляется и строится заново
+    db.create_index_concurrently("idx_snapshots_creator_created", "video_snapshots(creator_id, created_at)")
+    cursor.execute("ANALYZE videos")
+    cursor.execute("ANALYZE video_snapshots")
+    db.connection.commit()
+    print(f"Индекс (creator_id, created_at) построен за {time.monotonic() - started:.1f} с")
+
+
+def report(before: dict, after: dict) -> None:
+    print(f"\n{'отношение':<34}{'до, МБ':>10}{'после, МБ':>12}")
+    for name in sorted(set(before["sizes"]) | set(after["sizes"])):
+        old, new = before["sizes"].get(name), after["sizes"].get(name)
+        print(f"{name:<34}{'-' if old is None else f'{old / 2**20:.1f}':>10}"
+              f"{'-' if new is None else f'{new / 2**20:.1f}':>12}")
+    print(f"\n{'история по креатору':<34}{'до, мс':>10}{'после, мс':>12}")
+    for name in ("JOIN videos", "video_snapshots.creator_id"):
+        old, new = before["latency_ms"].get(name), after["latency_ms"].get(name)
+        print(f"{name:<34}{'-' if old is None else f'{old:.1f}':>10}{'-' if new is None else f'{new:.1f}':>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=1000, help="Видео в одной транзакции заполнения")
+    parser.add_argument("--creators", type=int, default=20, help="Сколько крупнейших креаторов замерять")
+    parser.add_argument("--runs", type=int, default=3, help="Повторов запроса на креатора")
+    parser.add_argument("--measure-only", action="store_true")
+    args = parser.parse_args()
+
+    db = VideoDatabase()
+    db.connect()
+    try:
+        before = measure(db, args.creators, args.runs)
+        if args.measure_only:
+            report(before, before)
+            return
+        migrate(db, args.batch)
+        after = measure(db, args.creators, args.runs)
+        report(before, after)
+    except psycopg2.Error as e:
+        db.connection.rollback()
+        sys.exit(f"Ошибка миграции: {e}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Обучение классификатора вопросов (app/services/question_classifier.py).
+
+Разметка берется из журнала вопросов в Redis (stats:questions:log: вопросы,
+на которые бот ответил, и вопросы, для которых YandexGPT не сгенерировал
+корректный запрос), из начального набора scripts/question_seed.jsonl и из
+дополнительных файлов --labeled в том же формате. Модель сохраняется
+в CLASSIFIER_MODEL_PATH (или --output) и подхватывается при запуске бота:
+
+    python scripts/train_question_classifier.py --labeled reviewed.jsonl
+"""
+import sys
+import asyncio
+import argparse
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.config import settings
+from app.services.cache_service import cache_service
+from app.services.question_classifier import QuestionClassifier, examples_from_log, read_labeled
+
+SEED_PATH = Path(__file__).resolve().parent / "question_seed.jsonl"
+
+
+async def logged_examples() -> list:
+    await cache_service.connect()
+    try:
+        return examples_from_log(await cache_service.get_question_log())
+    finally:
+        await cache_service.disconnect()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labeled", nargs="*", default=[], help="Размеченные вопросы (JSONL)")
+    parser.add_argument("--no-seed", action="store_true", help="Не добавлять начальный набор")
+    parser.add_argument("--no-log", action="store_true", help="Не читать журнал вопросов из Redis")
+    parser.add_argument("--output", default=settings.CLASSIFIER_MODEL_PATH)
+    parser.add_argument("--dim", type=int, default=1 << 14, help="Размер вектора хешированных признаков")
+    parser.add_argument("--epochs", type=int, default=200)
+    args = parser.parse_args()
+
+    # Ручная разметка важнее журнала: при совпадении текста остается первая
+    examples = {}
+    sources = [read_labeled(path) for path in args.labeled]
+    if not args.no_seed:
+        sources.append(read_labeled(SEED_PATH))
+    if not args.no_log:
+        sources.append(await logged_examples())
+    for source in sources:
+        for example in source:
+            examples.setdefault(example.text, example)
+    examples = list(examples.values())
+    if not examples:
+        sys.exit("Нет размеченных вопросов")
+
+    answerable = sum(example.answerable for example in examples)
+    print(f"Вопросов: {len(examples)} (с ответом: {answerable}, без ответа: {len(examples) - answerable})")
+    print("Таблицы:", dict(Counter(example.table for example in examples if example.answerable)))
+    print("Агрегаты:", dict(Counter(example.aggregate for example in examples if example.answerable)))
+
+    model = QuestionClassifier.train(examples, dim=args.dim, epochs=args.epochs)
+    model.save(args.output)
+    print(f"Модель сохранена: {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -7,4 +7,11 @@ def event_loop():
     """Создание event loop для тестов"""
     loop = asyncio.get_event_loop_policy().new_event_loop()
     yield loop
-    loop.close()
\ No newline at end of file
+    loop.close()
+
+
+@pytest.fixture(autouse=True)
+def empty_semantic_cache(monkeypatch):
+    """Каждый тест начинает с пустого семантического кеша: отвеченные в других тестах вопросы не находятся"""
+    from app.services.semantic_cache import SemanticCache
+    monkeypatch.setattr("app.handlers.user_handlers.semantic_cache", SemanticCache(capacity=100))
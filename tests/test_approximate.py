@@ -0,0 +1,121 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.services.approximate import Approximator, Approximation, build_approximation, estimate_from_row
+from app.services.db_service import QueryResult
+from app.services.sql_guard import analyze_sql
+
+
+class TestBuildApproximation:
+    """Тесты построения запроса по выборке"""
+
+    def test_sum_sampled_with_squares(self):
+        """Тест: SUM считается по выборке вместе с суммой квадратов"""
+        guarded = analyze_sql("SELECT SUM(delta_views_count) FROM video_snapshots WHERE video_id = 5")
+        approximation = build_approximation(guarded, 1.0)
+
+        assert approximation.kind == "sum"
+        assert approximation.fraction == 0.01
+        assert "TABLESAMPLE SYSTEM (1.0)" in approximation.guarded.sql
+        assert "WHERE video_id = 5" in approximation.guarded.sql
+        assert "AS s2" in approximation.guarded.sql
+
+    def test_distinct_counts_singletons(self):
+        """Тест: COUNT(DISTINCT) - частоты значений в выборке без NULL"""
+        guarded = analyze_sql(
+            "SELECT COUNT(DISTINCT s.video_id) FROM video_snapshots s WHERE s.created_at >= '2025-11-01'"
+        )
+        approximation = build_approximation(guarded, 2.0)
+
+        assert approximation.kind == "distinct"
+        sql = approximation.guarded.sql
+        assert "video_snapshots AS s TABLESAMPLE SYSTEM (2.0)" in sql
+        assert "NOT s.video_id IS NULL" in sql
+        assert "GROUP BY s.video_id" in sql
+
+    @pytest.mark.parametrize("sql", [
+        "SELECT COUNT(*) FROM videos",
+        "SELECT AVG(delta_views_count) FROM video_snapshots",
+        "SELECT video_id, SUM(delta_views_count) FROM video_snapshots GROUP BY video_id",
+        "SELECT COUNT(*) FROM video_snapshots s JOIN videos v ON v.id = s.video_id",
+        "SELECT COUNT(*) FROM video_snapshots WHERE video_id IN (SELECT id FROM videos)",
+    ])
+    def test_unsupported_queries(self, sql):
+        """Тест: другие таблицы, агрегаты, группировки и подзапросы не оцениваются"""
+        assert build_approximation(analyze_sql(sql), 1.0) is None
+
+
+class TestEstimate:
+    """Тесты пересчета выборки в оценку"""
+
+    @staticmethod
+    def _approximation(kind, fraction=0.01):
+        return Approximation(guarded=MagicMock(), kind=kind, fraction=fraction)
+
+    def test_count_scaled(self):
+        """Тест: COUNT делится на долю выборки, интервал вокруг оценки"""
+        estimate = estimate_from_row(self._approximation("count"), {"n": 100})
+
+        assert estimate.value == pytest.approx(10000)
+        assert estimate.low < 10000 < estimate.high
+        assert estimate.low >= 100
+
+    def test_sum_interval_from_squares(self):
+        """Тест: интервал SUM по сумме квадратов"""
+        estimate = estimate_from_row(self._approximation("sum"), {"s": 500, "s2": 2500})
+
+        assert estimate.value == pytest.approx(50000)
+        spread = 1.96 * (0.99 * 2500) ** 0.5 / 0.01
+        assert estimate.high - estimate.value == pytest.approx(spread)
+
+    def test_distinct_bounds(self):
+        """Тест: GEE-оценка между числом различных в выборке и худшим случаем"""
+        estimate = estimate_from_row(self._approximation("distinct"), {"d": 30, "f1": 10})
+
+        assert estimate.value == pytest.approx(20 + 10 * 10)
+        assert estimate.low == 30
+        assert estimate.high == pytest.approx(20 + 10 * 100)
+
+    def test_empty_sample(self):
+        """Тест: пустая выборка оценки не дает"""
+        assert estimate_from_row(self._approximation("count"), {"n": 0}) is None
+        assert estimate_from_row(self._approximation("sum"), {"s": None, "s2": None}) is None
+
+    def test_format_marked_approximate(self):
+        """Тест: оценка помечена как приблизительная"""
+        estimate = estimate_from_row(self._approximation("count"), {"n": 100})
+        assert estimate.format().startswith("≈ 10000 (приблизительно")
+
+
+class TestApproximator:
+    """Тесты выбора между оценкой и точным запросом"""
+
+    SQL = "SELECT COUNT(*) FROM video_snapshots WHERE created_at >= '2025-11-01'"
+
+    @pytest.mark.asyncio
+    async def test_cheap_query_not_sampled(self):
+        """Тест: дешевый по плану запрос считается только точно"""
+        db = AsyncMock()
+        db.plan_cost.return_value = 10.0
+
+        with patch('app.services.approximate.settings') as mock_settings:
+            mock_settings.APPROXIMATE_COST_THRESHOLD = 1000.0
+            mock_settings.APPROXIMATE_SAMPLE_PERCENT = 1.0
+            assert await Approximator(db).estimate(analyze_sql(self.SQL)) is None
+
+        db.fetch_result.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_expensive_query_sampled(self):
+        """Тест: дорогой запрос оценивается по выборке"""
+        db = AsyncMock()
+        db.plan_cost.return_value = 5000.0
+        db.fetch_result.return_value = QueryResult(value=42, scalar=True)
+
+        with patch('app.services.approximate.settings') as mock_settings:
+            mock_settings.APPROXIMATE_COST_THRESHOLD = 1000.0
+            mock_settings.APPROXIMATE_SAMPLE_PERCENT = 1.0
+            estimate = await Approximator(db).estimate(analyze_sql(self.SQL))
+
+        assert estimate.value == pytest.approx(4200)
+        assert "TABLESAMPLE" in db.fetch_result.call_args[0][0].sql
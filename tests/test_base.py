@@ -1,5 +1,8 @@
 import pytest
-from app.handlers.base import contains_non_numeric_keywords, format_numeric_result
+from asyncpg.protocol.protocol import _create_record
+
+from app.handlers.base import contains_non_numeric_keywords, format_numeric_result, split_questions
+from app.services.db_service import QueryResult
 
 
 class TestBaseFunctions:
@@ -87,4 +90,36 @@ class TestBaseFunctions:
             {"id": 2, "total_views": 2000, "avg_likes": 30.0}
         ])
         # Исправлено: теперь функция возвращает ВСЕ числовые значения
-        assert result == "1, 1000, 25.5, 2, 2000, 30"
\ No newline at end of file
+        assert result == "1, 1000, 25.5, 2, 2000, 30"
+
+    def test_format_numeric_result_scalar(self):
+        """Тест форматирования результата быстрого пути с одним значением"""
+        assert format_numeric_result(QueryResult(value=42, scalar=True)) == "42"
+        assert format_numeric_result(QueryResult(value=42.0, scalar=True)) == "42"
+        assert format_numeric_result(QueryResult(value=None, scalar=True)) == "Нет данных"
+
+    def test_format_numeric_result_records(self):
+        """Тест форматирования записей asyncpg без преобразования в словари"""
+        rows = [
+            _create_record({"views": 0, "name": 1}, (100, "Video1")),
+            _create_record({"views": 0, "name": 1}, (200, "Video2")),
+        ]
+        assert format_numeric_result(QueryResult(rows=rows)) == "100, 200"
+        assert format_numeric_result([_create_record({"count": 0}, (7,))]) == "7"
+
+    def test_split_questions_by_question_mark(self):
+        """Тест разделения сообщения на вопросы по знаку вопроса"""
+        text = "Сколько всего видео? Сумма просмотров за ноябрь? Среднее число лайков?"
+        assert split_questions(text) == [
+            "Сколько всего видео?", "Сумма просмотров за ноябрь?", "Среднее число лайков?"
+        ]
+
+    def test_split_questions_list(self):
+        """Тест разделения нумерованного и маркированного списка вопросов"""
+        text = "1) Сколько всего видео\n2. Сумма просмотров за ноябрь\n- Среднее число лайков"
+        assert split_questions(text) == ["Сколько всего видео", "Сумма просмотров за ноябрь", "Среднее число лайков"]
+
+    def test_split_questions_single(self):
+        """Тест: перенос строки внутри одного вопроса его не разделяет"""
+        assert split_questions("Сколько видео\nза ноябрь 2025?") == ["Сколько видео\nза ноябрь 2025?"]
+        assert split_questions("Сколько всего видео") == ["Сколько всего видео"]
@@ -0,0 +1,56 @@
+import pytest
+from datetime import datetime
+from unittest.mock import patch
+
+from app.services.cache_policy import cache_policy_for_sql
+
+NOW = datetime(2025, 12, 2, 15, 0)
+
+
+class TestCachePolicy:
+    """Тесты выбора TTL по условиям на время"""
+
+    @pytest.fixture(autouse=True)
+    def mock_settings(self):
+        with patch('app.services.cache_policy.settings') as mock_settings:
+            mock_settings.CACHE_HISTORICAL_TTL = 2592000
+            mock_settings.CACHE_SLIDING_TTL = 60
+            yield mock_settings
+
+    @pytest.mark.parametrize("sql", [
+        "SELECT COUNT(*) FROM videos WHERE (video_created_at >= '2024-11-01' AND video_created_at < '2024-12-01')",
+        "SELECT COUNT(*) FROM videos WHERE video_created_at BETWEEN '2024-01-01' AND '2024-02-01'",
+        "SELECT SUM(delta_views_count) FROM video_snapshots WHERE created_at < '2025-12-02'",
+        "SELECT COUNT(*) FROM video_snapshots WHERE DATE(created_at) = '2025-11-27'",
+    ])
+    def test_closed_window(self, sql):
+        policy = cache_policy_for_sql(sql, now=NOW, default_ttl=7200)
+        assert policy.window == "closed"
+        assert policy.ttl == 2592000
+
+    @pytest.mark.parametrize("sql", [
+        "SELECT COUNT(*) FROM videos",
+        "SELECT COUNT(*) FROM videos WHERE video_created_at >= '2024-01-01'",
+        "SELECT COUNT(*) FROM videos WHERE video_created_at >= '2025-11-01' AND video_created_at < '2025-12-03'",
+        "SELECT COUNT(*) FROM videos WHERE video_created_at < '2024-12-01' OR video_created_at > '2025-01-01'",
+    ])
+    def test_open_window(self, sql):
+        policy = cache_policy_for_sql(sql, now=NOW, default_ttl=7200)
+        assert policy.window == "open"
+        assert policy.ttl == 7200
+
+    def test_current_date_aligned_to_next_day(self):
+        policy = cache_policy_for_sql(
+            "SELECT SUM(delta_views_count) FROM video_snapshots WHERE created_at >= CURRENT_DATE - INTERVAL '1 day'",
+            now=NOW, default_ttl=7200,
+        )
+        assert policy.window == "day"
+        assert policy.ttl == 9 * 3600
+
+    def test_now_is_sliding(self):
+        policy = cache_policy_for_sql(
+            "SELECT SUM(delta_views_count) FROM video_snapshots WHERE created_at >= NOW() - INTERVAL '24 hours'",
+            now=NOW, default_ttl=7200,
+        )
+        assert policy.window == "sliding"
+        assert policy.ttl == 60
@@ -4,7 +4,7 @@ from unittest.mock import AsyncMock, patch, MagicMock
 from datetime import datetime
 import json
 
-from app.services.cache_service import CacheService
+from app.services.cache_service import CacheService, FailureKind
 
 
 class TestCacheService:
@@ -85,18 +85,18 @@ class TestCacheService:
         """Тест получения закешированного результата (найден)"""
         cache_service.redis_client = mock_redis
         cache_key = cache_service._get_cache_key("тестовый запрос")
-        mock_redis.get.return_value = "42"
+        mock_redis.mget = AsyncMock(return_value=["3", json.dumps({"result": "42", "generation": 3})])
         
         result = await cache_service.get_cached_result("тестовый запрос")
         
         assert result == "42"
-        mock_redis.get.assert_called_once()
+        mock_redis.mget.assert_called_once_with("cache:generation", cache_key)
     
     @pytest.mark.asyncio
     async def test_get_cached_result_not_found(self, cache_service, mock_redis):
         """Тест получения закешированного результата (не найден)"""
         cache_service.redis_client = mock_redis
-        mock_redis.get.return_value = None
+        mock_redis.mget = AsyncMock(return_value=[None, None])
         
         result = await cache_service.get_cached_result("тестовый запрос")
         
@@ -108,45 +108,113 @@ class TestCacheService:
         cache_service.redis_client = mock_redis
         
         with patch.object(cache_service, '_should_cache_query', AsyncMock(return_value=True)):
-            await cache_service.save_to_cache("тестовый запрос", "результат")
+            await cache_service.save_to_cache("тестовый запрос", "результат", generation=2)
             
             mock_redis.setex.assert_called_once()
             args = mock_redis.setex.call_args[0]
             assert args[1] == cache_service.ttl
-            assert args[2] == "результат"
+            assert json.loads(args[2]) == {"result": "результат", "generation": 2}
+
+    @pytest.mark.asyncio
+    async def test_get_cached_result_stale_generation(self, cache_service, mock_redis):
+        """Тест: ответ прошлого поколения данных не отдается и удаляется"""
+        cache_service.redis_client = mock_redis
+        mock_redis.mget = AsyncMock(return_value=["4", json.dumps({"result": "42", "generation": 3})])
+
+        assert await cache_service.get_cached_result("тестовый запрос") is None
+        mock_redis.delete.assert_called_once_with(cache_service._get_cache_key("тестовый запрос"))
+        assert cache_service.get_metrics()["stale"] == 1
+
+    @pytest.mark.asyncio
+    async def test_get_cached_result_legacy_entry(self, cache_service, mock_redis):
+        """Тест: запись старого формата (просто текст) читается как есть"""
+        cache_service.redis_client = mock_redis
+        mock_redis.mget = AsyncMock(return_value=[None, "42"])
+
+        assert await cache_service.get_cached_result("тестовый запрос") == "42"
+
+    @pytest.mark.asyncio
+    async def test_save_to_cache_ttl_from_sql(self, cache_service, mock_redis):
+        """Тест выбора TTL по периоду в SQL"""
+        cache_service.redis_client = mock_redis
+
+        with patch.object(cache_service, '_should_cache_query', AsyncMock(return_value=True)), \
+                patch('app.services.cache_policy.settings') as mock_settings:
+            mock_settings.CACHE_HISTORICAL_TTL = 86400 * 30
+            mock_settings.CACHE_SLIDING_TTL = 60
+            await cache_service.save_to_cache(
+                "за ноябрь 2024", "7", generation=1,
+                sql="SELECT COUNT(*) FROM videos WHERE video_created_at >= '2024-11-01' AND video_created_at < '2024-12-01'"
+            )
+            await cache_service.save_to_cache(
+                "за сутки", "8", generation=1,
+                sql="SELECT SUM(delta_views_count) FROM video_snapshots WHERE created_at >= NOW() - INTERVAL '1 day'"
+            )
+
+        ttls = [call.args[1] for call in mock_redis.setex.call_args_list]
+        assert ttls == [86400 * 30, 60]
+
+    @pytest.mark.asyncio
+    async def test_bump_generation(self, cache_service, mock_redis):
+        cache_service.redis_client = mock_redis
+        mock_redis.incr = AsyncMock(return_value=5)
+
+        assert await cache_service.bump_generation() == 5
+        mock_redis.incr.assert_called_once_with("cache:generation")
     
+    @staticmethod
+    def _scripts(mock_redis, exists=0, estimate=1):
+        """Мок Lua-скриптов популярности: учет вопроса и сохранение SQL"""
+        scripts = {
+            "record": AsyncMock(return_value=[exists, estimate]),
+            "remember_sql": AsyncMock(return_value=1),
+        }
+        mock_redis.register_script = MagicMock(
+            side_effect=lambda source: scripts["record"] if "BITFIELD" in source else scripts["remember_sql"]
+        )
+        return scripts
+
     @pytest.mark.asyncio
     async def test_should_cache_query_new(self, cache_service, mock_redis):
         """Тест проверки необходимости кеширования (новый запрос)"""
         cache_service.redis_client = mock_redis
+        scripts = self._scripts(mock_redis, estimate=1)
         
         with patch('app.services.cache_service.settings') as mock_settings:
             mock_settings.MIN_CACHE_LENGTH = 3
             
-            # Настроим мок: нет кеша, первый вызов hincrby возвращает 1
-            mock_redis.get.return_value = None
-            mock_redis.hincrby.return_value = 1
-            
             result = await cache_service._should_cache_query("тестовый запрос")
             
             assert result is False  # Не достигли порога
-            mock_redis.hincrby.assert_called_once()
+            scripts["record"].assert_called_once()
+            # Отдельных запросов к Redis нет - только скрипт
+            mock_redis.get.assert_not_called()
+            mock_redis.hincrby.assert_not_called()
     
     @pytest.mark.asyncio
     async def test_should_cache_query_reached_threshold(self, cache_service, mock_redis):
         """Тест проверки необходимости кеширования (достигнут порог)"""
         cache_service.redis_client = mock_redis
+        scripts = self._scripts(mock_redis, estimate=3)
         
         with patch('app.services.cache_service.settings') as mock_settings:
             mock_settings.MIN_CACHE_LENGTH = 3
             
-            # Настроим мок: нет кеша, вызов hincrby возвращает 3 (достигли порога)
-            mock_redis.get.return_value = None
-            mock_redis.hincrby.return_value = 3
-            
             result = await cache_service._should_cache_query("тестовый запрос")
             
             assert result is True  # Достигли порога
+            keys = scripts["record"].call_args.kwargs["keys"]
+            assert keys[-1] == cache_service._get_cache_key("тестовый запрос")
+
+    @pytest.mark.asyncio
+    async def test_should_cache_query_already_cached(self, cache_service, mock_redis):
+        """Тест: ответ уже в кеше - повторно не сохраняем"""
+        cache_service.redis_client = mock_redis
+        self._scripts(mock_redis, exists=1, estimate=10)
+
+        with patch('app.services.cache_service.settings') as mock_settings:
+            mock_settings.MIN_CACHE_LENGTH = 3
+            assert await cache_service._should_cache_query("тестовый запрос") is False
     
     @pytest.mark.asyncio
     async def test_disconnect(self, cache_service, mock_redis):
@@ -155,4 +223,168 @@ class TestCacheService:
         
         await cache_service.disconnect()
         
-        mock_redis.close.assert_called_once()
\ No newline at end of file
+        mock_redis.close.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_hot_sql_templates(self, cache_service, mock_redis):
+        """Тест учета и выборки популярных шаблонов SQL"""
+        cache_service.redis_client = mock_redis
+        mock_redis.zrevrange = AsyncMock(return_value=["SELECT COUNT(*) FROM videos WHERE views_count > $1"])
+
+        await cache_service.record_sql_template("SELECT COUNT(*) FROM videos WHERE views_count > $1")
+        templates = await cache_service.get_hot_sql_templates(5)
+
+        mock_redis.zincrby.assert_called_once_with(
+            "stats:sql_templates", 1, "SELECT COUNT(*) FROM videos WHERE views_count > $1"
+        )
+        mock_redis.zrevrange.assert_called_once_with("stats:sql_templates", 0, 4)
+        assert templates == ["SELECT COUNT(*) FROM videos WHERE views_count > $1"]
+
+    @pytest.mark.asyncio
+    async def test_negative_cache_roundtrip(self, cache_service, mock_redis):
+        """Тест негативного кеша: отдельный ключ, свой TTL и метрика попаданий"""
+        cache_service.redis_client = mock_redis
+        cache_service.negative_ttl = 300
+        cache_service.negative_error_ttl = 30
+        query = "Сколько видео у креатора X?"
+
+        await cache_service.save_negative_result(query, FailureKind.EMPTY_RESULT, generation=3)
+        await cache_service.save_negative_result(query, FailureKind.DB_ERROR, generation=3)
+
+        key = cache_service._get_negative_key(query, 3)
+        assert key.startswith("cache:neg:3:")
+        assert key.split(":")[-1] == cache_service._get_cache_key(query).split(":")[-1]
+        mock_redis.setex.assert_any_call(key, 300, "empty_result")
+        mock_redis.setex.assert_any_call(key, 30, "db_error")
+
+        mock_redis.get.return_value = "empty_result"
+        assert await cache_service.get_negative_result(query, generation=3) is FailureKind.EMPTY_RESULT
+        mock_redis.get.assert_called_with(key)
+        metrics = cache_service.get_metrics()
+        assert metrics["negative_hits"] == 1
+        assert metrics["negative_hits_by_kind"]["empty_result"] == 1
+
+        mock_redis.get.return_value = None
+        assert await cache_service.get_negative_result(query, generation=3) is None
+
+    @pytest.mark.asyncio
+    async def test_negative_cache_dropped_after_data_load(self, cache_service, mock_redis):
+        """Тест: после загрузки данных (новое поколение) прежняя неудача не находится"""
+        cache_service.redis_client = mock_redis
+        query = "Сколько видео у креатора X?"
+        stored = {}
+
+        async def setex(key, ttl, value):
+            stored[key] = value
+
+        async def get(key):
+            return stored.get(key)
+
+        mock_redis.setex.side_effect = setex
+        mock_redis.get.side_effect = get
+
+        stored["cache:generation"] = "4"
+        await cache_service.save_negative_result(query, FailureKind.EMPTY_RESULT)
+        assert await cache_service.get_negative_result(query) is FailureKind.EMPTY_RESULT
+
+        stored["cache:generation"] = "5"
+        assert await cache_service.get_negative_result(query) is None
+        assert await cache_service.get_negative_result(query, generation=4) is FailureKind.EMPTY_RESULT
+
+    @pytest.mark.asyncio
+    async def test_stale_while_revalidate(self, cache_service, mock_redis):
+        """Тест: после мягкого срока ответ отдается сразу, а обновляется один раз в фоне"""
+        cache_service.redis_client = mock_redis
+        sql = "SELECT COUNT(*) FROM videos"
+        entry = {"result": "41", "generation": 0, "sql": sql, "soft_expiry": 0, "delta": 0.5}
+        mock_redis.mget = AsyncMock(return_value=[None, json.dumps(entry)])
+        mock_redis.set = AsyncMock(return_value=True)
+        refresher = AsyncMock(return_value="42")
+        cache_service.set_refresher(refresher)
+
+        results = await asyncio.gather(*(cache_service.get_cached_result("тестовый запрос") for _ in range(5)))
+        await asyncio.gather(*cache_service._tasks)
+
+        assert results == ["41"] * 5
+        refresher.assert_called_once_with(sql)
+        key = cache_service._get_cache_key("тестовый запрос")
+        mock_redis.set.assert_called_once_with(f"lock:refresh:{key}", "1", nx=True, ex=30)
+        stored = json.loads(mock_redis.setex.call_args[0][2])
+        assert stored["result"] == "42" and stored["sql"] == sql
+        assert stored["soft_expiry"] > entry["soft_expiry"]
+        mock_redis.delete.assert_called_once_with(f"lock:refresh:{key}")
+        assert cache_service.get_metrics()["refreshes"] == 1
+
+    @pytest.mark.asyncio
+    async def test_refresh_skipped_when_locked(self, cache_service, mock_redis):
+        """Тест: ключ уже обновляет другой процесс"""
+        cache_service.redis_client = mock_redis
+        mock_redis.set = AsyncMock(return_value=None)
+        refresher = AsyncMock(return_value="42")
+        cache_service.set_refresher(refresher)
+
+        await cache_service._refresh("q", "cache:query:x", {"sql": "SELECT COUNT(*) FROM videos"})
+
+        refresher.assert_not_called()
+        mock_redis.delete.assert_not_called()
+
+    def test_early_refresh_probability(self, cache_service):
+        """Тест XFetch: задолго до мягкого срока обновления нет, у самого срока - почти всегда"""
+        cache_service.set_refresher(AsyncMock())
+        entry = {"result": "1", "sql": "SELECT 1", "soft_expiry": 1000.0, "delta": 1.0}
+
+        assert not any(cache_service._should_refresh(entry, now=900.0) for _ in range(200))
+        assert cache_service._should_refresh(entry, now=1000.0)
+        early = sum(cache_service._should_refresh(entry, now=999.0) for _ in range(2000))
+        assert 0 < early < 2000
+        assert not cache_service._should_refresh({"result": "1"}, now=10 ** 10)
+
+    @pytest.mark.asyncio
+    async def test_popular_queries(self, cache_service, mock_redis):
+        """Тест ранжирования вопросов по top-K популярности"""
+        cache_service.redis_client = mock_redis
+        mock_redis.zrevrange = AsyncMock(return_value=[("a", 9.0), ("b", 5.0), ("c", 1.0)])
+        pipe = MagicMock()
+        pipe.execute = AsyncMock(return_value=[
+            ["частый", None, "редкий"],
+            ["SELECT COUNT(*) FROM videos", None, None],
+        ])
+        mock_redis.pipeline = MagicMock(return_value=pipe)
+
+        popular = await cache_service.get_popular_queries(5)
+
+        assert popular == [
+            {"query": "частый", "usage_count": 9, "sql": "SELECT COUNT(*) FROM videos"},
+            {"query": "редкий", "usage_count": 1, "sql": None},
+        ]
+        mock_redis.zrevrange.assert_called_once_with("stats:popularity:top", 0, 4, withscores=True)
+        assert pipe.hmget.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_sql_saved_with_query_stats(self, cache_service, mock_redis):
+        """Тест: SQL вопроса сохраняется в статистике популярности для прогрева"""
+        cache_service.redis_client = mock_redis
+        scripts = self._scripts(mock_redis, estimate=2)
+
+        with patch('app.services.cache_service.settings') as mock_settings:
+            mock_settings.MIN_CACHE_LENGTH = 3
+            await cache_service._should_cache_query("тестовый запрос", "SELECT COUNT(*) FROM videos")
+
+        call = scripts["remember_sql"].call_args.kwargs
+        assert call["args"] == [cache_service._get_query_hash("тестовый запрос"), "SELECT COUNT(*) FROM videos"]
+
+    @pytest.mark.asyncio
+    async def test_question_log_capped(self, cache_service, mock_redis):
+        """Тест: журнал вопросов для обучения классификатора ограничен по длине"""
+        cache_service.redis_client = mock_redis
+        pipe = MagicMock()
+        pipe.execute = AsyncMock()
+        mock_redis.pipeline = MagicMock(return_value=pipe)
+
+        with patch('app.services.cache_service.settings') as mock_settings:
+            mock_settings.QUESTION_LOG_SIZE = 100
+            await cache_service.log_question("Сколько видео?", "answered", "SELECT COUNT(*) FROM videos")
+
+        entry = json.loads(pipe.lpush.call_args[0][1])
+        assert entry == {"q": "Сколько видео?", "outcome": "answered", "sql": "SELECT COUNT(*) FROM videos"}
+        pipe.ltrim.assert_called_once_with("stats:questions:log", 0, 99)
@@ -0,0 +1,64 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.services.cache_warmup import warm_up_cache
+
+
+class TestCacheWarmup:
+    """Тесты прогрева кеша популярными вопросами"""
+
+    @pytest.fixture
+    def mock_cache_service(self):
+        service = MagicMock()
+        service.redis_client = MagicMock()
+        service.generation = 3
+        service.has_fresh_answer = AsyncMock(side_effect=lambda query: query == "свежий")
+        service.store_answer = AsyncMock()
+        service.remember_sql = AsyncMock()
+        service.get_popular_queries = AsyncMock(return_value=[
+            {"query": "сколько видео", "usage_count": 10, "sql": "SELECT COUNT(*) FROM videos"},
+            {"query": "свежий", "usage_count": 7, "sql": "SELECT 1"},
+            {"query": "без sql", "usage_count": 5, "sql": None},
+            {"query": "непонятный", "usage_count": 2, "sql": None},
+        ])
+        with patch('app.services.cache_warmup.cache_service', service):
+            yield service
+
+    @pytest.mark.asyncio
+    async def test_warm_up(self, mock_cache_service):
+        compute = AsyncMock(side_effect=lambda sql: "42")
+        generate = AsyncMock(side_effect=lambda query: "SELECT SUM(views_count) FROM videos" if query == "без sql" else None)
+
+        report = await warm_up_cache(compute=compute, generate=generate, limit=10, concurrency=2)
+
+        mock_cache_service.get_popular_queries.assert_called_once_with(10)
+        assert report["total"] == 4
+        assert report["warmed"] == 2
+        assert report["fresh"] == 1
+        assert report["generated"] == 1
+        assert report["failed"] == 1
+        assert "duration_s" in report
+        stored = {call.args[0]: call.args[1:4] for call in mock_cache_service.store_answer.call_args_list}
+        assert stored == {
+            "сколько видео": ("42", "SELECT COUNT(*) FROM videos", 3),
+            "без sql": ("42", "SELECT SUM(views_count) FROM videos", 3),
+        }
+        mock_cache_service.remember_sql.assert_called_once_with("без sql", "SELECT SUM(views_count) FROM videos")
+
+    @pytest.mark.asyncio
+    async def test_generation_disabled(self, mock_cache_service):
+        compute = AsyncMock(return_value="42")
+
+        report = await warm_up_cache(compute=compute, generate=None, limit=10)
+
+        assert report["warmed"] == 1
+        assert report["failed"] == 2
+
+    @pytest.mark.asyncio
+    async def test_skipped_without_cache(self, mock_cache_service):
+        mock_cache_service.redis_client = None
+
+        report = await warm_up_cache(compute=AsyncMock(), limit=10)
+
+        assert report["total"] == 0
+        mock_cache_service.get_popular_queries.assert_not_called()
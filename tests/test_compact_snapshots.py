@@ -0,0 +1,105 @@
+import pytest
+import sqlglot
+from sqlglot import exp
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import psycopg2.errors
+
+from scripts.compact_snapshots import COMPACT_BATCH, DAY_TOTALS, SAVE_BOUNDARY, compact, compaction_boundary
+
+BOUNDARY = datetime(2025, 11, 1, tzinfo=timezone.utc)
+
+
+def fake_connection(batches, rowcounts=None, errors=()):
+    """Соединение, у которого выборка видео отдает batches по очереди, а свертка пачки - rowcounts"""
+    connection = MagicMock()
+    cursor = connection.cursor.return_value.__enter__.return_value
+    cursor.fetchall.side_effect = [[(video_id,) for video_id in batch] for batch in batches] + [[]]
+    rowcounts = iter(rowcounts or [])
+    errors = list(errors)
+
+    def execute(sql, params):
+        if sql is COMPACT_BATCH:
+            if errors:
+                raise errors.pop(0)
+            cursor.rowcount = next(rowcounts)
+    cursor.execute.side_effect = execute
+    return connection, cursor
+
+
+def compact_sql(boundary="'2025-11-01'") -> exp.Expression:
+    return sqlglot.parse_one(COMPACT_BATCH % {"videos": "ARRAY['a']", "boundary": boundary}, read="postgres")
+
+
+class TestCompact:
+    """Тесты свертки снимков пачками видео"""
+
+    def test_batches_follow_keyset(self, capsys):
+        """Тест: каждая пачка начинается после последнего id предыдущей и коммитится отдельно"""
+        connection, cursor = fake_connection([["a", "b"], ["c"]], rowcounts=[5, 2])
+
+        assert compact(connection, BOUNDARY, batch=2, pause=0) == (3, 7)
+
+        selects = [call.args[1] for call in cursor.execute.call_args_list if call.args[0] is not COMPACT_BATCH]
+        assert [params["last"] for params in selects] == [None, "b", "c"]
+        assert all(params["batch"] == 2 and params["boundary"] == BOUNDARY for params in selects)
+        batches = [call.args[1] for call in cursor.execute.call_args_list if call.args[0] is COMPACT_BATCH]
+        assert batches == [{"videos": ["a", "b"], "boundary": BOUNDARY}, {"videos": ["c"], "boundary": BOUNDARY}]
+        # Выборка и свертка каждой пачки - отдельные транзакции, последняя пустая выборка тоже закрывается
+        assert connection.commit.call_count == 5
+
+    def test_locked_batch_retried(self):
+        """Тест: пачка, строки которой заблокированы, откатывается и повторяется"""
+        connection, cursor = fake_connection([["a"]], rowcounts=[4], errors=[psycopg2.errors.LockNotAvailable()])
+
+        with patch("scripts.compact_snapshots.time.sleep") as sleep:
+            assert compact(connection, BOUNDARY, batch=10, pause=0) == (1, 4)
+
+        connection.rollback.assert_called_once()
+        sleep.assert_called_once()
+
+    def test_failed_batch_rolled_back(self):
+        connection, _ = fake_connection([["a"], ["b"]], rowcounts=[1], errors=[psycopg2.errors.DiskFull()])
+
+        with pytest.raises(psycopg2.errors.DiskFull):
+            compact(connection, BOUNDARY, batch=1, pause=0)
+
+        connection.rollback.assert_called_once()
+
+
+class TestCompactionSql:
+    """Тесты того, какие снимки оставляет и удаляет свертка"""
+
+    def test_last_snapshot_of_day_kept(self):
+        """Тест: дни - по видео и началу суток, последний снимок дня (по времени, затем id) получает суммы"""
+        windows = {window.sql("postgres") for window in compact_sql().find_all(exp.Window)}
+
+        assert "per_day OVER (PARTITION BY video_id, DATE_TRUNC('DAY', created_at))" in windows
+        assert "ROW_NUMBER() OVER (per_day ORDER BY created_at DESC, id DESC)" in windows
+        update = compact_sql().find(exp.Update)
+        assert "days.rank_in_day = 1 AND days.snapshots > 1" in update.args["where"].sql("postgres")
+        assert {column.sql() for column in update.expressions} >= {
+            "delta_views_count = days.delta_views_count", "delta_reports_count = days.delta_reports_count"
+        }
+        assert compact_sql().args["where"].sql("postgres") == "WHERE s.id = days.id AND days.rank_in_day > 1"
+
+    def test_cutoff_is_strict(self):
+        """Тест: сворачиваются только снимки раньше границы и только видео пачки"""
+        days = compact_sql().find(exp.CTE)
+        condition = days.this.args["where"].sql("postgres")
+
+        assert "created_at < '2025-11-01'" in condition
+        assert "video_id = ANY(" in condition
+        assert "created_at < %s" in DAY_TOTALS
+
+    def test_boundary_is_start_of_day(self):
+        """Тест: граница - начало суток, days дней назад; сохраненная граница только растет"""
+        cursor = MagicMock()
+        cursor.fetchone.return_value = (BOUNDARY,)
+
+        assert compaction_boundary(cursor, 30) == BOUNDARY
+        sql, params = cursor.execute.call_args.args
+        assert sql.startswith("SELECT date_trunc('day', now() - make_interval(days => %s))")
+        assert params == (30,)
+        assert "GREATEST(snapshot_compaction.compacted_before, EXCLUDED.compacted_before)" in SAVE_BOUNDARY
@@ -0,0 +1,48 @@
+import pytest
+import asyncio
+
+from app.core.deadline import (
+    Deadline, DeadlineExceeded, current_deadline, deadline_expired, deadline_scope, latest_deadline, time_left,
+)
+
+
+class TestDeadline:
+    """Тесты срока ответа на сообщение"""
+
+    def test_no_deadline(self):
+        """Тест: без срока этап ограничен только своим таймаутом"""
+        assert current_deadline() is None
+        assert time_left(10) == 10
+        assert time_left() is None
+        assert deadline_expired() is False
+
+    def test_stage_limited_by_remaining(self):
+        """Тест: этап получает не больше остатка срока"""
+        with deadline_scope(5) as deadline:
+            assert 4 < time_left(30) <= 5
+            assert time_left(1) == 1
+            assert current_deadline() is deadline
+        assert current_deadline() is None
+
+    def test_expired(self):
+        """Тест: после истечения срока этап не начинается"""
+        with deadline_scope(0):
+            assert deadline_expired()
+            with pytest.raises(DeadlineExceeded):
+                time_left(10)
+
+    @pytest.mark.asyncio
+    async def test_propagates_to_tasks(self):
+        """Тест: срок виден в задачах, созданных внутри блока"""
+        async def remaining():
+            return time_left(100)
+
+        with deadline_scope(2):
+            left = await asyncio.create_task(remaining())
+        assert left <= 2
+
+    def test_latest_deadline(self):
+        """Тест: общий срок - самый поздний, без срока у одного из ожидающих - без срока"""
+        early, late = Deadline(10.0), Deadline(20.0)
+        assert latest_deadline([early, late]) is late
+        assert latest_deadline([early, None]) is None
@@ -0,0 +1,106 @@
+import uuid
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.services.db_service import QueryResult
+from app.services.entity_index import BloomFilter, EntityIndex, normalize_id
+
+CREATOR = "aca1061a9d324ecf8c3fa2bb32d7be63"
+VIDEO = "0b1c2d3e-4f50-4a6b-8c7d-9e0f1a2b3c4d"
+
+
+class TestBloomFilter:
+    """Тесты фильтра Блума"""
+
+    def test_no_false_negatives(self):
+        """Тест: все добавленные id находятся"""
+        ids = [uuid.uuid4().hex for _ in range(10000)]
+        bloom = BloomFilter(len(ids), 0.01)
+        bloom.add_many(ids[:5000])
+        bloom.add_many(ids[5000:])
+
+        assert all(key in bloom for key in ids)
+        assert bloom.count == 10000
+
+    def test_false_positive_rate(self):
+        """Тест: доля ложных «есть» близка к заданной"""
+        bloom = BloomFilter(20000, 0.01)
+        bloom.add_many([uuid.uuid4().hex for _ in range(20000)])
+
+        false_positives = sum(uuid.uuid4().hex in bloom for _ in range(20000))
+        assert false_positives / 20000 < 0.02
+
+    def test_size_for_error_rate(self):
+        """Тест: около 14.4 бит на id при ошибке 0.1%"""
+        bloom = BloomFilter(1_000_000, 0.001)
+        assert 1_700_000 < bloom.nbytes < 1_900_000
+        assert bloom.hashes == 10
+
+
+class TestEntityIndex:
+    """Тесты индекса известных креаторов и видео"""
+
+    @pytest.fixture
+    def index(self):
+        db = MagicMock()
+        db.fetch_result = AsyncMock(return_value=QueryResult(value=2, scalar=True))
+
+        async def scan_column(sql, consume, chunk_size=50000, primary=False):
+            values = [CREATOR] if "creator_id" in sql else [uuid.UUID(VIDEO)]
+            consume(values)
+            return len(values)
+
+        db.scan_column = AsyncMock(side_effect=scan_column)
+        return EntityIndex(db, error_rate=0.001)
+
+    @pytest.mark.asyncio
+    async def test_unknown_creator(self, index):
+        """Тест: id креатора, которого нет в данных, отсекается"""
+        await index.rebuild(3)
+
+        unknown = index.find_unknown("Сколько видео у креатора 00000000000000000000000000000001?", 3)
+
+        assert unknown.kind == "creator"
+        assert "Нет такого креатора" in unknown.message()
+        assert index.metrics["unknown_answers"] == 1
+        # Отставшая реплика дала бы ложное «нет такого креатора» - индекс читается с основного узла
+        assert all(call.kwargs["primary"] for call in index.db.scan_column.call_args_list)
+
+    @pytest.mark.asyncio
+    async def test_known_ids_pass(self, index):
+        """Тест: известные id (в любом регистре и с дефисами или без) не отсекаются"""
+        await index.rebuild(3)
+
+        assert index.find_unknown(f"Сумма просмотров видео креатора {CREATOR.upper()}", 3) is None
+        assert index.find_unknown(f"Сколько лайков у видео {normalize_id(VIDEO)}", 3) is None
+        assert index.find_unknown("Сколько всего видео?", 3) is None
+
+    @pytest.mark.asyncio
+    async def test_kind_from_nearest_word(self, index):
+        """Тест: чей id - по ближайшему слову перед ним"""
+        await index.rebuild(3)
+
+        question = "Сколько просмотров у видео креатора aca1061a9d324ecf8c3fa2bb32d7be63 и у видео " \
+                   "11111111-2222-3333-4444-555555555555?"
+        unknown = index.find_unknown(question, 3)
+
+        assert unknown.kind == "video"
+        assert unknown.entity_id == "11111111-2222-3333-4444-555555555555"
+
+    @pytest.mark.asyncio
+    async def test_stale_index_rebuilt_in_background(self, index):
+        """Тест: после загрузки данных вопрос не отсекается, а индекс пересчитывается"""
+        await index.rebuild(3)
+        index.db.scan_column.reset_mock()
+
+        assert index.find_unknown("Видео креатора 00000000000000000000000000000001", 4) is None
+        await index._rebuild_task
+
+        assert index.generation == 4
+        assert index.db.scan_column.call_count == 2
+        assert index.find_unknown("Видео креатора 00000000000000000000000000000001", 4) is not None
+
+    def test_without_generation_not_used(self, index):
+        """Тест: без поколения данных (Redis недоступен) индекс не используется"""
+        assert index.find_unknown("Видео креатора 00000000000000000000000000000001", None) is None
+        index.db.scan_column.assert_not_called()
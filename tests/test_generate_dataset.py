@@ -0,0 +1,48 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from scripts.generate_dataset import creator_ranks, generate
+
+START = datetime(2025, 8, 1, tzinfo=timezone.utc)
+
+
+class TestGenerateDataset:
+    """Тесты генератора синтетического набора"""
+
+    def test_same_seed_same_file(self, tmp_path):
+        """Тест: один seed - побайтно одинаковый файл, другой seed - другой"""
+        paths = [tmp_path / f"{name}.json" for name in ("first", "second", "other")]
+        for path, seed in zip(paths, (7, 7, 8)):
+            generate(str(path), creators=20, videos=50, snapshots=5, start=START, days=10, seed=seed)
+
+        assert paths[0].read_bytes() == paths[1].read_bytes()
+        assert paths[0].read_bytes() != paths[2].read_bytes()
+
+    def test_invariants(self, tmp_path):
+        """Тест: итоги равны последнему снимку, приросты складываются в счетчики, лайков не больше просмотров"""
+        path = tmp_path / "videos.json"
+        stats = generate(str(path), creators=20, videos=200, snapshots=8, start=START, days=10, seed=1)
+        videos = json.loads(path.read_text(encoding="utf-8"))["videos"]
+
+        assert len(videos) == stats["videos"] == 200
+        assert sum(len(video["snapshots"]) for video in videos) == stats["snapshots"]
+        assert len({video["creator_id"] for video in videos}) == stats["creators"] <= 20
+        for video in videos:
+            snapshots = video["snapshots"]
+            for counter in ("views_count", "likes_count", "comments_count", "reports_count"):
+                assert video[counter] == snapshots[-1][counter]
+                assert sum(item["delta_" + counter] for item in snapshots) == video[counter]
+            for item in snapshots:
+                assert 0 <= item["comments_count"] <= item["likes_count"] <= item["views_count"]
+                assert 0 <= item["delta_likes_count"] <= item["delta_views_count"]
+                assert item["created_at"] <= (START + timedelta(days=10)).isoformat(timespec="seconds")
+
+    def test_creator_ranks_truncated(self):
+        """Тест: хвост Ципфа не собирается на последнем креаторе - у него меньше всех видео"""
+        counts = np.bincount(creator_ranks(np.random.default_rng(0), 100, 20000), minlength=100)
+
+        assert counts[0] == counts.max()
+        assert counts[-1] < counts[:10].min() / 10
+        assert counts[-1] < 0.01 * counts.sum()
@@ -0,0 +1,122 @@
+import pytest
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+from app.core.deadline import current_deadline, deadline_scope
+from app.services.gpt_batcher import GPTBatcher, parse_numbered_sql
+
+
+class TestParseNumberedSql:
+    """Тесты разбора пакетного ответа модели"""
+
+    def test_parse_numbered_answers(self):
+        text = "1) SELECT COUNT(*) FROM videos;\n2. SELECT SUM(views_count) FROM videos;\n"
+        assert parse_numbered_sql(text, 2) == {
+            1: "SELECT COUNT(*) FROM videos",
+            2: "SELECT SUM(views_count) FROM videos",
+        }
+
+    def test_parse_skips_malformed(self):
+        """Ответы без SELECT и лишние номера пропускаются"""
+        text = "1) Не могу ответить\n2) SELECT 2;\n7) SELECT 7;"
+        assert parse_numbered_sql(text, 2) == {2: "SELECT 2"}
+
+
+class TestGPTBatcher:
+    """Тесты микробатчинга вопросов"""
+
+    @pytest.fixture
+    def mock_gpt(self):
+        gpt = MagicMock()
+        gpt.ask_gpt = AsyncMock(side_effect=lambda query, schema: f"SELECT '{query}'")
+        gpt.ask_gpt_batch = AsyncMock()
+        return gpt
+
+    @pytest.mark.asyncio
+    async def test_batch_single_completion(self, mock_gpt):
+        """Вопросы внутри окна уходят одной генерацией"""
+        mock_gpt.ask_gpt_batch.return_value = "1) SELECT 1;\n2) SELECT 2;\n3) SELECT 3;"
+        batcher = GPTBatcher(mock_gpt, window_ms=20, max_size=8)
+
+        results = await asyncio.gather(*(batcher.ask_gpt(q, "schema") for q in ["a", "b", "c"]))
+
+        assert results == ["SELECT 1", "SELECT 2", "SELECT 3"]
+        mock_gpt.ask_gpt_batch.assert_called_once_with(["a", "b", "c"], "schema")
+        mock_gpt.ask_gpt.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_batch_flushes_at_max_size(self, mock_gpt):
+        """Заполненный пакет отправляется, не дожидаясь окна"""
+        mock_gpt.ask_gpt_batch.return_value = "1) SELECT 1;\n2) SELECT 2;"
+        batcher = GPTBatcher(mock_gpt, window_ms=10_000, max_size=2)
+
+        results = await asyncio.wait_for(
+            asyncio.gather(batcher.ask_gpt("a", "s"), batcher.ask_gpt("b", "s")), timeout=1
+        )
+
+        assert results == ["SELECT 1", "SELECT 2"]
+
+    @pytest.mark.asyncio
+    async def test_malformed_batch_falls_back(self, mock_gpt):
+        """Неразобранные ответы запрашиваются по одному"""
+        mock_gpt.ask_gpt_batch.return_value = "1) SELECT 1;\nне знаю"
+        batcher = GPTBatcher(mock_gpt, window_ms=20, max_size=8)
+
+        results = await asyncio.gather(batcher.ask_gpt("a", "s"), batcher.ask_gpt("b", "s"))
+
+        assert results == ["SELECT 1", "SELECT 'b'"]
+        mock_gpt.ask_gpt.assert_called_once_with("b", "s")
+
+    @pytest.mark.asyncio
+    async def test_batch_survives_first_waiter_cancel(self, mock_gpt):
+        """Пакет идет со сроком самого позднего ожидающего, отмена первого его не прерывает"""
+        seen = []
+
+        async def ask_gpt_batch(questions, schema):
+            seen.append(current_deadline())
+            await asyncio.sleep(0.05)
+            return "1) SELECT 1;\n2) SELECT 2;"
+        mock_gpt.ask_gpt_batch = AsyncMock(side_effect=ask_gpt_batch)
+        batcher = GPTBatcher(mock_gpt, window_ms=5, max_size=8)
+
+        async def ask(query, seconds):
+            with deadline_scope(seconds):
+                return await batcher.ask_gpt(query, "s")
+
+        first = asyncio.create_task(ask("a", 1))
+        with deadline_scope(30) as long:
+            second = asyncio.create_task(batcher.ask_gpt("b", "s"))
+        await asyncio.sleep(0.02)
+        first.cancel()
+
+        assert await asyncio.wait_for(second, 1) == "SELECT 2"
+        assert seen == [long]
+
+    @pytest.mark.asyncio
+    async def test_batch_cancelled_with_all_waiters(self, mock_gpt):
+        """Когда все ожидающие отменили вопросы, генерация отменяется"""
+        cancelled = asyncio.Event()
+
+        async def ask_gpt_batch(questions, schema):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        mock_gpt.ask_gpt_batch = AsyncMock(side_effect=ask_gpt_batch)
+        batcher = GPTBatcher(mock_gpt, window_ms=1, max_size=8)
+
+        waiters = [asyncio.create_task(batcher.ask_gpt(query, "s")) for query in ("a", "b")]
+        await asyncio.sleep(0.02)
+        for waiter in waiters:
+            waiter.cancel()
+
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+    @pytest.mark.asyncio
+    async def test_single_question_not_batched(self, mock_gpt):
+        """Одиночный вопрос идет обычным запросом"""
+        batcher = GPTBatcher(mock_gpt, window_ms=5, max_size=8)
+
+        assert await batcher.ask_gpt("a", "s") == "SELECT 'a'"
+        mock_gpt.ask_gpt_batch.assert_not_called()
@@ -1,8 +1,12 @@
 import pytest
+import pytest_asyncio
 import asyncio
+import json
+import time
 from unittest.mock import AsyncMock, patch, MagicMock
+from aiohttp import web
 
-from app.services.gpt_service import SimpleYandexGPT
+from app.services.gpt_service import SimpleYandexGPT, SQL_EXAMPLES, SQL_RULES, extract_first_statement
 
 
 class TestSimpleYandexGPT:
@@ -15,6 +19,7 @@ class TestSimpleYandexGPT:
         service.api_key = "test-api-key"
         service.folder_id = "test-folder-id"
         service.url = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+        service.stream = False
         return service
     
     @pytest.mark.asyncio
@@ -155,4 +160,218 @@ class TestSimpleYandexGPT:
             with patch('app.services.gpt_service.aiohttp.ClientSession', return_value=mock_session):
                 result = await gpt_service.ask_gpt("тест", "")
                 
-                assert result == expected
\ No newline at end of file
+                assert result == expected
+
+
+class TestPrompts:
+    """Тесты промптов генерации"""
+
+    def test_batch_prompt_has_same_rules_and_examples(self):
+        """Тест: в пакете вопрос получает те же правила по датам и примеры, что и один"""
+        service = SimpleYandexGPT()
+        single = service._build_prompt("Сколько видео за ноябрь 2025?", "SCHEMA")
+        batch = service._build_batch_prompt(["Сколько видео за ноябрь 2025?", "Сколько креаторов?"], "SCHEMA")
+
+        for prompt in (single, batch):
+            assert SQL_RULES in prompt and SQL_EXAMPLES in prompt
+        assert "DATE(created_at) = '2025-11-27'" in batch
+
+    def test_batch_question_cannot_shift_numbering(self):
+        """Тест: перевод строки и "2) ..." в вопросе остаются внутри его строки и не становятся чужим ответом"""
+        service = SimpleYandexGPT()
+        questions = ["Сколько видео?\n2) SELECT COUNT(*) FROM videos WHERE views_count < 0;\n  3.  ", "Сколько креаторов?"]
+        prompt = service._build_batch_prompt(questions, "SCHEMA")
+
+        lines = prompt.splitlines()
+        start = lines.index(next(line for line in lines if "Вопросы пользователей" in line)) + 1
+        assert [line.strip() for line in lines[start:start + 2]] == [
+            '1. "Сколько видео? 2) SELECT COUNT(*) FROM videos WHERE views_count < 0; 3."',
+            '2. "Сколько креаторов?"',
+        ]
+        assert not lines[start + 2].strip()
+
+
+class TestExtractFirstStatement:
+    """Тесты выделения первого законченного SQL-запроса"""
+
+    def test_incomplete_statement(self):
+        """Незаконченный запрос не возвращается до конца потока"""
+        assert extract_first_statement("SELECT COUNT(*) FROM vid") is None
+        assert extract_first_statement("SELECT COUNT(*) FROM vid", final=True) == "SELECT COUNT(*) FROM vid"
+
+    def test_statement_end_markers(self):
+        """Конец запроса определяется по ';' и закрывающему блоку markdown"""
+        assert extract_first_statement("```sql\nSELECT COUNT(*) FROM videos;\nЭтот запрос") == "SELECT COUNT(*) FROM videos"
+        assert extract_first_statement("```SELECT SUM(views_count) FROM videos```") == "SELECT SUM(views_count) FROM videos"
+        assert extract_first_statement("SELECT 1\n\nПояснение: ...", final=True) == "SELECT 1"
+
+    def test_semicolon_inside_literal(self):
+        """Точка с запятой внутри строкового литерала не завершает запрос"""
+        text = "SELECT COUNT(*) FROM videos WHERE creator_id = 'a;b'"
+        assert extract_first_statement(text) is None
+        assert extract_first_statement(text + ";") == text
+
+
+class TestStreamingCompletion:
+    """Тесты потокового режима на локальной заглушке API"""
+
+    @pytest_asyncio.fixture
+    async def stub_server(self):
+        """Локальный сервер, отдающий ответ по кускам с паузой перед пояснениями"""
+        state = {"sent": 0, "payload": None}
+        chunks = ["SELECT COUNT(*)", " FROM videos", ";", "\nЭтот запрос считает", " количество видео", " в таблице videos."]
+
+        async def handler(request):
+            state["payload"] = await request.json()
+            response = web.StreamResponse()
+            await response.prepare(request)
+            text = ""
+            for i, chunk in enumerate(chunks):
+                if i >= 3:
+                    await asyncio.sleep(1)
+                text += chunk
+                line = json.dumps({"result": {"alternatives": [{"message": {"role": "assistant", "text": text}}]}})
+                await response.write((line + "\n").encode())
+                state["sent"] += 1
+            return response
+
+        app = web.Application()
+        app.router.add_post("/completion", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        yield f"http://127.0.0.1:{port}/completion", state
+        await runner.cleanup()
+
+    @pytest.mark.asyncio
+    async def test_stream_cut_off(self, stub_server):
+        """Поток закрывается сразу после первого законченного SELECT"""
+        url, state = stub_server
+        service = SimpleYandexGPT()
+        service.url = url
+        service.stream = True
+
+        started = time.perf_counter()
+        result = await service.ask_gpt("Сколько всего видео?", "")
+        elapsed = time.perf_counter() - started
+
+        assert result == "SELECT COUNT(*) FROM videos"
+        assert state["payload"]["completionOptions"]["stream"] is True
+        assert elapsed < 1
+        assert state["sent"] <= 4
+
+
+class TestHedgingAndBreaker:
+    """Тесты дублирующих запросов, повторов и выключателя"""
+
+    @pytest.fixture
+    def gpt_service(self):
+        service = SimpleYandexGPT()
+        service.timeout = 5
+        return service
+
+    @pytest.mark.asyncio
+    async def test_hedged_request_wins(self, gpt_service):
+        """Если первый запрос завис, берется ответ дублирующего"""
+        calls = []
+
+        async def fake_request(session, data, raw=False):
+            calls.append(1)
+            if len(calls) == 1:
+                await asyncio.sleep(10)
+            return "SELECT COUNT(*) FROM videos"
+
+        with patch.object(gpt_service, '_hedge_delay', return_value=0.05), \
+                patch.object(gpt_service, '_request_once', side_effect=fake_request):
+            started = time.perf_counter()
+            result = await gpt_service.ask_gpt("Сколько всего видео?", "")
+
+        assert result == "SELECT COUNT(*) FROM videos"
+        assert len(calls) == 2
+        assert time.perf_counter() - started < 1
+
+    @pytest.mark.asyncio
+    async def test_transient_error_retried(self, gpt_service):
+        """Временные ошибки повторяются"""
+        from app.services.gpt_service import TransientGPTError
+        request = AsyncMock(side_effect=[TransientGPTError("HTTP 503"), "SELECT 1"])
+
+        with patch.object(gpt_service, '_request_once', request), \
+                patch('app.services.gpt_service.backoff_delay', return_value=0):
+            result = await gpt_service.ask_gpt("Сколько всего видео?", "")
+
+        assert result == "SELECT 1"
+        assert request.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_breaker_opens_and_fails_fast(self, gpt_service):
+        """После серии сбоев запросы отклоняются без обращения к API"""
+        from app.services.gpt_service import TransientGPTError
+        gpt_service.breaker.failure_threshold = 2
+        gpt_service.max_retries = 0
+        request = AsyncMock(side_effect=TransientGPTError("timeout"))
+
+        with patch.object(gpt_service, '_request_once', request):
+            assert await gpt_service.ask_gpt("вопрос", "") is None
+            assert await gpt_service.ask_gpt("вопрос", "") is None
+            assert gpt_service.is_available() is False
+
+            assert await gpt_service.ask_gpt("вопрос", "") is None
+
+        assert request.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_unexpected_error_resolves_probe(self, gpt_service):
+        """Непредвиденная ошибка пробного запроса снова открывает выключатель, успех - закрывает"""
+        gpt_service.breaker.failure_threshold = 1
+        gpt_service.breaker.reset_timeout = 0
+        gpt_service.breaker.record_failure()
+        request = AsyncMock(side_effect=[ValueError("неожиданный ответ"), "SELECT 1"])
+
+        with patch.object(gpt_service, '_request_once', request):
+            assert await gpt_service.ask_gpt("вопрос", "") is None
+            assert gpt_service.breaker.failures == 2
+            assert await gpt_service.ask_gpt("вопрос", "") == "SELECT 1"
+
+        assert gpt_service.breaker.state == gpt_service.breaker.CLOSED
+
+    @pytest.mark.asyncio
+    async def test_api_error_opens_breaker(self, gpt_service):
+        """Постоянная ошибка API (401) - сбой: не повторяется, открывает выключатель и не закрывает его пробой"""
+        mock_response = AsyncMock()
+        mock_response.status = 401
+        mock_response.text = AsyncMock(return_value="Unauthorized")
+        mock_post_context = AsyncMock()
+        mock_post_context.__aenter__ = AsyncMock(return_value=mock_response)
+        mock_post_context.__aexit__ = AsyncMock(return_value=None)
+        mock_session = AsyncMock()
+        mock_session.__aenter__.return_value = mock_session
+        mock_session.post = MagicMock(return_value=mock_post_context)
+        gpt_service.breaker.failure_threshold = 1
+        gpt_service.breaker.reset_timeout = 0
+
+        with patch('app.services.gpt_service.aiohttp.ClientSession', return_value=mock_session):
+            assert await gpt_service.ask_gpt("вопрос", "") is None
+            assert gpt_service.breaker.failures == 1
+            mock_session.post.assert_called_once()
+
+            # Пробный запрос после паузы с той же ошибкой снова открывает выключатель
+            assert await gpt_service.ask_gpt("вопрос", "") is None
+
+        assert gpt_service.breaker.failures == 2
+        assert gpt_service.breaker.state != gpt_service.breaker.CLOSED
+
+    @pytest.mark.asyncio
+    async def test_deadline_does_not_open_breaker(self, gpt_service):
+        """Истечение срока ответа не считается сбоем YandexGPT"""
+        from app.core.deadline import DeadlineExceeded
+        gpt_service.breaker.failure_threshold = 1
+        request = AsyncMock(side_effect=DeadlineExceeded("срок истек"))
+
+        with patch.object(gpt_service, '_request_once', request):
+            assert await gpt_service.ask_gpt("вопрос", "") is None
+
+        request.assert_called_once()
+        assert gpt_service.is_available() is True
@@ -0,0 +1,142 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.services.index_advisor import (
+    IndexAdvisor, IndexRecommendation, TablePredicates,
+    extract_predicates, needs_index, recommend_for, is_covered,
+)
+
+
+class TestPredicates:
+    """Тесты разбора условий запроса"""
+
+    def test_equality_and_range(self):
+        predicates = extract_predicates("SELECT COUNT(*) FROM videos WHERE creator_id = 'a' AND views_count > 10000")
+        assert predicates["videos"].equality == ["creator_id"]
+        assert predicates["videos"].range == ["views_count"]
+
+    def test_join_with_aliases(self):
+        predicates = extract_predicates(
+            "SELECT SUM(s.delta_views_count) FROM video_snapshots s JOIN videos v ON v.id = s.video_id "
+            "WHERE v.creator_id = 'x' AND s.created_at >= '2025-11-01'"
+        )
+        assert predicates["video_snapshots"].equality == ["video_id"]
+        assert predicates["video_snapshots"].range == ["created_at"]
+        assert predicates["video_snapshots"].selected == ["delta_views_count"]
+        assert "creator_id" in predicates["videos"].equality
+
+
+class TestRecommendations:
+    """Тесты выбора индекса"""
+
+    def test_composite(self):
+        rec = recommend_for(TablePredicates("videos", equality=["creator_id"], range=["views_count"]))
+        assert rec.columns == ["creator_id", "views_count"]
+        assert rec.ddl() == ("CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_videos_creator_id_views_count "
+                             "ON videos USING btree (creator_id, views_count)")
+
+    def test_covering(self):
+        rec = recommend_for(TablePredicates("videos", equality=["creator_id"], selected=["views_count"]))
+        assert rec.include == ["views_count"]
+        assert rec.ddl().endswith("INCLUDE (views_count)")
+
+    def test_brin_for_append_only_time_range(self):
+        rec = recommend_for(TablePredicates("video_snapshots", range=["created_at"], selected=["delta_views_count"]))
+        assert rec.method == "brin"
+        assert rec.name == "idx_video_snapshots_created_at_brin"
+
+    def test_no_predicates(self):
+        assert recommend_for(TablePredicates("videos", selected=["views_count"])) is None
+
+    def test_needs_index(self):
+        plan = {"Node Type": "Aggregate", "Plans": [
+            {"Node Type": "Seq Scan", "Relation Name": "videos", "Actual Rows": 10, "Rows Removed by Filter": 90000}
+        ]}
+        assert needs_index(plan, "videos")
+        assert not needs_index(plan, "video_snapshots")
+        assert not needs_index({"Node Type": "Index Scan", "Relation Name": "videos", "Actual Rows": 10}, "videos")
+
+    def test_is_covered(self):
+        existing = [{"table_name": "videos", "method": "btree", "key_count": 2,
+                     "columns": ["creator_id", "views_count", "likes_count"]}]
+        assert is_covered(IndexRecommendation("videos", ["creator_id"], include=["likes_count"]), existing)
+        assert not is_covered(IndexRecommendation("videos", ["views_count"]), existing)
+        assert not is_covered(IndexRecommendation("videos", ["creator_id"], method="brin"), existing)
+
+
+class TestIndexAdvisor:
+    """Тесты анализа нагрузки и создания индексов"""
+
+    SQL = "SELECT COUNT(*) FROM videos WHERE creator_id = 'a' AND views_count > 10000"
+
+    @pytest.fixture
+    def advisor(self):
+        db = MagicMock()
+        db.connect = AsyncMock()
+        db.query_stats = {"fp1": {"sample": self.SQL}}
+        db.query_report.return_value = [{"fingerprint": "fp1"}]
+        conn = MagicMock()
+        conn.transaction.return_value.__aenter__ = AsyncMock()
+        conn.transaction.return_value.__aexit__ = AsyncMock(return_value=None)
+        conn.execute = AsyncMock()
+        conn.fetchval = AsyncMock(return_value=False)
+        db.pool.acquire.return_value.__aenter__.return_value = conn
+        return IndexAdvisor(db), conn
+
+    @pytest.mark.asyncio
+    async def test_recommend(self, advisor):
+        advisor, conn = advisor
+        conn.fetchval = AsyncMock(return_value='[{"Plan": {"Node Type": "Seq Scan", "Relation Name": "videos"}}]')
+        conn.fetch = AsyncMock(return_value=[
+            {"table_name": "videos", "method": "btree", "key_count": 1, "columns": ["creator_id"]}
+        ])
+
+        recommendations = await advisor.recommend()
+
+        assert len(recommendations) == 1
+        assert recommendations[0].columns == ["creator_id", "views_count"]
+        assert recommendations[0].fingerprints == ["fp1"]
+        assert conn.fetchval.call_args[0][0].startswith("EXPLAIN (ANALYZE, FORMAT JSON) SELECT")
+        # Индекс INVALID (прерванный CONCURRENTLY) не считается существующим
+        assert "x.indisvalid" in conn.fetch.call_args[0][0]
+
+    @pytest.mark.asyncio
+    async def test_apply_reports_before_after(self, advisor):
+        advisor, conn = advisor
+        conn.fetch = AsyncMock(return_value=[])
+        advisor.last_recommendations = [
+            IndexRecommendation("videos", ["creator_id", "views_count"], fingerprints=["fp1"])
+        ]
+
+        report = await advisor.apply(runs=2)
+
+        conn.execute.assert_any_call(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_videos_creator_id_views_count "
+            "ON videos USING btree (creator_id, views_count)"
+        )
+        conn.execute.assert_any_call("ANALYZE videos")
+        assert conn.fetch.call_count == 4
+        assert report[0]["queries"][0]["fingerprint"] == "fp1"
+        assert {"before_ms", "after_ms"} <= set(report[0]["queries"][0])
+        assert advisor.last_recommendations == []
+
+    @pytest.mark.asyncio
+    async def test_failed_build_leaves_no_invalid_index(self, advisor):
+        """Тест: недостроенный индекс удаляется после ошибки и перед повторным созданием"""
+        advisor, conn = advisor
+        conn.fetch = AsyncMock(return_value=[])
+        conn.fetchval = AsyncMock(return_value=True)
+        recommendation = IndexRecommendation("videos", ["creator_id"], fingerprints=["fp1"])
+
+        async def execute(sql):
+            if sql.startswith("CREATE"):
+                raise RuntimeError("deadlock detected")
+        conn.execute = AsyncMock(side_effect=execute)
+
+        report = await advisor.apply([recommendation], runs=1)
+
+        assert report[0]["error"] == "deadlock detected"
+        statements = [call.args[0] for call in conn.execute.call_args_list]
+        assert statements == ["DROP INDEX CONCURRENTLY IF EXISTS idx_videos_creator_id", recommendation.ddl(),
+                              "DROP INDEX CONCURRENTLY IF EXISTS idx_videos_creator_id"]
+
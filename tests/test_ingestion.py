@@ -0,0 +1,222 @@
+import json
+import uuid
+import pytest
+import asyncpg
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock
+
+from app.services.ingestion import (
+    Ingestor, parse_messages, publish, GENERATION_KEY, SNAPSHOT_COLUMNS, SYNC_SNAPSHOT_CREATORS, UPSERT_SNAPSHOTS,
+    UPSERT_VIDEOS, VIDEO_COLUMNS,
+)
+
+VIDEO_ID = "0b1c2d3e-4f50-4a6b-8c7d-9e0f1a2b3c4d"
+
+
+def video(views=100, snapshots=()):
+    return {
+        "id": VIDEO_ID, "creator_id": "aca1061a9d324ecf8c3fa2bb32d7be63",
+        "video_created_at": "2025-11-26T10:00:00+00:00", "views_count": views, "likes_count": 5,
+        "comments_count": 1, "reports_count": 0, "created_at": "2025-11-26T10:00:00+00:00",
+        "updated_at": "2025-11-27T10:00:00", "snapshots": list(snapshots),
+    }
+
+
+def snapshot(hour, delta=10, snapshot_id=None):
+    return {
+        "id": snapshot_id or str(uuid.uuid4()), "views_count": 100 + delta * hour, "likes_count": 5,
+        "comments_count": 1, "reports_count": 0, "delta_views_count": delta, "delta_likes_count": 0,
+        "delta_comments_count": 0, "delta_reports_count": 0,
+        "created_at": f"2025-11-27T{hour:02d}:00:00+00:00", "updated_at": f"2025-11-27T{hour:02d}:00:00+00:00",
+    }
+
+
+def mock_redis(entries=()):
+    client = MagicMock()
+    client.xreadgroup = AsyncMock(side_effect=lambda *args, **kwargs: [["ingest:videos", list(entries)]])
+    client.incr = AsyncMock(return_value=8)
+    client.pipeline.return_value = MagicMock(execute=AsyncMock())
+    return client
+
+
+def mock_conn(inserted=1):
+    conn = MagicMock()
+    conn.transaction.return_value = MagicMock()
+    conn.fetchval = AsyncMock(return_value=False)
+    conn.copy_records_to_table = AsyncMock()
+    conn.execute = AsyncMock(side_effect=lambda sql, *args: f"INSERT 0 {inserted}")
+    return conn
+
+
+class TestParseMessages:
+    """Тесты разбора сообщений очереди"""
+
+    def test_video_with_snapshots_and_single_snapshot(self):
+        """Тест: видео со снимками и отдельный снимок превращаются в типизированные строки"""
+        first = snapshot(9, snapshot_id="11111111-1111-1111-1111-111111111111")
+        videos, snapshots = parse_messages([
+            json.dumps(video(snapshots=[first])),
+            json.dumps({**snapshot(10), "video_id": VIDEO_ID}),
+        ])
+
+        assert len(videos) == 1 and len(snapshots) == 2
+        row = dict(zip(VIDEO_COLUMNS, videos[0]))
+        assert row["id"] == uuid.UUID(VIDEO_ID) and row["views_count"] == 100
+        assert row["creator_id"] == uuid.UUID("aca1061a9d324ecf8c3fa2bb32d7be63")
+        # Время без пояса - UTC
+        assert row["updated_at"] == datetime(2025, 11, 27, 10, tzinfo=timezone.utc)
+        assert dict(zip(SNAPSHOT_COLUMNS, snapshots[0]))["video_id"] == uuid.UUID(VIDEO_ID)
+
+    def test_duplicates_collapsed(self):
+        """Тест: повтор id в пачке оставляет последнюю версию (иначе upsert упадет)"""
+        videos, _ = parse_messages([json.dumps(video(views=1)), json.dumps(video(views=2))])
+        assert len(videos) == 1
+        assert dict(zip(VIDEO_COLUMNS, videos[0]))["views_count"] == 2
+
+
+class TestIngestor:
+    """Тесты загрузчика из потока"""
+
+    @pytest.mark.asyncio
+    async def test_batch_written_and_acknowledged(self):
+        """Тест: пачка копируется во временные таблицы, переносится upsert'ами и подтверждается"""
+        entries = [("1700000000000-0", {"data": json.dumps(video(snapshots=[snapshot(9), snapshot(10)]))})]
+        redis_client = mock_redis(entries)
+        conn = mock_conn(inserted=1)
+        ingestor = Ingestor(redis_client, conn, batch_size=1, generation_interval=0)
+
+        batch = await ingestor.run_once()
+
+        assert (batch.messages, batch.videos, batch.snapshots, batch.skipped_snapshots) == (1, 1, 1, 1)
+        tables = [call.args[0] for call in conn.copy_records_to_table.call_args_list]
+        assert tables == ["ingest_videos", "ingest_snapshots"]
+        statements = [call.args[0] for call in conn.execute.call_args_list]
+        assert UPSERT_SNAPSHOTS in statements and any(s.strip().startswith("UPDATE videos") for s in statements)
+        # Креатор в старых снимках меняется до того, как новое значение попадет в videos
+        assert statements.index(SYNC_SNAPSHOT_CREATORS) < statements.index(UPSERT_VIDEOS)
+
+        pipe = redis_client.pipeline.return_value
+        pipe.xack.assert_called_once_with("ingest:videos", "ingesters", "1700000000000-0")
+        pipe.xdel.assert_called_once_with("ingest:videos", "1700000000000-0")
+        redis_client.incr.assert_called_once_with(GENERATION_KEY)
+        assert ingestor.report()["visible_lag_ms"]["p50"] > 0
+
+    @pytest.mark.asyncio
+    async def test_failed_batch_not_acknowledged(self):
+        """Тест: при ошибке записи сообщения не подтверждаются и поколение не меняется"""
+        entries = [("1700000000000-0", {"data": json.dumps(video())})]
+        redis_client = mock_redis(entries)
+        conn = mock_conn()
+        conn.copy_records_to_table.side_effect = RuntimeError("connection lost")
+        ingestor = Ingestor(redis_client, conn, batch_size=1, generation_interval=0)
+
+        with pytest.raises(RuntimeError):
+            await ingestor.run_once()
+
+        redis_client.pipeline.return_value.xack.assert_not_called()
+        redis_client.incr.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_malformed_messages_dead_lettered(self):
+        """Тест: неразборчивые сообщения откладываются и подтверждаются, остальные пишутся"""
+        entries = [
+            ("1700000000000-0", {"data": "{not json"}),
+            ("1700000000000-1", {"payload": json.dumps(video())}),
+            ("1700000000000-2", {"data": json.dumps({**video(), "id": "not-a-uuid"})}),
+            ("1700000000000-3", {"data": json.dumps({**video(), "views_count": "много"})}),
+            ("1700000000000-4", {"data": json.dumps(video())}),
+        ]
+        redis_client = mock_redis(entries)
+        conn = mock_conn()
+        ingestor = Ingestor(redis_client, conn, batch_size=5, generation_interval=0, dead_letter_stream="dead")
+
+        batch = await ingestor.run_once()
+
+        assert (batch.messages, batch.videos, batch.dead_lettered) == (5, 1, 4)
+        assert len(conn.copy_records_to_table.call_args_list[0].kwargs["records"]) == 1
+        pipe = redis_client.pipeline.return_value
+        dead = [call.args for call in pipe.xadd.call_args_list]
+        assert [fields["entry_id"] for _, fields in dead] == [entry_id for entry_id, _ in entries[:4]]
+        assert all(stream == "dead" and fields["error"] for stream, fields in dead)
+        pipe.xack.assert_called_once_with("ingest:videos", "ingesters", *[entry_id for entry_id, _ in entries])
+
+    @pytest.mark.asyncio
+    async def test_snapshot_without_time_dead_lettered(self):
+        """Тест: снимок без created_at не отбрасывается молча при свертке, а откладывается"""
+        untimed = {**snapshot(9), "created_at": None}
+        entries = [("1700000000000-0", {"data": json.dumps(video(snapshots=[snapshot(8), untimed]))}),
+                   ("1700000000000-1", {"data": json.dumps({**untimed, "video_id": VIDEO_ID})}),
+                   ("1700000000000-2", {"data": json.dumps(video(snapshots=[snapshot(10)]))})]
+        redis_client = mock_redis(entries)
+        conn = mock_conn()
+        ingestor = Ingestor(redis_client, conn, batch_size=3, generation_interval=0, dead_letter_stream="dead")
+
+        batch = await ingestor.run_once()
+
+        assert batch.dead_lettered == 2
+        dead = [call.args[1] for call in redis_client.pipeline.return_value.xadd.call_args_list]
+        assert [fields["entry_id"] for fields in dead] == ["1700000000000-0", "1700000000000-1"]
+        assert all("created_at" in fields["error"] for fields in dead)
+        assert len(conn.copy_records_to_table.call_args_list[-1].kwargs["records"]) == 1
+
+    @pytest.mark.asyncio
+    async def test_rejected_by_db_written_one_by_one(self):
+        """Тест: пачку, отвергнутую PostgreSQL, пишут по сообщению; отвергнутое откладывается"""
+        bad = {**video(views=2 ** 40), "id": "1b1c2d3e-4f50-4a6b-8c7d-9e0f1a2b3c4d"}
+        entries = [("1700000000000-0", {"data": json.dumps(video())}),
+                   ("1700000000000-1", {"data": json.dumps(bad)})]
+        redis_client = mock_redis(entries)
+        conn = mock_conn()
+
+        async def copy(table, records, columns):
+            if any(row[3] == 2 ** 40 for row in records):
+                raise asyncpg.DataError("value out of int32 range")
+        conn.copy_records_to_table = AsyncMock(side_effect=copy)
+        ingestor = Ingestor(redis_client, conn, batch_size=2, generation_interval=0, dead_letter_stream="dead")
+
+        batch = await ingestor.run_once()
+
+        assert (batch.videos, batch.dead_lettered) == (1, 1)
+        assert conn.copy_records_to_table.await_count == 3
+        pipe = redis_client.pipeline.return_value
+        pipe.xadd.assert_called_once()
+        assert pipe.xadd.call_args.args[1]["entry_id"] == "1700000000000-1"
+        pipe.xack.assert_called_once_with("ingest:videos", "ingesters", "1700000000000-0", "1700000000000-1")
+
+    @pytest.mark.asyncio
+    async def test_batch_collected_until_size(self):
+        """Тест: новые сообщения добираются в пачку до batch_size"""
+        redis_client = mock_redis([(f"17000000000{i:02d}-0", {"data": json.dumps(video())}) for i in range(2)])
+        ingestor = Ingestor(redis_client, mock_conn(), batch_size=6, batch_interval_ms=1000,
+                            generation_interval=0)
+        ingestor._pending_recovered = True
+
+        batch = await ingestor.run_once()
+
+        assert batch.messages == 6
+        assert redis_client.xreadgroup.await_count == 3
+
+    @pytest.mark.asyncio
+    async def test_generation_throttled(self):
+        """Тест: поколение данных меняется не чаще generation_interval"""
+        redis_client = mock_redis([("1700000000000-0", {"data": json.dumps(video())})])
+        ingestor = Ingestor(redis_client, mock_conn(), batch_size=1, generation_interval=3600)
+        ingestor._pending_recovered = True
+
+        await ingestor.run_once()
+        await ingestor.run_once()
+        assert redis_client.incr.await_count == 1
+
+        # При остановке непоказанные боту данные публикуются сразу
+        await ingestor.publish_generation(force=True)
+        assert redis_client.incr.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_publish():
+    """Тест: каждое видео - отдельное сообщение потока"""
+    redis_client = mock_redis()
+    assert await publish(redis_client, [video(), video()], stream="s") == 2
+    pipe = redis_client.pipeline.return_value
+    assert pipe.xadd.call_count == 2
+    assert json.loads(pipe.xadd.call_args[0][1]["data"])["id"] == VIDEO_ID
@@ -0,0 +1,137 @@
+import json
+import pytest
+import psycopg2
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+from scripts.load_json import INVALID_INDEX_SQL, VideoDatabase
+
+BOUNDARY = datetime(2025, 11, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def db():
+    database = VideoDatabase()
+    database.connection = MagicMock(autocommit=False)
+    database.cursor = MagicMock()
+    return database
+
+
+def executed(database) -> list:
+    return [call.args[0] for call in database.cursor.execute.call_args_list]
+
+
+def snapshot(snapshot_id: str, created_at) -> dict:
+    return {"id": snapshot_id, "video_id": "v1", "views_count": 1, "likes_count": 0, "comments_count": 0,
+            "reports_count": 0, "delta_views_count": 1, "delta_likes_count": 0, "delta_comments_count": 0,
+            "delta_reports_count": 0, "created_at": created_at, "updated_at": created_at}
+
+
+def write_videos(path, snapshots: list) -> str:
+    video = {"id": "v1", "creator_id": "c1", "video_created_at": "2025-10-01T00:00:00+00:00", "views_count": 1,
+             "likes_count": 0, "comments_count": 0, "reports_count": 0, "created_at": "2025-10-01T00:00:00+00:00",
+             "updated_at": "2025-10-01T00:00:00+00:00", "snapshots": snapshots}
+    path.write_text(json.dumps({"videos": [video]}), encoding="utf-8")
+    return str(path)
+
+
+def inserted_snapshots(database) -> list:
+    return [call.args[1][0] for call in database.cursor.execute.call_args_list
+            if "INSERT INTO video_snapshots" in call.args[0]]
+
+
+class TestCreateIndexConcurrently:
+    """Тесты построения индекса без блокировки записи"""
+
+    def test_invalid_index_rebuilt(self, db):
+        """Тест: индекс INVALID от прерванного запуска удаляется и строится заново вне транзакции"""
+        db.cursor.fetchone.return_value = (True,)
+        modes = []
+        db.cursor.execute.side_effect = lambda *args: modes.append(db.connection.autocommit)
+
+        db.create_index_concurrently("idx_snapshots_creator_created", "video_snapshots(creator_id, created_at)")
+
+        assert executed(db) == [
+            INVALID_INDEX_SQL,
+            "DROP INDEX CONCURRENTLY IF EXISTS idx_snapshots_creator_created",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_snapshots_creator_created "
+            "ON video_snapshots(creator_id, created_at)",
+        ]
+        assert all(modes) and db.connection.autocommit is False
+
+    def test_valid_index_kept(self, db):
+        db.cursor.fetchone.return_value = (False,)
+
+        db.create_index_concurrently("idx_snapshots_creator_created", "video_snapshots(creator_id, created_at)")
+
+        assert not any(sql.startswith("DROP") for sql in executed(db))
+
+    def test_failed_build_leaves_no_invalid_index(self, db):
+        """Тест: после неудачного построения недостроенный индекс удаляется, ошибка пробрасывается"""
+        db.cursor.fetchone.side_effect = [(False,), (True,)]
+
+        def execute(sql, *args):
+            if sql.startswith("CREATE INDEX"):
+                raise psycopg2.OperationalError("canceling statement due to user request")
+        db.cursor.execute.side_effect = execute
+
+        with pytest.raises(psycopg2.OperationalError):
+            db.create_index_concurrently("idx_snapshots_creator_created", "video_snapshots(creator_id, created_at)")
+
+        assert executed(db)[-1] == "DROP INDEX CONCURRENTLY IF EXISTS idx_snapshots_creator_created"
+        assert db.connection.autocommit is False
+
+    def test_create_tables_builds_index_concurrently(self, db):
+        db.cursor.fetchone.return_value = (False,)
+
+        db.create_tables()
+
+        in_transaction = " ".join(executed(db)[:2])
+        assert "idx_snapshots_creator_created" not in in_transaction
+        assert executed(db)[-1].startswith("CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_snapshots_creator_created")
+
+
+class TestCompactionBoundary:
+    """Тесты пропуска снимков за уже свернутый период при загрузке"""
+
+    def test_is_compacted(self, db):
+        """Тест: граница строгая, время без пояса - в поясе границы, без свертки ничего не пропускается"""
+        assert db.is_compacted(snapshot("s", "2025-10-31T23:59:59+00:00"), BOUNDARY)
+        assert not db.is_compacted(snapshot("s", "2025-11-01T00:00:00+00:00"), BOUNDARY)
+        assert db.is_compacted(snapshot("s", "2025-10-31T23:00:00"), BOUNDARY)
+        assert not db.is_compacted(snapshot("s", "2025-10-01T00:00:00+00:00"), None)
+
+    def test_snapshots_before_boundary_not_loaded(self, db, tmp_path):
+        """Тест: снимки до границы свертки не загружаются повторно, остальные загружаются"""
+        db.cursor.fetchone.side_effect = [(True,), (BOUNDARY,)]
+        path = write_videos(tmp_path / "videos.json", [
+            snapshot("old", "2025-10-31T12:00:00+00:00"),
+            snapshot("new", "2025-11-01T12:00:00+00:00"),
+        ])
+
+        db.load_videos_data(path)
+
+        assert inserted_snapshots(db) == ["new"]
+        db.connection.commit.assert_called_once()
+
+    def test_snapshot_without_time_reported(self, db, tmp_path, capsys):
+        """Тест: снимок без created_at пропускается с сообщением, остальные снимки видео загружаются"""
+        db.cursor.fetchone.side_effect = [(True,), (BOUNDARY,)]
+        path = write_videos(tmp_path / "videos.json", [
+            snapshot("untimed", None),
+            snapshot("new", "2025-11-01T12:00:00+00:00"),
+        ])
+
+        db.load_videos_data(path)
+
+        assert inserted_snapshots(db) == ["new"]
+        output = capsys.readouterr().out
+        assert "untimed без created_at" in output and "Пропущено снапшотов без created_at: 1" in output
+
+    def test_without_compaction_everything_loaded(self, db, tmp_path):
+        db.cursor.fetchone.return_value = (False,)
+        path = write_videos(tmp_path / "videos.json", [snapshot("old", "2025-10-31T12:00:00+00:00")])
+
+        db.load_videos_data(path)
+
+        assert inserted_snapshots(db) == ["old"]
@@ -0,0 +1,62 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.services.popularity import PopularityTracker, SKETCH_KEY, TOP_KEY
+
+
+class TestPopularityTracker:
+    """Тесты для учета популярности вопросов (Count-Min sketch + top-K)"""
+
+    @pytest.fixture
+    def tracker(self):
+        return PopularityTracker(width=1024, depth=4, top_k=10, decay_interval=3600)
+
+    def test_offsets_one_per_row(self, tracker):
+        """Тест: по одному счетчику в каждой строке sketch, стабильно для вопроса"""
+        offsets = tracker.offsets("abc")
+
+        assert len(offsets) == 4
+        assert [offset // 1024 for offset in offsets] == [0, 1, 2, 3]
+        assert offsets == tracker.offsets("abc")
+        assert offsets != tracker.offsets("abd")
+
+    @pytest.mark.asyncio
+    async def test_record_single_round_trip(self, tracker):
+        """Тест: учет вопроса - один вызов скрипта с ключом ответа и номерами счетчиков"""
+        script = AsyncMock(return_value=[0, 4])
+        client = MagicMock()
+        client.register_script = MagicMock(return_value=script)
+
+        exists, estimate = await tracker.record(client, "abc", "вопрос", "cache:query:abc")
+
+        assert (exists, estimate) == (False, 4)
+        keys = script.call_args.kwargs["keys"]
+        args = script.call_args.kwargs["args"]
+        assert keys[0] == SKETCH_KEY and keys[1] == TOP_KEY and keys[-1] == "cache:query:abc"
+        assert args[:3] == ["abc", "вопрос", 10]
+        assert args[5:] == tracker.offsets("abc")
+
+    @pytest.mark.asyncio
+    async def test_scripts_registered_once_per_client(self, tracker):
+        """Тест: скрипт регистрируется один раз и заново для нового клиента"""
+        script = AsyncMock(return_value=[0, 1])
+        client = MagicMock()
+        client.register_script = MagicMock(return_value=script)
+
+        await tracker.record(client, "a", "a", "cache:query:a")
+        await tracker.record(client, "b", "b", "cache:query:b")
+        assert client.register_script.call_count == 1
+
+        other = MagicMock()
+        other.register_script = MagicMock(return_value=script)
+        await tracker.record(other, "a", "a", "cache:query:a")
+        assert other.register_script.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_top_empty(self, tracker):
+        """Тест: пустой top-K без лишних запросов"""
+        client = MagicMock()
+        client.zrevrange = AsyncMock(return_value=[])
+
+        assert await tracker.top(client, 5) == []
+        client.pipeline.assert_not_called()
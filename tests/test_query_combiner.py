@@ -0,0 +1,162 @@
+import pytest
+import asyncio
+from unittest.mock import AsyncMock
+
+from app.core.deadline import current_deadline, deadline_scope
+from app.services.db_service import QueryResult
+from app.services.query_combiner import QueryCombiner, combine_key, combine_sql
+from app.services.sql_guard import analyze_sql
+
+
+def _trees(*queries):
+    return [combine_key(analyze_sql(sql))[1] for sql in queries]
+
+
+class TestCombineSQL:
+    """Тесты объединения агрегатов в один SELECT"""
+
+    def test_shared_where_kept(self):
+        """Тест: одинаковое условие остается в WHERE без FILTER"""
+        sql = combine_sql(_trees(
+            "SELECT SUM(views_count) FROM videos WHERE creator_id = 'a'",
+            "SELECT AVG(likes_count) FROM videos WHERE creator_id = 'a'",
+        ))
+
+        assert sql == ("SELECT SUM(views_count) AS c0, AVG(likes_count) AS c1 "
+                       "FROM videos WHERE creator_id = 'a'")
+
+    def test_different_where_to_filter(self):
+        """Тест: разные условия - FILTER у агрегатов и OR в WHERE"""
+        sql = combine_sql(_trees(
+            "SELECT SUM(views_count) FROM videos WHERE creator_id = 'a'",
+            "SELECT MAX(comments_count) FROM videos WHERE views_count > 100",
+        ))
+
+        assert "SUM(views_count) FILTER(WHERE creator_id = 'a') AS c0" in sql
+        assert "MAX(comments_count) FILTER(WHERE views_count > 100) AS c1" in sql
+        assert sql.endswith("WHERE (creator_id = 'a') OR (views_count > 100)")
+
+    def test_without_where_reads_all(self):
+        """Тест: если у одного запроса нет условия, общего WHERE нет"""
+        sql = combine_sql(_trees(
+            "SELECT COUNT(*) FROM videos",
+            "SELECT ROUND(AVG(likes_count), 2) FROM videos WHERE views_count > 100",
+        ))
+
+        assert "WHERE views_count > 100)" in sql
+        assert not sql.endswith("views_count > 100")
+        assert "COUNT(*) AS c0" in sql
+
+    @pytest.mark.parametrize("sql", [
+        "SELECT video_id FROM video_snapshots",
+        "SELECT creator_id, COUNT(*) FROM videos GROUP BY creator_id",
+        "SELECT COUNT(*) FROM videos v JOIN video_snapshots s ON s.video_id = v.id",
+        "SELECT COUNT(*) FROM videos WHERE id IN (SELECT video_id FROM video_snapshots)",
+    ])
+    def test_not_combinable(self, sql):
+        """Тест: неагрегатные запросы, группировки, соединения и подзапросы не объединяются"""
+        assert combine_key(analyze_sql(sql)) is None
+
+
+class TestQueryCombiner:
+    """Тесты объединения одновременных запросов"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_queries_one_scan(self):
+        """Тест: одновременные агрегаты выполняются одним запросом и получают свои колонки"""
+        execute = AsyncMock(return_value=QueryResult(rows=[(100, 2.5, 7)]))
+        combiner = QueryCombiner(execute, window_ms=10, max_size=16)
+        queries = [
+            "SELECT SUM(views_count) FROM videos",
+            "SELECT AVG(likes_count) FROM videos",
+            "SELECT MAX(comments_count) FROM videos",
+        ]
+
+        results = await asyncio.gather(*(combiner.fetch_result(analyze_sql(sql)) for sql in queries))
+
+        execute.assert_called_once()
+        assert [result.value for result in results] == [100, 2.5, 7]
+        assert all(result.scalar for result in results)
+        assert results[0].fingerprint == analyze_sql(queries[0]).fingerprint
+        assert combiner.metrics["scans_saved"] == 2
+
+    @pytest.mark.asyncio
+    async def test_duplicates_executed_once(self):
+        """Тест: одинаковые запросы выполняются один раз"""
+        execute = AsyncMock(return_value=QueryResult(value=42, scalar=True))
+        combiner = QueryCombiner(execute, window_ms=10, max_size=16)
+        guarded = analyze_sql("SELECT COUNT(*) FROM videos")
+
+        results = await asyncio.gather(combiner.fetch_result(guarded), combiner.fetch_result(guarded))
+
+        execute.assert_called_once_with(guarded)
+        assert [result.value for result in results] == [42, 42]
+
+    @pytest.mark.asyncio
+    async def test_fallback_when_combined_fails(self):
+        """Тест: если общий запрос не выполнился, запросы выполняются по одному"""
+        async def execute(guarded):
+            if "c0" in guarded.sql:
+                return None
+            return QueryResult(value=guarded.sql, scalar=True)
+
+        combiner = QueryCombiner(execute, window_ms=10, max_size=16)
+        queries = ["SELECT SUM(views_count) FROM videos", "SELECT MIN(views_count) FROM videos"]
+
+        results = await asyncio.gather(*(combiner.fetch_result(analyze_sql(sql)) for sql in queries))
+
+        assert [result.value for result in results] == queries
+        assert combiner.metrics["fallbacks"] == 1
+
+    @pytest.mark.asyncio
+    async def test_batch_runs_until_latest_deadline(self):
+        """Тест: общий запрос ограничен самым поздним сроком ожидающих, а не сроком первого"""
+        seen = []
+
+        async def execute(guarded):
+            seen.append(current_deadline())
+            return QueryResult(rows=[(1, 2)])
+
+        combiner = QueryCombiner(execute, window_ms=10, max_size=16)
+
+        async def ask(sql, seconds):
+            with deadline_scope(seconds) as deadline:
+                return await combiner.fetch_result(analyze_sql(sql)), deadline
+
+        (_, short), (_, long) = await asyncio.gather(ask("SELECT SUM(views_count) FROM videos", 1),
+                                                     ask("SELECT MAX(views_count) FROM videos", 30))
+        assert seen == [long] and short is not long
+
+    @pytest.mark.asyncio
+    async def test_batch_cancelled_with_all_waiters(self):
+        """Тест: когда все ожидающие отменили запросы, общий запрос тоже отменяется"""
+        started, cancelled = asyncio.Event(), asyncio.Event()
+
+        async def execute(guarded):
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        combiner = QueryCombiner(execute, window_ms=1, max_size=16)
+        waiters = [asyncio.create_task(combiner.fetch_result(analyze_sql(sql)))
+                   for sql in ("SELECT SUM(views_count) FROM videos", "SELECT MAX(views_count) FROM videos")]
+        await asyncio.wait_for(started.wait(), 1)
+
+        waiters[0].cancel()
+        await asyncio.sleep(0.01)
+        assert not cancelled.is_set()
+
+        waiters[1].cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+    @pytest.mark.asyncio
+    async def test_disabled(self):
+        """Тест: max_size=1 - запрос выполняется сразу"""
+        execute = AsyncMock(return_value=QueryResult(value=1, scalar=True))
+        combiner = QueryCombiner(execute, window_ms=1000, max_size=1)
+
+        await asyncio.wait_for(combiner.fetch_result(analyze_sql("SELECT COUNT(*) FROM videos")), 0.5)
+        execute.assert_called_once()
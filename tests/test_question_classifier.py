@@ -0,0 +1,99 @@
+import pytest
+
+from app.services.question_classifier import (
+    LabeledQuestion, Prediction, QuestionClassifier, examples_from_log, feature_indices, labels_from_sql,
+)
+
+EXAMPLES = [
+    LabeledQuestion("Сколько всего видео в базе?", True, "videos", "count"),
+    LabeledQuestion("Сколько видео опубликовано в ноябре?", True, "videos", "count"),
+    LabeledQuestion("Общее количество просмотров всех видео", True, "videos", "sum"),
+    LabeledQuestion("Сумма лайков по всем видео", True, "videos", "sum"),
+    LabeledQuestion("Среднее число комментариев у видео", True, "videos", "avg"),
+    LabeledQuestion("На сколько выросли просмотры 28 ноября по снапшотам", True, "video_snapshots", "sum"),
+    LabeledQuestion("Прирост лайков в снапшотах за 27 ноября", True, "video_snapshots", "sum"),
+    LabeledQuestion("Напиши стихотворение про котиков", False),
+    LabeledQuestion("Привет, как дела?", False),
+    LabeledQuestion("Покажи последние видео", False),
+]
+
+
+class TestFeatures:
+    """Тесты признаков вопроса"""
+
+    def test_digits_and_case_ignored(self):
+        """Тест: регистр, "ё" и конкретные числа не меняют признаки"""
+        assert list(feature_indices("Сколько ЕЩЁ видео 27 ноября", 1024)) == \
+            list(feature_indices("сколько еще видео 15 ноября", 1024))
+
+    def test_empty_question(self):
+        """Тест: вопрос без слов не дает признаков"""
+        assert len(feature_indices("?!", 1024)) == 0
+
+
+class TestLabels:
+    """Тесты разметки по журналу вопросов"""
+
+    @pytest.mark.parametrize("sql, labels", [
+        ("SELECT COUNT(*) FROM videos", ("videos", "count")),
+        ("SELECT COUNT(DISTINCT video_id) FROM video_snapshots", ("video_snapshots", "count_distinct")),
+        ("SELECT ROUND(AVG(likes_count), 2) FROM videos", ("videos", "avg")),
+        ("SELECT SUM(s.delta_views_count) FROM video_snapshots s JOIN videos v ON v.id = s.video_id",
+         ("video_snapshots", "sum")),
+    ])
+    def test_labels_from_sql(self, sql, labels):
+        """Тест: таблица и агрегат берутся из выполненного SQL"""
+        assert labels_from_sql(sql) == labels
+
+    def test_examples_from_log(self):
+        """Тест: пустые результаты, ошибки БД и отклоненные вопросы не размечаются"""
+        log = [
+            {"q": "Сколько видео?", "outcome": "answered", "sql": "SELECT COUNT(*) FROM videos"},
+            {"q": "Сколько видео?", "outcome": "generation_failed", "sql": None},
+            {"q": "Напиши стих", "outcome": "generation_failed", "sql": None},
+            {"q": "Сколько видео у креатора x?", "outcome": "empty_result", "sql": None},
+            {"q": "Покажи видео", "outcome": "rejected", "sql": None},
+        ]
+
+        assert examples_from_log(log) == [
+            LabeledQuestion("Сколько видео?", True, "videos", "count"),
+            LabeledQuestion("Напиши стих", False),
+        ]
+
+
+class TestQuestionClassifier:
+    """Тесты классификатора вопросов"""
+
+    @pytest.fixture
+    def model(self):
+        return QuestionClassifier.train(EXAMPLES, dim=1 << 12)
+
+    def test_learns_training_set(self, model):
+        """Тест: обучающие вопросы классифицируются верно"""
+        for example in EXAMPLES:
+            prediction = model.predict(example.text)
+            assert (prediction.answerable >= 0.5) == example.answerable
+            if example.answerable:
+                assert prediction.table == example.table
+                assert prediction.aggregate == example.aggregate
+
+    def test_save_and_load(self, model, tmp_path):
+        """Тест: сохраненная модель предсказывает то же самое"""
+        path = str(tmp_path / "model.npz")
+        model.save(path)
+        loaded = QuestionClassifier.load(path)
+
+        question = "Сумма просмотров за ноябрь"
+        assert loaded.predict(question) == model.predict(question)
+
+    def test_missing_model(self, tmp_path):
+        """Тест: без файла модели классификатор не используется"""
+        assert QuestionClassifier.load(str(tmp_path / "missing.npz")) is None
+
+    def test_hint_only_confident(self):
+        """Тест: в подсказку попадают только уверенные предсказания"""
+        prediction = Prediction(0.9, "video_snapshots", 0.95, "count_distinct", 0.5)
+        assert prediction.hint(0.8) == "(подсказка: таблица video_snapshots)"
+        prediction.aggregate_confidence = 0.9
+        assert prediction.hint(0.8) == "(подсказка: таблица video_snapshots, агрегат COUNT DISTINCT)"
+        assert prediction.hint(0.99) == ""
@@ -0,0 +1,61 @@
+import pytest
+from unittest.mock import patch
+
+from app.services.resilience import CircuitBreaker, LatencyTracker, backoff_delay
+
+
+class TestCircuitBreaker:
+    """Тесты автоматического выключателя"""
+
+    def test_opens_after_threshold(self):
+        """Выключатель открывается после заданного числа ошибок подряд"""
+        breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30)
+
+        for _ in range(2):
+            breaker.record_failure()
+        assert breaker.allow_request() is True
+
+        breaker.record_failure()
+        assert breaker.is_open
+        assert breaker.allow_request() is False
+
+    def test_success_resets_failures(self):
+        """Успешный запрос сбрасывает счетчик ошибок"""
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_half_open_single_probe(self):
+        """После таймаута пропускается ровно один пробный запрос"""
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10)
+        with patch('app.services.resilience.time.monotonic', return_value=100.0):
+            breaker.record_failure()
+        with patch('app.services.resilience.time.monotonic', return_value=111.0):
+            assert breaker.state == CircuitBreaker.HALF_OPEN
+            assert breaker.allow_request() is True
+            assert breaker.allow_request() is False
+
+            breaker.record_success()
+            assert breaker.state == CircuitBreaker.CLOSED
+
+
+class TestLatencyTracker:
+    """Тесты расчета перцентилей задержки"""
+
+    def test_not_enough_samples(self):
+        tracker = LatencyTracker(min_samples=5)
+        tracker.observe(1.0)
+        assert tracker.percentile(0.95) is None
+
+    def test_p95(self):
+        tracker = LatencyTracker(min_samples=5)
+        for i in range(1, 101):
+            tracker.observe(i / 100)
+        assert tracker.percentile(0.95) == pytest.approx(0.96)
+
+    def test_backoff_delay_bounds(self):
+        for attempt in range(10):
+            assert 0 <= backoff_delay(attempt, base=0.5, cap=4.0) <= 4.0
@@ -0,0 +1,240 @@
+import json
+import pytest
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock
+
+from app.services.semantic_cache import SemanticCache, SEMANTIC_KEY, extract_params, rebind_sql
+
+CREATOR = "aca1061a9d324ecf8c3fa2bb32d7be63"
+OTHER = "0123456789abcdef0123456789abcdef"
+
+RANGE_QUESTION = f"Сколько видео у креатора {CREATOR} вышло с 1 ноября 2025 по 5 ноября 2025 включительно?"
+RANGE_SQL = (f"SELECT COUNT(*) FROM videos WHERE creator_id = '{CREATOR}' "
+             "AND video_created_at >= '2025-11-01' AND video_created_at < '2025-11-06'")
+
+
+def redis_mock(stored=None):
+    client = MagicMock()
+    client.pipeline.return_value = MagicMock(execute=AsyncMock())
+    client.hgetall = AsyncMock(return_value=stored or {})
+    return client
+
+
+class TestExtractParams:
+    """Тесты выделения значений из вопроса"""
+
+    def test_values_replaced_and_synonyms_unified(self):
+        """Тест: разные значения и синонимы дают один вопрос"""
+        first, first_params = extract_params(RANGE_QUESTION)
+        second, second_params = extract_params(
+            f"Сколько роликов у автора {OTHER} вышло с 3 декабря по 10.12.2025 включительно?"
+        )
+
+        assert first == second == "сколько видео креатор _id_ вышло с _day_ по _day_ включительно"
+        assert [(p.kind, p.value) for p in first_params] == [
+            ("id", CREATOR), ("day", (2025, 11, 1)), ("day", (2025, 11, 5))
+        ]
+        assert second_params[1].value == (None, 12, 3)
+        assert second_params[2].value == (2025, 12, 10)
+
+    def test_month_and_number(self):
+        skeleton, params = extract_params("Сколько видео с более чем 100000 просмотров вышло в мае 2025 года?")
+        assert skeleton == "сколько видео с более чем _num_ просмотров вышло _month_"
+        assert [(p.kind, p.value) for p in params] == [("number", Decimal(100000)), ("month", (2025, 5))]
+
+
+class TestRebindSql:
+    """Тесты подстановки значений нового вопроса в SQL похожего"""
+
+    def test_day_range_and_id(self):
+        """Тест: id и дни подставляются, конец диапазона остается следующим днем"""
+        _, old = extract_params(RANGE_QUESTION)
+        _, new = extract_params(f"Сколько видео у креатора {OTHER} вышло с 30 ноября 2025 по 31 декабря 2025?")
+
+        assert rebind_sql(RANGE_SQL, old, new) == (
+            f"SELECT COUNT(*) FROM videos WHERE creator_id = '{OTHER}' "
+            "AND video_created_at >= '2025-11-30' AND video_created_at < '2026-01-01'"
+        )
+
+    def test_month_range(self):
+        sql = "SELECT COUNT(*) FROM videos WHERE video_created_at >= '2025-11-01' AND video_created_at < '2025-12-01'"
+        _, old = extract_params("Сколько видео опубликовано в ноябре 2025?")
+        _, new = extract_params("Сколько видео опубликовано в декабре 2025?")
+
+        assert rebind_sql(sql, old, new) == (
+            "SELECT COUNT(*) FROM videos WHERE video_created_at >= '2025-12-01' AND video_created_at < '2026-01-01'"
+        )
+
+    def test_typed_literals_and_numbers(self):
+        sql = "SELECT COUNT(*) FROM videos WHERE views_count > 100000 AND video_created_at::date = DATE '2025-11-27'"
+        _, old = extract_params("Сколько видео 27 ноября 2025 набрало больше 100000 просмотров?")
+        _, new = extract_params("Сколько видео 28 ноября 2025 набрало больше 5000 просмотров?")
+
+        assert rebind_sql(sql, old, new) == (
+            "SELECT COUNT(*) FROM videos WHERE views_count > 5000 AND video_created_at::date = DATE '2025-11-28'"
+        )
+
+    def test_value_missing_from_sql(self):
+        """Тест: значение, которого нет среди литералов SQL, не подставить - промах"""
+        sql = "SELECT COUNT(*) FROM videos WHERE video_created_at >= CURRENT_DATE - INTERVAL '7 days'"
+        _, old = extract_params("Сколько видео вышло за последние 7 дней?")
+        _, new = extract_params("Сколько видео вышло за последние 14 дней?")
+
+        assert rebind_sql(sql, old, new) is None
+
+    def test_different_kinds(self):
+        _, old = extract_params("Сколько видео вышло в ноябре 2025?")
+        _, new = extract_params("Сколько видео вышло 5 ноября 2025?")
+        assert rebind_sql(RANGE_SQL, old, new) is None
+
+
+class TestSemanticCache:
+    """Тесты семантического кеша"""
+
+    @pytest.mark.asyncio
+    async def test_similar_question_hit(self):
+        """Тест: похожий вопрос получает SQL с новыми значениями, другой по смыслу - нет"""
+        cache = SemanticCache(capacity=10, threshold=0.9)
+        await cache.add(None, RANGE_QUESTION, RANGE_SQL)
+        await cache.add(None, "Сколько видео набрало больше 100000 просмотров?",
+                        "SELECT COUNT(*) FROM videos WHERE views_count > 100000")
+
+        hit = cache.lookup(f"Сколько роликов у автора {OTHER} вышло с 2 ноября 2025 по 3 ноября 2025 включительно?")
+        assert hit.source == RANGE_QUESTION
+        assert f"creator_id = '{OTHER}'" in hit.sql and "'2025-11-04'" in hit.sql
+
+        assert cache.lookup("Сколько видео набрало больше 5000 лайков?") is None
+        assert cache.lookup("Сколько видео набрало больше 5000 просмотров?").sql == \
+            "SELECT COUNT(*) FROM videos WHERE views_count > 5000"
+        assert cache.metrics["hits"] == 2 and cache.metrics["misses"] == 1
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("cached, cached_sql, question", [
+        ("Сколько видео с количеством просмотров больше 10000?",
+         "SELECT COUNT(*) FROM videos WHERE views_count > 10000",
+         "Сколько видео с количеством просмотров меньше 10000?"),
+        ("Сколько видео опубликовано в ноябре 2025?",
+         "SELECT COUNT(*) FROM videos WHERE video_created_at >= '2025-11-01' AND video_created_at < '2025-12-01'",
+         "Сколько видео опубликовано до ноября 2025?"),
+        ("Сколько видео опубликовано в ноябре 2025?",
+         "SELECT COUNT(*) FROM videos WHERE video_created_at >= '2025-11-01' AND video_created_at < '2025-12-01'",
+         "Сколько видео опубликовано после ноября 2025?"),
+    ])
+    async def test_other_comparison_not_reused(self, cached, cached_sql, question):
+        """Тест: близкий по словам вопрос с другим сравнением или направлением - промах, а не чужой SQL"""
+        cache = SemanticCache(capacity=10, threshold=0.9)
+        await cache.add(None, cached, cached_sql)
+
+        assert cache.search(question)[0] >= 0.9
+        assert cache.lookup(question) is None
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("question", [
+        "Сколько видео набрали больше 10000 просмотров вчера?",
+        "Сколько видео набрали больше 10000 просмотров сегодня?",
+    ])
+    async def test_other_time_not_reused(self, question):
+        """Тест: слово относительного времени - условие по дате, SQL без него не подходит"""
+        cache = SemanticCache(capacity=10, threshold=0.9)
+        await cache.add(None, "Сколько видео набрали больше 10000 просмотров?",
+                        "SELECT COUNT(*) FROM videos WHERE views_count > 10000")
+
+        assert cache.search(question)[0] >= 0.9
+        assert cache.lookup(question) is None
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("cached", [
+        "Сколько видео набрали больше 10000 просмотров?",
+        "Сколько видео набрали больше 10 тысяч просмотров?",
+    ])
+    async def test_number_scale_applied(self, cached):
+        """Тест: "10 млн" подставляется как 10000000, а не 10 и не прежние 10000"""
+        cache = SemanticCache(capacity=10, threshold=0.9)
+        await cache.add(None, cached, "SELECT COUNT(*) FROM videos WHERE views_count > 10000")
+
+        assert cache.lookup("Сколько видео набрали больше 10 млн просмотров?").sql == \
+            "SELECT COUNT(*) FROM videos WHERE views_count > 10000000"
+
+    def test_number_scales(self):
+        _, params = extract_params("Сколько видео набрали больше 2,5k просмотров и 3 млрд лайков за 7 дней?")
+        assert [p.value for p in params] == [Decimal(2500), Decimal(3_000_000_000), Decimal(7)]
+
+    def test_comparison_words_unified(self):
+        """Тест: синонимы сравнения совпадают, и "не" меняет сравнение"""
+        _, at_least = extract_params("Сколько видео набрало не менее 500 просмотров?")
+        _, minimum = extract_params("Сколько видео набрало минимум 700 просмотров?")
+        _, more = extract_params("Сколько видео набрало больше 500 просмотров?")
+
+        assert at_least[0].ops == minimum[0].ops == ("не меньше",)
+        assert rebind_sql("SELECT COUNT(*) FROM videos WHERE views_count >= 500", at_least, minimum) == \
+            "SELECT COUNT(*) FROM videos WHERE views_count >= 700"
+        assert rebind_sql("SELECT COUNT(*) FROM videos WHERE views_count >= 500", at_least, more) is None
+
+    @pytest.mark.asyncio
+    async def test_least_recently_used_evicted(self):
+        """Тест: при переполнении вытесняется давно не использованный вопрос, в том числе из Redis"""
+        cache = SemanticCache(capacity=2, threshold=0.9)
+        client = redis_mock()
+        await cache.add(client, "Сколько видео набрало больше 100 просмотров?",
+                        "SELECT COUNT(*) FROM videos WHERE views_count > 100")
+        await cache.add(client, "Сколько видео набрало больше 100 лайков?",
+                        "SELECT COUNT(*) FROM videos WHERE likes_count > 100")
+        assert cache.lookup("Сколько видео набрало больше 7 просмотров?") is not None
+
+        await cache.add(client, "Сколько всего креаторов?", "SELECT COUNT(DISTINCT creator_id) FROM videos")
+
+        assert cache.size == 2 and cache.metrics["evicted"] == 1
+        assert cache.lookup("Сколько видео набрало больше 7 лайков?") is None
+        assert cache.lookup("Сколько видео набрало больше 7 просмотров?") is not None
+        client.pipeline.return_value.hdel.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_hit_time_saved_to_redis(self):
+        """Тест: время использования попадает в Redis, и после перезапуска вытесняется неиспользованный вопрос"""
+        cache = SemanticCache(capacity=2, threshold=0.9)
+        client = redis_mock()
+        client.hset = AsyncMock()
+        await cache.add(client, "Сколько видео набрало больше 100 просмотров?",
+                        "SELECT COUNT(*) FROM videos WHERE views_count > 100")
+        await cache.add(client, "Сколько видео набрало больше 100 лайков?",
+                        "SELECT COUNT(*) FROM videos WHERE likes_count > 100")
+
+        hit = cache.lookup("Сколько видео набрало больше 7 просмотров?")
+        await cache.touch(client, hit)
+
+        name, key, value = client.hset.call_args[0]
+        stored = {call[0][1]: call[0][2] for call in client.pipeline.return_value.hset.call_args_list}
+        stored[key] = value
+        assert name == SEMANTIC_KEY and json.loads(value)["q"] == hit.source
+        assert json.loads(value)["t"] == cache.last_used[cache.rows[key]]
+
+        restarted = SemanticCache(capacity=2, threshold=0.9)
+        await restarted.load(redis_mock(stored))
+        await restarted.add(None, "Сколько всего креаторов?", "SELECT COUNT(DISTINCT creator_id) FROM videos")
+        assert restarted.lookup("Сколько видео набрало больше 7 лайков?") is None
+        assert restarted.lookup("Сколько видео набрало больше 7 просмотров?") is not None
+
+    @pytest.mark.asyncio
+    async def test_load_from_redis(self):
+        """Тест: при старте восстанавливаются последние использованные вопросы"""
+        stored = {
+            str(i): json.dumps({"q": f"Сколько видео набрало больше {i} {word}?",
+                                "sql": f"SELECT COUNT(*) FROM videos WHERE {column} > {i}", "t": i})
+            for i, word, column in ((1, "просмотров", "views_count"), (2, "лайков", "likes_count"),
+                                    (3, "комментариев", "comments_count"))
+        }
+        cache = SemanticCache(capacity=2, threshold=0.9)
+
+        assert await cache.load(redis_mock(stored)) == 2
+        assert cache.lookup("Сколько видео набрало больше 10 просмотров?") is None
+        assert cache.lookup("Сколько видео набрало больше 10 комментариев?").sql == \
+            "SELECT COUNT(*) FROM videos WHERE comments_count > 10"
+
+    @pytest.mark.asyncio
+    async def test_saved_to_redis(self):
+        client = redis_mock()
+        await SemanticCache(capacity=2).add(client, RANGE_QUESTION, RANGE_SQL)
+
+        name, _, value = client.pipeline.return_value.hset.call_args[0]
+        assert name == SEMANTIC_KEY
+        assert json.loads(value)["sql"] == RANGE_SQL
@@ -0,0 +1,69 @@
+import pytest
+
+from app.services.sql_guard import analyze_sql, UnsafeSQLError
+
+
+class TestAnalyzeSql:
+    """Тесты проверки сгенерированного SQL"""
+
+    @pytest.mark.parametrize("sql", [
+        "SELECT COUNT(*) FROM videos",
+        "SELECT SUM(delta_views_count) FROM video_snapshots WHERE created_at >= CURRENT_DATE - INTERVAL '1 day';",
+        "SELECT ROUND(AVG(likes_count)::numeric, 2) FROM videos WHERE EXTRACT(YEAR FROM video_created_at) = 2025",
+        "SELECT COUNT(DISTINCT v.id) FROM videos v JOIN video_snapshots s ON s.video_id = v.id",
+        "WITH daily AS (SELECT DATE(created_at) AS day FROM video_snapshots) SELECT COUNT(*) FROM daily",
+    ])
+    def test_allowed(self, sql):
+        assert analyze_sql(sql).tables
+
+    @pytest.mark.parametrize("sql, reason", [
+        ("SELECT COUNT(*) FROM videos; DELETE FROM videos", "один запрос"),
+        ("DELETE FROM videos", "только SELECT"),
+        ("SELECT pg_sleep(600) FROM videos", "pg_sleep"),
+        ("SELECT current_setting('server_version') FROM videos", "current_setting"),
+        ("SELECT * FROM pg_catalog.pg_user", "pg_catalog.pg_user"),
+        ("SELECT COUNT(*) FROM users", "users"),
+        ("SELECT * FROM videos FOR UPDATE", "LOCK"),
+        ("SELECT * INTO copy FROM videos", "INTO"),
+        ("WITH gone AS (DELETE FROM videos RETURNING id) SELECT COUNT(*) FROM gone", "DELETE"),
+        ("SELECT 1", "ни к одной таблице"),
+        ("SELEC COUNT(*) FROM videos", "разобрать"),
+    ])
+    def test_rejected(self, sql, reason):
+        with pytest.raises(UnsafeSQLError, match=reason):
+            analyze_sql(sql)
+
+    def test_scalar_detection(self):
+        """Тест определения запросов с одним агрегированным значением"""
+        assert analyze_sql("SELECT COUNT(*) FROM videos").scalar
+        assert analyze_sql("select sum(views_count) as total from videos where creator_id = 'x'").scalar
+        assert analyze_sql("SELECT COUNT(DISTINCT video_id) FROM video_snapshots WHERE DATE(created_at) = '2025-11-27'").scalar
+        assert not analyze_sql("SELECT COUNT(*), SUM(views_count) FROM videos").scalar
+        assert not analyze_sql("SELECT creator_id, COUNT(*) FROM videos GROUP BY creator_id").scalar
+        assert not analyze_sql("SELECT COUNT(*) FROM videos GROUP BY creator_id").scalar
+        assert not analyze_sql("SELECT views_count FROM videos").scalar
+
+    def test_fingerprint_ignores_literals(self):
+        first = analyze_sql("SELECT COUNT(*) FROM videos WHERE creator_id = 'a' AND views_count > 10")
+        second = analyze_sql("select count(*) from videos where creator_id = 'b' and views_count > 99;")
+        other = analyze_sql("SELECT COUNT(*) FROM videos WHERE likes_count > 10")
+
+        assert first.fingerprint == second.fingerprint
+        assert first.fingerprint != other.fingerprint
+        assert first.normalized == "SELECT COUNT(*) FROM videos WHERE creator_id = ? AND views_count > ?"
+
+    def test_limit_injected_for_row_results(self):
+        guarded = analyze_sql("SELECT views_count FROM videos WHERE creator_id = 'a';", max_rows=100)
+        assert guarded.limited
+        assert guarded.sql == "SELECT views_count FROM videos WHERE creator_id = 'a' LIMIT 101"
+
+    def test_limit_lowered_when_too_large(self):
+        guarded = analyze_sql("SELECT views_count FROM videos LIMIT 100000", max_rows=100)
+        assert guarded.sql == "SELECT views_count FROM videos LIMIT 101"
+
+    def test_limit_kept(self):
+        """Агрегаты без группировки и небольшой LIMIT не меняются"""
+        for sql in ("SELECT COUNT(*), SUM(views_count) FROM videos", "SELECT views_count FROM videos LIMIT 5"):
+            guarded = analyze_sql(sql, max_rows=100)
+            assert not guarded.limited
+            assert guarded.sql == sql
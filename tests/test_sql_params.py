@@ -0,0 +1,98 @@
+import pytest
+from decimal import Decimal
+from datetime import date, datetime, timezone
+from unittest.mock import MagicMock
+
+from app.services.sql_params import parameterize_sql, coerce_params, render_template
+
+
+def pg_type(name):
+    t = MagicMock()
+    t.name = name
+    return t
+
+
+class TestParameterizeSql:
+    """Тесты выноса литералов в параметры"""
+
+    def test_literals_lifted(self):
+        template, params = parameterize_sql(
+            "SELECT COUNT(*) FROM videos WHERE creator_id = 'aca1' AND views_count > 10000"
+        )
+        assert template == "SELECT COUNT(*) FROM videos WHERE creator_id = $1 AND views_count > $2"
+        assert params == ['aca1', 10000]
+
+    def test_same_template_for_different_values(self):
+        """Запросы с разными значениями дают один шаблон"""
+        first, _ = parameterize_sql("SELECT SUM(views_count) FROM videos WHERE DATE(video_created_at) = '2025-11-01'")
+        second, _ = parameterize_sql("SELECT SUM(views_count) FROM videos WHERE DATE(video_created_at) = '2025-11-02'")
+        assert first == second
+
+    def test_typed_and_cast_literals_kept(self):
+        """Типизированные литералы и литералы с приведением не выносятся"""
+        sql = ("SELECT SUM(delta_views_count) FROM video_snapshots "
+               "WHERE created_at >= CURRENT_DATE - INTERVAL '1 day' AND created_at < '2025-12-01'::date")
+        assert parameterize_sql(sql) == (sql, [])
+
+        template, params = parameterize_sql(sql, typed_literals=True)
+        assert params == ['1 day', '2025-12-01']
+        assert render_template(template, params) == sql
+
+    def test_select_list_and_escaped_quotes(self):
+        template, params = parameterize_sql("SELECT ROUND(AVG(x), 2) FROM t WHERE a = 'it''s' AND t1 > 1.5")
+        assert template == "SELECT ROUND(AVG(x), 2) FROM t WHERE a = $1 AND t1 > $2"
+        assert params == ["it's", Decimal("1.5")]
+
+    def test_order_by_position_kept(self):
+        """Номер колонки в ORDER BY остается литералом, LIMIT и условия выносятся"""
+        template, params = parameterize_sql(
+            "SELECT creator_id, SUM(views_count) FROM videos WHERE views_count > 100 "
+            "GROUP BY creator_id ORDER BY 2 DESC, 1 LIMIT 3"
+        )
+        assert template == ("SELECT creator_id, SUM(views_count) FROM videos WHERE views_count > $1 "
+                            "GROUP BY creator_id ORDER BY 2 DESC, 1 LIMIT $2")
+        assert params == [100, 3]
+
+    def test_group_by_position_kept(self):
+        """Номер колонки в GROUP BY остается литералом, HAVING и подзапрос - параметрами"""
+        template, params = parameterize_sql(
+            "SELECT DATE(created_at), COUNT(*) FROM video_snapshots "
+            "WHERE video_id IN (SELECT id FROM videos ORDER BY views_count DESC LIMIT 5) "
+            "AND delta_views_count > 0 GROUP BY 1 HAVING COUNT(*) > 10"
+        )
+        assert template == (
+            "SELECT DATE(created_at), COUNT(*) FROM video_snapshots "
+            "WHERE video_id IN (SELECT id FROM videos ORDER BY views_count DESC LIMIT $1) "
+            "AND delta_views_count > $2 GROUP BY 1 HAVING COUNT(*) > $3"
+        )
+        assert params == [5, 0, 10]
+
+    def test_render_template_roundtrip(self):
+        """Шаблон с параметрами собирается обратно в исходный запрос"""
+        sql = ("SELECT COUNT(*) FROM videos WHERE creator_id = 'o''brien' "
+               "AND views_count > 10 AND likes_count > 1.5 AND video_created_at >= '2025-11-01'")
+        template, params = parameterize_sql(sql)
+        assert render_template(template, params) == sql
+
+
+class TestCoerceParams:
+    """Тесты приведения значений к типам параметров"""
+
+    def test_coerce_types(self):
+        values = coerce_params(
+            ['2025-11-27', '2025-11-27', 10000, 'aca1061a9d324ecf8c3fa2bb32d7be63'],
+            [pg_type('timestamptz'), pg_type('date'), pg_type('int4'), pg_type('uuid')],
+            timezone='UTC'
+        )
+        assert values[0] == datetime(2025, 11, 27, tzinfo=timezone.utc)
+        assert values[1] == date(2025, 11, 27)
+        assert values[2] == 10000
+        assert str(values[3]) == 'aca1061a-9d32-4ecf-8c3f-a2bb32d7be63'
+
+    def test_fractional_literal_for_integer_rejected(self):
+        with pytest.raises(ValueError):
+            coerce_params([Decimal("1.5")], [pg_type('int4')])
+
+    def test_unsupported_type_rejected(self):
+        with pytest.raises(ValueError):
+            coerce_params(['1 day'], [pg_type('interval')])
@@ -0,0 +1,66 @@
+import pytest
+
+from app.services.sql_rewriter import rewrite_sargable
+
+
+class TestRewriteSargable:
+    """Тесты переписывания условий по датам в диапазоны"""
+
+    @pytest.mark.parametrize("sql, expected", [
+        (
+            "SELECT COUNT(DISTINCT video_id) FROM video_snapshots WHERE DATE(created_at) = '2025-11-27'",
+            "SELECT COUNT(DISTINCT video_id) FROM video_snapshots WHERE (created_at >= '2025-11-27' AND created_at < '2025-11-28')",
+        ),
+        (
+            "SELECT COUNT(*) FROM videos WHERE DATE(video_created_at) BETWEEN '2025-11-01' AND '2025-11-30'",
+            "SELECT COUNT(*) FROM videos WHERE (video_created_at >= '2025-11-01' AND video_created_at < '2025-12-01')",
+        ),
+        (
+            "SELECT COUNT(*) FROM videos WHERE video_created_at::date > '2025-12-31'",
+            "SELECT COUNT(*) FROM videos WHERE video_created_at >= '2026-01-01'",
+        ),
+        (
+            "SELECT COUNT(*) FROM videos WHERE CAST(video_created_at AS DATE) <= '2025-11-30'",
+            "SELECT COUNT(*) FROM videos WHERE video_created_at < '2025-12-01'",
+        ),
+        (
+            "SELECT COUNT(*) FROM videos WHERE EXTRACT(YEAR FROM video_created_at) = 2025 AND EXTRACT(MONTH FROM video_created_at) = 12",
+            "SELECT COUNT(*) FROM videos WHERE (video_created_at >= '2025-12-01' AND video_created_at < '2026-01-01')",
+        ),
+        (
+            "SELECT COUNT(*) FROM videos WHERE EXTRACT(YEAR FROM video_created_at) = 2024",
+            "SELECT COUNT(*) FROM videos WHERE (video_created_at >= '2024-01-01' AND video_created_at < '2025-01-01')",
+        ),
+        (
+            "SELECT SUM(delta_views_count) FROM video_snapshots WHERE date_trunc('month', created_at) = '2025-11-01'",
+            "SELECT SUM(delta_views_count) FROM video_snapshots WHERE (created_at >= '2025-11-01' AND created_at < '2025-12-01')",
+        ),
+        (
+            "SELECT SUM(delta_views_count) FROM video_snapshots WHERE DATE(created_at) = CURRENT_DATE",
+            "SELECT SUM(delta_views_count) FROM video_snapshots WHERE (created_at >= CURRENT_DATE AND created_at < (CURRENT_DATE) + INTERVAL '1 day')",
+        ),
+    ])
+    def test_rewrite(self, sql, expected):
+        assert rewrite_sargable(sql) == expected
+
+    def test_unaligned_date_trunc_kept(self):
+        """date_trunc, сравниваемый с невыровненной датой, не переписывается"""
+        sql = "SELECT COUNT(*) FROM videos WHERE date_trunc('month', video_created_at) = '2025-11-15'"
+        assert rewrite_sargable(sql) == sql
+
+    @pytest.mark.parametrize("sql", [
+        "SELECT COUNT(*) FROM videos WHERE EXTRACT(YEAR FROM video_created_at) = 20251",
+        "SELECT COUNT(*) FROM videos WHERE EXTRACT(YEAR FROM video_created_at) = 2025 - 1",
+        "SELECT COUNT(*) FROM videos WHERE DATE(video_created_at) = '2025-11-27' + 1",
+        "SELECT COUNT(*) FROM videos WHERE video_created_at::date = '2025-11-27'::date - 1",
+        "SELECT COUNT(*) FROM videos WHERE date_trunc('month', video_created_at) = '2025-11-01' - INTERVAL '1 month'",
+        "SELECT COUNT(*) FROM videos WHERE TO_DATE(video_created_at) = '2025-11-27'",
+        "SELECT COUNT(*) FROM videos WHERE 1 + DATE(video_created_at) = '2025-11-27'",
+    ])
+    def test_part_of_expression_kept(self, sql):
+        """Литерал или колонка - часть большего выражения: переписывание сломало бы запрос, он остается как есть"""
+        assert rewrite_sargable(sql) == sql
+
+    def test_sargable_sql_unchanged(self):
+        sql = "SELECT COUNT(*) FROM videos WHERE video_created_at >= '2025-11-01' AND video_created_at < '2025-12-01'"
+        assert rewrite_sargable(sql) == sql
@@ -4,8 +4,9 @@ from unittest.mock import AsyncMock, patch, MagicMock
 from aiogram.types import Message, Chat, User
 from app.services.db_service import db_service
 from app.services.gpt_service import gpt_service
-from app.services.cache_service import cache_service
-from app.handlers.user_handlers import handle_text, cmd_start
+from app.services.cache_service import cache_service, FailureKind
+from app.services.db_service import QueryResult
+from app.handlers.user_handlers import handle_text, cmd_start, cmd_stats, TIMEOUT_MESSAGE
 
 
 class TestUserHandlers:
@@ -82,4 +83,374 @@ class TestUserHandlers:
                     await handle_text(mock_message, bot=mock_bot)
                     
                     mock_answer.assert_called_once_with("42")
-                    mock_bot.send_chat_action.assert_not_called()
\ No newline at end of file
+                    mock_bot.send_chat_action.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_handle_text_gpt_unavailable(self, mock_message):
+        """Тест мгновенного ответа, когда выключатель YandexGPT открыт"""
+        mock_message.text = "Сколько всего видео?"
+
+        mock_bot = AsyncMock()
+        mock_cache_service = AsyncMock()
+        mock_cache_service.get_cached_result.return_value = None
+        mock_cache_service.get_negative_result.return_value = None
+        mock_gpt_service = MagicMock()
+        mock_gpt_service.is_available.return_value = False
+
+        with patch('app.handlers.user_handlers.cache_service', mock_cache_service), \
+                patch('app.handlers.user_handlers.gpt_service', mock_gpt_service):
+            with patch.object(mock_message, 'answer', AsyncMock()) as mock_answer:
+                await handle_text(mock_message, bot=mock_bot)
+
+                args, _ = mock_answer.call_args
+                assert "временно недоступен" in args[0]
+                mock_gpt_service.ask_gpt.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_cmd_stats(self, mock_message):
+        """Тест вывода метрик пулов для администратора"""
+        mock_db_service = MagicMock()
+        mock_db_service.pool_metrics.return_value = {"primary": {"utilization": 0.4}}
+        mock_db_service.planning_report.return_value = {"reuses": 3}
+        mock_db_service.query_report.return_value = [{"sql": "SELECT COUNT(*) FROM videos", "calls": 2}]
+        mock_db_service.combiner.metrics = {"scans_saved": 7}
+        mock_cache_service = MagicMock()
+        mock_cache_service.get_metrics.return_value = {"negative_hits": 4}
+
+        with patch('app.handlers.user_handlers.db_service', mock_db_service), \
+                patch('app.handlers.user_handlers.cache_service', mock_cache_service):
+            with patch.object(mock_message, 'answer', AsyncMock()) as mock_answer:
+                await cmd_stats(mock_message)
+
+                response_text = mock_answer.call_args[0][0]
+                assert '"utilization": 0.4' in response_text
+                assert '"reuses": 3' in response_text
+                assert '"calls": 2' in response_text
+                assert '"scans_saved": 7' in response_text
+                assert '"negative_hits": 4' in response_text
+
+    @pytest.mark.asyncio
+    async def test_handle_text_unsafe_sql_rejected(self, mock_message):
+        """Тест: опасный сгенерированный SQL не выполняется"""
+        mock_message.text = "Сколько всего видео в базе?"
+
+        mock_cache_service = AsyncMock()
+        mock_cache_service.get_cached_result.return_value = None
+        mock_cache_service.get_negative_result.return_value = None
+        mock_gpt_service = MagicMock()
+        mock_gpt_service.is_available.return_value = True
+        mock_batcher = AsyncMock()
+        mock_batcher.ask_gpt.return_value = "SELECT COUNT(*) FROM videos; DELETE FROM videos"
+        mock_db_service = AsyncMock()
+
+        with patch('app.handlers.user_handlers.cache_service', mock_cache_service), \
+                patch('app.handlers.user_handlers.gpt_service', mock_gpt_service), \
+                patch('app.handlers.user_handlers.gpt_batcher', mock_batcher), \
+                patch('app.handlers.user_handlers.db_service', mock_db_service):
+            with patch.object(mock_message, 'answer', AsyncMock()) as mock_answer:
+                await handle_text(mock_message, bot=AsyncMock())
+
+                assert "некорректный запрос" in mock_answer.call_args[0][0]
+                mock_db_service.fetch_result.assert_not_called()
+                mock_cache_service.save_negative_result.assert_called_once_with(
+                    "Сколько всего видео в базе?", FailureKind.INVALID_SQL, mock_cache_service.generation
+                )
+
+    @pytest.mark.asyncio
+    async def test_handle_text_negative_cache_hit(self, mock_message):
+        """Тест: повтор вопроса без ответа не идет в YandexGPT"""
+        mock_message.text = "Сколько видео у несуществующего креатора?"
+
+        mock_cache_service = AsyncMock()
+        mock_cache_service.get_cached_result.return_value = None
+        mock_cache_service.get_negative_result.return_value = FailureKind.EMPTY_RESULT
+        mock_batcher = AsyncMock()
+
+        with patch('app.handlers.user_handlers.cache_service', mock_cache_service), \
+                patch('app.handlers.user_handlers.gpt_batcher', mock_batcher):
+            with patch.object(mock_message, 'answer', AsyncMock()) as mock_answer:
+                await handle_text(mock_message, bot=AsyncMock())
+
+                assert "данных не найдено" in mock_answer.call_args[0][0]
+                mock_batcher.ask_gpt.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_handle_text_empty_result_cached_negatively(self, mock_message):
+        """Тест: пустой результат и ошибка БД сохраняются в негативный кеш с разной причиной"""
+        mock_message.text = "Сколько видео у несуществующего креатора?"
+
+        mock_cache_service = AsyncMock()
+        mock_cache_service.get_cached_result.return_value = None
+        mock_cache_service.get_negative_result.return_value = None
+        mock_gpt_service = MagicMock()
+        mock_gpt_service.is_available.return_value = True
+        mock_batcher = AsyncMock()
+        mock_batcher.ask_gpt.return_value = "SELECT views_count FROM videos WHERE creator_id = 'x'"
+        mock_db_service = AsyncMock()
+
+        with patch('app.handlers.user_handlers.cache_service', mock_cache_service), \
+                patch('app.handlers.user_handlers.gpt_service', mock_gpt_service), \
+                patch('app.handlers.user_handlers.gpt_batcher', mock_batcher), \
+                patch('app.handlers.user_handlers.db_service', mock_db_service):
+            with patch.object(mock_message, 'answer', AsyncMock()):
+                mock_db_service.fetch_result.return_value = QueryResult(rows=[])
+                await handle_text(mock_message, bot=AsyncMock())
+                mock_db_service.fetch_result.return_value = None
+                await handle_text(mock_message, bot=AsyncMock())
+
+        kinds = [call.args[1] for call in mock_cache_service.save_negative_result.call_args_list]
+        assert kinds == [FailureKind.EMPTY_RESULT, FailureKind.DB_ERROR]
+
+    @pytest.mark.asyncio
+    async def test_handle_text_approximate_then_exact(self, mock_message):
+        """Тест: для дорогого запроса сначала оценка, затем сообщение заменяется точным значением"""
+        mock_message.text = "Сколько снимков за ноябрь 2025?"
+
+        mock_cache_service = AsyncMock()
+        mock_cache_service.get_cached_result.return_value = None
+        mock_cache_service.get_negative_result.return_value = None
+        mock_gpt_service = MagicMock()
+        mock_gpt_service.is_available.return_value = True
+        mock_batcher = AsyncMock()
+        mock_batcher.ask_gpt.return_value = "SELECT COUNT(*) FROM video_snapshots"
+        mock_db_service = AsyncMock()
+
+        async def slow_fetch(guarded):
+            await asyncio.sleep(0.01)
+            return QueryResult(value=12345, scalar=True)
+
+        mock_db_service.fetch_result.side_effect = slow_fetch
+        mock_approximator = AsyncMock()
+        mock_approximator.estimate.return_value = MagicMock(format=MagicMock(return_value="≈ 12000 (приблизительно)"))
+        sent = AsyncMock()
+
+        with patch('app.handlers.user_handlers.cache_service', mock_cache_service), \
+                patch('app.handlers.user_handlers.gpt_service', mock_gpt_service), \
+                patch('app.handlers.user_handlers.gpt_batcher', mock_batcher), \
+                patch('app.handlers.user_handlers.db_service', mock_db_service), \
+                patch('app.handlers.user_handlers.approximator', mock_approximator):
+            with patch.object(mock_message, 'answer', AsyncMock(return_value=sent)) as mock_answer:
+                await handle_text(mock_message, bot=AsyncMock())
+
+                mock_answer.assert_called_once_with("≈ 12000 (приблизительно)")
+                sent.edit_text.assert_called_once_with("12345")
+        # В кеш попадает только точный ответ
+        assert mock_cache_service.save_to_cache.call_args[0][1] == "12345"
+
+    @pytest.mark.asyncio
+    async def test_classifier_rejects_and_routes(self, mock_message):
+        """Тест: классификатор отклоняет вопрос без YandexGPT или передает ему подсказку"""
+        from app.services.question_classifier import Prediction
+        mock_message.text = "Какое общее количество просмотров?"
+
+        mock_cache_service = AsyncMock()
+        mock_cache_service.get_cached_result.return_value = None
+        mock_cache_service.get_negative_result.return_value = None
+        mock_gpt_service = MagicMock()
+        mock_gpt_service.is_available.return_value = True
+        mock_batcher = AsyncMock()
+        mock_batcher.ask_gpt.return_value = "SELECT SUM(views_count) FROM videos"
+        mock_db_service = AsyncMock()
+        mock_db_service.fetch_result.return_value = QueryResult(value=100, scalar=True)
+        mock_classifier = MagicMock()
+
+        with patch('app.handlers.user_handlers.cache_service', mock_cache_service), \
+                patch('app.handlers.user_handlers.gpt_service', mock_gpt_service), \
+                patch('app.handlers.user_handlers.gpt_batcher', mock_batcher), \
+                patch('app.handlers.user_handlers.db_service', mock_db_service), \
+                patch('app.handlers.user_handlers.approximator', AsyncMock(estimate=AsyncMock(return_value=None))), \
+                patch('app.handlers.user_handlers.question_classifier', mock_classifier):
+            with patch.object(mock_message, 'answer', AsyncMock()) as mock_answer:
+                # Слово "какое" не мешает: решает модель
+                mock_classifier.predict.return_value = Prediction(0.9, "videos", 0.95, "sum", 0.5)
+                await handle_text(mock_message, bot=AsyncMock())
+
+                mock_answer.assert_called_once_with("100")
+                mock_batcher.ask_gpt.assert_called_once()
+                assert mock_batcher.ask_gpt.call_args[0][0] == \
+                    "Какое общее количество просмотров? (подсказка: таблица videos)"
+                # Кеш и журнал - по исходному тексту вопроса
+                assert mock_cache_service.save_to_cache.call_args[0][0] == "Какое общее количество просмотров?"
+                mock_cache_service.log_question.assert_called_once_with(
+                    "Какое общее количество просмотров?", "answered", "SELECT SUM(views_count) FROM videos"
+                )
+
+                mock_answer.reset_mock()
+                mock_batcher.ask_gpt.reset_mock()
+                mock_classifier.predict.return_value = Prediction(0.05, "videos", 0.5, "count", 0.5)
+                await handle_text(mock_message, bot=AsyncMock())
+
+                assert "только на количественные вопросы" in mock_answer.call_args[0][0]
+                mock_batcher.ask_gpt.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_handle_text_unknown_creator(self, mock_message):
+        """Тест: вопрос о несуществующем креаторе получает ответ без YandexGPT и БД"""
+        from app.services.entity_index import UnknownEntity
+        mock_message.text = "Сколько видео у креатора aca1061a9d324ecf8c3fa2bb32d7be64?"
+
+        mock_cache_service = AsyncMock()
+        mock_cache_service.get_cached_result.return_value = None
+        mock_cache_service.get_negative_result.return_value = None
+        mock_cache_service.generation = 7
+        mock_batcher = AsyncMock()
+        mock_db_service = AsyncMock()
+        mock_index = MagicMock()
+        mock_index.find_unknown.return_value = UnknownEntity("creator", "aca1061a9d324ecf8c3fa2bb32d7be64")
+
+        with patch('app.handlers.user_handlers.cache_service', mock_cache_service), \
+                patch('app.handlers.user_handlers.gpt_batcher', mock_batcher), \
+                patch('app.handlers.user_handlers.db_service', mock_db_service), \
+                patch('app.handlers.user_handlers.entity_index', mock_index):
+            with patch.object(mock_message, 'answer', AsyncMock()) as mock_answer:
+                await handle_text(mock_message, bot=AsyncMock())
+
+                assert "Нет такого креатора" in mock_answer.call_args[0][0]
+        mock_index.find_unknown.assert_called_once_with(mock_message.text, 7)
+        mock_batcher.ask_gpt.assert_not_called()
+        mock_db_service.fetch_result.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_handle_text_similar_question_without_gpt(self, mock_message):
+        """Тест: похожий вопрос с другой датой получает SQL предыдущего без YandexGPT"""
+        mock_cache_service = AsyncMock()
+        mock_cache_service.get_cached_result.return_value = None
+        mock_cache_service.get_negative_result.return_value = None
+        mock_cache_service.redis_client = None
+        mock_cache_service.generation = 7
+        mock_gpt_service = MagicMock()
+        mock_gpt_service.is_available.return_value = True
+        mock_batcher = AsyncMock()
+        mock_batcher.ask_gpt.return_value = \
+            "SELECT SUM(delta_views_count) FROM video_snapshots WHERE DATE(created_at) = '2025-11-28'"
+        mock_db_service = AsyncMock()
+        mock_db_service.fetch_result.return_value = QueryResult(value=1500, scalar=True)
+
+        with patch('app.handlers.user_handlers.cache_service', mock_cache_service), \
+                patch('app.handlers.user_handlers.gpt_service', mock_gpt_service), \
+                patch('app.handlers.user_handlers.gpt_batcher', mock_batcher), \
+                patch('app.handlers.user_handlers.db_service', mock_db_service):
+            with patch.object(mock_message, 'answer', AsyncMock()):
+                mock_message.text = "На сколько просмотров в сумме выросли все видео 28 ноября 2025?"
+                await handle_text(mock_message, bot=AsyncMock())
+
+                # YandexGPT недоступен, но он и не нужен
+                mock_gpt_service.is_available.return_value = False
+                mock_message.text = "На сколько просмотров суммарно выросли все ролики 1 декабря 2025?"
+                await handle_text(mock_message, bot=AsyncMock())
+
+                assert mock_message.answer.call_args[0][0] == "1500"
+
+        mock_batcher.ask_gpt.assert_called_once()
+        guarded = mock_db_service.fetch_result.call_args[0][0]
+        assert "'2025-12-01'" in guarded.sql and "'2025-12-02'" in guarded.sql
+        # Без Redis индекс id не используется, но ответ сохраняется с поколением до выполнения запроса
+        assert mock_cache_service.save_to_cache.call_args.kwargs["generation"] == 7
+
+    @pytest.mark.asyncio
+    async def test_handle_text_deadline_cancels_query(self, mock_message):
+        """Тест: по истечении срока запрос к БД отменяется, неудача не кешируется"""
+        mock_message.text = "Сколько снимков за ноябрь 2025?"
+
+        mock_cache_service = AsyncMock()
+        mock_cache_service.get_cached_result.return_value = None
+        mock_cache_service.get_negative_result.return_value = None
+        mock_gpt_service = MagicMock()
+        mock_gpt_service.is_available.return_value = True
+        mock_batcher = AsyncMock()
+        mock_batcher.ask_gpt.return_value = "SELECT COUNT(*) FROM video_snapshots"
+        mock_db_service = AsyncMock()
+        cancelled = asyncio.Event()
+
+        async def hanging_fetch(guarded):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        mock_db_service.fetch_result.side_effect = hanging_fetch
+        mock_approximator = AsyncMock()
+        mock_approximator.estimate.return_value = None
+
+        with patch('app.handlers.user_handlers.cache_service', mock_cache_service), \
+                patch('app.handlers.user_handlers.gpt_service', mock_gpt_service), \
+                patch('app.handlers.user_handlers.gpt_batcher', mock_batcher), \
+                patch('app.handlers.user_handlers.db_service', mock_db_service), \
+                patch('app.handlers.user_handlers.approximator', mock_approximator), \
+                patch('app.handlers.user_handlers.settings.REQUEST_DEADLINE', 0.05):
+            with patch.object(mock_message, 'answer', AsyncMock()) as mock_answer:
+                await handle_text(mock_message, bot=AsyncMock())
+
+                mock_answer.assert_called_once_with(TIMEOUT_MESSAGE)
+        assert cancelled.is_set()
+        mock_cache_service.save_negative_result.assert_not_called()
+        mock_cache_service.save_to_cache.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_handle_text_multiple_questions_concurrently(self, mock_message):
+        """Тест: несколько вопросов обрабатываются одновременно и получают один общий ответ"""
+        mock_message.text = "Сколько всего видео? Сумма просмотров за ноябрь? Кто автор?"
+
+        mock_cache_service = AsyncMock()
+        mock_cache_service.get_cached_result.side_effect = lambda query: "42" if "всего" in query else None
+        mock_cache_service.get_negative_result.return_value = None
+        mock_gpt_service = MagicMock()
+        mock_gpt_service.is_available.return_value = True
+        mock_batcher = AsyncMock()
+        mock_batcher.ask_gpt.return_value = "SELECT SUM(views_count) FROM videos"
+        mock_db_service = AsyncMock()
+
+        async def slow_fetch(guarded):
+            await asyncio.sleep(0.05)
+            return QueryResult(value=1000, scalar=True)
+
+        mock_db_service.fetch_result.side_effect = slow_fetch
+        mock_bot = AsyncMock()
+
+        with patch('app.handlers.user_handlers.cache_service', mock_cache_service), \
+                patch('app.handlers.user_handlers.gpt_service', mock_gpt_service), \
+                patch('app.handlers.user_handlers.gpt_batcher', mock_batcher), \
+                patch('app.handlers.user_handlers.db_service', mock_db_service):
+            with patch.object(mock_message, 'answer', AsyncMock()) as mock_answer:
+                await handle_text(mock_message, bot=mock_bot)
+
+                mock_answer.assert_called_once()
+                text = mock_answer.call_args[0][0]
+                assert "1. Сколько всего видео?\n42" in text
+                assert "2. Сумма просмотров за ноябрь?\n1000" in text
+                assert "3. Кто автор?\nОтвечаю только на количественные вопросы." in text
+                mock_batcher.ask_gpt.assert_called_once()
+                mock_bot.send_chat_action.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_multiple_questions_latency_of_slowest(self, mock_message):
+        """Тест: общее время - как у самого медленного вопроса, а не сумма"""
+        mock_message.text = "Сколько всего видео? Сумма просмотров? Среднее число лайков?"
+
+        mock_cache_service = AsyncMock()
+        mock_cache_service.get_cached_result.return_value = None
+        mock_cache_service.get_negative_result.return_value = None
+        mock_gpt_service = MagicMock()
+        mock_gpt_service.is_available.return_value = True
+        mock_batcher = AsyncMock()
+        mock_batcher.ask_gpt.return_value = "SELECT COUNT(*) FROM videos"
+        mock_db_service = AsyncMock()
+
+        async def slow_fetch(guarded):
+            await asyncio.sleep(0.1)
+            return QueryResult(value=1, scalar=True)
+
+        mock_db_service.fetch_result.side_effect = slow_fetch
+
+        with patch('app.handlers.user_handlers.cache_service', mock_cache_service), \
+                patch('app.handlers.user_handlers.gpt_service', mock_gpt_service), \
+                patch('app.handlers.user_handlers.gpt_batcher', mock_batcher), \
+                patch('app.handlers.user_handlers.db_service', mock_db_service):
+            with patch.object(mock_message, 'answer', AsyncMock()):
+                started = asyncio.get_running_loop().time()
+                await handle_text(mock_message, bot=AsyncMock())
+                elapsed = asyncio.get_running_loop().time() - started
+
+        assert mock_db_service.fetch_result.call_count == 3
+        assert elapsed < 0.25